@@ -0,0 +1,363 @@
+import bisect
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+import numpy as np
+from columnar_codec import time_to_ms
+
+
+class LevelIndex:
+    """按觸發水平排序的提醒索引，區間查詢為O(log n + k)"""
+
+    def __init__(self):
+        self.levels = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.levels)
+
+    def add(self, level, alert_id):
+        i = bisect.bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, alert_id)
+
+    def remove(self, level, alert_id):
+        i = bisect.bisect_left(self.levels, level)
+        while i < len(self.levels) and self.levels[i] == level:
+            if self.ids[i] == alert_id:
+                del self.levels[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def between(self, low, high, include_low, include_high):
+        """返回水平位於 low ~ high 之間的提醒ID"""
+        lo = bisect.bisect_left(self.levels, low) if include_low else bisect.bisect_right(self.levels, low)
+        hi = bisect.bisect_right(self.levels, high) if include_high else bisect.bisect_left(self.levels, high)
+        return self.ids[lo:hi]
+
+
+class FileSink:
+    """將觸發的提醒以JSON Lines格式追加寫入文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+
+
+class QueueSink:
+    """將觸發的提醒放入隊列，供UI或其他線程消費"""
+
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def send(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            pass
+
+    def drain(self):
+        """取出隊列中所有提醒"""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+class WebhookSink:
+    """Webhook替身：記錄將要推送的請求內容，設置url時以POST發送到本地端點"""
+
+    def __init__(self, url=None, timeout=2):
+        self.url = url
+        self.timeout = timeout
+        self.sent = []
+
+    def send(self, event):
+        self.sent.append(event)
+        if self.url:
+            import requests
+            try:
+                requests.post(self.url, json=event, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                pass
+
+
+class AlertEngine:
+    """價格提醒引擎：以每個交易對的排序價格索引匹配行情，而非線性掃描所有提醒"""
+
+    # 支持的提醒條件
+    CONDITIONS = {
+        'price_above': '價格向上突破',
+        'price_below': '價格向下跌破',
+        'rsi_above': 'RSI向上突破',
+        'rsi_below': 'RSI向下跌破',
+        'new_bos': '出現新的結構突破',
+        'enter_order_block': '價格進入訂單區塊'
+    }
+
+    def __init__(self, sinks=None, tech_indicators=None, smc_analyzer=None, latency_samples=10000):
+        self.sinks = list(sinks or [])
+        self.tech_indicators = tech_indicators
+        self.smc_analyzer = smc_analyzer
+
+        self.alerts = {}
+        # (symbol, field, direction) -> LevelIndex，field為 'price' 或 'rsi'，direction為 'up' 或 'down'
+        self.indexes = {}
+        # symbol -> 自動跟蹤SMC結果的提醒ID集合
+        self.smc_alerts = {}
+        # (symbol, interval) -> 上一次的價格/RSI 和最近的結構突破時間；不同時間週期的序列各自比較，
+        # 避免以1分鐘的RSI與日線的RSI比較而誤報穿越。時間一律存為int毫秒，
+        # 與K線索引是DatetimeIndex還是精簡模式的毫秒整數無關
+        self.last_values = {}
+        self.last_bos_time = {}
+        self.match_latency = deque(maxlen=latency_samples)
+
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _index(self, symbol, field, direction):
+        key = (symbol, field, direction)
+        if key not in self.indexes:
+            self.indexes[key] = LevelIndex()
+        return self.indexes[key]
+
+    def _index_entries(self, alert):
+        """提醒在索引中的位置：[(field, direction, level), ...]"""
+        condition = alert['condition']
+        if condition == 'price_above':
+            return [('price', 'up', alert['value'])]
+        if condition == 'price_below':
+            return [('price', 'down', alert['value'])]
+        if condition == 'rsi_above':
+            return [('rsi', 'up', alert['value'])]
+        if condition == 'rsi_below':
+            return [('rsi', 'down', alert['value'])]
+        if condition == 'enter_order_block' and alert['low'] is not None:
+            # 從上方跌入區塊必然向下穿越上沿，從下方升入必然向上穿越下沿
+            return [('price', 'down', alert['high']), ('price', 'up', alert['low'])]
+        return []
+
+    def add_alert(self, symbol, condition, value=None, low=None, high=None, message=None, once=True):
+        """
+        註冊提醒
+
+        Args:
+            symbol (str): 交易對符號
+            condition (str): 提醒條件，見CONDITIONS
+            value (float): 價格或RSI水平（price_*/rsi_* 條件）
+            low (float): 訂單區塊下沿；不提供時跟蹤SMC分析得到的訂單區塊
+            high (float): 訂單區塊上沿
+            message (str): 自定義提醒內容
+            once (bool): 觸發一次後是否自動移除
+
+        Returns:
+            int: 提醒ID
+        """
+        if condition not in self.CONDITIONS:
+            raise ValueError(f"不支持的提醒條件: {condition}")
+        if condition.startswith(('price_', 'rsi_')) and value is None:
+            raise ValueError(f"提醒條件 {condition} 需要提供水平值")
+        if (low is None) != (high is None):
+            raise ValueError("訂單區塊提醒需要同時提供上沿和下沿")
+
+        with self._lock:
+            alert_id = next(self._ids)
+            alert = {
+                'id': alert_id,
+                'symbol': symbol,
+                'condition': condition,
+                'value': value,
+                'low': low,
+                'high': high,
+                'message': message or self.CONDITIONS[condition],
+                'once': once,
+                'created': time.time()
+            }
+            self.alerts[alert_id] = alert
+
+            entries = self._index_entries(alert)
+            for field, direction, level in entries:
+                self._index(symbol, field, direction).add(level, alert_id)
+            if not entries:
+                self.smc_alerts.setdefault(symbol, set()).add(alert_id)
+
+            return alert_id
+
+    def remove_alert(self, alert_id):
+        """移除提醒"""
+        with self._lock:
+            alert = self.alerts.pop(alert_id, None)
+            if alert is None:
+                return False
+            for field, direction, level in self._index_entries(alert):
+                self._index(alert['symbol'], field, direction).remove(level, alert_id)
+            self.smc_alerts.get(alert['symbol'], set()).discard(alert_id)
+            return True
+
+    def _match_crossings(self, symbol, field, prev, new):
+        """找出在 prev -> new 之間被穿越的提醒"""
+        if prev is None or new is None or prev == new or np.isnan(prev) or np.isnan(new):
+            return []
+        if new > prev:
+            index = self.indexes.get((symbol, field, 'up'))
+            return index.between(prev, new, False, True) if index else []
+        index = self.indexes.get((symbol, field, 'down'))
+        return index.between(new, prev, True, False) if index else []
+
+    def _fire(self, alert, observed, timestamp, extra=None):
+        event = {
+            'alert_id': alert['id'],
+            'symbol': alert['symbol'],
+            'condition': alert['condition'],
+            'message': alert['message'],
+            'observed': observed,
+            'time': timestamp
+        }
+        if extra:
+            event.update(extra)
+        for sink in self.sinks:
+            sink.send(event)
+        if alert['once']:
+            self.remove_alert(alert['id'])
+        return event
+
+    def on_tick(self, symbol, price, timestamp=None, rsi=None, interval=None):
+        """
+        以最新成交價（及可選的RSI）匹配提醒
+
+        Args:
+            symbol (str): 交易對符號
+            price (float): 最新價格
+            timestamp (int): 行情時間（毫秒）
+            rsi (float): 最新RSI
+            interval (str): 行情所屬的時間週期；逐筆成交為None
+
+        Returns:
+            list: 觸發的提醒事件
+        """
+        start = time.perf_counter()
+        timestamp = timestamp if timestamp is not None else int(time.time() * 1000)
+        fired = []
+
+        with self._lock:
+            prev = self.last_values.get((symbol, interval), {})
+            values = {'price': price, 'rsi': rsi}
+
+            for field, new in values.items():
+                if new is None:
+                    continue
+                for alert_id in list(self._match_crossings(symbol, field, prev.get(field), new)):
+                    alert = self.alerts.get(alert_id)
+                    if alert is None:
+                        continue
+                    if alert['condition'] == 'enter_order_block':
+                        # 跳空穿越整個區塊不算進入
+                        if not alert['low'] <= new <= alert['high']:
+                            continue
+                    fired.append(self._fire(alert, new, timestamp))
+
+            self.last_values[(symbol, interval)] = {
+                'price': price,
+                'rsi': rsi if rsi is not None else prev.get('rsi')
+            }
+
+        self.match_latency.append(time.perf_counter() - start)
+        return fired
+
+    def on_bar(self, symbol, df, interval=None):
+        """
+        以最新K線匹配提醒，必要時計算RSI和SMC結構
+
+        Args:
+            symbol (str): 交易對符號
+            df (pandas.DataFrame): OHLCV數據（可包含rsi列）
+            interval (str): K線的時間週期
+
+        Returns:
+            list: 觸發的提醒事件
+        """
+        if df is None or df.empty:
+            return []
+
+        timestamp = time_to_ms(df.index[-1])
+        close = float(df['close'].iloc[-1])
+
+        rsi = None
+        if self.indexes.get((symbol, 'rsi', 'up')) or self.indexes.get((symbol, 'rsi', 'down')):
+            if 'rsi' in df.columns:
+                rsi = float(df['rsi'].iloc[-1])
+            elif self.tech_indicators is not None:
+                rsi = float(self.tech_indicators.rsi(df['close']).iloc[-1])
+
+        prev_price = self.last_values.get((symbol, interval), {}).get('price')
+        fired = self.on_tick(symbol, close, timestamp, rsi, interval)
+
+        smc_ids = self.smc_alerts.get(symbol)
+        if smc_ids and self.smc_analyzer is not None:
+            start = time.perf_counter()
+            fired.extend(self._match_smc(symbol, interval, df, close, prev_price, timestamp, smc_ids))
+            self.match_latency.append(time.perf_counter() - start)
+
+        return fired
+
+    def _match_smc(self, symbol, interval, df, close, prev_price, timestamp, smc_ids):
+        smc_results = self.smc_analyzer.analyze_smc(df)
+        fired = []
+
+        with self._lock:
+            bos_times = [time_to_ms(signal['time']) for signal in smc_results['bos_signals']]
+            latest_bos = max(bos_times) if bos_times else None
+            seen_bos = self.last_bos_time.get((symbol, interval))
+            self.last_bos_time[(symbol, interval)] = latest_bos
+
+            entered = []
+            if prev_price is not None:
+                entered = [ob for ob in smc_results['order_blocks']
+                           if ob['low'] <= close <= ob['high']
+                           and not ob['low'] <= prev_price <= ob['high']]
+
+            for alert_id in list(smc_ids):
+                alert = self.alerts.get(alert_id)
+                if alert is None:
+                    continue
+                if alert['condition'] == 'new_bos':
+                    if latest_bos is not None and seen_bos is not None and latest_bos > seen_bos:
+                        signal = next(s for s in smc_results['bos_signals'] if time_to_ms(s['time']) == latest_bos)
+                        fired.append(self._fire(alert, float(signal['price']), timestamp, {'bos_type': signal['type']}))
+                elif alert['condition'] == 'enter_order_block' and entered:
+                    ob = entered[0]
+                    fired.append(self._fire(alert, close, timestamp, {
+                        'ob_type': ob['type'], 'ob_low': float(ob['low']), 'ob_high': float(ob['high'])
+                    }))
+
+        return fired
+
+    def latency_stats(self):
+        """
+        匹配延遲統計
+
+        Returns:
+            dict: 樣本數及p50/p95/p99/最大延遲（微秒）
+        """
+        samples = np.array(self.match_latency)
+        if len(samples) == 0:
+            return {'count': 0, 'p50_us': 0.0, 'p95_us': 0.0, 'p99_us': 0.0, 'max_us': 0.0}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1e6
+        return {
+            'count': len(samples),
+            'p50_us': float(p50),
+            'p95_us': float(p95),
+            'p99_us': float(p99),
+            'max_us': float(samples.max() * 1e6)
+        }
@@ -0,0 +1,400 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from analysis_cache import BarCloseCache, current_bar_open, INTERVAL_MS
+from kline_stream import StreamHub
+from columnar_codec import (
+    encode_tables, encode_arrow, frame_columns, to_json_columns, index_to_ms,
+    JSON_CONTENT_TYPE, BINARY_CONTENT_TYPE, ARROW_CONTENT_TYPE
+)
+from smc_types import SMCCode, TYPE_NAMES, DESCRIPTIONS, MARKET_BIAS
+from metrics import METRICS
+from indicator_registry import REGISTRY
+
+# 推送連接無事件時發送心跳註釋的間隔秒數（防止代理關閉閒置連接）
+HEARTBEAT_SECONDS = 15
+
+# 交易對代碼：大寫字母和數字（查詢參數會先轉為大寫）
+SYMBOL_PATTERN = re.compile(r'[A-Z0-9]{2,20}')
+
+# 預設指標配置（與Streamlit側邊欄的預設值一致）
+DEFAULT_INDICATORS = {"sma": 20, "rsi": 14}
+
+# 靜態前端文件
+STATIC_FILES = {
+    '/': ('index.html', 'text/html; charset=utf-8'),
+    '/index.html': ('index.html', 'text/html; charset=utf-8'),
+    '/script.js': ('script.js', 'application/javascript; charset=utf-8'),
+    '/style.css': ('style.css', 'text/css; charset=utf-8')
+}
+
+# 指標標籤中的已知路徑；其他路徑（如各種404）統一記為 other，避免時間序列無限增長
+API_ENDPOINTS = {'/api/health', '/metrics', '/api/indicators', '/api/smc', '/api/stream'}
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    406: 'Not Acceptable',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway'
+}
+
+
+class APIError(Exception):
+    """帶HTTP狀態碼的API錯誤"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_indicator_config(query):
+    """
+    從查詢參數解析指標配置，如 ?sma=20&rsi=14&macd=1&bb=20
+
+    Returns:
+        dict: calculate_indicators使用的指標配置
+    """
+    config = {}
+    # 指標登記表中有週期參數的取整數，其餘為開關；沒有輸出列的（如成交量）不屬於計算配置
+    for key, spec in REGISTRY.items():
+        if key not in query or not spec.outputs:
+            continue
+        if spec.param_range is None:
+            if query[key] in ("1", "true"):
+                config[key] = True
+        else:
+            try:
+                period = int(query[key])
+            except ValueError:
+                raise APIError(400, f"參數 {key} 必須為整數")
+            low, high = spec.param_range[:2]
+            if not low <= period <= high:
+                raise APIError(400, f"參數 {key} 必須在 {low} 到 {high} 之間")
+            config[key] = period
+    return config or dict(DEFAULT_INDICATORS)
+
+
+class CachedResult:
+    """快取中的一份計算結果及其各格式的編碼結果"""
+
+    def __init__(self, etag, payload):
+        self.etag = etag
+        self.payload = payload
+        self.bodies = {}
+
+
+class AnalysisAPI:
+    """本地分析HTTP服務：以JSON或列式二進制格式提供技術指標和SMC分析結果"""
+
+    def __init__(self, data_fetcher, tech_indicators, smc_analyzer, cache=None, max_workers=8,
+                 static_dir=None, stream_poll_seconds=5.0):
+        self.data_fetcher = data_fetcher
+        self.tech_indicators = tech_indicators
+        self.smc_analyzer = smc_analyzer
+        self.cache = cache if cache is not None else BarCloseCache(name='api')
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.static_dir = static_dir or os.path.dirname(os.path.abspath(__file__))
+        self._inflight = {}
+        self.streams = StreamHub(self.executor, stream_poll_seconds)
+
+    # ---- 計算 ----
+
+    def _fetch(self, symbol, interval, limit):
+        df = self.data_fetcher.get_kline_data(symbol, interval, limit=limit)
+        if df is None or df.empty:
+            raise APIError(502, f"無法獲取 {symbol} 的K線數據")
+        return df
+
+    def _etag(self, kind, symbol, interval, df, extra=''):
+        last_bar = int(index_to_ms(df.index[-1:])[0])
+        digest = zlib.crc32(extra.encode('utf-8'))
+        return f'W/"{kind}-{symbol}-{interval}-{last_bar}-{digest:08x}"'
+
+    def compute_indicators(self, symbol, interval, limit, config):
+        df = self.tech_indicators.calculate_indicators(self._fetch(symbol, interval, limit), config)
+        etag = self._etag('ind', symbol, interval, df, repr(sorted(config.items())))
+        return CachedResult(etag, df)
+
+    def compute_smc(self, symbol, interval, limit):
+        df = self._fetch(symbol, interval, limit)
+        result = self.smc_analyzer.analyze_smc_compact(df)
+        return CachedResult(self._etag('smc', symbol, interval, df), result)
+
+    async def _get_result(self, key, interval, compute):
+        """從共享快取取結果；未命中時相同鍵的並發請求只計算一次"""
+        bar_time = current_bar_open(interval)
+        cached = self.cache.get(key, bar_time)
+        if cached is not None:
+            return cached
+
+        inflight = self._inflight.get((key, bar_time))
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, compute)
+        self._inflight[(key, bar_time)] = future
+        try:
+            result = await future
+            self.cache.set(key, bar_time, result)
+            return result
+        finally:
+            self._inflight.pop((key, bar_time), None)
+
+    # ---- 編碼 ----
+
+    def encode_indicators(self, result, fmt, symbol, interval):
+        df = result.payload
+        columns = frame_columns(df)
+        meta = {'symbol': symbol, 'interval': interval, 'etag': result.etag}
+        if fmt == 'json':
+            body = {'meta': meta, 'columns': to_json_columns(columns)}
+            return json.dumps(body, ensure_ascii=False).encode('utf-8'), JSON_CONTENT_TYPE
+        if fmt == 'bin':
+            return encode_tables({'klines': columns}, meta), BINARY_CONTENT_TYPE
+        if fmt == 'arrow':
+            try:
+                return encode_arrow(columns), ARROW_CONTENT_TYPE
+            except RuntimeError as e:
+                raise APIError(406, str(e))
+        raise APIError(400, f"不支持的格式: {fmt}")
+
+    def encode_smc(self, result, fmt, symbol, interval):
+        smc = result.payload
+        tables = {
+            'swing_highs': {'time': smc.swing_highs['time'], 'price': smc.swing_highs['price']},
+            'swing_lows': {'time': smc.swing_lows['time'], 'price': smc.swing_lows['price']},
+            'bos': {name: smc.bos[name] for name in smc.bos.dtype.names},
+            'order_blocks': {name: smc.order_blocks[name] for name in smc.order_blocks.dtype.names},
+            'liquidity': {name: smc.liquidity[name] for name in smc.liquidity.dtype.names},
+            'fair_value_gaps': {name: smc.fair_value_gaps[name] for name in smc.fair_value_gaps.dtype.names},
+            'key_levels': {'code': smc.key_levels['code'], 'price': smc.key_levels['price']},
+            'buy_signals': {name: smc.buy_signals[name] for name in smc.buy_signals.dtype.names},
+            'sell_signals': {name: smc.sell_signals[name] for name in smc.sell_signals.dtype.names}
+        }
+        meta = {
+            'symbol': symbol,
+            'interval': interval,
+            'etag': result.etag,
+            'market_bias': MARKET_BIAS[smc.market_bias],
+            # 類型代碼只在此處附帶一次描述文字
+            'codes': {int(code): {'type': TYPE_NAMES[code], 'description': DESCRIPTIONS[code]} for code in SMCCode}
+        }
+        if fmt == 'json':
+            body = {'meta': meta, 'tables': {name: to_json_columns(cols) for name, cols in tables.items()}}
+            return json.dumps(body, ensure_ascii=False).encode('utf-8'), JSON_CONTENT_TYPE
+        if fmt == 'bin':
+            return encode_tables(tables, meta), BINARY_CONTENT_TYPE
+        raise APIError(406 if fmt == 'arrow' else 400, f"SMC結果不支持的格式: {fmt}")
+
+    # ---- 路由 ----
+
+    async def route(self, method, target, headers):
+        """
+        處理一個請求
+
+        Returns:
+            tuple: (狀態碼, 響應頭dict, 響應體bytes)
+        """
+        if method not in ('GET', 'HEAD'):
+            raise APIError(405, "只支持GET請求")
+
+        parts = urlsplit(target)
+        path = parts.path
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+        if path in STATIC_FILES:
+            return self._static(*STATIC_FILES[path])
+        if path == '/api/health':
+            body = {'status': 'ok', 'upstream': self.data_fetcher.fetch_status()}
+            return 200, {'Content-Type': JSON_CONTENT_TYPE}, json.dumps(body).encode('utf-8')
+        if path == '/metrics':
+            return 200, {'Content-Type': 'text/plain; version=0.0.4'}, METRICS.prometheus_text().encode('utf-8')
+        if path not in ('/api/indicators', '/api/smc'):
+            raise APIError(404, f"找不到路徑: {path}")
+
+        symbol, interval, limit = self._series_params(query)
+        fmt = query.get('format', 'json')
+
+        if path == '/api/indicators':
+            config = parse_indicator_config(query)
+            key = ('api_indicators', symbol, interval, limit, tuple(sorted(config.items())))
+            result = await self._get_result(
+                key, interval, lambda: self.compute_indicators(symbol, interval, limit, config))
+            encode = self.encode_indicators
+        else:
+            key = ('api_smc', symbol, interval, limit)
+            result = await self._get_result(
+                key, interval, lambda: self.compute_smc(symbol, interval, limit))
+            encode = self.encode_smc
+
+        if fmt not in result.bodies:
+            result.bodies[fmt] = encode(result, fmt, symbol, interval)
+        body, content_type = result.bodies[fmt]
+
+        # 同一份數據的不同格式是不同的表示，ETag須區分，否則快取了JSON的客戶端請求bin時會得到304
+        etag = f'{result.etag[:-1]}-{fmt}-{content_type}"'
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Content-Type': content_type}
+        if headers.get('if-none-match') == etag:
+            return 304, response_headers, b''
+        return 200, response_headers, body
+
+    def _series_params(self, query):
+        symbol = query.get('symbol', 'BTCUSDT').upper()
+        interval = query.get('interval', '1h')
+        if not SYMBOL_PATTERN.fullmatch(symbol):
+            raise APIError(400, f"無效的交易對: {symbol}")
+        if interval not in INTERVAL_MS:
+            raise APIError(400, f"不支持的時間週期: {interval}")
+        try:
+            limit = int(query.get('limit', 500))
+        except ValueError:
+            raise APIError(400, "參數 limit 必須為整數")
+        if limit < 1:
+            raise APIError(400, "參數 limit 必須大於0")
+        return symbol, interval, min(limit, 1000)
+
+    def _static(self, filename, content_type):
+        with open(os.path.join(self.static_dir, filename), 'rb') as f:
+            return 200, {'Content-Type': content_type}, f.read()
+
+    # ---- 推送 ----
+
+    async def stream(self, target, reader, writer):
+        """
+        以Server-Sent Events推送K線和指標：先發送完整快照，之後只發送新增或改變的K線
+
+        每個事件的data為base64編碼的列式二進制（與 format=bin 相同），參數與 /api/indicators 相同。
+        訂閱成功前的錯誤以APIError拋出，由調用方返回普通的錯誤響應。
+        """
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(target).query).items()}
+        symbol, interval, limit = self._series_params(query)
+        config = parse_indicator_config(query)
+        key = ('stream', symbol, interval, limit, tuple(sorted(config.items())))
+        meta = {'symbol': symbol, 'interval': interval, 'limit': limit}
+        queue = await self.streams.subscribe(
+            key, lambda: frame_columns(self.compute_indicators(symbol, interval, limit, config).payload), meta)
+
+        try:
+            METRICS.inc('http_requests_total', help_text='分析服務請求次數', endpoint='/api/stream', status=200)
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Access-Control-Allow-Origin: *\r\n"
+                         b"Connection: close\r\n\r\n")
+            # 客戶端在推送連接上不再發送數據，讀到EOF即表示已斷開
+            closed = asyncio.ensure_future(reader.read(1))
+            while True:
+                pending = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({pending, closed}, timeout=HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    pending.cancel()
+                    break
+                if pending in done:
+                    event = pending.result()
+                else:
+                    pending.cancel()
+                    event = b': ping\n\n'
+                writer.write(event)
+                await writer.drain()
+            closed.cancel()
+        finally:
+            self.streams.unsubscribe(key, queue)
+
+    # ---- HTTP ----
+
+    async def handle_connection(self, reader, writer):
+        """處理一個連接（支持HTTP/1.1 keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                start = time.perf_counter()
+                endpoint = urlsplit(target).path
+                try:
+                    if endpoint == '/api/stream' and method == 'GET':
+                        # 推送連接在客戶端斷開前不返回，之後不再複用
+                        await self.stream(target, reader, writer)
+                        break
+                    status, response_headers, body = await self.route(method, target, headers)
+                except APIError as e:
+                    status, response_headers = e.status, {'Content-Type': JSON_CONTENT_TYPE}
+                    body = json.dumps({'error': e.message}, ensure_ascii=False).encode('utf-8')
+                except Exception as e:
+                    status, response_headers = 500, {'Content-Type': JSON_CONTENT_TYPE}
+                    body = json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+
+                METRICS.observe('stage_duration_seconds', time.perf_counter() - start, stage='http_request')
+                label = endpoint if endpoint in API_ENDPOINTS or endpoint in STATIC_FILES else 'other'
+                METRICS.inc('http_requests_total', help_text='分析服務請求次數', endpoint=label, status=status)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                response_headers['Content-Length'] = str(len(body))
+                response_headers['Access-Control-Allow-Origin'] = '*'
+                response_headers['Access-Control-Expose-Headers'] = 'ETag'
+                response_headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+
+                head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                head += ''.join(f"{k}: {v}\r\n" for k, v in response_headers.items()) + "\r\n"
+                writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8502):
+        """啟動服務並持續運行"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    from data_fetcher import CryptoDataFetcher
+    from technical_indicators import TechnicalIndicators
+    from smc_analysis import SMCAnalysis
+
+    parser = argparse.ArgumentParser(description="虛擬貨幣技術分析HTTP服務")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--stream-poll', type=float, default=5.0, help='推送頻道重新計算的間隔秒數')
+    args = parser.parse_args()
+
+    api = AnalysisAPI(CryptoDataFetcher(), TechnicalIndicators(), SMCAnalysis(),
+                      stream_poll_seconds=args.stream_poll)
+    print(f"分析服務已啟動: http://{args.host}:{args.port}/")
+    asyncio.run(api.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
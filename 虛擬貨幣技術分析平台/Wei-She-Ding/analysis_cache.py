@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from metrics import METRICS
+
+# 各時間週期對應的毫秒數
+INTERVAL_MS = {
+    "1m": 60 * 1000,
+    "5m": 5 * 60 * 1000,
+    "15m": 15 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "4h": 4 * 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000
+}
+
+
+def current_bar_open(interval, now_ms=None):
+    """
+    計算當前（尚未收盤）K線的開盤時間
+
+    同一根K線收盤前，此值保持不變，可作為「每根K線收盤刷新一次」的快取鍵。
+
+    Args:
+        interval (str): 時間間隔，如 '1h'
+        now_ms (int): 當前時間（毫秒），預設取系統時間
+
+    Returns:
+        int: 當前K線的開盤時間（毫秒）
+    """
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    step = INTERVAL_MS.get(interval, INTERVAL_MS["1h"])
+    return now_ms - now_ms % step
+
+
+class BarCloseCache:
+    """以K線收盤為失效邊界的分析結果快取（線程安全）"""
+
+    def __init__(self, max_entries=1024, name='analysis'):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, bar_time):
+        """
+        讀取快取
+
+        Args:
+            key: 快取鍵，如 (symbol, interval, ...)
+            bar_time (int): 計算結果所對應的K線時間
+
+        Returns:
+            快取值；若不存在或已跨越新的K線則返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != bar_time:
+                self.misses += 1
+                METRICS.inc('cache_requests_total', help_text='快取查詢次數', cache=self.name, result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            METRICS.inc('cache_requests_total', help_text='快取查詢次數', cache=self.name, result='hit')
+            return entry[1]
+
+    def set(self, key, bar_time, value):
+        """寫入快取，超過容量時淘汰最久未使用的條目"""
+        with self._lock:
+            self._entries[key] = (bar_time, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, bar_time, compute):
+        """
+        讀取快取，未命中時調用compute()計算並寫入
+
+        Args:
+            key: 快取鍵
+            bar_time (int): K線時間
+            compute (callable): 無參數的計算函數
+
+        Returns:
+            快取或新計算的結果
+        """
+        value = self.get(key, bar_time)
+        if value is None:
+            value = compute()
+            self.set(key, bar_time, value)
+        return value
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._entries.clear()
@@ -1,12 +1,26 @@
 import streamlit as st
+import os
 import pandas as pd
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
 import time
 from data_fetcher import CryptoDataFetcher
 from technical_indicators import TechnicalIndicators
 from chart_renderer import ChartRenderer
 from smc_analysis import SMCAnalysis
+from market_screener import MarketScreener
+from correlation_service import CorrelationService
+from alert_engine import AlertEngine, QueueSink
+from compact_frames import memory_usage
+from metrics import METRICS, span
+from profiling import PROFILER
+from notifier import StreamlitNotifier
+from depth_store import DepthStore, DepthRecorder
+from trade_aggregator import TradeAggregator
+from pattern_search import HistoryStore, PatternSearch
+from candle_patterns import pattern_names
+from indicator_registry import REGISTRY, kernel_specs
+from market_simulator import MarketSimulator
+from paper_trading import PaperTradingEngine, PaperTradingFeed, STATE_FILE, STOP
+from kline_integrity import KlineIntegrity
 
 # 設置頁面配置
 st.set_page_config(
@@ -16,10 +30,20 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 數據來源：FANIC_API_BASE 指向Binance兼容的API（如 market_simulator.py 啟動的本地模擬交易所）；
+# FANIC_MOCK_MARKET=live 時模擬數據改由連續推進的模擬交易所提供，FANIC_SIM_SPEED 為其加速倍數
+API_BASE_URL = os.environ.get("FANIC_API_BASE")
+MOCK_MARKET = os.environ.get("FANIC_MOCK_MARKET", "random")
+SIM_SPEED = float(os.environ.get("FANIC_SIM_SPEED", "1"))
+# 自動刷新間隔（秒），設為0時關閉（load_harness.py 以無頭會話壓測時使用）
+REFRESH_SECONDS = int(os.environ.get("FANIC_REFRESH_SECONDS", "600"))
+
 # 初始化組件
 @st.cache_resource
 def init_components():
-    data_fetcher = CryptoDataFetcher()
+    mock_generator = MarketSimulator(speed=SIM_SPEED) if MOCK_MARKET == "live" else None
+    data_fetcher = CryptoDataFetcher(notifier=StreamlitNotifier(), mock_generator=mock_generator,
+                                     base_url=API_BASE_URL)
     tech_indicators = TechnicalIndicators()
     chart_renderer = ChartRenderer()
     smc_analyzer = SMCAnalysis()
@@ -27,6 +51,78 @@ def init_components():
 
 data_fetcher, tech_indicators, chart_renderer, smc_analyzer = init_components()
 
+@st.cache_resource
+def init_screener():
+    return MarketScreener(data_fetcher)
+
+market_screener = init_screener()
+
+@st.cache_resource
+def init_alert_engine():
+    alert_sink = QueueSink()
+    return AlertEngine([alert_sink], tech_indicators, smc_analyzer), alert_sink
+
+alert_engine, alert_sink = init_alert_engine()
+
+@st.cache_resource
+def init_correlation_service(interval):
+    service = CorrelationService(data_fetcher, interval=interval, windows=(30, 100))
+    service.load(list(CRYPTOCURRENCIES.keys()))
+    return service
+
+@st.cache_resource
+def init_trade_aggregator():
+    return TradeAggregator(data_fetcher)
+
+trade_aggregator = init_trade_aggregator()
+
+@st.cache_resource
+def init_kline_integrity():
+    return KlineIntegrity(data_fetcher)
+
+kline_integrity = init_kline_integrity()
+
+# 收盤價歷史庫所在目錄（歷史相似形態搜索使用）
+HISTORY_DATA_DIR = os.environ.get("FANIC_HISTORY_DIR", "history_data")
+
+@st.cache_resource
+def init_pattern_search():
+    return PatternSearch(data_fetcher, HistoryStore(HISTORY_DATA_DIR), integrity=kline_integrity)
+
+pattern_search = init_pattern_search()
+
+# 訂單簿快照庫所在目錄（每個交易對一個子目錄）
+DEPTH_DATA_DIR = os.environ.get("FANIC_DEPTH_DIR", "depth_data")
+
+@st.cache_resource
+def init_depth_recorder(symbol):
+    store = DepthStore.around(os.path.join(DEPTH_DATA_DIR, symbol), data_fetcher.get_current_price(symbol))
+    recorder = DepthRecorder(data_fetcher, store, symbol, interval_seconds=30)
+    recorder.capture()
+    return recorder.start()
+
+# 模擬交易帳戶狀態所在目錄
+PAPER_DATA_DIR = os.environ.get("FANIC_PAPER_DIR", "paper_trading")
+
+@st.cache_resource
+def init_paper_trading():
+    if os.path.exists(os.path.join(PAPER_DATA_DIR, STATE_FILE)):
+        return PaperTradingEngine.load(PAPER_DATA_DIR)
+    engine = PaperTradingEngine()
+    # 帳戶0跟隨所查看交易對和週期的全部交易建議（SMC、RSI、MACD），每次開倉使用一半權益
+    engine.add_accounts(1, cash=10000.0, fraction=0.5)
+    return engine
+
+paper_trading = init_paper_trading()
+
+@st.cache_resource
+def init_paper_feed(symbol, interval):
+    # 每個 (交易對, 時間週期) 一個背景線程推進模擬交易，頁面重跑時不再撮合和保存
+    feed = PaperTradingFeed(paper_trading, data_fetcher, tech_indicators, smc_analyzer, symbol, interval,
+                            state_dir=PAPER_DATA_DIR)
+    feed.poll()
+    return feed.start()
+
 # 主要虛擬貨幣列表
 CRYPTOCURRENCIES = {
     "BTCUSDT": "比特幣 (BTC)",
@@ -51,17 +147,175 @@ TIMEFRAMES = {
     "1d": "1天"
 }
 
-# 技術指標選項
-INDICATORS = {
-    "sma": "簡單移動平均線 (SMA)",
-    "ema": "指數移動平均線 (EMA)",
-    "rsi": "相對強弱指標 (RSI)",
-    "macd": "MACD",
-    "bb": "布林通道 (Bollinger Bands)",
-    "volume": "成交量"
+# 技術指標選項（來自指標登記表）
+INDICATORS = {key: spec.label for key, spec in REGISTRY.items()}
+
+# 價格提醒條件
+ALERT_CONDITIONS = AlertEngine.CONDITIONS
+
+# 頁面選項
+PAGES = {
+    "chart": "📊 單一幣種分析",
+    "screener": "🔍 市場掃描",
+    "correlation": "🔗 相關性"
+}
+
+# 相關性滾動窗口選項
+CORRELATION_WINDOWS = {
+    30: "30根K線",
+    100: "100根K線"
+}
+
+# 掃描結果欄位名稱
+SCREENER_COLUMNS = {
+    "symbol": "交易對",
+    "price": "價格",
+    "change_pct": "漲跌幅 (%)",
+    "rsi": "RSI",
+    "macd_cross": "MACD",
+    "bb_bandwidth": "布林帶寬",
+    "bb_squeeze": "布林擠壓",
+    "smc_bias": "SMC偏向"
 }
 
+MACD_CROSS_LABELS = {
+    "golden_cross": "🟢 黃金交叉",
+    "death_cross": "🔴 死亡交叉",
+    "bullish": "🟢 多頭",
+    "bearish": "🔴 空頭"
+}
+
+SMC_BIAS_LABELS = {
+    "bullish": "🟢 看漲",
+    "bearish": "🔴 看跌",
+    "neutral": "🟡 中性"
+}
+
+KEY_LEVEL_LABELS = {
+    "support": "支撐",
+    "resistance": "阻力",
+    "bid_wall": "支撐（買單牆）",
+    "ask_wall": "阻力（賣單牆）",
+    "equal_highs": "阻力（等高點）",
+    "equal_lows": "支撐（等低點）"
+}
+
+def render_screener():
+    """市場掃描頁面：一次掃描所有交易對並以可排序表格顯示"""
+    with st.sidebar:
+        selected_timeframe = st.selectbox(
+            "選擇時間週期",
+            options=list(TIMEFRAMES.keys()),
+            format_func=lambda x: TIMEFRAMES[x],
+            index=3  # 預設1小時
+        )
+        extra_symbols = st.text_area("額外交易對（以逗號分隔）", value="")
+        squeeze_only = st.checkbox("只顯示布林擠壓")
+    
+    symbols = list(CRYPTOCURRENCIES.keys())
+    for symbol in extra_symbols.split(","):
+        symbol = symbol.strip().upper()
+        if symbol and symbol not in symbols:
+            symbols.append(symbol)
+    
+    st.subheader(f"市場掃描 - {TIMEFRAMES[selected_timeframe]}")
+    
+    with st.spinner("正在掃描市場..."):
+        start = time.perf_counter()
+        results = market_screener.scan(symbols, selected_timeframe)
+        elapsed = time.perf_counter() - start
+    
+    if results.empty:
+        st.error("無法獲取數據，請檢查網絡連接或稍後再試")
+        return
+    
+    table = results.copy()
+    if squeeze_only:
+        table = table[table["bb_squeeze"]]
+    table["symbol"] = table["symbol"].map(lambda x: CRYPTOCURRENCIES.get(x, x))
+    table["macd_cross"] = table["macd_cross"].map(MACD_CROSS_LABELS)
+    table["smc_bias"] = table["smc_bias"].map(SMC_BIAS_LABELS)
+    table = table.rename(columns=SCREENER_COLUMNS)
+    
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    st.caption(f"共 {len(results)} 個交易對，耗時 {elapsed * 1000:.0f} 毫秒（每根K線收盤後重新計算）")
+
+def render_correlation():
+    """相關性頁面：由相關性服務提供矩陣，僅增量刷新最新K線"""
+    with st.sidebar:
+        selected_timeframe = st.selectbox(
+            "選擇時間週期",
+            options=list(TIMEFRAMES.keys()),
+            format_func=lambda x: TIMEFRAMES[x],
+            index=3  # 預設1小時
+        )
+        window = st.selectbox(
+            "滾動窗口",
+            options=list(CORRELATION_WINDOWS.keys()),
+            format_func=lambda x: CORRELATION_WINDOWS[x]
+        )
+    
+    st.subheader(f"對數收益率相關性 - {TIMEFRAMES[selected_timeframe]}")
+    
+    service = init_correlation_service(selected_timeframe)
+    service.refresh()
+    matrix = service.correlation_matrix(window)
+    
+    if matrix.empty:
+        st.error("無法獲取數據，請檢查網絡連接或稍後再試")
+        return
+    
+    matrix = matrix.rename(index=CRYPTOCURRENCIES, columns=CRYPTOCURRENCIES)
+    fig = chart_renderer.create_heatmap(matrix, title=f"相關性熱力圖（{CORRELATION_WINDOWS[window]}）", precomputed=True)
+    st.plotly_chart(fig, use_container_width=True)
+
+def finish_render(show_debug, render_start, profiling):
+    """結束本次渲染的計時與採樣，並在側邊欄顯示各階段耗時"""
+    PROFILER.end(profiling)
+    stages = METRICS.end_trace()
+    total = time.perf_counter() - render_start
+    METRICS.observe('stage_duration_seconds', total, stage='render_total')
+    METRICS.write_prometheus()
+    
+    if not show_debug:
+        return
+    
+    with st.sidebar:
+        st.subheader("🐞 性能面板")
+        if stages:
+            timings = pd.DataFrame(stages, columns=["階段", "耗時 (毫秒)"])
+            timings["耗時 (毫秒)"] = timings["耗時 (毫秒)"] * 1000
+            timings = timings.groupby("階段", sort=False).agg(["sum", "count"])
+            timings.columns = ["耗時 (毫秒)", "次數"]
+            st.dataframe(timings.round(2), use_container_width=True)
+        st.write(f"**本次渲染總耗時:** {total * 1000:.0f} 毫秒")
+        hits = METRICS.counter_value('cache_requests_total', cache='screener', result='hit')
+        misses = METRICS.counter_value('cache_requests_total', cache='screener', result='miss')
+        st.write(f"**掃描快取命中:** {hits} / {hits + misses}")
+        st.write(f"**回退模擬數據次數:** {METRICS.counter_value('mock_fallback_total', endpoint='klines')}")
+        
+        fetch_status = data_fetcher.fetch_status()
+        if fetch_status:
+            st.write("**API端點狀態**")
+            st.dataframe(pd.DataFrame(fetch_status).T.round(1), use_container_width=True)
+        
+        integrity = kline_integrity.report_frame()
+        if not integrity.empty:
+            st.write("**K線數據完整性**")
+            st.dataframe(integrity, use_container_width=True, hide_index=True)
+        
+        if PROFILER.samples:
+            st.write(f"**採樣熱點**（累計 {PROFILER.samples} 個樣本，輸出至 `{PROFILER.output_path}`）")
+            hotspots = pd.DataFrame(PROFILER.top_functions(), columns=["函數", "樣本數", "佔比"])
+            hotspots["佔比"] = (hotspots["佔比"] * 100).round(1)
+            st.dataframe(hotspots, use_container_width=True, hide_index=True)
+
 def main():
+    render_start = time.perf_counter()
+    METRICS.start_trace()
+    # 環境變量 FANIC_PROFILE 全局開啟採樣，或在網址加上 ?profile=1 只採樣本次渲染
+    profiling = PROFILER.begin('main', force=st.query_params.get("profile") == "1")
+    
     # 主標題
     st.title("📈 虛擬貨幣技術分析平台")
     st.markdown("---")
@@ -70,6 +324,26 @@ def main():
     with st.sidebar:
         st.header("⚙️ 設置")
         
+        # 頁面選擇
+        page = st.radio(
+            "頁面",
+            options=list(PAGES.keys()),
+            format_func=lambda x: PAGES[x],
+            horizontal=True
+        )
+        show_debug = st.checkbox("🐞 顯示性能面板")
+    
+    if page == "screener":
+        render_screener()
+        finish_render(show_debug, render_start, profiling)
+        return
+    
+    if page == "correlation":
+        render_correlation()
+        finish_render(show_debug, render_start, profiling)
+        return
+    
+    with st.sidebar:
         # 幣種選擇
         selected_symbol = st.selectbox(
             "選擇虛擬貨幣",
@@ -117,19 +391,75 @@ def main():
             bb_period = st.slider("布林通道週期", 10, 50, 20, key="bb")
             selected_indicators["bb"] = bb_period
             
+        # 分位數通道與收盤價百分位排名
+        if st.checkbox("分位數通道 (Quantile Bands)"):
+            qband_period = st.slider("分位數通道週期", 10, 200, 50, key="qbands")
+            selected_indicators["qbands"] = qband_period
+            selected_indicators["pct_rank"] = qband_period
+            
+        # 以核函數登記的指標：開關及週期滑桿由登記表生成
+        for spec in kernel_specs():
+            if st.checkbox(spec.label, key=f"show_{spec.key}"):
+                if spec.param_range is None:
+                    selected_indicators[spec.key] = True
+                else:
+                    low, high, default = spec.param_range
+                    selected_indicators[spec.key] = st.slider(f"{spec.label}週期", low, high, default, key=spec.key)
+            
         # 成交量
         show_volume = st.checkbox("成交量", value=True)
         if show_volume:
             selected_indicators["volume"] = True
             
+        # K線形態
+        if st.checkbox("K線形態標記"):
+            selected_indicators["candles"] = True
+        
         # SMC分析
         show_smc = st.checkbox("SMC 智能資金概念分析")
         if show_smc:
             selected_indicators["smc"] = True
+        
+        # 成交量分佈
+        if st.checkbox("成交量分佈 (Volume Profile)"):
+            selected_indicators["profile"] = True
+        
+        # 訂單簿深度
+        if st.checkbox("訂單簿深度熱力圖"):
+            selected_indicators["depth"] = True
+        
+        # 歷史相似形態
+        if st.checkbox("歷史相似形態"):
+            pattern_length = st.slider("形態長度（K線數）", 20, 200, 40, key="pattern_length")
+            pattern_horizon = st.slider("觀察後續K線數", 5, 100, 20, key="pattern_horizon")
+            selected_indicators["patterns"] = (pattern_length, pattern_horizon)
+            
+        # 價格提醒
+        with st.expander("🔔 價格提醒"):
+            alert_condition = st.selectbox(
+                "提醒條件",
+                options=list(ALERT_CONDITIONS.keys()),
+                format_func=lambda x: ALERT_CONDITIONS[x]
+            )
+            alert_value = None
+            if alert_condition.startswith(("price_", "rsi_")):
+                alert_value = st.number_input("觸發水平", value=70.0 if alert_condition.startswith("rsi_") else 0.0)
+            if st.button("新增提醒"):
+                alert_engine.add_alert(selected_symbol, alert_condition, value=alert_value)
             
-        # 自動刷新設置（固定10分鐘）
-        auto_refresh = True
-        refresh_interval = 600  # 10分鐘 = 600秒
+            for alert in list(alert_engine.alerts.values()):
+                if alert['symbol'] != selected_symbol:
+                    continue
+                level = f" {alert['value']:.2f}" if alert['value'] is not None else ""
+                if st.button(f"✖ {alert['message']}{level}", key=f"alert_{alert['id']}"):
+                    alert_engine.remove_alert(alert['id'])
+        
+        # 精簡記憶體模式
+        compact_mode = st.checkbox("精簡記憶體模式 (float32)")
+        
+        # 自動刷新設置（預設10分鐘）
+        auto_refresh = REFRESH_SECONDS > 0
+        refresh_interval = REFRESH_SECONDS
     
     # 主要內容區域
     col1, col2 = st.columns([3, 1])
@@ -162,28 +492,80 @@ def main():
     try:
         # 獲取歷史數據
         with st.spinner("正在加載數據..."):
-            df = data_fetcher.get_kline_data(selected_symbol, selected_timeframe, limit=500)
+            df = data_fetcher.get_kline_data(selected_symbol, selected_timeframe, limit=500, compact=compact_mode)
             
         if df is not None and not df.empty:
+            # 缺失或重複的K線會使滾動指標和SMC擺動點窗口錯位：補取缺口，無法補取的以前一收盤價填充
+            df = kline_integrity.repair(selected_symbol, selected_timeframe, df)
+            report = df.attrs.get('integrity')
+            if report:
+                st.caption(f"🧩 數據完整性：去除重複 {report['duplicates']} 根，補取 {report['refetched']} 根，"
+                           f"填充 {report['filled']} 根")
+            
+            # API暫時不可用時返回的是最後一次成功獲取的數據
+            if df.attrs.get('stale'):
+                age_minutes = (time.time() - df.attrs['fetched_at']) / 60
+                st.warning(f"⚠️ 數據源暫時不可用，正在顯示 {age_minutes:.0f} 分鐘前的快取數據")
+            
             # 計算技術指標
             df_with_indicators = tech_indicators.calculate_indicators(df, selected_indicators)
             
+            # 匹配價格提醒
+            alert_engine.on_bar(selected_symbol, df_with_indicators, selected_timeframe)
+            for event in alert_sink.drain():
+                st.toast(f"🔔 {CRYPTOCURRENCIES.get(event['symbol'], event['symbol'])}: {event['message']} ({event['observed']:.2f})")
+            
+            # 訂單簿深度：掛單牆併入SMC流動性區域，並降採樣為熱力圖
+            depth_levels = None
+            depth_heatmap = None
+            if "depth" in selected_indicators:
+                depth_store = init_depth_recorder(selected_symbol).store
+                depth_levels = depth_store.resting_liquidity(float(df_with_indicators['close'].iloc[-1]))
+                depth_heatmap = depth_store.heatmap(
+                    df_with_indicators.index,
+                    price_low=float(df_with_indicators['low'].min()),
+                    price_high=float(df_with_indicators['high'].max())
+                )
+            
+            # 逐筆成交聚合：成交量分佈、買賣量差及時段VWAP
+            trade_summary = None
+            if "profile" in selected_indicators:
+                trade_summary = trade_aggregator.summary(selected_symbol, selected_timeframe, df_with_indicators)
+            
+            # 歷史相似形態：在全部交易對的歷史中搜索與最近走勢最相似的片段
+            pattern_matches = None
+            if "patterns" in selected_indicators:
+                pattern_length, pattern_horizon = selected_indicators["patterns"]
+                pattern_search.store.append(selected_symbol, selected_timeframe, df)
+                pattern_matches = pattern_search.similar(
+                    selected_symbol, selected_timeframe, df_with_indicators, list(CRYPTOCURRENCIES.keys()),
+                    length=pattern_length, horizon=pattern_horizon
+                )
+            
             # SMC分析
             smc_results = None
             if "smc" in selected_indicators:
-                smc_results = smc_analyzer.analyze_smc(df_with_indicators)
+                smc_results = smc_analyzer.analyze_smc(df_with_indicators, depth_levels)
+            
+            # 模擬交易：由背景線程按K線流撮合掛單並跟隨交易建議開倉或反手，這裡只確保其已啟動
+            with span('paper_trading'):
+                init_paper_feed(selected_symbol, selected_timeframe)
             
             # 渲染圖表
             fig = chart_renderer.create_candlestick_chart(
                 df_with_indicators, 
                 selected_symbol, 
                 selected_indicators,
-                smc_results
+                smc_results,
+                depth_heatmap,
+                trade_summary,
+                pattern_matches
             )
             
             # 顯示圖表
             with chart_container.container():
-                st.plotly_chart(fig, use_container_width=True, height=600)
+                with span('render_chart'):
+                    st.plotly_chart(fig, use_container_width=True, height=600)
             
             # 顯示市場信息
             with info_container.container():
@@ -210,6 +592,9 @@ def main():
                     daily_low = df_with_indicators.tail(24)['low'].min()
                     st.write(f"**24h最高:** ${daily_high:.2f}")
                     st.write(f"**24h最低:** ${daily_low:.2f}")
+                
+                usage = memory_usage(df_with_indicators)
+                st.write(f"**記憶體佔用:** {usage['total_bytes'] / 1024:.1f} KB（{usage['bytes_per_bar']:.0f} B/K線）")
             
             # 顯示技術指標數值
             with indicators_container.container():
@@ -240,6 +625,16 @@ def main():
                     st.write(f"**布林上軌:** ${bb_upper:.2f}")
                     st.write(f"**布林下軌:** ${bb_lower:.2f}")
                     
+                if "qbands" in selected_indicators:
+                    st.write(f"**滾動中位數:** ${latest_data.get('qband_middle', 0):.2f}")
+                    pct_rank = latest_data.get(f'pct_rank_{selected_indicators["pct_rank"]}', 0)
+                    st.write(f"**收盤價百分位:** {pct_rank * 100:.0f}%")
+                    
+                for spec in kernel_specs():
+                    if spec.key in selected_indicators:
+                        for column, name, _, _ in spec.traces(selected_indicators[spec.key]):
+                            st.write(f"**{name}:** {latest_data.get(column, float('nan')):.2f}")
+                    
             # 顯示交易信號和買賣點
             with signals_container.container():
                 if smc_results:
@@ -269,9 +664,14 @@ def main():
                     if trading_signals['key_levels']:
                         st.write("**🎯 關鍵價格水平:**")
                         for level in trading_signals['key_levels'][:5]:  # 只顯示前5個
-                            level_type = "支撐" if level['type'] == 'support' else "阻力"
+                            level_type = KEY_LEVEL_LABELS.get(level['type'], "阻力")
                             st.write(f"• {level_type}: ${level['price']:.2f}")
                 
+                # 最新K線的形態
+                if "candles" in selected_indicators:
+                    names = pattern_names(latest_data.get('candle_patterns', 0))
+                    st.write(f"**K線形態:** {'、'.join(names) if names else '無'}")
+                
                 # 傳統技術指標的買賣建議
                 if "rsi" in selected_indicators:
                     rsi_value = latest_data.get('rsi', 50)
@@ -289,7 +689,29 @@ def main():
                         st.write("**MACD建議:** 🟢 黃金交叉，看漲信號")
                     else:
                         st.write("**MACD建議:** 🔴 死亡交叉，看跌信號")
-        
+
+                # 模擬帳戶的實時持倉和盈虧
+                account = paper_trading.account_summary(0)
+                st.write("**🧪 模擬帳戶:**")
+                st.write(f"權益 ${account['equity']:,.2f}（已實現 {account['realized'] - account['fees']:+,.2f}，"
+                         f"未實現 {account['unrealized']:+,.2f}）")
+                position = account['positions'].get(selected_symbol)
+                if position:
+                    direction = "多" if position['qty'] > 0 else "空"
+                    st.write(f"持倉: {direction} {abs(position['qty']):.4f} @ ${position['avg_price']:.2f}")
+                for order in account['orders']:
+                    if order['symbol'] == selected_symbol:
+                        label = "止損" if order["kind"] == STOP else "止盈"
+                        st.write(f"{label}: ${order['level']:.2f}")
+
+                # 歷史相似形態的後續走勢統計
+                if pattern_matches and pattern_matches['matches']:
+                    st.write(f"**📐 歷史相似形態（其後{pattern_matches['horizon']}根K線）:**")
+                    st.write(f"上漲比例 {pattern_matches['up_ratio']:.0%}，中位數漲跌 {pattern_matches['median_return']:+.2%}")
+                    for match in pattern_matches['matches']:
+                        st.write(f"• {CRYPTOCURRENCIES.get(match['symbol'], match['symbol'])} "
+                                 f"{match['start']:%Y-%m-%d %H:%M}：{match['forward_return']:+.2%}")
+
         else:
             st.error("無法獲取數據，請檢查網絡連接或稍後再試")
             
@@ -297,6 +719,8 @@ def main():
         st.error(f"發生錯誤: {str(e)}")
         st.write("請檢查網絡連接或稍後再試")
     
+    finish_render(show_debug, render_start, profiling)
+    
     # 自動刷新功能
     if auto_refresh:
         time.sleep(refresh_interval)
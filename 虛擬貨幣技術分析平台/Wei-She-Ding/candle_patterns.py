@@ -0,0 +1,135 @@
+from enum import IntFlag
+import numpy as np
+
+
+class CandlePattern(IntFlag):
+    """K線形態位元：每根K線的形態以一個uint16位元組合表示"""
+    BULLISH_ENGULFING = 1 << 0
+    BEARISH_ENGULFING = 1 << 1
+    HAMMER = 1 << 2
+    SHOOTING_STAR = 1 << 3
+    DOJI = 1 << 4
+    INSIDE_BAR = 1 << 5
+    OUTSIDE_BAR = 1 << 6
+    THREE_WHITE_SOLDIERS = 1 << 7
+    THREE_BLACK_CROWS = 1 << 8
+
+
+PATTERN_LABELS = {
+    CandlePattern.BULLISH_ENGULFING: '看漲吞沒',
+    CandlePattern.BEARISH_ENGULFING: '看跌吞沒',
+    CandlePattern.HAMMER: '錘子線',
+    CandlePattern.SHOOTING_STAR: '射擊之星',
+    CandlePattern.DOJI: '十字星',
+    CandlePattern.INSIDE_BAR: '內包線',
+    CandlePattern.OUTSIDE_BAR: '外包線',
+    CandlePattern.THREE_WHITE_SOLDIERS: '紅三兵',
+    CandlePattern.THREE_BLACK_CROWS: '三隻烏鴉'
+}
+
+# 看漲/看跌形態的位元組合；十字星、內包線和外包線不帶方向
+BULLISH_MASK = CandlePattern.BULLISH_ENGULFING | CandlePattern.HAMMER | CandlePattern.THREE_WHITE_SOLDIERS
+BEARISH_MASK = CandlePattern.BEARISH_ENGULFING | CandlePattern.SHOOTING_STAR | CandlePattern.THREE_BLACK_CROWS
+
+PATTERN_DTYPE = np.uint16
+
+
+def _prev(values, periods=1):
+    """向後平移periods根K線，開頭以NaN填充（與NaN比較恆為False，開頭的K線不會被誤判）"""
+    shifted = np.empty_like(values)
+    shifted[:periods] = np.nan
+    shifted[periods:] = values[:-periods]
+    return shifted
+
+
+def _prev_mask(mask, periods=1):
+    """布林掩碼向後平移，開頭以False填充"""
+    shifted = np.zeros_like(mask)
+    shifted[periods:] = mask[:len(mask) - periods]
+    return shifted
+
+
+def detect_patterns(open_, high, low, close, doji_ratio=0.1, shadow_ratio=2.0, trend_bars=3):
+    """
+    一次性以布林掩碼識別所有K線形態
+
+    Args:
+        open_ (ndarray): 開盤價
+        high (ndarray): 最高價
+        low (ndarray): 最低價
+        close (ndarray): 收盤價
+        doji_ratio (float): 實體不超過全長此比例時視為十字星
+        shadow_ratio (float): 錘子線/射擊之星的長影線至少為實體的倍數
+        trend_bars (int): 判斷錘子線（之前下跌）和射擊之星（之前上漲）的回看K線數
+
+    Returns:
+        ndarray: uint16 形態位元數組，與輸入等長
+    """
+    o = np.asarray(open_, dtype=np.float64)
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    n = len(c)
+    patterns = np.zeros(n, dtype=PATTERN_DTYPE)
+    if n == 0:
+        return patterns
+
+    body = np.abs(c - o)
+    full = h - l
+    upper = h - np.maximum(o, c)
+    lower = np.minimum(o, c) - l
+    rising = c > o
+    falling = c < o
+
+    o1, c1, h1, l1 = _prev(o), _prev(c), _prev(h), _prev(l)
+    body1 = np.abs(c1 - o1)
+    rising1, falling1 = c1 > o1, c1 < o1
+
+    # 吞沒：本根實體完全覆蓋前一根方向相反的實體
+    bullish_engulfing = rising & falling1 & (o <= c1) & (c >= o1) & (body > body1)
+    bearish_engulfing = falling & rising1 & (o >= c1) & (c <= o1) & (body > body1)
+
+    # 錘子線/射擊之星：小實體、一側長影線、另一側幾乎沒有影線，且出現在相應的趨勢之後
+    small_body = body <= full * 0.35
+    prior = _prev(c, trend_bars)
+    hammer = small_body & (lower >= shadow_ratio * body) & (upper <= body + full * 0.1) & (c1 < prior)
+    shooting_star = small_body & (upper >= shadow_ratio * body) & (lower <= body + full * 0.1) & (c1 > prior)
+
+    doji = (full > 0) & (body <= full * doji_ratio)
+    inside_bar = (h < h1) & (l > l1)
+    outside_bar = (h > h1) & (l < l1)
+
+    # 三兵/三烏鴉：連續三根同向K線，收盤逐根推進，開盤落在前一根實體內，收盤接近極值
+    o2, c2 = _prev(o, 2), _prev(c, 2)
+    strong_up = rising & (upper <= body * 0.3)
+    strong_down = falling & (lower <= body * 0.3)
+    soldiers = (strong_up & _prev_mask(strong_up) & _prev_mask(strong_up, 2)
+                & (c > c1) & (c1 > c2) & (o > o1) & (o <= c1) & (o1 > o2) & (o1 <= c2))
+    crows = (strong_down & _prev_mask(strong_down) & _prev_mask(strong_down, 2)
+             & (c < c1) & (c1 < c2) & (o < o1) & (o >= c1) & (o1 < o2) & (o1 >= c2))
+
+    for flag, mask in ((CandlePattern.BULLISH_ENGULFING, bullish_engulfing),
+                       (CandlePattern.BEARISH_ENGULFING, bearish_engulfing),
+                       (CandlePattern.HAMMER, hammer),
+                       (CandlePattern.SHOOTING_STAR, shooting_star),
+                       (CandlePattern.DOJI, doji),
+                       (CandlePattern.INSIDE_BAR, inside_bar),
+                       (CandlePattern.OUTSIDE_BAR, outside_bar),
+                       (CandlePattern.THREE_WHITE_SOLDIERS, soldiers),
+                       (CandlePattern.THREE_BLACK_CROWS, crows)):
+        patterns |= mask.astype(PATTERN_DTYPE) * PATTERN_DTYPE(flag)
+    return patterns
+
+
+def pattern_names(bits):
+    """
+    把一根K線的形態位元轉為名稱列表
+
+    Args:
+        bits (int): 形態位元
+
+    Returns:
+        list: 形態中文名稱
+    """
+    bits = int(bits)
+    return [label for flag, label in PATTERN_LABELS.items() if bits & flag]
@@ -1,7 +1,9 @@
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
+from metrics import timed
+from columnar_codec import index_to_ms
+from candle_patterns import pattern_names, BULLISH_MASK, BEARISH_MASK
+from indicator_registry import active_specs, subplot_specs
 
 class ChartRenderer:
     """圖表渲染類"""
@@ -19,10 +21,13 @@ class ChartRenderer:
             'volume': '#70a1ff',  # 成交量顏色
             'bb_upper': '#7bed9f', # 布林上軌
             'bb_lower': '#7bed9f', # 布林下軌
-            'bb_middle': '#70a1ff' # 布林中軌
+            'bb_middle': '#70a1ff', # 布林中軌
+            'qband': '#eccc68'     # 分位數通道
         }
     
-    def create_candlestick_chart(self, df, symbol, indicators_config, smc_results=None):
+    @timed('build_figure')
+    def create_candlestick_chart(self, df, symbol, indicators_config, smc_results=None, depth_heatmap=None,
+                                 trade_summary=None, pattern_matches=None):
         """
         創建蠟燭圖
         
@@ -31,49 +36,51 @@ class ChartRenderer:
             symbol (str): 交易對符號
             indicators_config (dict): 指標配置
             smc_results (dict): SMC分析結果
+            depth_heatmap (tuple): 訂單簿深度熱力圖 (K線時間, 價格, 掛單量矩陣)，即DepthStore.heatmap的輸出
+            trade_summary (dict): 成交聚合結果（TradeAggregator.summary的輸出），提供時繪製成交量分佈和時段VWAP
+            pattern_matches (dict): 歷史相似形態（PatternSearch.similar的輸出），提供時疊加各匹配及其後續走勢
             
         Returns:
             plotly.graph_objects.Figure: Plotly圖表對象
         """
-        # 計算子圖數量
-        subplot_count = 1  # 主圖（價格圖）
-        subplot_titles = [f"{symbol} 價格走勢"]
+        # plotly只在繪圖時導入，批處理導入本模塊不需要付出其導入成本
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
         
-        # 檢查是否需要RSI子圖
-        if "rsi" in indicators_config:
-            subplot_count += 1
-            subplot_titles.append("RSI")
+        # 子圖佈局由指標登記表決定：每個需要獨立子圖的指標佔一行，按pane_order排列
+        subplots = subplot_specs(indicators_config)
+        rows = {spec.key: row for row, spec in enumerate(subplots, start=2)}
+        subplot_count = 1 + len(subplots)  # 主圖（價格圖）加各子圖
+        subplot_titles = [f"{symbol} 價格走勢"] + [spec.title for spec in subplots]
         
-        # 檢查是否需要MACD子圖
-        if "macd" in indicators_config:
-            subplot_count += 1
-            subplot_titles.append("MACD")
+        # 創建子圖（沒有子圖時也使用單行網格，後續按 row=1 加入的軌跡才有效）
+        # 設置子圖高度比例：主圖佔60%
+        row_heights = [0.6] + [spec.height for spec in subplots]
         
-        # 檢查是否需要成交量子圖
-        if "volume" in indicators_config:
-            subplot_count += 1
-            subplot_titles.append("成交量")
-        
-        # 創建子圖
-        if subplot_count == 1:
-            fig = go.Figure()
-        else:
-            # 設置子圖高度比例
-            row_heights = [0.6]  # 主圖佔60%
-            if "rsi" in indicators_config:
-                row_heights.append(0.15)
-            if "macd" in indicators_config:
-                row_heights.append(0.15)
-            if "volume" in indicators_config:
-                row_heights.append(0.1)
-            
-            fig = make_subplots(
-                rows=subplot_count,
-                cols=1,
-                shared_xaxes=True,
-                vertical_spacing=0.05,
-                subplot_titles=subplot_titles,
-                row_heights=row_heights
+        fig = make_subplots(
+            rows=subplot_count,
+            cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.05,
+            subplot_titles=subplot_titles,
+            row_heights=row_heights
+        )
+        
+        # 訂單簿深度熱力圖（先加入，位於蠟燭圖下層）
+        if depth_heatmap is not None:
+            depth_times, depth_prices, depth_z = depth_heatmap
+            fig.add_trace(
+                go.Heatmap(
+                    x=depth_times,
+                    y=depth_prices,
+                    z=depth_z,
+                    colorscale='Blues',
+                    opacity=0.5,
+                    showscale=False,
+                    name='訂單簿深度',
+                    hovertemplate='價格: %{y:.2f}<br>掛單量: %{z:.2f}<extra>訂單簿深度</extra>'
+                ),
+                row=1, col=1
             )
         
         # 主圖：蠟燭圖
@@ -166,10 +173,34 @@ class ChartRenderer:
                     row=1, col=1
                 )
         
-        current_row = 2
+        # 分位數通道：上下軌之間填充，中軌即滾動中位數
+        if "qbands" in indicators_config:
+            if all(col in df.columns for col in ['qband_upper', 'qband_middle', 'qband_lower']):
+                for column, name, extra in (('qband_upper', '分位數上軌', {}),
+                                            ('qband_lower', '分位數下軌',
+                                             dict(fill='tonexty', fillcolor='rgba(236, 204, 104, 0.08)')),
+                                            ('qband_middle', '滾動中位數', {})):
+                    fig.add_trace(
+                        go.Scatter(
+                            x=df.index,
+                            y=df[column],
+                            mode='lines',
+                            name=name,
+                            line=dict(color=self.colors['qband'], width=1,
+                                      dash='dot' if column == 'qband_middle' else 'solid'),
+                            opacity=0.7,
+                            **extra
+                        ),
+                        row=1, col=1
+                    )
+        
+        # K線形態標記：看漲形態標在最低價下方，看跌形態標在最高價上方
+        if "candles" in indicators_config and 'candle_patterns' in df.columns:
+            self._add_candle_markers(fig, go, df)
         
         # RSI子圖
         if "rsi" in indicators_config and 'rsi' in df.columns:
+            current_row = rows['rsi']
             fig.add_trace(
                 go.Scatter(
                     x=df.index,
@@ -188,10 +219,10 @@ class ChartRenderer:
             
             # 設置RSI Y軸範圍
             fig.update_yaxes(range=[0, 100], row=current_row, col=1)
-            current_row += 1
         
         # MACD子圖
         if "macd" in indicators_config and all(col in df.columns for col in ['macd', 'macd_signal', 'macd_hist']):
+            current_row = rows['macd']
             # MACD線
             fig.add_trace(
                 go.Scatter(
@@ -231,17 +262,20 @@ class ChartRenderer:
             
             # 添加零軸線
             fig.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.5, row=current_row, col=1)
-            current_row += 1
+        
+        # 以核函數登記的指標：按登記的線條樣式疊加於主圖或繪製在各自的子圖
+        for spec in active_specs(indicators_config):
+            if spec.kernel is not None:
+                self._add_registered_indicator(fig, go, df, spec, indicators_config[spec.key], rows.get(spec.key, 1))
         
         # 成交量子圖
         if "volume" in indicators_config:
-            # 計算成交量顏色（基於價格變化）
-            volume_colors = []
-            for i in range(len(df)):
-                if df['close'].iloc[i] >= df['open'].iloc[i]:
-                    volume_colors.append(self.colors['up'])
-                else:
-                    volume_colors.append(self.colors['down'])
+            # 計算成交量顏色：有逐筆成交時按主動買賣量差，否則按K線漲跌
+            if trade_summary is not None:
+                rising = trade_summary['bars']['delta'].to_numpy() >= 0
+            else:
+                rising = df['close'].to_numpy() >= df['open'].to_numpy()
+            volume_colors = np.where(rising, self.colors['up'], self.colors['down'])
             
             fig.add_trace(
                 go.Bar(
@@ -251,9 +285,17 @@ class ChartRenderer:
                     marker_color=volume_colors,
                     opacity=0.7
                 ),
-                row=current_row, col=1
+                row=rows['volume'], col=1
             )
         
+        # 成交量分佈：以主圖右側的水平柱狀圖顯示，並繪製時段VWAP
+        if trade_summary is not None:
+            self._add_volume_profile(fig, go, trade_summary)
+        
+        # 歷史相似形態：把匹配窗口對齊到最近的K線上，並延伸顯示其後續走勢
+        if pattern_matches and pattern_matches['matches']:
+            self._add_pattern_matches(fig, go, df, pattern_matches)
+        
         # 更新佈局
         fig.update_layout(
             title=f"{symbol} 技術分析圖表",
@@ -335,14 +377,37 @@ class ChartRenderer:
                     row=1, col=1
                 )
             
+            # 添加公允價值缺口：只畫尚未完全回補的缺口，延伸到被觸及的K線或圖表結束
+            for gap in smc_results.get('fair_value_gaps', []):
+                if gap['fill'] >= 1:
+                    continue
+                color = 'rgba(72, 219, 251, 0.15)' if gap['type'] == 'bullish_fvg' else 'rgba(255, 159, 243, 0.15)'
+                fig.add_shape(
+                    type="rect",
+                    x0=gap['time'],
+                    y0=gap['bottom'],
+                    x1=gap['mitigated_time'] if gap['mitigated_time'] is not None else df.index[-1],
+                    y1=gap['top'],
+                    fillcolor=color,
+                    line=dict(color=color.replace('0.15', '0.6'), width=1, dash='dot'),
+                    row=1, col=1
+                )
+            
             # 添加流動性水平線
             liquidity_zones = smc_results.get('liquidity_zones', {})
             for zone_type, zones in liquidity_zones.items():
                 color = 'yellow' if zone_type == 'buy_side_liquidity' else 'orange'
                 for zone in zones:
+                    # 訂單簿掛單牆以實線、等高/等低點流動性池以點劃線顯示，區別於由擺動點推斷的流動性
+                    if zone['type'] in ('ask_wall', 'bid_wall'):
+                        line_dash = "solid"
+                    elif zone['type'] in ('equal_highs', 'equal_lows'):
+                        line_dash = "dashdot"
+                    else:
+                        line_dash = "dot"
                     fig.add_hline(
                         y=zone['price'],
-                        line_dash="dot",
+                        line_dash=line_dash,
                         line_color=color,
                         opacity=0.7,
                         annotation_text=f"{zone['description']} (${zone['price']:.2f})",
@@ -351,18 +416,186 @@ class ChartRenderer:
                     )
         
         return fig
+
+    def _add_registered_indicator(self, fig, go, df, spec, value, row):
+        """按指標登記的線條樣式繪製，子圖指標另加參考線和Y軸範圍"""
+        for column, name, color, extra in spec.traces(value):
+            if column not in df.columns:
+                continue
+            fig.add_trace(
+                go.Scatter(
+                    x=df.index,
+                    y=df[column],
+                    mode='lines',
+                    name=name,
+                    line=dict(color=color, width=1.5),
+                    **extra
+                ),
+                row=row, col=1
+            )
+        if row == 1:
+            return
+        for level in spec.levels:
+            fig.add_hline(y=level, line_dash="dash", line_color="gray", opacity=0.5, row=row, col=1)
+        if spec.y_range is not None:
+            fig.update_yaxes(range=list(spec.y_range), row=row, col=1)
+
+    def _add_candle_markers(self, fig, go, df):
+        """按形態位元標記K線，懸停顯示該K線的全部形態名稱"""
+        bits = df['candle_patterns'].to_numpy().astype(np.int64)
+        offset = (df['high'] - df['low']).to_numpy(dtype=float) * 0.3
+        for mask, name, price, sign, symbol, color in (
+                (BULLISH_MASK, '看漲K線形態', df['low'], -1, 'triangle-up', self.colors['up']),
+                (BEARISH_MASK, '看跌K線形態', df['high'], 1, 'triangle-down', self.colors['down'])):
+            idx = np.flatnonzero(bits & int(mask))
+            if len(idx) == 0:
+                continue
+            fig.add_trace(
+                go.Scatter(
+                    x=df.index[idx],
+                    y=price.to_numpy(dtype=float)[idx] + sign * offset[idx],
+                    mode='markers',
+                    name=name,
+                    marker=dict(color=color, size=7, symbol=symbol, line=dict(color='white', width=0.5)),
+                    text=['、'.join(pattern_names(b)) for b in bits[idx]],
+                    hovertemplate='%{text}<extra></extra>'
+                ),
+                row=1, col=1
+            )
+    
+    def _add_volume_profile(self, fig, go, trade_summary):
+        """在主圖上疊加成交量分佈側柱、POC和時段VWAP"""
+        bars = trade_summary['bars']
+        profile = trade_summary['profile']
+        
+        fig.add_trace(
+            go.Scatter(
+                x=bars.index,
+                y=bars['session_vwap'],
+                mode='lines',
+                name='時段VWAP',
+                line=dict(color='#eccc68', width=1.5, dash='dash')
+            ),
+            row=1, col=1
+        )
+        
+        # 以獨立的x軸疊加在主圖上，範圍反轉使柱子從右邊緣向左延伸，最長約佔主圖寬度的四分之一
+        buy_dominant = profile['buy'] >= profile['sell']
+        fig.add_trace(
+            go.Bar(
+                x=profile['total'],
+                y=profile['prices'],
+                orientation='h',
+                xaxis='x99',
+                yaxis='y',
+                name='成交量分佈',
+                marker_color=np.where(buy_dominant, self.colors['up'], self.colors['down']),
+                opacity=0.35,
+                customdata=np.column_stack([profile['buy'], profile['sell']]),
+                hovertemplate='價格: %{y:.2f}<br>成交量: %{x:.2f}<br>主動買: %{customdata[0]:.2f}'
+                              '<br>主動賣: %{customdata[1]:.2f}<extra>成交量分佈</extra>'
+            )
+        )
+        fig.update_layout(xaxis99=dict(
+            overlaying='x',
+            side='top',
+            range=[float(profile['total'].max()) * 4, 0],
+            showgrid=False,
+            showticklabels=False,
+            zeroline=False
+        ))
+        
+        fig.add_hline(
+            y=profile['poc'],
+            line_dash="dash",
+            line_color='#eccc68',
+            opacity=0.8,
+            annotation_text=f"POC (${profile['poc']:.2f})",
+            annotation_position="left",
+            row=1, col=1
+        )
+        fig.add_hrect(
+            y0=profile['value_area_low'],
+            y1=profile['value_area_high'],
+            fillcolor='rgba(236, 204, 104, 0.06)',
+            line_width=0,
+            row=1, col=1
+        )
+    
+    def _add_pattern_matches(self, fig, go, df, pattern_matches):
+        """疊加相似形態：按z標準化把每個匹配映射到當前窗口的價格尺度，並繪製後續走勢的中位數"""
+        length = pattern_matches['length']
+        horizon = pattern_matches['horizon']
+        # 精簡模式的索引為毫秒整數，先統一為DatetimeIndex再向後延伸
+        index = pd.to_datetime(index_to_ms(df.index), unit='ms')
+        step = index[-1] - index[-2]
+        x = index[-length:].append(pd.DatetimeIndex(index[-1] + step * np.arange(1, horizon + 1)))
+        current = np.log(df['close'].to_numpy(dtype=float)[-length:])
+        
+        projections = []
+        for rank, match in enumerate(pattern_matches['matches']):
+            values = np.log(match['closes'])
+            window = values[:length]
+            mapped = np.exp((values - window.mean()) / window.std() * current.std() + current.mean())
+            projections.append(mapped[length - 1:])
+            fig.add_trace(
+                go.Scatter(
+                    x=x,
+                    y=mapped,
+                    mode='lines',
+                    name=f"相似形態 {match['symbol']} {match['start']:%Y-%m-%d}",
+                    line=dict(color='#a29bfe', width=1),
+                    opacity=0.35,
+                    legendgroup='patterns',
+                    showlegend=rank == 0,
+                    hovertemplate=f"{match['symbol']} {match['start']:%Y-%m-%d %H:%M}<br>"
+                                  f"距離: {match['distance']:.2f}<br>後續: {match['forward_return']:+.2%}<extra></extra>"
+                ),
+                row=1, col=1
+            )
+        
+        fig.add_trace(
+            go.Scatter(
+                x=x[length - 1:],
+                y=np.median(projections, axis=0),
+                mode='lines',
+                name='相似形態後續中位數',
+                line=dict(color='#a29bfe', width=2.5, dash='dot')
+            ),
+            row=1, col=1
+        )
     
-    def create_heatmap(self, data, title="相關性熱力圖"):
-        """創建相關性熱力圖"""
-        correlation_matrix = data.corr()
+    @timed('build_heatmap')
+    def create_heatmap(self, data, title="相關性熱力圖", precomputed=False):
+        """
+        創建相關性熱力圖
+        
+        Args:
+            data (pandas.DataFrame): 價格/收益率數據，或已計算好的相關係數矩陣
+            title (str): 圖表標題
+            precomputed (bool): data是否已為相關係數矩陣（如CorrelationService的輸出）
+            
+        Returns:
+            plotly.graph_objects.Figure: Plotly圖表對象
+        """
+        import plotly.graph_objects as go
+        
+        correlation_matrix = data if precomputed else data.corr()
+        n_symbols = len(correlation_matrix)
+        
+        # 交易對較多時不在格子內標註數值，並以float32縮減圖表數據量
+        show_text = n_symbols <= 30
+        z = correlation_matrix.values.astype(np.float32)
         
         fig = go.Figure(data=go.Heatmap(
-            z=correlation_matrix.values,
+            z=z,
             x=correlation_matrix.columns,
             y=correlation_matrix.index,
             colorscale='RdYlBu',
-            text=correlation_matrix.values,
-            texttemplate="%{text:.2f}",
+            zmin=-1,
+            zmax=1,
+            text=z if show_text else None,
+            texttemplate="%{text:.2f}" if show_text else None,
             textfont={"size": 10},
             hoverongaps=False
         ))
@@ -370,7 +603,7 @@ class ChartRenderer:
         fig.update_layout(
             title=title,
             template="plotly_dark",
-            height=500
+            height=500 if show_text else min(max(500, n_symbols * 4), 1600)
         )
         
         return fig
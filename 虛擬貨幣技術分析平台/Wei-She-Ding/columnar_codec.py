@@ -0,0 +1,158 @@
+import json
+import struct
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow為可選依賴，未安裝時只提供自定義二進制格式
+    pa = None
+
+# 二進制列式格式：
+#   b'FCOL' | uint32 頭部長度 | JSON頭部 | 填充至8字節對齊 | 各列原始小端數組（每列8字節對齊）
+# 頭部：{"meta": {...}, "tables": {表名: {"rows": n, "columns": [{"name", "dtype", "offset"}]}}}
+# offset相對於數據區起點，前端可直接以Float64Array/Float32Array/BigInt64Array視圖讀取
+MAGIC = b'FCOL'
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-fanic-columnar'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+_DTYPE_NAMES = {
+    np.dtype('<f8'): 'float64',
+    np.dtype('<f4'): 'float32',
+    np.dtype('<i8'): 'int64',
+    np.dtype('<i4'): 'int32',
+    np.dtype('u1'): 'uint8',
+    np.dtype('bool'): 'uint8'
+}
+
+
+def _pad(length, align=8):
+    return (-length) % align
+
+
+def index_to_ms(index):
+    """把DatetimeIndex或毫秒整數索引轉為int64毫秒數組"""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit('ms').asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+def time_to_ms(value):
+    """把單個時間（Timestamp、datetime64或毫秒整數）轉為int毫秒；精簡模式切換前後的時間因此可以互相比較"""
+    if isinstance(value, (datetime, np.datetime64)):
+        return pd.Timestamp(value).value // 10**6
+    return int(value)
+
+
+def frame_columns(df, columns=None):
+    """把K線數據框轉為 {列名: ndarray}，時間列以毫秒時間戳表示"""
+    columns = columns or list(df.columns)
+    data = {'time': index_to_ms(df.index)}
+    for col in columns:
+        data[col] = df[col].to_numpy()
+    return data
+
+
+def _normalize(values):
+    arr = np.asarray(values)
+    if arr.dtype == np.bool_:
+        arr = arr.astype(np.uint8)
+    elif arr.dtype.kind == 'M':
+        arr = arr.astype('M8[ms]').astype(np.int64)
+    elif arr.dtype.kind not in 'fiu':
+        raise TypeError(f"不支持的列類型: {arr.dtype}")
+    arr = arr.astype(arr.dtype.newbyteorder('<'), copy=False)
+    if arr.dtype not in _DTYPE_NAMES:
+        arr = arr.astype(np.float64)
+    return np.ascontiguousarray(arr)
+
+
+def encode_tables(tables, meta=None):
+    """
+    以自定義二進制列式格式編碼多個表
+
+    Args:
+        tables (dict): 表名 -> {列名: 一維數組}
+        meta (dict): 附加在頭部的JSON元數據
+
+    Returns:
+        bytes: 編碼後的數據
+    """
+    header = {'meta': meta or {}, 'tables': {}}
+    chunks = []
+    offset = 0
+    for name, columns in tables.items():
+        spec = {'rows': 0, 'columns': []}
+        for col, values in columns.items():
+            arr = _normalize(values)
+            spec['rows'] = len(arr)
+            spec['columns'].append({'name': col, 'dtype': _DTYPE_NAMES[arr.dtype], 'offset': offset})
+            raw = arr.tobytes()
+            chunks.append(raw + b'\0' * _pad(len(raw)))
+            offset += len(raw) + _pad(len(raw))
+        header['tables'][name] = spec
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    prefix_len = len(MAGIC) + 4 + len(header_bytes)
+    return b''.join([MAGIC, struct.pack('<I', len(header_bytes)), header_bytes,
+                     b'\0' * _pad(prefix_len)] + chunks)
+
+
+def decode_tables(data):
+    """
+    解碼encode_tables的輸出
+
+    Returns:
+        tuple: (元數據dict, {表名: {列名: ndarray}})
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("不是有效的列式數據")
+    header_len = struct.unpack('<I', data[4:8])[0]
+    header = json.loads(data[8:8 + header_len].decode('utf-8'))
+    base = 8 + header_len + _pad(8 + header_len)
+
+    tables = {}
+    for name, spec in header['tables'].items():
+        columns = {}
+        for col in spec['columns']:
+            dtype = np.dtype(col['dtype']).newbyteorder('<')
+            start = base + col['offset']
+            columns[col['name']] = np.frombuffer(data, dtype=dtype, count=spec['rows'], offset=start)
+        tables[name] = columns
+    return header.get('meta', {}), tables
+
+
+def encode_arrow(columns):
+    """
+    以Arrow IPC流格式編碼單個表（需要pyarrow）
+
+    Args:
+        columns (dict): 列名 -> 一維數組
+
+    Returns:
+        bytes: Arrow IPC流
+    """
+    if pa is None:
+        raise RuntimeError("未安裝pyarrow，無法輸出Arrow格式")
+    table = pa.table({col: _normalize(values) for col, values in columns.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_json_columns(columns):
+    """把 {列名: 數組} 轉為可JSON序列化的列表，NaN和NaT轉為null"""
+    result = {}
+    for col, values in columns.items():
+        arr = np.asarray(values)
+        if arr.dtype.kind == 'f':
+            result[col] = [None if v != v else v for v in arr.tolist()]
+        elif arr.dtype.kind == 'M':
+            missing = np.isnat(arr).tolist()
+            result[col] = [None if m else v for m, v in zip(missing, arr.astype('M8[ms]').astype(np.int64).tolist())]
+        else:
+            result[col] = arr.tolist()
+    return result
@@ -0,0 +1,68 @@
+import pandas as pd
+import numpy as np
+
+# 精簡模式下數值列的類型
+COMPACT_DTYPE = np.float32
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def to_compact(df):
+    """
+    轉換為精簡格式：float32數值列、int64毫秒時間戳索引
+
+    Args:
+        df (pandas.DataFrame): 以DatetimeIndex為索引的OHLCV數據
+
+    Returns:
+        pandas.DataFrame: 精簡格式數據
+    """
+    index = df.index
+    if isinstance(index, pd.DatetimeIndex):
+        index = pd.Index(index.as_unit('ms').asi8, name='timestamp')
+    data = {col: df[col].to_numpy(dtype=COMPACT_DTYPE) for col in df.columns}
+    return pd.DataFrame(data, index=index)
+
+
+def is_compact(df):
+    """判斷數據框是否為精簡格式"""
+    return 'close' in df.columns and df['close'].dtype == COMPACT_DTYPE
+
+
+def memory_usage(df):
+    """
+    統計單個交易對數據框的記憶體佔用
+
+    Args:
+        df (pandas.DataFrame): OHLCV（可含技術指標）數據
+
+    Returns:
+        dict: 索引、OHLCV、指標及總字節數，以及每根K線的字節數
+    """
+    # 只統計數據本身；索引查找時建立的哈希表不計入
+    usage = df.memory_usage(index=False, deep=True)
+    ohlcv = int(sum(usage[col] for col in OHLCV_COLUMNS if col in usage))
+    index_bytes = int(df.index.nbytes)
+    total = int(usage.sum()) + index_bytes
+    return {
+        'bars': len(df),
+        'index_bytes': index_bytes,
+        'ohlcv_bytes': ohlcv,
+        'indicator_bytes': total - ohlcv - index_bytes,
+        'total_bytes': total,
+        'bytes_per_bar': total / len(df) if len(df) else 0.0
+    }
+
+
+def memory_report(frames):
+    """
+    多個交易對的記憶體佔用報告
+
+    Args:
+        frames (dict): 交易對 -> 數據框
+
+    Returns:
+        pandas.DataFrame: 每個交易對一行的記憶體統計
+    """
+    rows = [dict(symbol=symbol, compact=is_compact(df), **memory_usage(df)) for symbol, df in frames.items()]
+    return pd.DataFrame(rows).set_index('symbol') if rows else pd.DataFrame()
@@ -0,0 +1,203 @@
+import pandas as pd
+import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from analysis_cache import INTERVAL_MS
+from columnar_codec import time_to_ms
+
+
+class RollingCoMoments:
+    """單一窗口的滾動協動差累積量（一階和與交叉乘積和）"""
+
+    def __init__(self, window, n_symbols):
+        self.window = window
+        self.sum = np.zeros(n_symbols)
+        self.cross = np.zeros((n_symbols, n_symbols))
+        self.count = 0
+
+    def add(self, row):
+        self.sum += row
+        self.cross += np.outer(row, row)
+        self.count += 1
+
+    def remove(self, row):
+        self.sum -= row
+        self.cross -= np.outer(row, row)
+        self.count -= 1
+
+    def replace(self, old_row, new_row):
+        self.sum += new_row - old_row
+        self.cross += np.outer(new_row, new_row) - np.outer(old_row, old_row)
+
+    def reset(self, rows):
+        self.sum = rows.sum(axis=0)
+        self.cross = rows.T @ rows
+        self.count = len(rows)
+
+    def correlation(self):
+        """由累積量計算皮爾遜相關係數矩陣"""
+        if self.count < 2:
+            return np.full_like(self.cross, np.nan)
+        cov = self.cross - np.outer(self.sum, self.sum) / self.count
+        std = np.sqrt(np.maximum(np.diag(cov), 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        return np.clip(corr, -1, 1)
+
+
+class CorrelationService:
+    """全市場對數收益率相關性服務，以滾動協動差增量更新相關係數矩陣"""
+
+    def __init__(self, data_fetcher, interval='1h', windows=(30, 100), history=500,
+                 max_workers=16, resync_every=500):
+        """
+        Args:
+            data_fetcher: 提供get_kline_data的數據獲取器
+            interval (str): 時間間隔
+            windows (tuple): 滾動窗口長度（K線數）
+            history (int): 初始加載的K線數
+            max_workers (int): 並發獲取數據的線程數
+            resync_every (int): 每累積多少次增量更新後重新全量計算，抑制浮點誤差
+        """
+        self.data_fetcher = data_fetcher
+        self.interval = interval
+        self.windows = tuple(sorted(windows))
+        self.history = history
+        self.max_workers = max_workers
+        self.resync_every = resync_every
+
+        self.symbols = []
+        self.returns = np.empty((0, 0))
+        self.last_close = np.empty(0)
+        self.last_time = None
+        self.moments = {}
+        self._updates = 0
+        self._lock = threading.Lock()
+
+    def _fetch_closes(self, symbols, limit):
+        def fetch(symbol):
+            try:
+                return self.data_fetcher.get_kline_data(symbol, self.interval, limit=limit)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            frames = list(executor.map(fetch, symbols))
+
+        closes = {s: df['close'] for s, df in zip(symbols, frames) if df is not None and not df.empty}
+        return pd.DataFrame(closes)
+
+    def load(self, symbols):
+        """
+        全量加載交易對的收盤價，按時間對齊並建立收益率矩陣
+
+        Args:
+            symbols (list): 交易對列表
+        """
+        closes = self._fetch_closes(symbols, self.history).dropna()
+        log_prices = np.log(closes.to_numpy(dtype=float))
+
+        with self._lock:
+            self.symbols = list(closes.columns)
+            self.returns = np.diff(log_prices, axis=0)[-self.windows[-1]:]
+            self.last_close = closes.to_numpy(dtype=float)[-1] if len(closes) else np.empty(0)
+            self.last_time = closes.index[-1] if len(closes) else None
+            self._resync()
+
+    def _resync(self):
+        """以當前收益率矩陣重新計算所有窗口的累積量"""
+        n = len(self.symbols)
+        self.moments = {}
+        for window in self.windows:
+            moments = RollingCoMoments(window, n)
+            moments.reset(self.returns[-window:])
+            self.moments[window] = moments
+        self._updates = 0
+
+    def update(self, bar_time, closes):
+        """
+        以一根新的或更新中的K線增量更新相關性
+
+        同一時間的K線再次到達（未收盤K線價格變動）時替換最後一行收益率，
+        否則追加一行；每個窗口的更新成本為O(N²)，與窗口長度無關。
+        新K線必須緊接上一根K線，中間缺少的K線由 refresh 先補取。
+
+        Args:
+            bar_time: K線時間
+            closes (array-like): 與self.symbols順序一致的收盤價
+        """
+        closes = np.asarray(closes, dtype=float)
+        if np.isnan(closes).any():
+            return
+
+        with self._lock:
+            if self.last_time is not None and bar_time < self.last_time:
+                return
+
+            if bar_time == self.last_time and len(self.returns):
+                # 更新中的K線：只替換最後一行
+                prev_close = self.last_close * np.exp(-self.returns[-1])
+                new_row = np.log(closes / prev_close)
+                old_row = self.returns[-1].copy()
+                for moments in self.moments.values():
+                    moments.replace(old_row, new_row)
+                self.returns[-1] = new_row
+            else:
+                new_row = np.log(closes / self.last_close)
+                for window, moments in self.moments.items():
+                    if moments.count >= window:
+                        moments.remove(self.returns[-window])
+                    moments.add(new_row)
+                self.returns = np.vstack([self.returns, new_row])[-self.windows[-1]:]
+
+            self.last_close = closes
+            self.last_time = bar_time
+            self._updates += 1
+            if self._updates >= self.resync_every:
+                self._resync()
+
+    def refresh(self):
+        """
+        獲取每個交易對的最近兩根K線並增量套用
+
+        若取回的K線不含上次處理的K線（期間漏掉了K線），先補取漏掉的K線依序套用，
+        以免把多根K線的價格變化合併為一個收益率；漏掉的K線超過最長窗口時全量重新加載。
+
+        Returns:
+            int: 套用的K線數
+        """
+        if not self.symbols:
+            return 0
+        closes = self._fetch_closes(self.symbols, 2)
+        if self.last_time is not None and len(closes) and time_to_ms(closes.index[0]) > time_to_ms(self.last_time):
+            step = INTERVAL_MS.get(self.interval, INTERVAL_MS['1h'])
+            missed = (time_to_ms(closes.index[-1]) - time_to_ms(self.last_time)) // step
+            if missed > self.windows[-1]:
+                self.load(self.symbols)
+                return len(self.returns)
+            closes = self._fetch_closes(self.symbols, missed + 1)
+        if list(closes.columns) != self.symbols:
+            closes = closes.reindex(columns=self.symbols)
+
+        applied = 0
+        for bar_time, row in closes.iterrows():
+            if self.last_time is None or bar_time >= self.last_time:
+                self.update(bar_time, row.to_numpy(dtype=float))
+                applied += 1
+        return applied
+
+    def correlation_matrix(self, window=None):
+        """
+        獲取相關係數矩陣
+
+        Args:
+            window (int): 滾動窗口長度，預設為最短窗口
+
+        Returns:
+            pandas.DataFrame: 以交易對為行列索引的相關係數矩陣
+        """
+        window = window or self.windows[0]
+        with self._lock:
+            corr = self.moments[window].correlation()
+            symbols = list(self.symbols)
+        return pd.DataFrame(corr, index=symbols, columns=symbols)
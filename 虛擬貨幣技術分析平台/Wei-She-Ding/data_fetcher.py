@@ -1,19 +1,38 @@
-import requests
+import copy
+import time
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import streamlit as st
 from mock_data_generator import MockDataGenerator
+from compact_frames import to_compact
+from metrics import METRICS, span
+from notifier import LoggingNotifier, logger
+from kline_decoder import decode_klines, klines_to_frame
+from trade_aggregator import trades_from_agg
+from resilience import ResilientClient, CircuitOpenError, SingleFlight, UpstreamClientError, GeoRestrictedError
+from analysis_cache import INTERVAL_MS
 
 class CryptoDataFetcher:
     """虛擬貨幣數據獲取類"""
     
-    def __init__(self):
-        self.base_url = "https://api.binance.com/api/v3"
-        self.mock_generator = MockDataGenerator()
-        self.use_mock_data = True  # 預設使用模擬數據
+    def __init__(self, notifier=None, client=None, mock_generator=None, base_url=None):
+        """
+        Args:
+            notifier: 提示通知器（需提供warning/error方法），預設寫入日誌
+            client (ResilientClient): 帶重試和熔斷的HTTP客戶端
+            mock_generator: 模擬數據來源（如MarketSimulator），預設為MockDataGenerator
+            base_url (str): API地址；指定時（如本地模擬交易所）直接請求該地址而不使用模擬數據
+        """
+        self.base_url = base_url or "https://api.binance.com/api/v3"
+        self.mock_generator = mock_generator if mock_generator is not None else MockDataGenerator()
+        self.use_mock_data = base_url is None  # 預設使用模擬數據
+        self.notifier = notifier if notifier is not None else LoggingNotifier()
+        self.client = client if client is not None else ResilientClient()
+        # 各請求最後一次成功的結果，API暫時不可用時作為過期數據返回
+        self._last_good = {}
+        self._inflight = SingleFlight('klines')
         
-    def get_kline_data(self, symbol, interval, limit=500):
+    def get_kline_data(self, symbol, interval, limit=500, compact=False):
         """
         獲取K線數據
         
@@ -21,14 +40,35 @@ class CryptoDataFetcher:
             symbol (str): 交易對符號，如 'BTCUSDT'
             interval (str): 時間間隔，如 '1h', '1d'
             limit (int): 返回的數據條數，最大1000
+            compact (bool): 是否返回精簡格式（float32價格、int64毫秒時間戳）
             
         Returns:
             pandas.DataFrame: K線數據
         """
         # 檢查是否使用模擬數據
         if self.use_mock_data:
-            return self.mock_generator.generate_kline_data(symbol, interval, limit)
+            METRICS.inc('kline_requests_total', help_text='K線請求次數', source='mock')
+            with span('mock_klines'):
+                return self.mock_generator.generate_kline_data(symbol, interval, limit, compact)
         
+        METRICS.inc('kline_requests_total', help_text='K線請求次數', source='api')
+        # 同一 (symbol, interval, limit) 的並發請求共用一次API請求和解析結果
+        df = self._inflight.do(('klines', symbol, interval, limit),
+                               lambda: self._fetch_klines(symbol, interval, limit))
+        if compact and df is not None:
+            attrs = dict(df.attrs)
+            df = to_compact(df)
+            df.attrs.update(attrs)
+        return df
+    
+    def _fetch_klines(self, symbol, interval, limit):
+        """
+        從API獲取K線（失敗時返回過期快取或模擬數據）
+        
+        返回的數據框會被並發的調用者共用，調用方不應原地修改。
+        """
+        import requests  # 只在實際請求API時導入
+        cache_key = ('klines', symbol, interval, limit)
         try:
             url = f"{self.base_url}/klines"
             params = {
@@ -37,48 +77,155 @@ class CryptoDataFetcher:
                 'limit': limit
             }
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            with span('fetch_klines'):
+                content = self.client.get_bytes('klines', url, params)
             
-            # 檢查API響應是否包含錯誤
-            if isinstance(data, dict) and 'code' in data:
-                st.warning("Binance API受地理位置限制，正在使用模擬數據進行展示")
-                self.use_mock_data = True
-                return self.mock_generator.generate_kline_data(symbol, interval, limit)
+            # 只取需要的字段直接解碼為NumPy數組，一次性構建數據框
+            parse_start = time.perf_counter()
+            df = decode_klines(content)
             
-            if not data:
+            if not isinstance(df, pd.DataFrame):
+                raise ValueError("無法識別的K線響應")
+            if df.empty:
                 return None
-                
-            # 轉換為DataFrame
-            df = pd.DataFrame(data, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-            ])
-            
-            # 數據類型轉換
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = df[col].astype(float)
-                
-            # 設置時間戳為索引
-            df.set_index('timestamp', inplace=True)
-            
-            # 只保留需要的列
-            df = df[['open', 'high', 'low', 'close', 'volume']]
             
+            METRICS.observe('stage_duration_seconds', time.perf_counter() - parse_start, stage='parse_klines')
+            self._remember(cache_key, df)
             return df
             
-        except requests.exceptions.RequestException as e:
-            st.warning("網絡連接問題，正在使用模擬數據進行展示")
-            self.use_mock_data = True
-            return self.mock_generator.generate_kline_data(symbol, interval, limit)
-        except Exception as e:
-            st.warning("數據獲取錯誤，正在使用模擬數據進行展示")
-            self.use_mock_data = True
+        except GeoRestrictedError:
+            # 地區限制不會自行恢復，改用模擬數據
+            self._geo_restricted('klines')
+            self.notifier.warning("Binance API受地理位置限制，正在使用模擬數據進行展示")
             return self.mock_generator.generate_kline_data(symbol, interval, limit)
+        except UpstreamClientError as e:
+            return self._client_error('klines', e)
+        except CircuitOpenError:
+            reason = 'circuit_open'
+        except requests.exceptions.RequestException:
+            self._record_error('klines', 'network')
+            reason = 'network'
+        except Exception:
+            self._record_error('klines', 'error')
+            reason = 'error'
+        
+        # 暫時性故障：優先返回最後一次成功的數據並標記為過期，不再永久切換到模擬數據
+        stale = self._stale('klines', cache_key)
+        if stale is not None:
+            fetched_at, df = stale
+            df.attrs['stale'] = True
+            df.attrs['fetched_at'] = fetched_at
+            return df
+        
+        self._record_mock_fallback('klines')
+        if reason == 'network':
+            self.notifier.warning("網絡連接問題，正在使用模擬數據進行展示")
+        elif reason == 'error':
+            self.notifier.warning("數據獲取錯誤，正在使用模擬數據進行展示")
+        return self.mock_generator.generate_kline_data(symbol, interval, limit)
+    
+    def get_kline_range(self, symbol, interval, start_ms, end_ms, page_limit=1000):
+        """
+        獲取開盤時間位於 [start_ms, end_ms) 的K線，以startTime/endTime分頁請求
+        
+        用於補取歷史中缺失的區間；失敗時返回None，不回退到過期快取或模擬數據，
+        避免把與真實行情無關的數據寫入歷史。
+        
+        Args:
+            symbol (str): 交易對符號
+            interval (str): 時間間隔
+            start_ms (int): 開始時間（毫秒）
+            end_ms (int): 結束時間（毫秒，不含）
+            page_limit (int): 每次請求的K線數，最大1000
+            
+        Returns:
+            pandas.DataFrame: K線數據；請求失敗時為None
+        """
+        bar_ms = INTERVAL_MS.get(interval, INTERVAL_MS["1h"])
+        url = f"{self.base_url}/klines"
+        frames = []
+        cursor = start_ms
+        try:
+            while cursor < end_ms:
+                if self.use_mock_data:
+                    df = self.mock_generator.generate_kline_data(symbol, interval, page_limit,
+                                                                 start_ms=cursor, end_ms=end_ms - 1)
+                else:
+                    params = {'symbol': symbol, 'interval': interval, 'startTime': cursor,
+                              'endTime': end_ms - 1, 'limit': page_limit}
+                    with span('fetch_klines'):
+                        df = decode_klines(self.client.get_bytes('klines', url, params))
+                    if not isinstance(df, pd.DataFrame):
+                        self._record_error('klines', 'error')
+                        return None
+                if df.empty:
+                    break
+                frames.append(df)
+                cursor = int(df.index[-1].value // 10**6) + bar_ms
+                if len(df) < page_limit:
+                    break
+        except Exception:
+            self._record_error('klines', 'network')
+            return None
+        METRICS.inc('kline_range_requests_total', help_text='按時間範圍補取K線的次數',
+                    source='mock' if self.use_mock_data else 'api')
+        return pd.concat(frames) if frames else klines_to_frame(np.empty(0, dtype=np.int64), np.empty((0, 5)))
+    
+    def _record_error(self, endpoint, reason):
+        """記錄API錯誤次數"""
+        METRICS.inc('api_errors_total', help_text='Binance API錯誤次數', endpoint=endpoint, reason=reason)
+    
+    def _geo_restricted(self, endpoint):
+        """上游因地區限制拒絕請求（HTTP 451/403）：此後改用模擬數據"""
+        self._record_error(endpoint, 'geo_restricted')
+        self.use_mock_data = True
+    
+    def _client_error(self, endpoint, error):
+        """
+        上游以其他4xx拒絕了請求本身（如無效的交易對）：記錄後返回None，不改變數據來源
+        
+        Returns:
+            None
+        """
+        self._record_error(endpoint, 'client_error')
+        logger.warning("%s 請求被拒絕 (HTTP %s): %s", endpoint, error.status, error.body)
+        return None
+    
+    def _record_mock_fallback(self, endpoint):
+        METRICS.inc('mock_fallback_total', help_text='回退到模擬數據的次數', endpoint=endpoint)
+    
+    @staticmethod
+    def _copy(data):
+        # 快取與調用方不共用可變對象，調用方原地修改不會污染之後返回的過期數據
+        if isinstance(data, (pd.DataFrame, np.ndarray)):
+            return data.copy()
+        return copy.deepcopy(data)
+    
+    def _remember(self, cache_key, data):
+        """記錄一次成功的結果（保存副本）"""
+        self._last_good[cache_key] = (time.time(), self._copy(data))
+    
+    def _stale(self, endpoint, cache_key):
+        """
+        取最後一次成功的結果
+        
+        Returns:
+            tuple: (成功時間戳, 數據副本)；沒有記錄時返回None
+        """
+        stale = self._last_good.get(cache_key)
+        if stale is None:
+            return None
+        METRICS.inc('stale_served_total', help_text='返回過期快取數據的次數', endpoint=endpoint)
+        return stale[0], self._copy(stale[1])
+    
+    def fetch_status(self):
+        """
+        各API端點的熔斷狀態與請求延遲百分位
+        
+        Returns:
+            dict: 端點 -> {'state', 'failures', 'count', 'p50_ms', 'p95_ms', 'p99_ms'}
+        """
+        return self.client.status()
     
     def get_24h_ticker(self, symbol):
         """
@@ -93,24 +240,29 @@ class CryptoDataFetcher:
         if self.use_mock_data:
             return self.mock_generator.get_24h_ticker(symbol)
             
+        cache_key = ('ticker_24hr', symbol)
         try:
             url = f"{self.base_url}/ticker/24hr"
             params = {'symbol': symbol}
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 檢查API響應是否包含錯誤
-            if isinstance(data, dict) and 'code' in data:
-                self.use_mock_data = True
-                return self.mock_generator.get_24h_ticker(symbol)
+            with span('fetch_ticker'):
+                data = self.client.get_json('ticker_24hr', url, params)
             
+            self._remember(cache_key, data)
             return data
             
+        except GeoRestrictedError:
+            self._geo_restricted('ticker_24hr')
+            return self.mock_generator.get_24h_ticker(symbol)
+        except UpstreamClientError as e:
+            return self._client_error('ticker_24hr', e)
         except Exception as e:
-            self.use_mock_data = True
+            if not isinstance(e, CircuitOpenError):
+                self._record_error('ticker_24hr', 'error')
+            stale = self._stale('ticker_24hr', cache_key)
+            if stale is not None:
+                return {**stale[1], 'stale': True}
+            self._record_mock_fallback('ticker_24hr')
             return self.mock_generator.get_24h_ticker(symbol)
     
     def get_symbol_info(self, symbol):
@@ -125,10 +277,8 @@ class CryptoDataFetcher:
         """
         try:
             url = f"{self.base_url}/exchangeInfo"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            with span('fetch_exchange_info'):
+                data = self.client.get_json('exchange_info', url)
             
             for symbol_info in data['symbols']:
                 if symbol_info['symbol'] == symbol:
@@ -137,7 +287,9 @@ class CryptoDataFetcher:
             return None
             
         except Exception as e:
-            st.error(f"獲取交易對信息失敗: {str(e)}")
+            if not isinstance(e, CircuitOpenError):
+                self._record_error('exchange_info', 'error')
+            self.notifier.error(f"獲取交易對信息失敗: {str(e)}")
             return None
     
     def get_current_price(self, symbol):
@@ -148,27 +300,130 @@ class CryptoDataFetcher:
             symbol (str): 交易對符號
             
         Returns:
-            float: 當前價格
+            float: 當前價格；API暫時不可用時為最後一次成功取得的價格，請求被拒絕（如無效的交易對）時為None
         """
         if self.use_mock_data:
             return self.mock_generator.get_current_price(symbol)
             
+        cache_key = ('ticker_price', symbol)
         try:
             url = f"{self.base_url}/ticker/price"
             params = {'symbol': symbol}
             
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            with span('fetch_price'):
+                data = self.client.get_json('ticker_price', url, params)
             
-            data = response.json()
+            price = float(data['price'])
+            self._remember(cache_key, price)
+            return price
             
-            # 檢查API響應是否包含錯誤
-            if isinstance(data, dict) and 'code' in data:
-                self.use_mock_data = True
-                return self.mock_generator.get_current_price(symbol)
+        except GeoRestrictedError:
+            self._geo_restricted('ticker_price')
+            return self.mock_generator.get_current_price(symbol)
+        except UpstreamClientError as e:
+            return self._client_error('ticker_price', e)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                self._record_error('ticker_price', 'error')
+            stale = self._stale('ticker_price', cache_key)
+            if stale is not None:
+                return stale[1]
+            self._record_mock_fallback('ticker_price')
+            return self.mock_generator.get_current_price(symbol)
+    
+    def get_order_book(self, symbol, limit=1000):
+        """
+        獲取訂單簿深度快照
+        
+        Args:
+            symbol (str): 交易對符號
+            limit (int): 每側檔位數（Binance允許5~5000）
             
-            return float(data['price'])
+        Returns:
+            dict: {'bids': [[價格, 數量], ...], 'asks': [[價格, 數量], ...]}；API暫時不可用時為最後一次成功的快照
+        """
+        if self.use_mock_data:
+            return self.mock_generator.generate_order_book(symbol, limit)
+            
+        cache_key = ('depth', symbol, limit)
+        try:
+            url = f"{self.base_url}/depth"
+            params = {'symbol': symbol, 'limit': limit}
             
+            with span('fetch_depth'):
+                data = self.client.get_json('depth', url, params)
+            
+            self._remember(cache_key, data)
+            return data
+            
+        except GeoRestrictedError:
+            self._geo_restricted('depth')
+            return self.mock_generator.generate_order_book(symbol, limit)
+        except UpstreamClientError as e:
+            return self._client_error('depth', e)
         except Exception as e:
-            self.use_mock_data = True
-            return self.mock_generator.get_current_price(symbol)
+            if not isinstance(e, CircuitOpenError):
+                self._record_error('depth', 'error')
+            stale = self._stale('depth', cache_key)
+            if stale is not None:
+                return {**stale[1], 'stale': True}
+            self._record_mock_fallback('depth')
+            return self.mock_generator.generate_order_book(symbol, limit)
+    
+    def get_agg_trades(self, symbol, start_ms, end_ms, max_trades=200000, klines=None):
+        """
+        獲取時間範圍內的歸集成交（aggTrades）
+        
+        從最新的成交開始以fromId向前翻頁，最多取max_trades筆，因此時間範圍過長時只保留最近的部分。
+        
+        Args:
+            symbol (str): 交易對符號
+            start_ms (int): 開始時間（毫秒）
+            end_ms (int): 結束時間（毫秒，不含）
+            max_trades (int): 最多獲取的成交筆數
+            klines (pandas.DataFrame): 對應的K線，僅在模擬模式下用於生成與圖表一致的成交
+            
+        Returns:
+            ndarray: trade_aggregator.TRADE_DTYPE 數組，按時間排序
+        """
+        if self.use_mock_data:
+            return self.mock_generator.generate_trades(symbol, start_ms, end_ms, min(max_trades, 100000), klines)
+            
+        cache_key = ('agg_trades', symbol)
+        try:
+            url = f"{self.base_url}/aggTrades"
+            batches = []
+            total = 0
+            params = {'symbol': symbol, 'limit': 1000}
+            with span('fetch_agg_trades'):
+                while total < max_trades:
+                    data = self.client.get_json('agg_trades', url, params)
+                    if not data:
+                        break
+                    
+                    batches.append(trades_from_agg(data))
+                    total += len(data)
+                    first_id = data[0]['a']
+                    if data[0]['T'] < start_ms or first_id == 0:
+                        break
+                    params = {'symbol': symbol, 'fromId': max(first_id - 1000, 0), 'limit': min(1000, first_id)}
+            
+            trades = np.concatenate(batches[::-1]) if batches else trades_from_agg([])
+            trades = trades[(trades['time'] >= start_ms) & (trades['time'] < end_ms)]
+            self._remember(cache_key, trades)
+            return trades
+            
+        except GeoRestrictedError:
+            self._geo_restricted('agg_trades')
+            return self.mock_generator.generate_trades(symbol, start_ms, end_ms, min(max_trades, 100000), klines)
+        except UpstreamClientError as e:
+            return self._client_error('agg_trades', e)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                self._record_error('agg_trades', 'error')
+            stale = self._stale('agg_trades', cache_key)
+            if stale is not None:
+                trades = stale[1]
+                return trades[(trades['time'] >= start_ms) & (trades['time'] < end_ms)]
+            self._record_mock_fallback('agg_trades')
+            return self.mock_generator.generate_trades(symbol, start_ms, end_ms, min(max_trades, 100000), klines)
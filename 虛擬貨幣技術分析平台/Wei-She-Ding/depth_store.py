@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from metrics import METRICS
+from notifier import logger
+
+# 快照矩陣第二維：0 為買單（bids），1 為賣單（asks）
+BID = 0
+ASK = 1
+
+
+def _to_ms(index):
+    """把K線索引（DatetimeIndex或毫秒整數）轉為int64毫秒"""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit('ms').asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+class DepthStore:
+    """
+    訂單簿深度快照庫
+
+    每個快照按固定價格分箱累加掛單量，存為 (快照 × 買賣 × 價格箱) 的float32矩陣。
+    矩陣和時間戳都以內存映射的.npy文件保存在目錄中，作為環形緩衝區覆寫最舊的快照，
+    進程重啟後可直接重新打開。
+    """
+
+    def __init__(self, directory, price_min=None, price_max=None, bin_size=None, capacity=2880):
+        """
+        打開或創建快照庫
+
+        Args:
+            directory (str): 存放文件的目錄
+            price_min (float): 價格下限（創建時必填）
+            price_max (float): 價格上限（創建時必填）
+            bin_size (float): 價格箱寬度（創建時必填）
+            capacity (int): 最多保留的快照數
+        """
+        self.directory = directory
+        meta_path = os.path.join(directory, 'meta.json')
+        grid_path = os.path.join(directory, 'depth.npy')
+        times_path = os.path.join(directory, 'times.npy')
+
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            self.price_min = meta['price_min']
+            self.bin_size = meta['bin_size']
+            self.n_bins = meta['n_bins']
+            self.grid = np.load(grid_path, mmap_mode='r+')
+            self.times = np.load(times_path, mmap_mode='r+')
+        else:
+            if price_min is None or price_max is None or bin_size is None:
+                raise ValueError("創建快照庫需要 price_min、price_max 和 bin_size")
+            os.makedirs(directory, exist_ok=True)
+            self.price_min = float(price_min)
+            self.bin_size = float(bin_size)
+            self.n_bins = int(np.ceil((price_max - price_min) / bin_size))
+            self.grid = np.lib.format.open_memmap(grid_path, mode='w+', dtype=np.float32,
+                                                  shape=(capacity, 2, self.n_bins))
+            self.times = np.lib.format.open_memmap(times_path, mode='w+', dtype=np.int64, shape=(capacity,))
+            self.times[:] = -1  # -1 表示空槽
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'price_min': self.price_min, 'bin_size': self.bin_size, 'n_bins': self.n_bins}, f)
+
+        self.capacity = len(self.times)
+        self._lock = threading.Lock()
+        filled = self.times >= 0
+        # 寫入位置：有空槽時取第一個空槽，否則覆寫最舊的快照
+        self._cursor = int(np.argmin(filled)) if not filled.all() else int(np.argmin(self.times))
+
+    @classmethod
+    def around(cls, directory, mid_price, width=0.25, bin_ratio=0.0005, capacity=2880):
+        """
+        以當前價格為中心打開或創建快照庫
+
+        Args:
+            mid_price (float): 中心價格
+            width (float): 上下覆蓋的價格比例
+            bin_ratio (float): 價格箱寬度佔中心價格的比例
+        """
+        return cls(directory, price_min=mid_price * (1 - width), price_max=mid_price * (1 + width),
+                   bin_size=mid_price * bin_ratio, capacity=capacity)
+
+    @property
+    def price_levels(self):
+        """各價格箱的中心價格"""
+        return self.price_min + (np.arange(self.n_bins) + 0.5) * self.bin_size
+
+    def _bin(self, levels):
+        """把 [[價格, 數量], ...] 分箱累加為長度n_bins的數組，超出範圍的價位忽略"""
+        if len(levels) == 0:
+            return np.zeros(self.n_bins, dtype=np.float32)
+        arr = np.asarray(levels, dtype=np.float64).reshape(-1, 2)
+        idx = np.floor((arr[:, 0] - self.price_min) / self.bin_size).astype(np.int64)
+        valid = (idx >= 0) & (idx < self.n_bins)
+        return np.bincount(idx[valid], weights=arr[valid, 1], minlength=self.n_bins).astype(np.float32)
+
+    def record(self, timestamp_ms, bids, asks):
+        """
+        寫入一個訂單簿快照
+
+        Args:
+            timestamp_ms (int): 快照時間（毫秒）
+            bids (list): 買單 [[價格, 數量], ...]，價格和數量可為字符串（Binance格式）
+            asks (list): 賣單 [[價格, 數量], ...]
+        """
+        bid_row = self._bin(bids)
+        ask_row = self._bin(asks)
+        with self._lock:
+            slot = self._cursor
+            self.grid[slot, BID] = bid_row
+            self.grid[slot, ASK] = ask_row
+            self.times[slot] = int(timestamp_ms)
+            self._cursor = (slot + 1) % self.capacity
+
+    def __len__(self):
+        return int(np.count_nonzero(self.times >= 0))
+
+    def snapshots(self, start_ms=None, end_ms=None):
+        """
+        按時間順序讀取快照
+
+        Returns:
+            tuple: (時間戳數組, (快照 × 買賣 × 價格箱) 矩陣)
+        """
+        with self._lock:
+            times = np.array(self.times)
+        mask = times >= 0
+        if start_ms is not None:
+            mask &= times >= start_ms
+        if end_ms is not None:
+            mask &= times <= end_ms
+        slots = np.flatnonzero(mask)
+        slots = slots[np.argsort(times[slots], kind='stable')]
+        return times[slots], np.asarray(self.grid[slots])
+
+    def resting_liquidity(self, mid_price, lookback=20, top_n=3, min_ratio=3.0):
+        """
+        找出最近快照中持續存在的大額掛單（掛單牆）
+
+        以最近lookback個快照的平均掛單量計算，只保留大於該側平均水平min_ratio倍的價格箱。
+
+        Args:
+            mid_price (float): 當前價格，上方看賣單、下方看買單
+            lookback (int): 使用的最近快照數
+            top_n (int): 每側最多返回的價位數
+            min_ratio (float): 相對該側平均掛單量的最小倍數
+
+        Returns:
+            dict: {'time': 最新快照時間, 'bids': [(價格, 數量), ...], 'asks': [(價格, 數量), ...]}，
+                  沒有快照時返回None
+        """
+        times, grid = self.snapshots()
+        if len(times) == 0:
+            return None
+        average = grid[-lookback:].mean(axis=0)
+        prices = self.price_levels
+
+        def walls(side, in_range):
+            sizes = np.where(in_range, average[side], 0)
+            nonzero = sizes[sizes > 0]
+            if len(nonzero) == 0:
+                return []
+            candidates = np.flatnonzero(sizes >= nonzero.mean() * min_ratio)
+            top = candidates[np.argsort(sizes[candidates])[::-1][:top_n]]
+            return [(float(prices[i]), float(sizes[i])) for i in top]
+
+        return {
+            'time': pd.Timestamp(int(times[-1]), unit='ms'),
+            'bids': walls(BID, prices < mid_price),
+            'asks': walls(ASK, prices > mid_price)
+        }
+
+    def heatmap(self, bar_index, price_low=None, price_high=None, max_price_bins=120):
+        """
+        把快照降採樣為K線時間軸上的深度熱力圖
+
+        每根K線取其時間範圍內快照的平均掛單量（買賣合計），價格箱合併至不超過max_price_bins個。
+
+        Args:
+            bar_index: K線索引（DatetimeIndex或毫秒整數）
+            price_low (float): 熱力圖價格下限，預設為全部範圍
+            price_high (float): 熱力圖價格上限
+            max_price_bins (int): 價格方向的最大格數
+
+        Returns:
+            tuple: (K線時間, 價格, (價格 × K線) 矩陣)；沒有落在K線範圍內的快照時返回None
+        """
+        bar_ms = _to_ms(bar_index)
+        if len(bar_ms) == 0:
+            return None
+        times, grid = self.snapshots(start_ms=bar_ms[0])
+        if len(times) == 0:
+            return None
+
+        # 價格範圍裁剪
+        prices = self.price_levels
+        lo = 0 if price_low is None else max(int((price_low - self.price_min) // self.bin_size), 0)
+        hi = self.n_bins if price_high is None else min(int((price_high - self.price_min) // self.bin_size) + 1, self.n_bins)
+        if hi <= lo:
+            return None
+        depth = grid[:, BID, lo:hi] + grid[:, ASK, lo:hi]
+        prices = prices[lo:hi]
+
+        # 合併相鄰價格箱
+        factor = max(1, int(np.ceil(len(prices) / max_price_bins)))
+        usable = len(prices) // factor * factor
+        if usable == 0:
+            return None
+        depth = depth[:, :usable].reshape(len(times), -1, factor).sum(axis=2)
+        prices = prices[:usable].reshape(-1, factor).mean(axis=1)
+
+        # 每個快照歸入其所在的K線，按K線求平均
+        bar_pos = np.searchsorted(bar_ms, times, side='right') - 1
+        counts = np.bincount(bar_pos, minlength=len(bar_ms))
+        sums = np.zeros((len(bar_ms), depth.shape[1]))
+        np.add.at(sums, bar_pos, depth)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = sums / counts[:, None]
+        z[counts == 0] = np.nan
+
+        bar_times = bar_index if isinstance(bar_index, pd.DatetimeIndex) else pd.to_datetime(bar_ms, unit='ms')
+        return bar_times, prices, z.T.astype(np.float32)
+
+
+class DepthRecorder:
+    """定期抓取訂單簿快照寫入DepthStore的背景線程，可同時把原始快照追加到JSONL錄製文件"""
+
+    def __init__(self, data_fetcher, store, symbol, interval_seconds=30, limit=1000, recording_path=None):
+        self.data_fetcher = data_fetcher
+        self.store = store
+        self.symbol = symbol
+        self.interval_seconds = interval_seconds
+        self.limit = limit
+        self.recording_path = recording_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def capture(self):
+        """
+        抓取並寫入一個快照
+
+        Returns:
+            bool: 是否成功
+        """
+        book = self.data_fetcher.get_order_book(self.symbol, self.limit)
+        if not book:
+            return False
+        timestamp_ms = int(time.time() * 1000)
+        self.store.record(timestamp_ms, book['bids'], book['asks'])
+        if self.recording_path:
+            with open(self.recording_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'time': timestamp_ms, 'bids': book['bids'], 'asks': book['asks']}) + '\n')
+        return True
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'depth-{self.symbol}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # 單次抓取失敗不中斷錄製，但計數並記錄日誌
+            try:
+                if not self.capture():
+                    METRICS.inc('depth_capture_errors_total', help_text='訂單簿快照抓取失敗次數',
+                                symbol=self.symbol, reason='empty')
+            except Exception as e:
+                METRICS.inc('depth_capture_errors_total', help_text='訂單簿快照抓取失敗次數',
+                            symbol=self.symbol, reason='error')
+                logger.warning("%s 訂單簿快照抓取失敗: %r", self.symbol, e)
+            self._stop.wait(self.interval_seconds)
+
+
+class DepthReplayer:
+    """回放DepthRecorder錄製的JSONL深度文件，無需網絡即可重建快照庫"""
+
+    def __init__(self, recording_path):
+        self.recording_path = recording_path
+
+    def __iter__(self):
+        with open(self.recording_path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    snapshot = json.loads(line)
+                    yield snapshot['time'], snapshot['bids'], snapshot['asks']
+
+    def replay(self, store, speed=None):
+        """
+        把錄製的快照依序寫入快照庫
+
+        Args:
+            store (DepthStore): 目標快照庫
+            speed (float): 回放倍速；None表示不等待、盡快寫入
+
+        Returns:
+            int: 回放的快照數
+        """
+        count = 0
+        previous = None
+        for timestamp_ms, bids, asks in self:
+            if speed and previous is not None:
+                time.sleep(max(timestamp_ms - previous, 0) / 1000 / speed)
+            store.record(timestamp_ms, bids, asks)
+            previous = timestamp_ms
+            count += 1
+        return count
@@ -0,0 +1,148 @@
+import argparse
+import sys
+import time
+import numpy as np
+from indicator_registry import REGISTRY
+from technical_indicators import TechnicalIndicators
+from compact_frames import to_compact
+from mock_data_generator import MockDataGenerator
+
+# 精簡模式（float32）與float64結果比較時的相對容差，絕對容差按該列的量級縮放
+COMPACT_RTOL = 1e-4
+# 串流與批量比較時的容差
+STREAM_RTOL = 1e-9
+
+
+def default_config(spec):
+    """以指標的預設參數組成的配置"""
+    return {spec.key: True if spec.param_range is None else spec.param_range[2]}
+
+
+def _allclose(actual, expected, rtol):
+    actual = np.asarray(actual, dtype=float)
+    expected = np.asarray(expected, dtype=float)
+    finite = np.isfinite(expected)
+    scale = np.abs(expected[finite]).max() if finite.any() else 0.0
+    return np.allclose(actual, expected, rtol=rtol, atol=rtol * scale, equal_nan=True)
+
+
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _stream_rows(tech, config, spec, df):
+    """逐根K線送入串流模式，記錄每根K線的輸出；最後一根先以偏離的價格送入再以真實價格替換"""
+    stream = tech.streaming(config)
+    names = [name for name in spec.inputs if name != 'close']
+    fields = {name: df[name].to_numpy(dtype=float) for name in names}
+    closes = df['close'].to_numpy(dtype=float)
+    rows = []
+    last = len(df) - 1
+    for i, bar_time in enumerate(df.index):
+        if i == last:
+            stream.update(bar_time, closes[i] * 1.05, **{name: values[i] * 1.05 for name, values in fields.items()})
+        rows.append(stream.update(bar_time, closes[i], **{name: values[i] for name, values in fields.items()}))
+    return rows
+
+
+def check_parity(spec, df, tech=None):
+    """
+    檢查指標的各種計算路徑是否一致
+
+    - 批量結果包含登記的全部輸出列
+    - 精簡模式（float32）與相同數值的float64輸入結果一致
+    - 支持串流模式的指標逐根更新（含替換最後一根K線）與批量結果一致
+
+    Args:
+        spec (IndicatorSpec): 指標描述
+        df (pandas.DataFrame): OHLCV數據
+        tech (TechnicalIndicators): 計算器，可選
+
+    Returns:
+        list: 不一致之處的描述；為空表示全部通過
+    """
+    tech = tech or TechnicalIndicators()
+    config = default_config(spec)
+    columns = spec.columns(config[spec.key])
+    compact_input = to_compact(df)
+    reference = tech.calculate_indicators(compact_input.astype(np.float64), config)
+    missing = [column for column in columns if column not in reference.columns]
+    if missing:
+        return [f"缺少輸出列: {', '.join(missing)}"]
+
+    failures = []
+    compact = tech.calculate_indicators(compact_input, config)
+    for column in columns:
+        if not _allclose(compact[column], reference[column], COMPACT_RTOL):
+            failures.append(f"{column}: 精簡模式與float64結果不一致")
+
+    if spec.streaming:
+        batch = tech.calculate_indicators(df, config)
+        rows = _stream_rows(tech, config, spec, df)
+        for column in columns:
+            streamed = [row[column] for row in rows]
+            if not _allclose(streamed, batch[column], STREAM_RTOL):
+                failures.append(f"{column}: 串流模式與批量結果不一致")
+    return failures
+
+
+def benchmark(spec, df, repeat=3, stream_bars=20000, tech=None):
+    """
+    測量指標的批量計算耗時及串流模式的每根K線更新耗時
+
+    Args:
+        spec (IndicatorSpec): 指標描述
+        df (pandas.DataFrame): OHLCV數據
+        repeat (int): 重複次數，取最小值
+        stream_bars (int): 串流測量使用的K線數
+        tech (TechnicalIndicators): 計算器，可選
+
+    Returns:
+        tuple: (批量耗時毫秒, 串流每根K線耗時微秒；不支持串流時為None)
+    """
+    tech = tech or TechnicalIndicators()
+    config = default_config(spec)
+    batch_ms = _best_time(lambda: tech.calculate_indicators(df, config), repeat) * 1000
+    per_bar_us = None
+    if spec.streaming:
+        tail = df.tail(stream_bars)
+        per_bar_us = _best_time(lambda: tech.streaming(config, tail), 1) / len(tail) * 1e6
+    return batch_ms, per_bar_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description='對指標登記表中的每個指標做一致性檢查和基準測試')
+    parser.add_argument('--bars', type=int, default=100000, help='基準測試的K線數')
+    parser.add_argument('--parity-bars', type=int, default=2000, help='一致性檢查的K線數')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('keys', nargs='*', help='只檢查指定的配置鍵')
+    args = parser.parse_args()
+
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1m', args.bars)
+    parity_df = df.tail(args.parity_bars)
+    tech = TechnicalIndicators()
+
+    failures = 0
+    for key, spec in REGISTRY.items():
+        # 沒有輸出列的登記項（如成交量）只影響圖表佈局
+        if not spec.outputs or (args.keys and key not in args.keys):
+            continue
+        problems = check_parity(spec, parity_df, tech)
+        batch_ms, per_bar_us = benchmark(spec, df, args.repeat, tech=tech)
+        failures += bool(problems)
+        stream = f"{per_bar_us:6.1f} µs/根" if per_bar_us is not None else '      -    '
+        print(f"{'OK  ' if not problems else 'FAIL'} {key:<10} 批量 {batch_ms:8.1f} ms / {args.bars} 根  串流 {stream}")
+        for problem in problems:
+            print(f"     {problem}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from candle_patterns import detect_patterns
+from indicator_registry import REGISTRY
+
+# 分位數通道的各軌對應的分位
+QUANTILE_BANDS = {'upper': 0.9, 'middle': 0.5, 'lower': 0.1}
+
+
+def _first_valid(x):
+    """序列中第一個有效值，作為平方和的平移中心以減少相消誤差"""
+    idx = x.first_valid_index()
+    return 0.0 if idx is None else float(x.loc[idx])
+
+
+def _rolling_mad(x, rolling_sum, window):
+    """滾動平均絕對偏差（以滑動窗口視圖一次性向量化計算）"""
+    values = x.to_numpy(dtype=float)
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        windows = sliding_window_view(values, window)
+        mean = rolling_sum.to_numpy(dtype=float)[window - 1:] / window
+        result[window - 1:] = np.abs(windows - mean[:, None]).mean(axis=1)
+    return pd.Series(result, index=x.index)
+
+
+def _run_kernel(*series, key, params):
+    """執行已登記指標的核函數：輸入轉為float64數組，結果連同索引一起保存"""
+    arrays = [s.to_numpy(dtype=float) for s in series]
+    return series[0].index, REGISTRY[key].kernel(*arrays, **dict(params))
+
+
+# 節點運算：每個函數接收輸入節點的結果（pandas.Series）及參數
+NODE_OPS = {
+    'diff': lambda x: x.diff(),
+    'shift': lambda x, periods: x.shift(periods),
+    'gain': lambda x: x.where(x > 0, 0),
+    'loss': lambda x: -x.where(x < 0, 0),
+    'sub': lambda a, b: a - b,
+    # 以float64累加：精簡模式下float32的舍入誤差會被CCI的小分母放大
+    'typical_price': lambda high, low, close: (high.astype(float) + low + close) / 3,
+    'true_range': lambda high, low, prev_close: np.maximum(
+        high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close))),
+    'stoch_k': lambda close, lowest, highest: 100 * ((close - lowest) / (highest - lowest)),
+    'rolling_sum': lambda x, window: x.rolling(window=window).sum(),
+    'rolling_sumsq': lambda x, window: ((x - _first_valid(x)) ** 2).rolling(window=window).sum(),
+    'rolling_max': lambda x, window: x.rolling(window=window).max(),
+    'rolling_min': lambda x, window: x.rolling(window=window).min(),
+    'rolling_mad': _rolling_mad,
+    # 順序統計：pandas以跳表維護窗口，每根K線 O(log w)，不經過rolling().apply
+    'rolling_quantile': lambda x, window, q: x.rolling(window=window).quantile(q),
+    'rolling_rank': lambda x, window: x.rolling(window=window).rank(pct=True),
+    'ema': lambda x, span: x.ewm(span=span).mean(),
+    'kernel': _run_kernel
+}
+
+
+def _mean(rolling_sum, window):
+    return rolling_sum / window
+
+
+def _rsi(gain_sum, loss_sum):
+    rs = gain_sum / loss_sum
+    return 100 - (100 / (1 + rs))
+
+
+def _bollinger(x, rolling_sum, rolling_sumsq, window, std_dev, band):
+    middle = rolling_sum / window
+    if band == 'middle':
+        return middle
+    # 平移不變的樣本方差：Σ(x-c)² - (Σx - wc)² / w
+    shifted_sum = rolling_sum - window * _first_valid(x)
+    var = (rolling_sumsq - shifted_sum ** 2 / window) / (window - 1)
+    std = np.sqrt(var.clip(lower=0))
+    return middle + std * std_dev if band == 'upper' else middle - std * std_dev
+
+
+def _williams_r(close, lowest, highest):
+    return -100 * ((highest - close) / (highest - lowest))
+
+
+def _cci(tp, rolling_sum, mad, window):
+    return (tp - rolling_sum / window) / (0.015 * mad)
+
+
+def _identity(x):
+    return x
+
+
+def _kernel_column(result, name):
+    index, columns = result
+    return pd.Series(columns[name], index=index)
+
+
+def _candle_patterns(open_, high, low, close):
+    return pd.Series(detect_patterns(open_.to_numpy(), high.to_numpy(), low.to_numpy(), close.to_numpy()),
+                     index=close.index)
+
+
+class IndicatorPlan:
+    """指標計算計劃：按拓撲順序排列的去重節點及輸出列"""
+
+    def __init__(self):
+        # 節點鍵 -> (運算名, 輸入節點鍵, 參數)；插入順序即拓撲順序
+        self.nodes = {}
+        # 輸出列名 -> (終結函數, 輸入節點鍵, 參數)
+        self.outputs = {}
+
+    def node(self, op, *inputs, **params):
+        """登記節點；相同運算、輸入和參數的節點只會登記一次"""
+        key = (op, inputs, tuple(sorted(params.items())))
+        if key not in self.nodes:
+            self.nodes[key] = (op, inputs, params)
+        return key
+
+    def output(self, column, finalize, *inputs, **params):
+        self.outputs[column] = (finalize, inputs, params)
+
+    def execute(self, df):
+        """
+        執行計劃
+
+        Args:
+            df (pandas.DataFrame): OHLCV數據
+
+        Returns:
+            dict: 輸出列名 -> pandas.Series
+        """
+        results = {}
+        for key, (op, inputs, params) in self.nodes.items():
+            if op == 'col':
+                results[key] = df[params['name']]
+            else:
+                results[key] = NODE_OPS[op](*(results[k] for k in inputs), **params)
+
+        return {
+            column: finalize(*(results[k] for k in inputs), **params)
+            for column, (finalize, inputs, params) in self.outputs.items()
+        }
+
+
+class IndicatorPlanner:
+    """指標規劃器：把指標配置轉換為原始運算的有向無環圖，共享的中間結果只計算一次"""
+
+    def __init__(self):
+        self._plans = {}
+
+    def plan(self, indicators_config):
+        """
+        生成（並快取）指標配置對應的計算計劃
+
+        支持的配置鍵：sma、ema、rsi、macd、bb、stoch、williams、cci、atr、candles（K線形態位元）、
+        median（滾動中位數）、pct_rank（收盤價百分位排名）、qbands（分位數通道），
+        以及indicator_registry中以核函數登記的指標（如ichimoku、kdj、adx、vwap）；
+        其他鍵（如volume、smc）會被忽略。
+
+        Args:
+            indicators_config (dict): 指標配置
+
+        Returns:
+            IndicatorPlan: 計算計劃
+        """
+        cache_key = tuple(sorted((k, str(v)) for k, v in indicators_config.items()))
+        if cache_key not in self._plans:
+            self._plans[cache_key] = self._build(indicators_config)
+        return self._plans[cache_key]
+
+    def _build(self, config):
+        plan = IndicatorPlan()
+        close = plan.node('col', name='close')
+
+        if "sma" in config:
+            period = config["sma"]
+            plan.output(f'sma_{period}', _mean, plan.node('rolling_sum', close, window=period), window=period)
+
+        if "ema" in config:
+            period = config["ema"]
+            plan.output(f'ema_{period}', _identity, plan.node('ema', close, span=period))
+
+        if "rsi" in config:
+            period = config["rsi"]
+            delta = plan.node('diff', close)
+            gain_sum = plan.node('rolling_sum', plan.node('gain', delta), window=period)
+            loss_sum = plan.node('rolling_sum', plan.node('loss', delta), window=period)
+            plan.output('rsi', _rsi, gain_sum, loss_sum)
+
+        if "macd" in config:
+            macd_line = plan.node('sub', plan.node('ema', close, span=12), plan.node('ema', close, span=26))
+            macd_signal = plan.node('ema', macd_line, span=9)
+            plan.output('macd', _identity, macd_line)
+            plan.output('macd_signal', _identity, macd_signal)
+            plan.output('macd_hist', NODE_OPS['sub'], macd_line, macd_signal)
+
+        if "bb" in config:
+            period = config["bb"]
+            rolling_sum = plan.node('rolling_sum', close, window=period)
+            rolling_sumsq = plan.node('rolling_sumsq', close, window=period)
+            for band in ('upper', 'middle', 'lower'):
+                plan.output(f'bb_{band}', _bollinger, close, rolling_sum, rolling_sumsq,
+                            window=period, std_dev=2, band=band)
+
+        if "median" in config:
+            period = config["median"]
+            plan.output(f'median_{period}', _identity, plan.node('rolling_quantile', close, window=period, q=0.5))
+
+        if "pct_rank" in config:
+            period = config["pct_rank"]
+            plan.output(f'pct_rank_{period}', _identity, plan.node('rolling_rank', close, window=period))
+
+        if "qbands" in config:
+            period = config["qbands"]
+            for band, q in QUANTILE_BANDS.items():
+                plan.output(f'qband_{band}', _identity, plan.node('rolling_quantile', close, window=period, q=q))
+
+        if any(key in config for key in ("stoch", "williams", "atr", "cci", "candles")):
+            high = plan.node('col', name='high')
+            low = plan.node('col', name='low')
+
+        if "stoch" in config:
+            stoch = config["stoch"]
+            if isinstance(stoch, tuple):
+                k_period, d_period = stoch
+            else:
+                k_period, d_period = (14 if stoch is True else stoch), 3
+            k = plan.node('stoch_k', close,
+                          plan.node('rolling_min', low, window=k_period),
+                          plan.node('rolling_max', high, window=k_period))
+            plan.output('stoch_k', _identity, k)
+            plan.output('stoch_d', _mean, plan.node('rolling_sum', k, window=d_period), window=d_period)
+
+        if "williams" in config:
+            period = config["williams"]
+            plan.output('williams_r', _williams_r, close,
+                        plan.node('rolling_min', low, window=period),
+                        plan.node('rolling_max', high, window=period))
+
+        if "atr" in config:
+            period = config["atr"]
+            tr = plan.node('true_range', high, low, plan.node('shift', close, periods=1))
+            plan.output('atr', _mean, plan.node('rolling_sum', tr, window=period), window=period)
+
+        if "cci" in config:
+            period = config["cci"]
+            tp = plan.node('typical_price', high, low, close)
+            rolling_sum = plan.node('rolling_sum', tp, window=period)
+            plan.output('cci', _cci, tp, rolling_sum,
+                        plan.node('rolling_mad', tp, rolling_sum, window=period), window=period)
+
+        if "candles" in config:
+            plan.output('candle_patterns', _candle_patterns, plan.node('col', name='open'), high, low, close)
+
+        # 已登記的核函數指標：每個指標一個節點，多個輸出列共享同一次計算
+        for key, value in config.items():
+            spec = REGISTRY.get(key)
+            if spec is None or spec.kernel is None:
+                continue
+            inputs = [plan.node('col', name=name) for name in spec.inputs]
+            node = plan.node('kernel', *inputs, key=key, params=tuple(spec.params(value).items()))
+            for column in spec.columns(value):
+                plan.output(column, _kernel_column, node, name=column)
+
+        return plan
@@ -0,0 +1,397 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from rolling_stats import SortedWindow, RollingSum, RecursiveMean, NAN
+
+
+class IndicatorSpec:
+    """
+    已登記指標的描述
+
+    規劃器、串流模式、圖表、側邊欄和API都從這裡發現指標，新增指標只需登記一個IndicatorSpec。
+
+    核函數約定：kernel(*inputs, **params) 接收與inputs順序一致的float64數組，
+    返回 {輸出列名: 等長數組}；不依賴索引或DataFrame，相同輸入總得到相同輸出。
+    串流約定：stream(**params) 返回具有 push(*values)、replace_last(*values)、values()
+    三個方法的對象，values() 按outputs順序返回最新一根K線的值。
+
+    Args:
+        key (str): 配置鍵
+        label (str): 顯示名稱
+        outputs (tuple): 輸出列名模板，可含 {period}
+        inputs (tuple): 需要的OHLCV列
+        kernel (callable): 向量化核函數；None表示由IndicatorPlanner內建的運算圖計算
+        stream (callable): 串流更新對象的工廠，可選
+        streaming (bool): 內建指標是否由StreamingIndicators直接支持
+        pane (str): 'overlay' 疊加於主圖，'subplot' 獨立子圖
+        title (str): 子圖標題
+        height (float): 子圖高度比例
+        pane_order (int): 子圖排列順序，越小越靠上
+        param_range (tuple): 週期參數的 (最小值, 最大值, 預設值)；None表示只有開關
+        lines (tuple): 通用繪圖的線條 (列名模板, 名稱模板, 顏色, 額外的Scatter參數)
+        levels (tuple): 子圖中的水平參考線
+        y_range (tuple): 子圖Y軸範圍
+    """
+
+    def __init__(self, key, label, outputs=(), inputs=('close',), kernel=None, stream=None, streaming=False,
+                 pane='overlay', title=None, height=0.15, pane_order=50, param_range=None,
+                 lines=(), levels=(), y_range=None):
+        self.key = key
+        self.label = label
+        self.outputs = tuple(outputs)
+        self.inputs = tuple(inputs)
+        self.kernel = kernel
+        self.stream = stream
+        self.streaming = streaming or stream is not None
+        self.pane = pane
+        self.title = title or label
+        self.height = height
+        self.pane_order = pane_order
+        self.param_range = param_range
+        self.lines = tuple(lines)
+        self.levels = tuple(levels)
+        self.y_range = y_range
+
+    def period(self, value):
+        """配置值對應的週期；True表示使用預設值，沒有週期參數時為None"""
+        if self.param_range is None:
+            return None
+        return self.param_range[2] if value is True else int(value)
+
+    def params(self, value):
+        """配置值對應的核函數參數"""
+        period = self.period(value)
+        return {} if period is None else {'period': period}
+
+    def columns(self, value):
+        """配置值對應的輸出列名"""
+        period = self.period(value)
+        return [template.format(period=period) for template in self.outputs]
+
+    def traces(self, value):
+        """配置值對應的繪圖線條 (列名, 名稱, 顏色, 額外參數)"""
+        period = self.period(value)
+        return [(column.format(period=period), name.format(period=period), color, extra)
+                for column, name, color, extra in self.lines]
+
+
+REGISTRY = {}
+
+
+def register(spec):
+    """
+    登記指標；相同配置鍵的指標會被替換
+
+    Args:
+        spec (IndicatorSpec): 指標描述
+
+    Returns:
+        IndicatorSpec: 傳入的指標描述
+    """
+    REGISTRY[spec.key] = spec
+    return spec
+
+
+def get_spec(key):
+    return REGISTRY.get(key)
+
+
+def active_specs(indicators_config):
+    """
+    配置中啟用的已登記指標（按登記順序）
+
+    Args:
+        indicators_config (dict): 指標配置
+
+    Returns:
+        list: IndicatorSpec列表
+    """
+    return [spec for key, spec in REGISTRY.items() if key in indicators_config]
+
+
+def subplot_specs(indicators_config):
+    """配置中需要獨立子圖的指標，按pane_order排列"""
+    specs = [spec for spec in active_specs(indicators_config) if spec.pane == 'subplot']
+    return sorted(specs, key=lambda spec: spec.pane_order)
+
+
+def kernel_specs():
+    """以核函數實現的指標（側邊欄和圖表以通用方式處理）"""
+    return [spec for spec in REGISTRY.values() if spec.kernel is not None]
+
+
+# ---- 核函數的數組工具 ----
+
+def _rolling(values, window, how):
+    """滾動聚合（pandas的滾動最大/最小值為單調隊列實現，O(n)）"""
+    return getattr(pd.Series(values).rolling(window=window), how)().to_numpy()
+
+
+def _shift(values, periods):
+    """數組平移，空出的位置以NaN填充；periods為負數時向前平移"""
+    shifted = np.full(len(values), np.nan)
+    if periods > 0:
+        shifted[periods:] = values[:len(values) - periods]
+    elif periods < 0:
+        shifted[:periods] = values[-periods:]
+    return shifted
+
+
+def _ratio(numerator, denominator):
+    """比值；分母為0時取0（沒有波動），NaN照常傳播"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = numerator / denominator
+    result[denominator == 0] = 0.0
+    return result
+
+
+def _recursive_mean(values, alpha, initial=None, min_periods=1):
+    """遞歸平均，與RecursiveMean的逐根更新一致：跳過開頭的NaN，可指定起始值"""
+    result = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return result
+    first = valid[0]
+    if initial is None:
+        seq, offset = values[first:], 0
+    else:
+        seq, offset = np.concatenate(([initial], values[first:])), 1
+    smoothed = pd.Series(seq).ewm(alpha=alpha, adjust=False, min_periods=min_periods + offset).mean()
+    result[first:] = smoothed.to_numpy()[offset:]
+    return result
+
+
+def _midpoint(high, low, window):
+    return (_rolling(high, window, 'max') + _rolling(low, window, 'min')) / 2
+
+
+# ---- 一目均衡表 ----
+
+def ichimoku(high, low, close):
+    """一目均衡表：轉換線(9)、基準線(26)、先行帶A/B(向後平移26)、遲行線(收盤價向前平移26)"""
+    tenkan = _midpoint(high, low, 9)
+    kijun = _midpoint(high, low, 26)
+    return {
+        'ichimoku_tenkan': tenkan,
+        'ichimoku_kijun': kijun,
+        'ichimoku_senkou_a': _shift((tenkan + kijun) / 2, 26),
+        'ichimoku_senkou_b': _shift(_midpoint(high, low, 52), 26),
+        'ichimoku_chikou': _shift(close, -26)
+    }
+
+
+# ---- KDJ ----
+
+def _rsv(close, lowest, highest):
+    """未成熟隨機值；區間為0時取中性值50"""
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = 100 * (close - lowest) / span
+    return np.where(span == 0, 50.0, rsv)
+
+
+def kdj(high, low, close, period=9):
+    """KDJ：K、D為RSV的1/3遞歸平均（起始值50），J = 3K - 2D"""
+    rsv = _rsv(close, _rolling(low, period, 'min'), _rolling(high, period, 'max'))
+    k = _recursive_mean(rsv, 1 / 3, initial=50.0)
+    d = _recursive_mean(k, 1 / 3, initial=50.0)
+    return {'kdj_k': k, 'kdj_d': d, 'kdj_j': 3 * k - 2 * d}
+
+
+class KdjStream:
+    """KDJ逐根更新：窗口最高/最低價以SortedWindow維護"""
+
+    def __init__(self, period=9):
+        self.highs = SortedWindow(period)
+        self.lows = SortedWindow(period)
+        self.k = RecursiveMean(1 / 3, initial=50.0)
+        self.d = RecursiveMean(1 / 3, initial=50.0)
+
+    def _current_rsv(self, close):
+        if not self.highs.full:
+            return NAN
+        lowest, highest = self.lows.min(), self.highs.max()
+        return 50.0 if highest == lowest else 100 * (close - lowest) / (highest - lowest)
+
+    def push(self, high, low, close):
+        self.highs.push(high)
+        self.lows.push(low)
+        self.k.push(self._current_rsv(close))
+        self.d.push(self.k.value())
+
+    def replace_last(self, high, low, close):
+        self.highs.replace_last(high)
+        self.lows.replace_last(low)
+        self.k.replace_last(self._current_rsv(close))
+        self.d.replace_last(self.k.value())
+
+    def values(self):
+        k, d = self.k.value(), self.d.value()
+        return k, d, 3 * k - 2 * d
+
+
+# ---- ADX ----
+
+def adx(high, low, close, period=14):
+    """平均趨向指標：+DM/-DM/TR以Wilder平滑（alpha=1/period），ADX為DX的Wilder平滑"""
+    up = high - _shift(high, 1)
+    down = _shift(low, 1) - low
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    plus_dm[np.isnan(up)] = np.nan
+    minus_dm[np.isnan(up)] = np.nan
+    prev_close = _shift(close, 1)
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+    alpha = 1 / period
+    atr = _recursive_mean(tr, alpha, min_periods=period)
+    plus_di = 100 * _ratio(_recursive_mean(plus_dm, alpha, min_periods=period), atr)
+    minus_di = 100 * _ratio(_recursive_mean(minus_dm, alpha, min_periods=period), atr)
+    dx = 100 * _ratio(np.abs(plus_di - minus_di), plus_di + minus_di)
+    return {'adx': _recursive_mean(dx, alpha, min_periods=period), 'plus_di': plus_di, 'minus_di': minus_di}
+
+
+def _scalar_ratio(numerator, denominator):
+    return 0.0 if denominator == 0 else numerator / denominator
+
+
+class AdxStream:
+    """ADX逐根更新：保留最近兩根K線以計算方向變動和真實範圍"""
+
+    def __init__(self, period=14):
+        alpha = 1 / period
+        self.bars = deque(maxlen=2)
+        self.tr = RecursiveMean(alpha, min_periods=period)
+        self.plus_dm = RecursiveMean(alpha, min_periods=period)
+        self.minus_dm = RecursiveMean(alpha, min_periods=period)
+        self.adx = RecursiveMean(alpha, min_periods=period)
+
+    def _update(self, replace):
+        if len(self.bars) == 2:
+            (high0, low0, close0), (high, low, close) = self.bars
+            up, down = high - high0, low0 - low
+            plus_dm = up if up > down and up > 0 else 0.0
+            minus_dm = down if down > up and down > 0 else 0.0
+            tr = max(high - low, abs(high - close0), abs(low - close0))
+        else:
+            plus_dm = minus_dm = tr = NAN
+        for state, value in ((self.tr, tr), (self.plus_dm, plus_dm), (self.minus_dm, minus_dm)):
+            if replace:
+                state.replace_last(value)
+            else:
+                state.push(value)
+        plus_di, minus_di = self._di()
+        dx = 100 * _scalar_ratio(abs(plus_di - minus_di), plus_di + minus_di)
+        if replace:
+            self.adx.replace_last(dx)
+        else:
+            self.adx.push(dx)
+
+    def _di(self):
+        atr = self.tr.value()
+        return (100 * _scalar_ratio(self.plus_dm.value(), atr),
+                100 * _scalar_ratio(self.minus_dm.value(), atr))
+
+    def push(self, high, low, close):
+        self.bars.append((high, low, close))
+        self._update(replace=False)
+
+    def replace_last(self, high, low, close):
+        self.bars[-1] = (high, low, close)
+        self._update(replace=True)
+
+    def values(self):
+        plus_di, minus_di = self._di()
+        return (self.adx.value(), plus_di, minus_di)
+
+
+# ---- 滾動VWAP ----
+
+def rolling_vwap(high, low, close, volume, period=20):
+    """滾動成交量加權平均價：Σ(典型價格×成交量) / Σ成交量"""
+    typical = (high + low + close) / 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = _rolling(typical * volume, period, 'sum') / _rolling(volume, period, 'sum')
+    return {f'vwap_{period}': vwap}
+
+
+class VwapStream:
+    """滾動VWAP逐根更新：兩個滾動和"""
+
+    def __init__(self, period=20):
+        self.weighted = RollingSum(period)
+        self.volume = RollingSum(period)
+
+    def push(self, high, low, close, volume):
+        self.weighted.push((high + low + close) / 3 * volume)
+        self.volume.push(volume)
+
+    def replace_last(self, high, low, close, volume):
+        self.weighted.replace_last((high + low + close) / 3 * volume)
+        self.volume.replace_last(volume)
+
+    def values(self):
+        if not self.volume.full or self.volume.total == 0:
+            return (NAN,)
+        return (self.weighted.total / self.volume.total,)
+
+
+# ---- 內建指標：由IndicatorPlanner的運算圖計算，共享中間結果 ----
+
+register(IndicatorSpec('sma', '簡單移動平均線 (SMA)', outputs=('sma_{period}',), streaming=True,
+                       param_range=(5, 200, 20)))
+register(IndicatorSpec('ema', '指數移動平均線 (EMA)', outputs=('ema_{period}',), streaming=True,
+                       param_range=(5, 200, 12)))
+register(IndicatorSpec('rsi', '相對強弱指標 (RSI)', outputs=('rsi',), streaming=True,
+                       pane='subplot', title='RSI', pane_order=10, param_range=(5, 50, 14)))
+register(IndicatorSpec('macd', 'MACD', outputs=('macd', 'macd_signal', 'macd_hist'),
+                       pane='subplot', title='MACD', pane_order=20))
+register(IndicatorSpec('bb', '布林通道 (Bollinger Bands)', outputs=('bb_upper', 'bb_middle', 'bb_lower'),
+                       param_range=(10, 50, 20)))
+register(IndicatorSpec('qbands', '分位數通道 (Quantile Bands)', streaming=True,
+                       outputs=('qband_upper', 'qband_middle', 'qband_lower'), param_range=(10, 200, 50)))
+register(IndicatorSpec('median', '滾動中位數', outputs=('median_{period}',), streaming=True,
+                       param_range=(5, 200, 20)))
+register(IndicatorSpec('pct_rank', '收盤價百分位排名', outputs=('pct_rank_{period}',), streaming=True,
+                       param_range=(10, 500, 100)))
+register(IndicatorSpec('stoch', '隨機指標 (Stochastic)', outputs=('stoch_k', 'stoch_d'),
+                       inputs=('high', 'low', 'close')))
+register(IndicatorSpec('williams', '威廉指標 (Williams %R)', outputs=('williams_r',),
+                       inputs=('high', 'low', 'close'), param_range=(5, 50, 14)))
+register(IndicatorSpec('cci', '順勢指標 (CCI)', outputs=('cci',), inputs=('high', 'low', 'close'),
+                       param_range=(5, 50, 20)))
+register(IndicatorSpec('atr', '平均真實範圍 (ATR)', outputs=('atr',), inputs=('high', 'low', 'close'),
+                       param_range=(5, 50, 14)))
+register(IndicatorSpec('candles', 'K線形態標記', outputs=('candle_patterns',),
+                       inputs=('open', 'high', 'low', 'close')))
+register(IndicatorSpec('volume', '成交量', inputs=('volume',), pane='subplot', title='成交量',
+                       height=0.1, pane_order=90))
+
+# ---- 以核函數實現的指標 ----
+
+register(IndicatorSpec(
+    'ichimoku', '一目均衡表 (Ichimoku)', kernel=ichimoku, inputs=('high', 'low', 'close'),
+    outputs=('ichimoku_tenkan', 'ichimoku_kijun', 'ichimoku_senkou_a', 'ichimoku_senkou_b', 'ichimoku_chikou'),
+    lines=(('ichimoku_tenkan', '轉換線', '#ff6b81', {}),
+           ('ichimoku_kijun', '基準線', '#1e90ff', {}),
+           ('ichimoku_senkou_a', '先行帶A', '#2ed573', {}),
+           ('ichimoku_senkou_b', '先行帶B', '#ff4757', dict(fill='tonexty', fillcolor='rgba(164, 176, 190, 0.12)')),
+           ('ichimoku_chikou', '遲行線', '#a4b0be', dict(line_dash='dot')))
+))
+register(IndicatorSpec(
+    'kdj', 'KDJ隨機指標', kernel=kdj, stream=KdjStream, inputs=('high', 'low', 'close'),
+    outputs=('kdj_k', 'kdj_d', 'kdj_j'), pane='subplot', title='KDJ', pane_order=30,
+    param_range=(5, 50, 9), levels=(20, 80),
+    lines=(('kdj_k', 'K', '#ffa502', {}), ('kdj_d', 'D', '#3742fa', {}), ('kdj_j', 'J', '#ff6b81', {}))
+))
+register(IndicatorSpec(
+    'adx', 'ADX趨向指標', kernel=adx, stream=AdxStream, inputs=('high', 'low', 'close'),
+    outputs=('adx', 'plus_di', 'minus_di'), pane='subplot', title='ADX', pane_order=40,
+    param_range=(5, 50, 14), levels=(25,), y_range=(0, 100),
+    lines=(('adx', 'ADX', '#eccc68', {}), ('plus_di', '+DI', '#2ed573', {}), ('minus_di', '-DI', '#ff4757', {}))
+))
+register(IndicatorSpec(
+    'vwap', '滾動VWAP', kernel=rolling_vwap, stream=VwapStream, inputs=('high', 'low', 'close', 'volume'),
+    outputs=('vwap_{period}',), param_range=(5, 200, 20),
+    lines=(('vwap_{period}', 'VWAP({period})', '#70a1ff', dict(line_dash='dash')),)
+))
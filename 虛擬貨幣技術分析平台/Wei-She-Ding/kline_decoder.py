@@ -0,0 +1,156 @@
+import json
+import time
+import pandas as pd
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson為可選依賴，未安裝時使用標準庫json
+    orjson = None
+
+# Binance K線每行12個字段：開盤時間、開高低收量、收盤時間及6個不需要的統計字段
+KLINE_FIELDS = 12
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 快速路徑只需刪除的字符：引號、方括號和空白
+_STRIP_CHARS = b'"[] \t\r\n'
+
+
+def loads(content):
+    """解析JSON，安裝了orjson時優先使用"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def klines_to_frame(times_ms, ohlcv):
+    """
+    由數組一次性構建K線數據框
+
+    Args:
+        times_ms (ndarray): int64 開盤時間（毫秒）
+        ohlcv (ndarray): (K線數 × 5) float64 開高低收量
+
+    Returns:
+        pandas.DataFrame: 以 'timestamp' 為索引的OHLCV數據
+    """
+    index = pd.DatetimeIndex(np.asarray(times_ms, dtype=np.int64).astype('datetime64[ms]'), name='timestamp')
+    # Fortran順序使每一列在內存中連續，copy=False避免再複製一次
+    return pd.DataFrame(np.asfortranarray(ohlcv, dtype=np.float64), index=index,
+                        columns=OHLCV_COLUMNS, copy=False)
+
+
+def _decode_text(content):
+    """
+    快速路徑：K線數組的所有字段都是數字或數字字符串，
+    刪除引號和括號後即為逗號分隔的數字，可由NumPy直接解析。
+
+    解析結果必須與響應的行數和每行字段數完全吻合才接受：fromstring遇到無法解析的內容時
+    可能只返回前面的部分（舊版NumPy只發出DeprecationWarning），字段數不齊的行也會使其餘的行錯位。
+    不吻合時拋出ValueError，由調用方改走通用路徑。
+    """
+    # 第i行的結束括號之前應恰有 12i+11 個逗號（字段均為數字，不含逗號和括號）
+    buf = np.frombuffer(content, dtype=np.uint8)
+    row_ends = np.flatnonzero(buf == ord(']'))[:-1]
+    commas_before = np.searchsorted(np.flatnonzero(buf == ord(',')), row_ends)
+    if not np.array_equal(commas_before, np.arange(len(row_ends)) * KLINE_FIELDS + KLINE_FIELDS - 1):
+        raise ValueError("K線字段數不符")
+
+    flat = np.fromstring(content.translate(None, _STRIP_CHARS).decode('ascii'), sep=',')
+    if flat.size != len(row_ends) * KLINE_FIELDS:
+        raise ValueError("K線字段數不符")
+    rows = flat.reshape(-1, KLINE_FIELDS)
+    return rows[:, 0].astype(np.int64), rows[:, 1:6]
+
+
+def _decode_rows(rows):
+    """通用路徑：從已解析的JSON列表中只取需要的字段"""
+    n = len(rows)
+    times_ms = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+    ohlcv = np.fromiter((float(value) for row in rows for value in row[1:6]),
+                        dtype=np.float64, count=n * 5).reshape(n, 5)
+    return times_ms, ohlcv
+
+
+def decode_klines(content):
+    """
+    把 /api/v3/klines 的響應內容解碼為K線數據框
+
+    Args:
+        content (bytes): 原始響應內容
+
+    Returns:
+        pandas.DataFrame: K線數據；若響應不是K線數組（如錯誤信息），返回解析後的JSON對象
+    """
+    head = content.lstrip()[:1]
+    if head != b'[':
+        return loads(content)
+    try:
+        times_ms, ohlcv = _decode_text(content)
+    except (ValueError, UnicodeDecodeError):
+        times_ms, ohlcv = _decode_rows(loads(content))
+    return klines_to_frame(times_ms, ohlcv)
+
+
+def _legacy_frame(content):
+    """原有的解碼方式（僅供基準測試對照）"""
+    data = json.loads(content)
+    df = pd.DataFrame(data, columns=[
+        'timestamp', 'open', 'high', 'low', 'close', 'volume',
+        'close_time', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+    ])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    for col in OHLCV_COLUMNS:
+        df[col] = df[col].astype(float)
+    df.set_index('timestamp', inplace=True)
+    return df[OHLCV_COLUMNS]
+
+
+def _sample_payload(n_bars, seed=0):
+    """生成與Binance格式一致的K線響應內容"""
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.002, n_bars)))
+    start = 1_700_000_000_000
+    rows = []
+    for i, price in enumerate(close):
+        open_time = start + i * 60_000
+        rows.append([
+            open_time, f"{price * 0.999:.8f}", f"{price * 1.002:.8f}", f"{price * 0.997:.8f}",
+            f"{price:.8f}", f"{rng.uniform(1, 500):.8f}", open_time + 59_999,
+            f"{rng.uniform(1e4, 1e6):.8f}", int(rng.integers(10, 5000)),
+            f"{rng.uniform(1, 200):.8f}", f"{rng.uniform(1e4, 5e5):.8f}", "0"
+        ])
+    return json.dumps(rows, separators=(',', ':')).encode('utf-8')
+
+
+def benchmark(sizes=(500, 10_000, 100_000), repeat=5):
+    """
+    與原解碼方式對比耗時，並校驗結果完全一致
+
+    Returns:
+        list: [(K線數, 原方式毫秒, 新方式毫秒), ...]
+    """
+    results = []
+    for n_bars in sizes:
+        content = _sample_payload(n_bars)
+        expected = _legacy_frame(content)
+        actual = decode_klines(content)
+        pd.testing.assert_frame_equal(actual, expected)
+
+        timings = []
+        for decode in (_legacy_frame, decode_klines):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                decode(content)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best * 1000)
+        results.append((n_bars, timings[0], timings[1]))
+    return results
+
+
+if __name__ == '__main__':
+    print(f"orjson: {'已安裝' if orjson is not None else '未安裝'}")
+    for n_bars, legacy_ms, fast_ms in benchmark():
+        print(f"{n_bars:>7} 根K線  原方式 {legacy_ms:8.2f} ms  新方式 {fast_ms:8.2f} ms  加速 {legacy_ms / fast_ms:5.1f}x")
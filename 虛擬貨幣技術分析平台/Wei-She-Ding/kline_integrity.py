@@ -0,0 +1,325 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis_cache import INTERVAL_MS
+from columnar_codec import index_to_ms
+from metrics import METRICS, span
+
+# 補取後仍存在的缺口的處理方式：
+#   ffill - 插入以前一收盤價為開高低收、成交量為0的K線，滾動指標和SMC擺動點窗口按K線數對齊
+#   mask  - 插入全為NaN的K線，跨越缺口的滾動窗口結果為NaN
+FILL_MODES = ('ffill', 'mask')
+
+OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+def scan(times_ms, step_ms):
+    """
+    以int64時間戳差分檢查K線序列
+
+    Args:
+        times_ms (ndarray): 開盤時間（毫秒）
+        step_ms (int): 時間週期的毫秒數
+
+    Returns:
+        dict: unordered（時間倒退的位置數）、duplicates（重複的K線數）、misaligned（未對齊週期的K線數）、
+            gaps（缺口的 [開始, 結束) 毫秒，形狀 (n, 2)）、missing（缺失的K線數）
+    """
+    times = np.asarray(times_ms, dtype=np.int64)
+    diffs = np.diff(times)
+    unordered = int((diffs < 0).sum())
+    if unordered:
+        times = np.sort(times)
+        diffs = np.diff(times)
+    at = np.flatnonzero(diffs > step_ms)
+    return {
+        'unordered': unordered,
+        'duplicates': int((diffs == 0).sum()),
+        'misaligned': int((times % step_ms != 0).sum()),
+        'gaps': np.column_stack((times[at] + step_ms, times[at + 1])),
+        'missing': int(((diffs[at] - 1) // step_ms).sum())
+    }
+
+
+def _dedupe(times, values):
+    """排序並去除重複時間，重複時保留最後出現的一根（較新的數據，與HistoryStore.append一致）"""
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    keep = np.ones(len(times), dtype=bool)
+    keep[:-1] = times[1:] != times[:-1]
+    return times[keep], values[keep]
+
+
+def regularize(times, values, step_ms, columns, fill='ffill'):
+    """
+    把去重後的K線放到等間隔網格上，缺失的位置按fill填充
+
+    Args:
+        times (ndarray): 已排序且不重複的開盤時間（毫秒）
+        values (ndarray): (K線數 × 列數) 的數值
+        step_ms (int): 時間週期的毫秒數
+        columns (list): 列名
+        fill (str): 'ffill' 或 'mask'
+
+    Returns:
+        tuple: (網格時間, 網格數值, 是否為填充K線的布爾數組)
+    """
+    if len(times) == 0:
+        return times, values, np.zeros(0, dtype=bool)
+    positions = (times - times[0]) // step_ms
+    grid = times[0] + np.arange(positions[-1] + 1, dtype=np.int64) * step_ms
+    out = np.full((len(grid), values.shape[1]), np.nan)
+    out[positions] = values
+    filled = np.ones(len(grid), dtype=bool)
+    filled[positions] = False
+
+    if fill == 'ffill' and filled.any():
+        # 每個位置之前最近一根真實K線的位置
+        previous = np.maximum.accumulate(np.where(filled, 0, np.arange(len(grid))))
+        out[filled] = out[previous[filled]]
+        if 'close' in columns:
+            close = out[filled, columns.index('close')]
+            for name in OHLC_COLUMNS:
+                if name in columns:
+                    out[filled, columns.index(name)] = close
+        if 'volume' in columns:
+            out[filled, columns.index('volume')] = 0.0
+    return grid, out, filled
+
+
+def _rebuild_index(index, times):
+    """以原索引的類型（DatetimeIndex含時區，或毫秒整數）重建索引"""
+    if isinstance(index, pd.DatetimeIndex):
+        rebuilt = pd.DatetimeIndex(times.astype('datetime64[ms]'), name=index.name)
+        return rebuilt.tz_localize('UTC').tz_convert(index.tz) if index.tz is not None else rebuilt
+    return pd.Index(times, name=index.name)
+
+
+class KlineIntegrity:
+    """
+    K線數據完整性檢查與修復
+
+    以int64時間戳差分找出重複和缺口，只對缺口的時間範圍補取數據（所有缺口共用一個有界線程池），
+    補取後仍缺失的K線按填充方式處理，並按 (交易對, 時間週期) 保留最近一次的完整性報告。
+    """
+
+    def __init__(self, data_fetcher=None, max_workers=4, fill='ffill', max_refetch_bars=20000):
+        """
+        Args:
+            data_fetcher: 提供get_kline_range的數據獲取器；為None時只去重和填充，不補取
+            max_workers (int): 並發補取的最大請求數
+            fill (str): 補取後仍存在的缺口的處理方式，見FILL_MODES
+            max_refetch_bars (int): 每個序列最多補取的K線數，超出部分（較早的缺口）直接填充
+        """
+        if fill not in FILL_MODES:
+            raise ValueError(f"不支持的填充方式: {fill}")
+        self.data_fetcher = data_fetcher
+        self.max_workers = max_workers
+        self.fill = fill
+        self.max_refetch_bars = max_refetch_bars
+        self.reports = {}
+        self._lock = threading.Lock()
+
+    def check(self, symbol, interval, df):
+        """
+        只檢查不修復，並記錄報告
+
+        Args:
+            symbol (str): 交易對
+            interval (str): 時間間隔
+            df (pandas.DataFrame): K線數據
+
+        Returns:
+            dict: 完整性報告
+        """
+        found = scan(index_to_ms(df.index), INTERVAL_MS[interval])
+        report = self._report(symbol, interval, len(df), found)
+        self._record(report)
+        return report
+
+    def _report(self, symbol, interval, bars, found):
+        return {
+            'symbol': symbol,
+            'interval': interval,
+            'bars': bars,
+            'unordered': found['unordered'],
+            'duplicates': found['duplicates'],
+            'misaligned': found['misaligned'],
+            'gaps': len(found['gaps']),
+            'missing': found['missing'],
+            'refetched': 0,
+            'filled': 0,
+            'remaining_gaps': [],
+            'checked_at': time.time()
+        }
+
+    def _record(self, report):
+        with self._lock:
+            self.reports[(report['symbol'], report['interval'])] = report
+        labels = {'interval': report['interval']}
+        if report['duplicates']:
+            METRICS.inc('kline_duplicates_total', report['duplicates'], help_text='發現的重複K線數', **labels)
+        if report['missing']:
+            METRICS.inc('kline_missing_total', report['missing'], help_text='發現的缺失K線數', **labels)
+        if report['refetched']:
+            METRICS.inc('kline_refetched_total', report['refetched'], help_text='補取回來的K線數', **labels)
+
+    def _ranges(self, gaps, step_ms):
+        """從最近的缺口開始，在補取上限之內選出需要補取的範圍"""
+        budget = self.max_refetch_bars
+        ranges = []
+        for start, end in gaps[::-1]:
+            if budget <= 0:
+                break
+            count = (end - start) // step_ms
+            start = max(start, end - budget * step_ms)
+            ranges.append((int(start), int(end)))
+            budget -= count
+        return ranges[::-1]
+
+    def _fetch(self, jobs):
+        """
+        並發補取各序列的缺失範圍
+
+        Args:
+            jobs (list): [(鍵, 交易對, 時間週期, 開始毫秒, 結束毫秒), ...]
+
+        Returns:
+            dict: 鍵 -> 補取到的數據框列表
+        """
+        results = {}
+        if not jobs or self.data_fetcher is None:
+            return results
+
+        def fetch(job):
+            key, symbol, interval, start, end = job
+            return key, self.data_fetcher.get_kline_range(symbol, interval, start, end)
+
+        with span('refetch_gaps'):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for key, df in executor.map(fetch, jobs):
+                    if df is not None and not df.empty:
+                        results.setdefault(key, []).append(df)
+        return results
+
+    def repair_many(self, frames):
+        """
+        修復多個序列：去重、補取全部缺口（共用同一個有界線程池）、填充剩餘缺口
+
+        沒有問題的序列原樣返回，不複製。
+
+        Args:
+            frames (dict): (交易對, 時間週期) -> K線數據框
+
+        Returns:
+            dict: (交易對, 時間週期) -> 修復後的數據框（attrs['integrity']為其報告）
+        """
+        scans = {}
+        jobs = []
+        for key, df in frames.items():
+            symbol, interval = key
+            step_ms = INTERVAL_MS[interval]
+            found = scan(index_to_ms(df.index), step_ms)
+            scans[key] = found
+            jobs.extend((key, symbol, interval, start, end) for start, end in self._ranges(found['gaps'], step_ms))
+
+        fetched = self._fetch(jobs)
+        return {key: self._assemble(key, df, scans[key], fetched.get(key, [])) for key, df in frames.items()}
+
+    def repair(self, symbol, interval, df):
+        """
+        修復單個序列
+
+        Args:
+            symbol (str): 交易對
+            interval (str): 時間間隔
+            df (pandas.DataFrame): K線數據
+
+        Returns:
+            pandas.DataFrame: 修復後的數據框；沒有問題時為原數據框
+        """
+        return self.repair_many({(symbol, interval): df})[(symbol, interval)]
+
+    def _assemble(self, key, df, found, fetched):
+        symbol, interval = key
+        step_ms = INTERVAL_MS[interval]
+        report = self._report(symbol, interval, len(df), found)
+        if not (found['unordered'] or found['duplicates'] or len(found['gaps'])):
+            self._record(report)
+            return df
+
+        columns = list(df.columns)
+        times = index_to_ms(df.index)
+        values = df.to_numpy(dtype=np.float64)
+        times, values = _dedupe(times, values)
+
+        # 只採用落在缺口內的補取K線，已有的K線不被覆蓋
+        for extra in fetched:
+            extra_times = index_to_ms(extra.index)
+            inside = ~np.isin(extra_times, times)
+            inside &= (extra_times > times[0]) & (extra_times < times[-1])
+            if not inside.any():
+                continue
+            rows = np.full((int(inside.sum()), len(columns)), np.nan)
+            for j, name in enumerate(columns):
+                if name in extra.columns:
+                    rows[:, j] = extra[name].to_numpy(dtype=np.float64)[inside]
+            report['refetched'] += len(rows)
+            times, values = _dedupe(np.concatenate([times, extra_times[inside]]), np.vstack([values, rows]))
+
+        grid, out, filled = regularize(times, values, step_ms, columns, self.fill)
+        report['filled'] = int(filled.sum())
+        if filled.any():
+            report['remaining_gaps'] = [[int(start), int(end)] for start, end in scan(times, step_ms)['gaps']]
+        self._record(report)
+
+        # 浮點列保持原精度（精簡模式為float32），其他列因可能含NaN改為float64
+        data = {}
+        for j, name in enumerate(columns):
+            dtype = df[name].dtype
+            data[name] = out[:, j].astype(dtype, copy=False) if np.issubdtype(dtype, np.floating) else out[:, j]
+        repaired = pd.DataFrame(data, index=_rebuild_index(df.index, grid))
+        repaired.attrs.update(df.attrs)
+        repaired.attrs['integrity'] = report
+        return repaired
+
+    def repair_history(self, store, symbols, interval):
+        """
+        修復收盤價歷史庫（pattern_search.HistoryStore）中的缺口：補取缺失範圍後合併寫回；
+        fill為ffill時以前一收盤價填充剩餘缺口，mask時保留缺口（形態搜索不接受NaN）
+
+        Args:
+            store (HistoryStore): 歷史庫
+            symbols (list): 交易對
+            interval (str): 時間間隔
+
+        Returns:
+            dict: 交易對 -> 完整性報告
+        """
+        frames = {}
+        for symbol in symbols:
+            history = np.asarray(store.load(symbol, interval))
+            if len(history):
+                frames[(symbol, interval)] = pd.DataFrame(
+                    {'close': history['close']}, index=pd.Index(history['time'], name='timestamp'))
+
+        reports = {}
+        for (symbol, _), df in self.repair_many(frames).items():
+            if df is not frames[(symbol, interval)]:
+                store.append(symbol, interval, df.dropna(subset=['close']))
+            reports[symbol] = self.reports[(symbol, interval)]
+        return reports
+
+    def report_frame(self):
+        """
+        各序列最近一次的完整性報告
+
+        Returns:
+            pandas.DataFrame: 每行一個 (交易對, 時間週期)
+        """
+        with self._lock:
+            reports = list(self.reports.values())
+        columns = ['symbol', 'interval', 'bars', 'duplicates', 'gaps', 'missing', 'refetched', 'filled']
+        return pd.DataFrame([{name: report[name] for name in columns} for report in reports], columns=columns)
@@ -0,0 +1,171 @@
+import asyncio
+import base64
+import numpy as np
+from columnar_codec import encode_tables
+from metrics import METRICS
+
+# 每個訂閱者積壓事件的上限；慢客戶端超出時丟棄積壓，改發一份完整快照
+QUEUE_SIZE = 16
+
+# 已收盤的K線只比較這些列：遞歸類指標（EMA、MACD等）的歷史值會隨計算窗口的滑動而微小變化，
+# 已發送的歷史指標值不因此重發
+KLINE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def changed_rows(previous, current):
+    """
+    找出current中相對previous新增或數值改變的K線
+
+    上一次最後一根及之後的K線比較全部列，更早的（已收盤）K線只比較KLINE_COLUMNS，
+    以發現補取或修復造成的數據變化。
+
+    Args:
+        previous (dict): 上一次的 {列名: ndarray}，含按時間遞增的time列；為None表示沒有上一次
+        current (dict): 本次的 {列名: ndarray}
+
+    Returns:
+        ndarray: current中需要發送的行號
+    """
+    times = current['time']
+    if previous is None or previous.keys() != current.keys() or not len(previous['time']):
+        return np.arange(len(times))
+
+    previous_times = previous['time']
+    at = np.minimum(np.searchsorted(previous_times, times), len(previous_times) - 1)
+    changed = previous_times[at] != times
+    tail = times >= previous_times[-1]
+    for name, values in current.items():
+        if name == 'time':
+            continue
+        old = previous[name][at]
+        differs = old != values
+        if values.dtype.kind == 'f':
+            differs &= ~(np.isnan(old) & np.isnan(values))
+        changed |= differs if name in KLINE_COLUMNS else differs & tail
+    return np.flatnonzero(changed)
+
+
+def encode_event(kind, seq, columns, meta):
+    """
+    把一組列編碼為一個SSE事件：data為base64的列式二進制（見columnar_codec.encode_tables）
+
+    Returns:
+        bytes: 以空行結尾的事件文本
+    """
+    payload = base64.b64encode(encode_tables({'klines': columns}, dict(meta, seq=seq, kind=kind)))
+    return b'id: %d\nevent: %s\ndata: ' % (seq, kind.encode('ascii')) + payload + b'\n\n'
+
+
+class StreamChannel:
+    """
+    一個 (交易對, 時間週期, K線數, 指標配置) 的推送頻道
+
+    所有訂閱者共用同一個輪詢任務：每輪計算一次，與上一輪逐列比較，
+    只把新增或改變的K線（含其指標值）作為增量事件發給每個訂閱者。
+    """
+
+    def __init__(self, compute, poll_seconds, meta):
+        """
+        Args:
+            compute (callable): 在線程池中執行，返回 {列名: ndarray}
+            poll_seconds (float): 輪詢間隔秒數
+            meta (dict): 附加在每個事件頭部的元數據
+        """
+        self.compute = compute
+        self.poll_seconds = poll_seconds
+        self.meta = meta
+        self.columns = None
+        self.error = None
+        self.seq = 0
+        self.subscribers = set()
+        self.ready = asyncio.Event()
+        self.task = None
+        self._snapshot = None
+
+    def snapshot(self):
+        """當前全部K線的快照事件（同一序號只編碼一次）"""
+        if self._snapshot is None:
+            self._snapshot = encode_event('snapshot', self.seq, self.columns, self.meta)
+        return self._snapshot
+
+    async def run(self, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                columns = await loop.run_in_executor(executor, self.compute)
+                self.error = None
+                self.publish(columns)
+            except Exception as e:
+                # 上游暫時故障時保留已有數據，下一輪重試
+                self.error = e
+                METRICS.inc('stream_errors_total', help_text='推送頻道計算失敗次數', interval=self.meta['interval'])
+            self.ready.set()
+            await asyncio.sleep(self.poll_seconds)
+
+    def publish(self, columns):
+        """與上一輪比較並把增量發給所有訂閱者"""
+        rows = changed_rows(self.columns, columns)
+        first = self.columns is None
+        self.columns = columns
+        if first or not len(rows):
+            return
+
+        self.seq += 1
+        self._snapshot = None
+        event = encode_event('delta', self.seq, {name: values[rows] for name, values in columns.items()}, self.meta)
+        METRICS.inc('stream_delta_rows_total', len(rows), help_text='推送的增量K線數', interval=self.meta['interval'])
+        for queue in self.subscribers:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot())
+                METRICS.inc('stream_resyncs_total', help_text='慢客戶端改發快照次數')
+            else:
+                queue.put_nowait(event)
+
+
+class StreamHub:
+    """按訂閱鍵管理推送頻道：第一個訂閱者到來時啟動輪詢，最後一個離開時停止"""
+
+    def __init__(self, executor, poll_seconds=5.0):
+        self.executor = executor
+        self.poll_seconds = poll_seconds
+        self.channels = {}
+
+    async def subscribe(self, key, compute, meta):
+        """
+        訂閱一個頻道
+
+        Args:
+            key (tuple): 訂閱鍵，相同鍵的訂閱者共用計算
+            compute (callable): 頻道的計算函數
+            meta (dict): 事件元數據
+
+        Returns:
+            asyncio.Queue: 事件隊列，第一個事件為完整快照
+
+        Raises:
+            Exception: 頻道還沒有任何成功的計算結果時，拋出最近一次計算的異常
+        """
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = StreamChannel(compute, self.poll_seconds, meta)
+            channel.task = asyncio.create_task(channel.run(self.executor))
+
+        queue = asyncio.Queue(QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        await channel.ready.wait()
+        if channel.columns is None:
+            self.unsubscribe(key, queue)
+            raise channel.error
+        queue.put_nowait(channel.snapshot())
+        return queue
+
+    def unsubscribe(self, key, queue):
+        channel = self.channels.get(key)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            channel.task.cancel()
+            del self.channels[key]
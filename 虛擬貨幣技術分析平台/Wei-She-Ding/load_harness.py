@@ -0,0 +1,250 @@
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import threading
+import time
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "ADAUSDT", "XRPUSDT",
+           "SOLUSDT", "DOTUSDT", "DOGEUSDT", "AVAXUSDT", "MATICUSDT"]
+TIMEFRAMES = ["1m", "5m", "15m", "1h", "4h", "1d"]
+
+# 每次渲染隨機開關的側邊欄勾選框；「歷史相似形態」和「訂單簿深度熱力圖」會寫入磁碟或啟動後台錄製，
+# 默認不參與，可用 --indicators 指定
+INDICATOR_LABELS = [
+    "簡單移動平均線 (SMA)",
+    "指數移動平均線 (EMA)",
+    "相對強弱指標 (RSI)",
+    "MACD",
+    "布林通道",
+    "分位數通道 (Quantile Bands)",
+    "成交量",
+    "K線形態標記",
+    "SMC 智能資金概念分析",
+    "成交量分佈 (Volume Profile)",
+]
+
+PERCENTILES = (50, 95, 99)
+
+
+def rss_bytes():
+    """
+    當前進程的常駐記憶體（RSS）
+
+    Returns:
+        int: 位元組數；無法取得時為0
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def cpu_seconds():
+    """當前進程累計佔用的CPU時間（用戶態+內核態，秒）"""
+    times = os.times()
+    return times.user + times.system
+
+
+class Session:
+    """
+    一個無頭瀏覽會話：以AppTest執行app.py，每次渲染前隨機選擇幣種、時間週期和指標
+
+    Args:
+        rng (random.Random): 隨機數生成器
+        indicators (list): 參與隨機開關的勾選框標籤
+        timeout (float): 單次渲染的超時秒數
+    """
+
+    def __init__(self, rng, indicators, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.rng = rng
+        self.indicators = indicators
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.renders = 0
+
+    def _widget(self, widgets, label):
+        return next((widget for widget in widgets if widget.label == label), None)
+
+    def randomize(self):
+        """隨機選擇本次渲染的幣種、時間週期和指標（首次渲染前控件尚未生成，使用預設值）"""
+        app = self.app
+        if not self.renders:
+            return
+        symbol = self._widget(app.selectbox, "選擇虛擬貨幣")
+        timeframe = self._widget(app.selectbox, "選擇時間週期")
+        if symbol is not None:
+            symbol.set_value(self.rng.choice(SYMBOLS))
+        if timeframe is not None:
+            timeframe.set_value(self.rng.choice(TIMEFRAMES))
+        for label in self.indicators:
+            checkbox = self._widget(app.checkbox, label)
+            if checkbox is not None:
+                checkbox.set_value(self.rng.random() < 0.5)
+
+    def render(self):
+        """
+        執行一次渲染
+
+        Returns:
+            tuple: (耗時秒數, 錯誤描述；成功時為None)
+        """
+        self.randomize()
+        start = time.perf_counter()
+        try:
+            self.app.run()
+        except Exception as e:
+            return time.perf_counter() - start, f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        self.renders += 1
+        # 頁面內捕獲的錯誤以 st.error 顯示，未捕獲的異常記錄在 exception 中
+        problems = [e.value for e in self.app.exception] + \
+                   [e.value for e in self.app.error if e.value.startswith("發生錯誤")]
+        return elapsed, problems[0] if problems else None
+
+
+def run_level(concurrency, renders, indicators, timeout, seed, warmup):
+    """
+    以指定並發數運行一輪壓測：每個會話在獨立線程中連續渲染
+
+    Args:
+        concurrency (int): 同時在線的會話數
+        renders (int): 每個會話的計時渲染次數
+        indicators (list): 參與隨機開關的勾選框標籤
+        timeout (float): 單次渲染的超時秒數
+        seed (int): 隨機種子
+        warmup (int): 每個會話在計時前的預熱渲染次數
+
+    Returns:
+        dict: 本輪的吞吐量、延遲分位數、每會話記憶體和CPU使用情況
+    """
+    gc.collect()
+    baseline = rss_bytes()
+    sessions = [Session(random.Random(seed * 1000 + i), indicators, timeout) for i in range(concurrency)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    # 所有會話完成預熱後同時開始計時，計時區間內的並發數才穩定
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(session):
+        for _ in range(warmup):
+            session.render()
+        barrier.wait()
+        for _ in range(renders):
+            elapsed, problem = session.render()
+            with lock:
+                latencies.append(elapsed)
+                if problem is not None:
+                    errors.append(problem)
+
+    threads = [threading.Thread(target=worker, args=(session,), daemon=True) for session in sessions]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    # 會話仍然存活時取樣，增量即為這些會話（含其元素樹和狀態）佔用的記憶體
+    resident = rss_bytes()
+
+    p50, p95, p99 = np.percentile(latencies, PERCENTILES) if latencies else (np.nan,) * 3
+    busy = cpu / wall if wall else 0.0
+    return {
+        'concurrency': concurrency,
+        'renders': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_seconds': wall,
+        'throughput': len(latencies) / wall if wall else 0.0,
+        'p50_ms': p50 * 1000,
+        'p95_ms': p95 * 1000,
+        'p99_ms': p99 * 1000,
+        'rss_mb': resident / 2**20,
+        'mb_per_session': (resident - baseline) / 2**20 / concurrency,
+        'cpu_cores_busy': busy,
+        'cpu_saturation': busy / (os.cpu_count() or 1),
+    }
+
+
+def format_row(result):
+    """把一輪結果格式化為表格的一行"""
+    return (f"{result['concurrency']:>4} {result['renders']:>6} {result['errors']:>4} "
+            f"{result['throughput']:>8.2f} {result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} "
+            f"{result['mb_per_session']:>10.1f} {result['rss_mb']:>8.0f} "
+            f"{result['cpu_cores_busy']:>6.2f} {result['cpu_saturation']:>6.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以多個無頭會話並發執行app.py，測量不同並發數下的吞吐量、延遲、記憶體和CPU')
+    parser.add_argument('--levels', default='1,2,4,8', help='逗號分隔的並發會話數，依次遞增測量')
+    parser.add_argument('--renders', type=int, default=10, help='每個會話的計時渲染次數')
+    parser.add_argument('--warmup', type=int, default=1, help='每個會話在計時前的預熱渲染次數')
+    parser.add_argument('--timeout', type=float, default=120, help='單次渲染的超時秒數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--market', choices=['random', 'live'], default='random',
+                        help='模擬數據來源：random 為隨機生成，live 為連續推進的模擬交易所（同 FANIC_MOCK_MARKET）')
+    parser.add_argument('--api-base', help='Binance兼容的API地址（如 market_simulator.py 的回放服務，同 FANIC_API_BASE）')
+    parser.add_argument('--indicators', help='逗號分隔的勾選框標籤，替換默認的隨機指標集合')
+    parser.add_argument('--json', help='把各輪結果寫入此JSON文件')
+    parser.add_argument('--max-p95-ms', type=float, help='任一輪p95延遲超過此值時以非零狀態退出')
+    args = parser.parse_args()
+
+    # 會話不應停在自動刷新的等待中；環境變量須在第一次執行app.py前設置
+    os.environ['FANIC_REFRESH_SECONDS'] = '0'
+    os.environ['FANIC_MOCK_MARKET'] = args.market
+    if args.api_base:
+        os.environ['FANIC_API_BASE'] = args.api_base
+    from streamlit.logger import set_log_level
+
+    # 先完成一次渲染，模塊導入和 st.cache_resource 組件的初始化不計入第一輪的延遲和記憶體
+    Session(random.Random(args.seed), [], args.timeout).render()
+    set_log_level('error')
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    indicators = [label.strip() for label in args.indicators.split(',')] if args.indicators else INDICATOR_LABELS
+
+    print(f"app.py 壓測：每會話 {args.renders} 次渲染，數據來源 {args.api_base or args.market}，CPU核心 {os.cpu_count()}")
+    print(f"{'並發':>4} {'渲染':>6} {'錯誤':>4} {'次/秒':>8} {'p50毫秒':>8} {'p95毫秒':>8} {'p99毫秒':>8} "
+          f"{'MB/會話':>10} {'RSS MB':>8} {'核心':>6} {'CPU':>6}")
+    results = []
+    for level in levels:
+        result = run_level(level, args.renders, indicators, args.timeout, args.seed, args.warmup)
+        results.append(result)
+        print(format_row(result), flush=True)
+        if result['first_error']:
+            print(f"     首個錯誤: {result['first_error']}")
+
+    # 吞吐量不再隨並發增長時，CPU已被單個進程（GIL）佔滿
+    if len(results) > 1:
+        best = max(results, key=lambda r: r['throughput'])
+        print(f"最高吞吐量 {best['throughput']:.2f} 次/秒 出現在並發 {best['concurrency']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    failed = any(r['errors'] for r in results)
+    if args.max_p95_ms is not None:
+        failed = failed or any(r['p95_ms'] > args.max_p95_ms for r in results)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from analysis_cache import BarCloseCache, current_bar_open
+from columnar_codec import index_to_ms
+from metrics import span, timed
+
+
+def last_valid(values, count=1):
+    """
+    取每行最後count個非NaN值
+
+    Args:
+        values (ndarray): (交易對 × K線) 數組
+        count (int): 取值個數
+
+    Returns:
+        ndarray: (交易對 × count)，按時間順序排列；有效值不足時前面以NaN補齊
+    """
+    valid = ~np.isnan(values)
+    # 每個位置及其之後的有效值個數，等於 count - k 的有效位置即第k個輸出
+    remaining = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1]
+    result = np.full((values.shape[0], count), np.nan)
+    for k in range(count):
+        rows, cols = np.nonzero(valid & (remaining == count - k))
+        result[rows, k] = values[rows, cols]
+    return result
+
+
+class MarketScreener:
+    """全市場掃描器：對所有交易對批量計算RSI、MACD交叉、布林擠壓及SMC偏向"""
+
+    def __init__(self, data_fetcher, max_workers=16, limit=500, cache=None):
+        self.data_fetcher = data_fetcher
+        self.max_workers = max_workers
+        self.limit = limit
+        self.cache = cache if cache is not None else BarCloseCache(name='screener')
+
+    def build_panel(self, symbols, interval):
+        """
+        並發獲取K線並按開盤時間對齊成 (交易對 × K線) 的數組面板
+
+        各交易對的開盤時間取並集（保留最近limit個），缺少的K線（新上市或缺口）以NaN填充，
+        同一列始終是同一開盤時間。
+
+        Args:
+            symbols (list): 交易對列表
+            interval (str): 時間間隔
+
+        Returns:
+            tuple: (有效交易對列表, {'open','high','low','close','volume'} -> 2D ndarray，
+                    另含 'time' -> 各列的開盤時間（毫秒）)
+        """
+        def fetch(symbol):
+            try:
+                return self.data_fetcher.get_kline_data(symbol, interval, limit=self.limit)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            frames = list(executor.map(fetch, symbols))
+
+        valid = [(s, df) for s, df in zip(symbols, frames) if df is not None and not df.empty]
+        if not valid:
+            return [], {}
+
+        times = [index_to_ms(df.index) for _, df in valid]
+        bar_times = np.unique(np.concatenate(times))[-self.limit:]
+        panel = {col: np.full((len(valid), len(bar_times)), np.nan)
+                 for col in ['open', 'high', 'low', 'close', 'volume']}
+        for row, ((_, df), symbol_times) in enumerate(zip(valid, times)):
+            pos = np.minimum(np.searchsorted(bar_times, symbol_times), len(bar_times) - 1)
+            keep = bar_times[pos] == symbol_times
+            for col, values in panel.items():
+                values[row, pos[keep]] = df[col].to_numpy(dtype=float)[keep]
+        panel['time'] = bar_times
+
+        return [s for s, _ in valid], panel
+
+    def scan(self, symbols, interval, rsi_period=14, bb_period=20, squeeze_lookback=120):
+        """
+        掃描全部交易對，結果按K線收盤快取
+
+        Args:
+            symbols (list): 交易對列表
+            interval (str): 時間間隔
+            rsi_period (int): RSI週期
+            bb_period (int): 布林通道週期
+            squeeze_lookback (int): 判斷布林擠壓的回看K線數
+
+        Returns:
+            pandas.DataFrame: 每個交易對一行的掃描結果
+        """
+        key = ('screener', tuple(symbols), interval, rsi_period, bb_period, squeeze_lookback)
+        bar_time = current_bar_open(interval)
+        return self.cache.get_or_compute(
+            key, bar_time,
+            lambda: self._scan(symbols, interval, rsi_period, bb_period, squeeze_lookback)
+        )
+
+    @timed('screener_scan')
+    def _scan(self, symbols, interval, rsi_period, bb_period, squeeze_lookback):
+        with span('screener_fetch'):
+            valid_symbols, panel = self.build_panel(symbols, interval)
+        if not valid_symbols:
+            return pd.DataFrame(columns=[
+                'symbol', 'price', 'change_pct', 'rsi', 'macd_cross',
+                'bb_bandwidth', 'bb_squeeze', 'smc_bias'
+            ])
+
+        close = panel['close']
+        high = panel['high']
+        low = panel['low']
+
+        rsi = self.panel_rsi(close, rsi_period)
+        macd_cross = self.panel_macd_cross(close)
+        bandwidth, squeeze = self.panel_bb_squeeze(close, bb_period, squeeze_lookback)
+        # 結構偏向按各自實際存在的K線計算，缺失的K線不參與擺動點判斷
+        present = ~np.isnan(close)
+        smc_bias = [self.structure_bias(high[i][present[i]], low[i][present[i]]) for i in range(len(valid_symbols))]
+
+        # 最新價取各交易對最後一根實際存在的K線
+        price = last_valid(close)[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            latest_open = last_valid(panel['open'])[:, 0]
+            change_pct = (price - latest_open) / latest_open * 100
+
+        return pd.DataFrame({
+            'symbol': valid_symbols,
+            'price': price,
+            'change_pct': change_pct,
+            'rsi': rsi,
+            'macd_cross': macd_cross,
+            'bb_bandwidth': bandwidth,
+            'bb_squeeze': squeeze,
+            'smc_bias': smc_bias
+        })
+
+    def panel_rsi(self, close, period=14):
+        """
+        批量計算最新一根K線的RSI（與TechnicalIndicators.rsi的簡單平均口徑一致）
+
+        Args:
+            close (ndarray): (交易對 × K線) 收盤價，缺失的K線為NaN（跳過）
+
+        Returns:
+            ndarray: 每個交易對的RSI
+        """
+        delta = np.diff(last_valid(close, period + 1), axis=1)
+        # 有效K線不足 period+1 根時差分含NaN，結果為NaN
+        gain = np.maximum(delta, 0).mean(axis=1)
+        loss = np.maximum(-delta, 0).mean(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = gain / loss
+            return 100 - (100 / (1 + rs))
+
+    def panel_ema(self, data, span):
+        """
+        沿K線方向批量計算EMA（與pandas ewm(span).mean() 的adjust=True口徑一致）
+
+        以K線為外層迴圈、交易對為向量維度，每步只做一次向量運算。
+        NaN（缺失的K線）處輸出NaN且不推進該交易對的狀態，即按各自實際存在的K線計算。
+        """
+        decay = 1 - 2 / (span + 1)
+        result = np.empty_like(data)
+        num = np.zeros(data.shape[0])
+        den = np.zeros(data.shape[0])
+        for t in range(data.shape[1]):
+            present = ~np.isnan(data[:, t])
+            num = np.where(present, np.nan_to_num(data[:, t]) + decay * num, num)
+            den = np.where(present, 1 + decay * den, den)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[:, t] = np.where(present, num / den, np.nan)
+        return result
+
+    def panel_macd_cross(self, close, fast=12, slow=26, signal=9):
+        """
+        批量判斷MACD交叉狀態
+
+        Returns:
+            ndarray: 'golden_cross'（最新K線金叉）、'death_cross'（最新K線死叉）、
+                     'bullish'（MACD在信號線上方）或 'bearish'
+        """
+        macd_line = self.panel_ema(close, fast) - self.panel_ema(close, slow)
+        macd_signal = self.panel_ema(macd_line, signal)
+        diff = last_valid(macd_line - macd_signal, 2)
+
+        above_now = diff[:, 1] > 0
+        above_prev = diff[:, 0] > 0
+        return np.where(
+            above_now & ~above_prev, 'golden_cross',
+            np.where(~above_now & above_prev, 'death_cross',
+                     np.where(above_now, 'bullish', 'bearish'))
+        )
+
+    def panel_bb_squeeze(self, close, period=20, lookback=120):
+        """
+        批量計算布林帶寬並判斷是否處於擠壓狀態
+
+        帶寬 = (上軌 - 下軌) / 中軌；最新帶寬為回看區間內最低值時視為擠壓。
+        含缺失K線（NaN）的窗口不計算帶寬。
+
+        Returns:
+            tuple: (最新帶寬, 是否擠壓)
+        """
+        # 以累積和一次算出所有滾動窗口的均值和樣本標準差
+        present = ~np.isnan(close)
+        filled = np.where(present, close, 0.0)
+        csum = np.cumsum(np.pad(filled, ((0, 0), (1, 0))), axis=1)
+        csq = np.cumsum(np.pad(filled * filled, ((0, 0), (1, 0))), axis=1)
+        ccount = np.cumsum(np.pad(present, ((0, 0), (1, 0))), axis=1)
+        window_sum = csum[:, period:] - csum[:, :-period]
+        window_sq = csq[:, period:] - csq[:, :-period]
+        complete = (ccount[:, period:] - ccount[:, :-period]) == period
+
+        mean = window_sum / period
+        var = np.maximum(window_sq - window_sum * mean, 0) / (period - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bandwidth = np.where(complete, 4 * np.sqrt(var) / mean, np.nan)
+
+        recent = bandwidth[:, -lookback:]
+        latest = last_valid(recent)[:, 0]
+        with np.errstate(invalid='ignore'):
+            squeeze = latest <= np.fmin.reduce(recent, axis=1)
+        return latest, squeeze
+
+    def structure_bias(self, high, low, swing_length=5, recent_bars=50):
+        """
+        以數組方式重現SMCAnalysis的市場偏向判斷
+
+        擺動點、結構突破及「最近50根K線」的計數規則與analyze_smc一致，
+        但不需要逐根K線的pandas迴圈。
+
+        Args:
+            high (ndarray): 單一交易對的最高價
+            low (ndarray): 單一交易對的最低價
+
+        Returns:
+            str: 'bullish'、'bearish' 或 'neutral'
+        """
+        n = len(high)
+        if n < 2 * swing_length + 1:
+            return 'neutral'
+
+        swing_high_idx, swing_low_idx = self.swing_indices(high, low, swing_length)
+        if len(swing_high_idx) < 2 or len(swing_low_idx) < 2:
+            return 'neutral'
+
+        # 每根K線之後（不含當根）的最低價與最高價
+        future_min_low = np.append(np.minimum.accumulate(low[::-1])[::-1][1:], np.inf)
+        future_max_high = np.append(np.maximum.accumulate(high[::-1])[::-1][1:], -np.inf)
+        first_recent = n - recent_bars
+
+        # 看漲結構突破：更高的擺動高點，之後價格跌破此前最後一個擺動低點
+        idx = swing_high_idx[1:]
+        higher = high[idx] > high[swing_high_idx[:-1]]
+        pos = np.searchsorted(swing_low_idx, idx) - 1
+        has_low = pos >= 0
+        last_low = low[swing_low_idx[np.maximum(pos, 0)]]
+        bullish = np.sum(higher & has_low & (future_min_low[idx] < last_low) & (idx >= first_recent))
+
+        # 看跌結構突破：更低的擺動低點，之後價格突破此前最後一個擺動高點
+        idx = swing_low_idx[1:]
+        lower = low[idx] < low[swing_low_idx[:-1]]
+        pos = np.searchsorted(swing_high_idx, idx) - 1
+        has_high = pos >= 0
+        last_high = high[swing_high_idx[np.maximum(pos, 0)]]
+        bearish = np.sum(lower & has_high & (future_max_high[idx] > last_high) & (idx >= first_recent))
+
+        if bullish > bearish:
+            return 'bullish'
+        if bearish > bullish:
+            return 'bearish'
+        return 'neutral'
+
+    def swing_indices(self, high, low, swing_length=5):
+        """
+        向量化識別擺動高低點（口徑與SMCAnalysis.identify_swing_points一致）
+
+        Returns:
+            tuple: (擺動高點索引, 擺動低點索引)
+        """
+        width = 2 * swing_length + 1
+        high_windows = sliding_window_view(high, width)
+        low_windows = sliding_window_view(low, width)
+
+        center_high = high_windows[:, swing_length]
+        center_low = low_windows[:, swing_length]
+        others_high = np.maximum(high_windows[:, :swing_length].max(axis=1),
+                                 high_windows[:, swing_length + 1:].max(axis=1))
+        others_low = np.minimum(low_windows[:, :swing_length].min(axis=1),
+                                low_windows[:, swing_length + 1:].min(axis=1))
+
+        swing_high_idx = np.flatnonzero(center_high > others_high) + swing_length
+        swing_low_idx = np.flatnonzero(center_low < others_low) + swing_length
+        return swing_high_idx, swing_low_idx
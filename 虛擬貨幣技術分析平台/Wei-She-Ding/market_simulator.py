@@ -0,0 +1,641 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from analysis_cache import INTERVAL_MS
+from compact_frames import to_compact
+from kline_decoder import klines_to_frame
+from mock_data_generator import MockDataGenerator
+from trade_aggregator import TRADE_DTYPE, DAY_MS
+from metrics import METRICS
+
+# 價格過程的最小時間步長：每5秒一個價格點，所有週期的K線、成交和行情都由它聚合而成
+TICK_MS = 5000
+TICKS_PER_DAY = DAY_MS // TICK_MS
+
+# 日線層的起點（2020-01-01 UTC），此前沒有數據
+EPOCH_DAY = 18262
+EPOCH_MS = EPOCH_DAY * DAY_MS
+
+# 日線層按塊生成，每塊的隨機數由 (種子, 交易對, 塊號) 決定
+DAY_BLOCK = 512
+
+# 對數價格向基準價格回歸的速度：價格長期圍繞基準價格波動，不會漂移到不合理的水平
+MEAN_REVERSION = 0.02
+
+# 平均每日成交筆數
+TRADES_PER_DAY = 20000
+
+# RNG子流編號
+_STREAM_DAILY, _STREAM_TICKS, _STREAM_ACTIVITY, _STREAM_TRADES = 0, 1, 2, 3
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class SimClock:
+    """
+    模擬時鐘：從start_ms開始，按speed倍速隨真實時間推進
+
+    Args:
+        speed (float): 加速倍數，60表示真實1秒等於模擬1分鐘
+        start_ms (int): 模擬起始時間（毫秒），預設為當前真實時間
+    """
+
+    def __init__(self, speed=1.0, start_ms=None):
+        self.speed = speed
+        self._real_start = time.time()
+        self.start_ms = int(self._real_start * 1000) if start_ms is None else int(start_ms)
+
+    def now_ms(self):
+        return self.start_ms + int((time.time() - self._real_start) * 1000 * self.speed)
+
+
+class _DayPath:
+    """一個交易對一天的5秒價格路徑；成交量、成交筆數和逐筆成交在首次需要時才生成"""
+
+    __slots__ = ('open', 'close', 'volume', 'counts', 'trades')
+
+    def __init__(self, open_, close):
+        self.open = open_
+        self.close = close
+        self.volume = None
+        self.counts = None
+        self.trades = None
+
+
+class MarketSimulator(MockDataGenerator):
+    """
+    有狀態的模擬交易所
+
+    每個交易對有一條確定的價格過程：日線層為對數價格的均值回歸隨機遊走，
+    日內以布朗橋在前一日收盤和當日收盤之間細化為5秒價格點，成交量和逐筆成交也按價格點分配。
+    所有週期的K線、24小時行情、當前價格、訂單簿和逐筆成交都由同一條路徑聚合而成，
+    並且只揭示模擬時鐘當前時刻之前的部分，因此數據隨時間連續推進，不同週期之間相互一致。
+
+    與MockDataGenerator接口相同，可直接作為CryptoDataFetcher的mock_generator使用。
+
+    Args:
+        speed (float): 模擬時間的加速倍數
+        seed (int): 隨機種子，相同種子得到相同的市場
+        clock (SimClock): 模擬時鐘，提供時忽略speed
+        max_days (int): 快取的日內路徑天數上限（每天約0.5MB）
+        max_bar_days (int): 快取的已結束交易日K線（按交易對、日期和週期）上限
+    """
+
+    def __init__(self, speed=1.0, seed=0, clock=None, max_days=32, max_bar_days=8192):
+        super().__init__()
+        self.clock = clock if clock is not None else SimClock(speed)
+        self.seed = seed
+        self.max_days = max_days
+        self.max_bar_days = max_bar_days
+        self._levels = {}
+        self._day_counts = {}
+        self._day_volumes = {}
+        self._paths = OrderedDict()
+        self._bars = OrderedDict()
+        self._lock = threading.RLock()
+
+    # ---- 價格過程 ----
+
+    def _rng(self, symbol, *key):
+        return np.random.default_rng([self.seed, zlib.crc32(symbol.encode('utf-8')), *key])
+
+    def _daily(self, symbol, day):
+        """
+        確保日線層已生成到day，返回 (該日收盤對數價格, 前一日收盤對數價格, 當日成交量, 當日成交筆數)
+        """
+        k = day - EPOCH_DAY
+        levels = self._levels.get(symbol)
+        if levels is None or k >= len(levels):
+            base = np.log(self.base_prices.get(symbol, 1000))
+            sigma = self.volatility.get(symbol, 0.03)
+            levels = self._levels.get(symbol, np.empty(0))
+            volumes = self._day_volumes.get(symbol, np.empty(0))
+            counts = self._day_counts.get(symbol, np.empty(0, dtype=np.int64))
+            while k >= len(levels):
+                block = len(levels) // DAY_BLOCK
+                rng = self._rng(symbol, _STREAM_DAILY, block)
+                shocks = rng.normal(0, sigma, DAY_BLOCK)
+                new_levels = np.empty(DAY_BLOCK)
+                level = levels[-1] if len(levels) else base
+                for i, shock in enumerate(shocks):
+                    level += MEAN_REVERSION * (base - level) + shock
+                    new_levels[i] = level
+                # 成交量與當日波動正相關
+                activity = rng.lognormal(0, 0.3, DAY_BLOCK) * (1 + np.abs(shocks) / sigma)
+                levels = np.concatenate((levels, new_levels))
+                volumes = np.concatenate((volumes, activity * 24 * 5500 * np.exp(base) / 1000))
+                counts = np.concatenate((counts, (activity * TRADES_PER_DAY).astype(np.int64)))
+            self._levels[symbol] = levels
+            self._day_volumes[symbol] = volumes
+            self._day_counts[symbol] = counts
+        previous = levels[k - 1] if k > 0 else np.log(self.base_prices.get(symbol, 1000))
+        return levels[k], previous, self._day_volumes[symbol][k], int(self._day_counts[symbol][k])
+
+    def _path(self, symbol, day):
+        """某日的5秒價格路徑（布朗橋），按LRU快取"""
+        key = (symbol, day)
+        path = self._paths.get(key)
+        if path is not None:
+            self._paths.move_to_end(key)
+            return path
+
+        close_level, open_level, _, _ = self._daily(symbol, day)
+        sigma = self.volatility.get(symbol, 0.03)
+        rng = self._rng(symbol, _STREAM_TICKS, day)
+        walk = np.cumsum(rng.normal(0, sigma / np.sqrt(TICKS_PER_DAY), TICKS_PER_DAY))
+        fraction = np.arange(1, TICKS_PER_DAY + 1) / TICKS_PER_DAY
+        levels = open_level + (close_level - open_level) * fraction + walk - fraction * walk[-1]
+        prices = np.exp(levels)
+        opens = np.empty(TICKS_PER_DAY)
+        opens[0] = np.exp(open_level)
+        opens[1:] = prices[:-1]
+        path = _DayPath(opens, prices)
+
+        self._paths[key] = path
+        if len(self._paths) > self.max_days:
+            self._paths.popitem(last=False)
+        return path
+
+    def _activity(self, symbol, day):
+        """某日的價格路徑，並確保已按價格點分配成交筆數和成交量"""
+        path = self._path(symbol, day)
+        if path.counts is None:
+            _, _, volume, count = self._daily(symbol, day)
+            sigma = self.volatility.get(symbol, 0.03)
+            rng = self._rng(symbol, _STREAM_ACTIVITY, day)
+            # 波動大的價格點分得更多成交；成交量只分配給有成交的價格點，使逐筆成交量之和等於K線成交量
+            moves = np.abs(np.log(path.close / path.open)) * np.sqrt(TICKS_PER_DAY) / sigma
+            weights = rng.lognormal(0, 0.5, TICKS_PER_DAY) * (1 + moves)
+            counts = rng.multinomial(count, weights / weights.sum())
+            weights *= counts > 0
+            path.volume = volume * weights / weights.sum() if weights.any() else np.zeros(TICKS_PER_DAY)
+            path.counts = counts
+        return path
+
+    def _first_trade_id(self, symbol, day):
+        """某日第一筆成交的全局編號（自起點以來的累計成交筆數）"""
+        self._daily(symbol, day)
+        return int(self._day_counts[symbol][:day - EPOCH_DAY].sum())
+
+    def _revealed(self, now_ms, day):
+        """某日在當前時刻已揭示的價格點數（當前進行中的5秒也計入）"""
+        if day < now_ms // DAY_MS:
+            return TICKS_PER_DAY
+        return min((now_ms - day * DAY_MS) // TICK_MS + 1, TICKS_PER_DAY)
+
+    # ---- K線 ----
+
+    def _day_bars(self, symbol, day, minutes, n_ticks):
+        """把某日前n_ticks個價格點聚合為指定週期的K線"""
+        per_bar = minutes * 60000 // TICK_MS
+        starts = np.arange(0, n_ticks, per_bar)
+        if minutes == 1440:
+            # 日成交量即日線層的成交量，不需要生成日內的成交分配
+            path = self._path(symbol, day)
+            volume = [self._daily(symbol, day)[2]] if n_ticks == TICKS_PER_DAY else None
+        else:
+            path = self._activity(symbol, day)
+            volume = None
+        if volume is None:
+            volume = np.add.reduceat(self._activity(symbol, day).volume[:n_ticks], starts)
+        opens, closes = path.open[:n_ticks], path.close[:n_ticks]
+        ends = np.minimum(starts + per_bar, n_ticks) - 1
+        ohlcv = np.column_stack((
+            opens[starts],
+            np.maximum.reduceat(np.maximum(opens, closes), starts),
+            np.minimum.reduceat(np.minimum(opens, closes), starts),
+            closes[ends],
+            volume
+        ))
+        return day * DAY_MS + starts * TICK_MS, ohlcv
+
+    def _completed_day_bars(self, symbol, day, minutes):
+        """已結束交易日的K線（快取，長週期圖表不必反復生成日內路徑）"""
+        key = (symbol, day, minutes)
+        bars = self._bars.get(key)
+        if bars is None:
+            bars = self._day_bars(symbol, day, minutes, TICKS_PER_DAY)
+            self._bars[key] = bars
+            if len(self._bars) > self.max_bar_days:
+                self._bars.popitem(last=False)
+        else:
+            self._bars.move_to_end(key)
+        return bars
+
+    def generate_kline_data(self, symbol, interval, limit=500, compact=False, start_ms=None, end_ms=None):
+        """
+        截至模擬時鐘當前時刻的K線，最後一根為尚未收盤的K線
+
+        與Binance的startTime/endTime一致：指定start_ms時返回開盤時間不早於它的前limit根，
+        只指定end_ms時返回開盤時間不晚於它的最後limit根。
+
+        Args:
+            symbol (str): 交易對符號
+            interval (str): 時間間隔（最長1d）
+            limit (int): 數據條數
+            compact (bool): 是否返回精簡格式
+            start_ms (int): 最早的開盤時間（毫秒），可選
+            end_ms (int): 最晚的開盤時間（毫秒，含），可選
+
+        Returns:
+            pandas.DataFrame: K線數據（UTC時間索引，與Binance API解碼結果一致）
+        """
+        now = self.clock.now_ms()
+        bar_ms = INTERVAL_MS.get(interval, INTERVAL_MS["1h"])
+        minutes = bar_ms // 60000
+        last_open = now - now % bar_ms
+        if end_ms is not None:
+            last_open = min(last_open, end_ms - end_ms % bar_ms)
+        if start_ms is not None:
+            first_open = max(-(-start_ms // bar_ms) * bar_ms, EPOCH_MS)
+            last_open = min(last_open, first_open + (limit - 1) * bar_ms)
+        else:
+            first_open = max(last_open - (limit - 1) * bar_ms, EPOCH_MS)
+        today = now // DAY_MS
+        if last_open < first_open:
+            df = klines_to_frame(np.empty(0, dtype=np.int64), np.empty((0, 5)))
+            return to_compact(df) if compact else df
+
+        times, rows = [], []
+        with self._lock:
+            for day in range(first_open // DAY_MS, last_open // DAY_MS + 1):
+                if day < today:
+                    day_times, day_rows = self._completed_day_bars(symbol, day, minutes)
+                else:
+                    day_times, day_rows = self._day_bars(symbol, day, minutes, self._revealed(now, day))
+                times.append(day_times)
+                rows.append(day_rows)
+
+        times = np.concatenate(times)
+        ohlcv = np.vstack(rows)
+        keep = (times >= first_open) & (times <= last_open)
+        df = klines_to_frame(times[keep], ohlcv[keep])
+        METRICS.inc('simulator_requests_total', help_text='模擬交易所請求次數', endpoint='klines')
+        return to_compact(df) if compact else df
+
+    # ---- 行情 ----
+
+    def _tick_window(self, symbol, start_ms, end_ms):
+        """時間範圍內已揭示的價格點 (開盤, 收盤, 成交量, 成交筆數)"""
+        parts = []
+        with self._lock:
+            for day in range(max(start_ms, EPOCH_MS) // DAY_MS, end_ms // DAY_MS + 1):
+                path = self._activity(symbol, day)
+                first = max(start_ms - day * DAY_MS, 0) // TICK_MS
+                last = self._revealed(end_ms, day)
+                if last > first:
+                    parts.append(tuple(values[first:last] for values in
+                                       (path.open, path.close, path.volume, path.counts)))
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def get_current_price(self, symbol):
+        """模擬時鐘當前時刻的價格"""
+        now = self.clock.now_ms()
+        with self._lock:
+            path = self._path(symbol, now // DAY_MS)
+            return float(path.close[self._revealed(now, now // DAY_MS) - 1])
+
+    def get_24h_ticker(self, symbol):
+        """最近24小時的價格變動統計（Binance /api/v3/ticker/24hr 格式）"""
+        now = self.clock.now_ms()
+        opens, closes, volumes, counts = self._tick_window(symbol, now - DAY_MS, now)
+        highs, lows = np.maximum(opens, closes), np.minimum(opens, closes)
+        open_price, last_price = opens[0], closes[-1]
+        METRICS.inc('simulator_requests_total', help_text='模擬交易所請求次數', endpoint='ticker_24hr')
+        return {
+            'symbol': symbol,
+            'priceChange': f"{last_price - open_price:.8f}",
+            'priceChangePercent': f"{(last_price / open_price - 1) * 100:.2f}",
+            'openPrice': f"{open_price:.8f}",
+            'highPrice': f"{highs.max():.8f}",
+            'lowPrice': f"{lows.min():.8f}",
+            'lastPrice': f"{last_price:.8f}",
+            'volume': f"{volumes.sum():.8f}",
+            'openTime': now - DAY_MS,
+            'closeTime': now,
+            'count': int(counts.sum())
+        }
+
+    # ---- 逐筆成交 ----
+
+    def _day_trades(self, symbol, day):
+        """某日全部成交（含尚未揭示的部分），按時間排序"""
+        path = self._activity(symbol, day)
+        if path.trades is None:
+            rng = self._rng(symbol, _STREAM_TRADES, day)
+            tick = np.repeat(np.arange(TICKS_PER_DAY), path.counts)
+            n = len(tick)
+            trades = np.empty(n, dtype=TRADE_DTYPE)
+            # 同一價格點內的成交時間均勻分佈，排序後整體仍按時間遞增
+            offsets = np.sort(rng.uniform(0, TICK_MS, n).astype(np.int64) + tick * TICK_MS)
+            trades['time'] = day * DAY_MS + offsets
+            tick = offsets // TICK_MS
+            start, end = path.open[tick], path.close[tick]
+            trades['price'] = start + (end - start) * rng.random(n)
+            # 成交量按指數分佈拆分，同一價格點的成交量之和等於該點的成交量
+            share = rng.exponential(1.0, n)
+            trades['qty'] = path.volume[tick] * share / np.bincount(tick, weights=share, minlength=TICKS_PER_DAY)[tick]
+            trades['buyer_maker'] = rng.random(n) < np.where(end >= start, 0.4, 0.6)
+            path.trades = trades
+        return path.trades
+
+    def generate_trades(self, symbol, start_ms, end_ms, n_trades=100000, klines=None):
+        """
+        時間範圍內已揭示的逐筆成交
+
+        Args:
+            symbol (str): 交易對符號
+            start_ms (int): 開始時間（毫秒）
+            end_ms (int): 結束時間（毫秒，不含）
+            n_trades (int): 最多返回的成交筆數，超出時保留最近的部分
+            klines (pandas.DataFrame): 不使用；成交本身已與K線一致
+
+        Returns:
+            ndarray: trade_aggregator.TRADE_DTYPE 數組，按時間排序
+        """
+        end_ms = min(end_ms, self.clock.now_ms())
+        parts, total = [], 0
+        with self._lock:
+            # 從最近的一天向前取，取夠n_trades筆即停止
+            for day in range(end_ms // DAY_MS, max(start_ms, EPOCH_MS) // DAY_MS - 1, -1):
+                trades = self._day_trades(symbol, day)
+                trades = trades[(trades['time'] >= start_ms) & (trades['time'] < end_ms)]
+                parts.append(trades)
+                total += len(trades)
+                if total >= n_trades:
+                    break
+        trades = np.concatenate(parts[::-1]) if parts else np.empty(0, dtype=TRADE_DTYPE)
+        return trades[-n_trades:] if n_trades else trades[:0]
+
+    def agg_trades(self, symbol, limit=500, from_id=None):
+        """
+        Binance /api/v3/aggTrades 格式的成交：未指定from_id時為最近limit筆，否則為編號從from_id起的limit筆
+
+        Returns:
+            list: [{'a', 'p', 'q', 'f', 'l', 'T', 'm', 'M'}, ...]
+        """
+        now = self.clock.now_ms()
+        rows = []
+        with self._lock:
+            if from_id is None:
+                day = now // DAY_MS
+                while len(rows) < limit and day >= EPOCH_DAY:
+                    trades = self._day_trades(symbol, day)
+                    n = int(np.searchsorted(trades['time'], now))
+                    first_id = self._first_trade_id(symbol, day)
+                    take = min(limit - len(rows), n)
+                    rows[:0] = self._agg_rows(trades[n - take:n], first_id + n - take)
+                    day -= 1
+            else:
+                self._daily(symbol, now // DAY_MS)
+                starts = np.concatenate(([0], np.cumsum(self._day_counts[symbol])))
+                day = EPOCH_DAY + int(np.searchsorted(starts, from_id, side='right')) - 1
+                while len(rows) < limit and day <= now // DAY_MS:
+                    trades = self._day_trades(symbol, day)
+                    first_id = int(starts[day - EPOCH_DAY])
+                    begin = max(from_id - first_id, 0)
+                    end = min(begin + limit - len(rows), int(np.searchsorted(trades['time'], now)))
+                    rows.extend(self._agg_rows(trades[begin:end], first_id + begin))
+                    if end < len(trades):
+                        break
+                    day += 1
+        return rows
+
+    @staticmethod
+    def _agg_rows(trades, first_id):
+        return [
+            {'a': first_id + i, 'p': f"{price:.8f}", 'q': f"{qty:.8f}", 'f': first_id + i, 'l': first_id + i,
+             'T': int(t), 'm': bool(maker), 'M': True}
+            for i, (t, price, qty, maker) in enumerate(trades.tolist())
+        ]
+
+
+class MarketSimulatorServer:
+    """
+    以Binance API格式提供模擬交易所數據的本地HTTP/WebSocket服務
+
+    REST：/api/v3/klines（支持startTime/endTime）、ticker/24hr、ticker/price、depth、aggTrades、exchangeInfo、time、ping；
+    WebSocket：/ws/<symbol>@kline_<interval>，按push_seconds推送未收盤K線的更新。
+    把CryptoDataFetcher的base_url指向本服務即可走完整的API請求和解析路徑進行離線壓測。
+    """
+
+    def __init__(self, simulator, push_seconds=1.0):
+        self.simulator = simulator
+        self.push_seconds = push_seconds
+
+    def _symbol(self, query):
+        symbol = query.get('symbol', '').upper()
+        if symbol not in self.simulator.base_prices:
+            raise ValueError(f"Invalid symbol: {symbol}")
+        return symbol
+
+    def _kline_rows(self, symbol, interval, limit, start_ms=None, end_ms=None):
+        df = self.simulator.generate_kline_data(symbol, interval, limit, start_ms=start_ms, end_ms=end_ms)
+        bar_ms = INTERVAL_MS.get(interval, INTERVAL_MS["1h"])
+        times = df.index.as_unit('ms').asi8
+        return [
+            [int(t), f"{o:.8f}", f"{h:.8f}", f"{l:.8f}", f"{c:.8f}", f"{v:.8f}", int(t) + bar_ms - 1,
+             f"{v * c:.8f}", 0, "0", "0", "0"]
+            for t, (o, h, l, c, v) in zip(times, df.to_numpy().tolist())
+        ]
+
+    def route(self, path, query):
+        """
+        處理一個REST請求
+
+        Returns:
+            tuple: (狀態碼, 可JSON序列化的響應體)
+        """
+        sim = self.simulator
+        if path == '/api/v3/ping':
+            return 200, {}
+        if path == '/api/v3/time':
+            return 200, {'serverTime': sim.clock.now_ms()}
+        if path == '/api/v3/exchangeInfo':
+            return 200, {'timezone': 'UTC', 'serverTime': sim.clock.now_ms(), 'symbols': [
+                {'symbol': s, 'status': 'TRADING', 'baseAsset': s[:-4], 'quoteAsset': s[-4:]}
+                for s in sim.base_prices
+            ]}
+        try:
+            symbol = self._symbol(query)
+            limit = int(query.get('limit', 500))
+            if path == '/api/v3/klines':
+                start_ms = int(query['startTime']) if 'startTime' in query else None
+                end_ms = int(query['endTime']) if 'endTime' in query else None
+                return 200, self._kline_rows(symbol, query.get('interval', '1h'), min(limit, 1000), start_ms, end_ms)
+            if path == '/api/v3/ticker/24hr':
+                return 200, sim.get_24h_ticker(symbol)
+            if path == '/api/v3/ticker/price':
+                return 200, {'symbol': symbol, 'price': f"{sim.get_current_price(symbol):.8f}"}
+            if path == '/api/v3/depth':
+                return 200, sim.generate_order_book(symbol, min(limit, 5000))
+            if path == '/api/v3/aggTrades':
+                from_id = int(query['fromId']) if 'fromId' in query else None
+                return 200, sim.agg_trades(symbol, min(limit, 1000), from_id)
+        except (KeyError, ValueError) as e:
+            return 400, {'code': -1100, 'msg': str(e)}
+        return 404, {'code': -1, 'msg': f"Unknown path: {path}"}
+
+    def kline_event(self, symbol, interval):
+        """Binance kline 推送事件（最新一根K線）"""
+        df = self.simulator.generate_kline_data(symbol, interval, 1)
+        bar_ms = INTERVAL_MS.get(interval, INTERVAL_MS["1h"])
+        open_ms = int(df.index.as_unit('ms').asi8[-1])
+        o, h, l, c, v = df.to_numpy()[-1].tolist()
+        now = self.simulator.clock.now_ms()
+        return {'e': 'kline', 'E': now, 's': symbol, 'k': {
+            't': open_ms, 'T': open_ms + bar_ms - 1, 's': symbol, 'i': interval,
+            'o': f"{o:.8f}", 'c': f"{c:.8f}", 'h': f"{h:.8f}", 'l': f"{l:.8f}", 'v': f"{v:.8f}",
+            'x': now >= open_ms + bar_ms
+        }}
+
+    # ---- HTTP ----
+
+    async def handle_connection(self, reader, writer):
+        """處理一個連接（HTTP/1.1 keep-alive，或升級為WebSocket）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = urlsplit(target)
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self._websocket(reader, writer, headers, parts.path)
+                    break
+
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                try:
+                    status, payload = await asyncio.get_running_loop().run_in_executor(
+                        None, self.route, parts.path, query)
+                except Exception as e:
+                    status, payload = 500, {'code': -1000, 'msg': str(e)}
+                body = json.dumps(payload).encode('utf-8')
+                METRICS.inc('simulator_http_requests_total', help_text='模擬交易所HTTP請求次數',
+                            endpoint=parts.path, status=status)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                head = (f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+                writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ---- WebSocket ----
+
+    @staticmethod
+    def _frame(payload, opcode=0x1):
+        """服務端發出的WebSocket幀（不加掩碼）"""
+        length = len(payload)
+        if length < 126:
+            header = bytes((0x80 | opcode, length))
+        elif length < 1 << 16:
+            header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, 'big')
+        else:
+            header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, 'big')
+        return header + payload
+
+    async def _read_frames(self, reader, writer, closed):
+        """讀取客戶端幀：回應ping，收到close或連接斷開時結束推送"""
+        try:
+            while True:
+                first, second = await reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), 'big')
+                elif length == 127:
+                    length = int.from_bytes(await reader.readexactly(8), 'big')
+                mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+                opcode = first & 0x0F
+                if opcode == 0x8:
+                    writer.write(self._frame(payload[:2], 0x8))
+                    break
+                if opcode == 0x9:
+                    writer.write(self._frame(payload, 0xA))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            closed.set()
+
+    async def _websocket(self, reader, writer, headers, path):
+        stream = path.rsplit('/', 1)[-1]
+        symbol, _, kind = stream.partition('@')
+        symbol = symbol.upper()
+        if not kind.startswith('kline_') or symbol not in self.simulator.base_prices:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return
+        interval = kind[len('kline_'):]
+
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + _WS_GUID).encode()).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        await writer.drain()
+        METRICS.inc('simulator_ws_connections_total', help_text='模擬交易所WebSocket連接次數')
+
+        closed = asyncio.Event()
+        reader_task = asyncio.create_task(self._read_frames(reader, writer, closed))
+        loop = asyncio.get_running_loop()
+        try:
+            while not closed.is_set():
+                event = await loop.run_in_executor(None, self.kline_event, symbol, interval)
+                writer.write(self._frame(json.dumps(event).encode('utf-8')))
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(closed.wait(), self.push_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            reader_task.cancel()
+
+    async def serve(self, host='127.0.0.1', port=8600):
+        """啟動服務並持續運行"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬交易所：以Binance API格式提供連續推進的模擬行情")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--speed', type=float, default=1.0, help='模擬時間加速倍數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--push-seconds', type=float, default=1.0, help='WebSocket推送間隔（真實秒）')
+    args = parser.parse_args()
+
+    server = MarketSimulatorServer(MarketSimulator(args.speed, args.seed), args.push_seconds)
+    print(f"模擬交易所已啟動: http://{args.host}:{args.port}/api/v3 "
+          f"（ws://{args.host}:{args.port}/ws/btcusdt@kline_1m）")
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 階段耗時直方圖的桶邊界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 設置此環境變量時，write_prometheus() 預設寫入該文件
+METRICS_FILE_ENV = 'FANIC_METRICS_FILE'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    """按Prometheus文本格式轉義標籤值中的反斜線、雙引號和換行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    body = ','.join(f'{k}="{_escape_label(v)}"' for k, v in items)
+    return '{' + body + '}'
+
+
+class MetricsRegistry:
+    """進程內指標登記表：計數器和耗時直方圖，可導出為Prometheus文本格式"""
+
+    def __init__(self, prefix='fanic', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def inc(self, name, value=1, help_text=None, **labels):
+        """計數器加值"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def observe(self, name, seconds, help_text=None, **labels):
+        """記錄一次耗時到直方圖"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+            hist['count'] += 1
+            hist['sum'] += seconds
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+        stages = getattr(self._local, 'stages', None)
+        if stages is not None and name == 'stage_duration_seconds':
+            stages.append((labels.get('stage', ''), seconds))
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """計時區塊：耗時記入 stage_duration_seconds{stage=...}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start,
+                         help_text='各處理階段耗時', stage=stage, **labels)
+
+    def timed(self, stage):
+        """計時裝飾器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def start_trace(self):
+        """開始收集當前線程內（如一次Streamlit渲染）各階段的耗時"""
+        self._local.stages = []
+
+    def end_trace(self):
+        """
+        結束收集
+
+        Returns:
+            list: [(階段名, 秒數), ...]
+        """
+        stages = getattr(self._local, 'stages', None) or []
+        self._local.stages = None
+        return stages
+
+    @contextmanager
+    def trace(self):
+        """
+        以區塊方式收集當前線程內各階段的耗時
+
+        Yields:
+            list: [(階段名, 秒數), ...]，區塊結束後仍可讀取
+        """
+        previous = getattr(self._local, 'stages', None)
+        stages = []
+        self._local.stages = stages
+        try:
+            yield stages
+        finally:
+            self._local.stages = previous
+
+    def prometheus_text(self):
+        """導出Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: {'buckets': list(v['buckets']), 'count': v['count'], 'sum': v['sum']}
+                          for k, v in self._histograms.items()}
+            help_texts = dict(self._help)
+
+        for name in sorted({name for name, _ in counters}):
+            full = f'{self.prefix}_{name}'
+            if name in help_texts:
+                lines.append(f'# HELP {full} {help_texts[name]}')
+            lines.append(f'# TYPE {full} counter')
+            for (metric, key), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full}{_format_labels(key)} {value}')
+
+        for name in sorted({name for name, _ in histograms}):
+            full = f'{self.prefix}_{name}'
+            if name in help_texts:
+                lines.append(f'# HELP {full} {help_texts[name]}')
+            lines.append(f'# TYPE {full} histogram')
+            for (metric, key), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, hist['buckets']):
+                    lines.append(f'{full}_bucket{_format_labels(key, [("le", bound)])} {count}')
+                lines.append(f'{full}_bucket{_format_labels(key, [("le", "+Inf")])} {hist["count"]}')
+                lines.append(f'{full}_sum{_format_labels(key)} {hist["sum"]:.6f}')
+                lines.append(f'{full}_count{_format_labels(key)} {hist["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        """
+        把指標寫入文本文件（可供node_exporter的textfile收集器讀取）
+
+        Args:
+            path (str): 文件路徑，預設取環境變量 FANIC_METRICS_FILE
+
+        Returns:
+            bool: 是否已寫入
+        """
+        path = path or os.environ.get(METRICS_FILE_ENV)
+        if not path:
+            return False
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# 全局指標登記表
+METRICS = MetricsRegistry()
+span = METRICS.span
+timed = METRICS.timed
+trace = METRICS.trace
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import random
+from compact_frames import to_compact
+from trade_aggregator import TRADE_DTYPE
 
 class MockDataGenerator:
     """模擬數據生成器"""
@@ -35,7 +37,7 @@ class MockDataGenerator:
             "MATICUSDT": 0.06
         }
     
-    def generate_kline_data(self, symbol, interval, limit=500):
+    def generate_kline_data(self, symbol, interval, limit=500, compact=False, start_ms=None, end_ms=None):
         """
         生成模擬K線數據
         
@@ -43,6 +45,9 @@ class MockDataGenerator:
             symbol (str): 交易對符號
             interval (str): 時間間隔
             limit (int): 數據條數
+            compact (bool): 是否返回精簡格式（float32價格、int64毫秒時間戳）
+            start_ms (int): 最早的開盤時間（毫秒），指定時返回從此開始的至多limit根
+            end_ms (int): 最晚的開盤時間（毫秒，含），與start_ms一起使用
             
         Returns:
             pandas.DataFrame: K線數據
@@ -59,57 +64,61 @@ class MockDataGenerator:
         
         minutes = interval_minutes.get(interval, 60)
         
-        # 生成時間序列
-        end_time = datetime.now()
-        start_time = end_time - timedelta(minutes=minutes * limit)
-        timestamps = pd.date_range(start=start_time, end=end_time, periods=limit)
+        # 生成時間序列（與交易所K線一致，對齊到時間週期的整點開盤時間）
+        end_time = pd.Timestamp(datetime.now()).floor(f"{minutes}min")
+        if start_ms is None:
+            timestamps = pd.date_range(end=end_time, periods=limit, freq=f"{minutes}min")
+        else:
+            # 指定範圍時按毫秒網格生成（與交易所的startTime/endTime一致，不超過當前時間）
+            bar_ms = minutes * 60000
+            first_ms = -(-start_ms // bar_ms) * bar_ms
+            last_ms = min(end_time.value // 10**6, first_ms + (limit - 1) * bar_ms)
+            if end_ms is not None:
+                last_ms = min(last_ms, end_ms)
+            times_ms = np.arange(first_ms, last_ms + 1, bar_ms, dtype=np.int64)
+            timestamps = pd.DatetimeIndex(times_ms.astype('datetime64[ms]'))
+            limit = len(timestamps)
         
         # 獲取基準價格和波動率
         base_price = self.base_prices.get(symbol, 1000)
         vol = self.volatility.get(symbol, 0.03)
         
-        # 生成價格數據（使用隨機遊走模型）
-        prices = []
-        current_price = base_price
-        
-        for i in range(limit):
-            # 隨機價格變動
-            change = np.random.normal(0, vol * current_price / 100)
-            current_price = max(current_price + change, current_price * 0.9)  # 防止價格過低
-            prices.append(current_price)
+        # 生成價格數據（使用隨機遊走模型，以向量化方式一次生成整段序列）
+        # 每根K線的價格變動與前一版逐根迴圈相同：change ~ N(0, vol * price / 100)，
+        # 且單根跌幅不超過10%
+        returns = np.random.normal(0, vol / 100, limit)
+        prices = base_price * np.cumprod(1 + np.maximum(returns, -0.1))
         
         # 生成OHLCV數據
-        data = []
-        for i, price in enumerate(prices):
-            # 開盤價（如果是第一條，使用基準價格）
-            if i == 0:
-                open_price = base_price
-            else:
-                open_price = prices[i-1]
-            
-            # 收盤價
-            close_price = price
-            
-            # 高低價（在開盤和收盤價附近隨機生成）
-            high_price = max(open_price, close_price) + random.uniform(0, abs(close_price - open_price) * 0.5)
-            low_price = min(open_price, close_price) - random.uniform(0, abs(close_price - open_price) * 0.5)
-            
-            # 成交量（隨機生成）
-            volume = random.uniform(1000, 10000) * (base_price / 1000)
-            
-            data.append({
-                'timestamp': timestamps[i],
-                'open': open_price,
-                'high': high_price,
-                'low': low_price,
-                'close': close_price,
-                'volume': volume
-            })
+        # 開盤價（第一條使用基準價格，其餘為前一根收盤價）
+        open_prices = np.empty(limit)
+        open_prices[:1] = base_price
+        open_prices[1:] = prices[:-1]
+        close_prices = prices
+        
+        # 高低價（在開盤和收盤價附近隨機生成）
+        body = np.abs(close_prices - open_prices) * 0.5
+        high_prices = np.maximum(open_prices, close_prices) + np.random.uniform(0, 1, limit) * body
+        low_prices = np.minimum(open_prices, close_prices) - np.random.uniform(0, 1, limit) * body
+        
+        # 成交量（隨機生成）
+        volumes = np.random.uniform(1000, 10000, limit) * (base_price / 1000)
+        
+        data = {
+            'timestamp': timestamps,
+            'open': open_prices,
+            'high': high_prices,
+            'low': low_prices,
+            'close': close_prices,
+            'volume': volumes
+        }
         
         # 轉換為DataFrame
         df = pd.DataFrame(data)
         df.set_index('timestamp', inplace=True)
         
+        if compact:
+            return to_compact(df)
         return df
     
     def get_24h_ticker(self, symbol):
@@ -134,4 +143,81 @@ class MockDataGenerator:
         base_price = self.base_prices.get(symbol, 1000)
         # 添加小幅隨機變動
         current_price = base_price + random.uniform(-base_price * 0.02, base_price * 0.02)
-        return current_price
\ No newline at end of file
+        return current_price
+    
+    def generate_order_book(self, symbol, limit=1000):
+        """
+        生成模擬訂單簿（Binance /api/v3/depth 格式）
+        
+        每個交易對有幾個固定價位的大額掛單牆，使連續的快照呈現持續存在的流動性。
+        
+        Args:
+            symbol (str): 交易對符號
+            limit (int): 每側檔位數
+            
+        Returns:
+            dict: {'lastUpdateId', 'bids': [[價格, 數量], ...], 'asks': [[價格, 數量], ...]}
+        """
+        mid = self.get_current_price(symbol)
+        base_price = self.base_prices.get(symbol, 1000)
+        tick = base_price * 0.0001
+        
+        steps = np.arange(1, limit + 1)
+        bid_prices = mid - steps * tick
+        ask_prices = mid + steps * tick
+        bid_qty = np.random.exponential(1.0, limit) * (1000 / base_price)
+        ask_qty = np.random.exponential(1.0, limit) * (1000 / base_price)
+        
+        # 以交易對為種子的固定掛單牆（距基準價格0.5%~8%）
+        walls = random.Random(symbol)
+        for _ in range(3):
+            for sign, prices, qty in ((-1, bid_prices, bid_qty), (1, ask_prices, ask_qty)):
+                wall_price = base_price * (1 + sign * walls.uniform(0.005, 0.08))
+                pos = np.abs(prices - wall_price).argmin()
+                qty[pos] += 40 * (1000 / base_price)
+        
+        return {
+            'lastUpdateId': int(datetime.now().timestamp() * 1000),
+            'bids': [[f"{p:.8f}", f"{q:.8f}"] for p, q in zip(bid_prices, bid_qty)],
+            'asks': [[f"{p:.8f}", f"{q:.8f}"] for p, q in zip(ask_prices, ask_qty)]
+        }
+    
+    def generate_trades(self, symbol, start_ms, end_ms, n_trades=100000, klines=None):
+        """
+        生成模擬逐筆成交
+        
+        Args:
+            symbol (str): 交易對符號
+            start_ms (int): 開始時間（毫秒）
+            end_ms (int): 結束時間（毫秒）
+            n_trades (int): 成交筆數
+            klines (pandas.DataFrame): 若提供，成交價落在每根K線的高低價之間，使成交與圖表一致
+            
+        Returns:
+            ndarray: trade_aggregator.TRADE_DTYPE 數組，按時間排序
+        """
+        base_price = self.base_prices.get(symbol, 1000)
+        vol = self.volatility.get(symbol, 0.03)
+        
+        trades = np.empty(n_trades, dtype=TRADE_DTYPE)
+        trades['time'] = np.sort(np.random.randint(start_ms, end_ms, n_trades))
+        trades['qty'] = np.random.exponential(1.0, n_trades) * (1000 / base_price)
+        
+        if klines is not None and len(klines) > 0:
+            index = klines.index
+            bar_ms = index.as_unit('ms').asi8 if isinstance(index, pd.DatetimeIndex) else np.asarray(index, dtype=np.int64)
+            pos = np.clip(np.searchsorted(bar_ms, trades['time'], side='right') - 1, 0, len(bar_ms) - 1)
+            low = klines['low'].to_numpy(dtype=float)[pos]
+            high = klines['high'].to_numpy(dtype=float)[pos]
+            # 成交價偏向收盤價附近；上漲K線主動買入較多
+            close = klines['close'].to_numpy(dtype=float)[pos]
+            trades['price'] = np.clip(np.random.triangular(low, close, np.maximum(high, close + 1e-12)), low, high)
+            rising = (klines['close'].to_numpy() >= klines['open'].to_numpy())[pos]
+            trades['buyer_maker'] = np.random.random(n_trades) < np.where(rising, 0.4, 0.6)
+        else:
+            # 價格為隨機遊走，整段的波動幅度與同長度的模擬K線相近
+            n_bars = max((end_ms - start_ms) / 3600000, 1)
+            step = vol / 100 * np.sqrt(n_bars / n_trades)
+            trades['price'] = base_price * np.exp(np.cumsum(np.random.normal(0, step, n_trades)))
+            trades['buyer_maker'] = np.random.random(n_trades) < 0.5
+        return trades
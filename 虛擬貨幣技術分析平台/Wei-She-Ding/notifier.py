@@ -0,0 +1,25 @@
+import logging
+
+logger = logging.getLogger('fanic')
+
+
+class LoggingNotifier:
+    """預設通知器：寫入日誌，供批處理及無界面環境使用"""
+
+    def warning(self, message):
+        logger.warning(message)
+
+    def error(self, message):
+        logger.error(message)
+
+
+class StreamlitNotifier:
+    """在Streamlit頁面上顯示提示（streamlit只在實際通知時才導入）"""
+
+    def warning(self, message):
+        import streamlit as st
+        st.warning(message)
+
+    def error(self, message):
+        import streamlit as st
+        st.error(message)
@@ -0,0 +1,896 @@
+import argparse
+import bisect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+import numpy as np
+from columnar_codec import index_to_ms, time_to_ms
+from metrics import METRICS
+from notifier import logger
+
+BUY = 1
+SELL = -1
+SIDES = {'buy': BUY, 'sell': SELL}
+
+MARKET = 0
+LIMIT = 1
+STOP = 2
+ORDER_KINDS = {'market': MARKET, 'limit': LIMIT, 'stop': STOP}
+
+# 策略位元：帳戶按位訂閱；同一根K線有多個策略給出方向時，按此順序取第一個
+STRATEGIES = {'smc': 1, 'rsi': 2, 'macd': 4}
+ALL_STRATEGIES = 7
+
+RSI_OVERBOUGHT = 70
+RSI_OVERSOLD = 30
+
+# 持久化格式：帳戶、持倉和掛單都是定長數組，每個帳戶約50字節加每個交易對16字節
+ACCOUNT_DTYPE = np.dtype([
+    ('cash', '<f8'),
+    ('initial', '<f8'),
+    ('realized', '<f8'),
+    ('fees', '<f8'),
+    ('fraction', '<f8'),
+    ('strategies', 'u1'),
+])
+# 保存的狀態文件：數組和元數據寫入同一個.npz，以一次改名替換，中斷時不會留下新舊混合的狀態
+STATE_FILE = 'state.npz'
+ORDER_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('account', '<i8'),
+    ('symbol', '<i4'),
+    ('side', 'i1'),
+    ('kind', 'i1'),
+    ('reduce_only', 'u1'),
+    ('qty', '<f8'),
+    ('level', '<f8'),
+    ('stop_loss', '<f8'),
+    ('take_profit', '<f8'),
+])
+
+
+def signal_intents(row, trading_signals=None):
+    """
+    把圖表上展示的交易建議轉為方向意圖
+
+    - SMC：generate_trading_signals 的買入/賣出信號（訂單區塊入場、K線形態），帶止損；
+      買賣信號同時出現時按市場偏向取捨，偏向中性則不操作
+    - RSI：超買（>70）賣出，超賣（<30）買入
+    - MACD：MACD線在信號線之上（黃金交叉後）買入，之下賣出
+
+    Args:
+        row: 最新K線（pandas.Series或dict），可包含rsi、macd、macd_signal
+        trading_signals (dict): SMCAnalysis的交易信號，可選
+
+    Returns:
+        list: [{'strategy', 'side', 'reason', 'stop_loss', 'take_profit'}, ...]，按STRATEGIES的順序
+    """
+    intents = []
+    if trading_signals:
+        buys = trading_signals['buy_signals']
+        sells = trading_signals['sell_signals']
+        side = None
+        if buys and not sells:
+            side = BUY
+        elif sells and not buys:
+            side = SELL
+        elif buys and sells and trading_signals['market_bias'] != 'neutral':
+            side = BUY if trading_signals['market_bias'] == 'bullish' else SELL
+        if side is not None:
+            signal = (buys if side == BUY else sells)[0]
+            intents.append({
+                'strategy': 'smc',
+                'side': side,
+                'reason': signal['reason'],
+                'stop_loss': signal['stop_loss'],
+                'take_profit': signal['target']
+            })
+
+    rsi = row.get('rsi')
+    if rsi is not None and np.isfinite(rsi):
+        if rsi > RSI_OVERBOUGHT:
+            intents.append({'strategy': 'rsi', 'side': SELL, 'reason': 'RSI超買區域',
+                            'stop_loss': None, 'take_profit': None})
+        elif rsi < RSI_OVERSOLD:
+            intents.append({'strategy': 'rsi', 'side': BUY, 'reason': 'RSI超賣區域',
+                            'stop_loss': None, 'take_profit': None})
+
+    macd = row.get('macd')
+    macd_signal = row.get('macd_signal')
+    if macd is not None and macd_signal is not None and np.isfinite(macd) and np.isfinite(macd_signal):
+        golden = macd > macd_signal
+        intents.append({'strategy': 'macd', 'side': BUY if golden else SELL,
+                        'reason': 'MACD黃金交叉' if golden else 'MACD死亡交叉',
+                        'stop_loss': None, 'take_profit': None})
+    return intents
+
+
+class OrderIndex:
+    """
+    按觸發水平排序的掛單索引，取出區間內的掛單為O(log n + k)
+
+    撤單只從掛單表中刪除，索引中的條目延遲清理：取出時跳過，失效條目過多時整體重建。
+    大量帳戶跟隨同一信號時止損水平完全相同，逐個刪除會退化為O(n²)。
+    """
+
+    def __init__(self, live):
+        self.live = live
+        self.levels = []
+        self.ids = []
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.levels) - self.stale
+
+    def add(self, level, order_id):
+        i = bisect.bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, order_id)
+
+    def discard(self):
+        """記錄一個失效條目，失效條目超過一半時重建索引"""
+        self.stale += 1
+        if self.stale > max(64, len(self.levels) // 2):
+            keep = [i for i, order_id in enumerate(self.ids) if order_id in self.live]
+            self.levels = [self.levels[i] for i in keep]
+            self.ids = [self.ids[i] for i in keep]
+            self.stale = 0
+
+    def pop_between(self, low, high, include_low, include_high):
+        """取出並移除水平位於 low ~ high 之間的有效掛單ID（按水平升序）"""
+        lo = bisect.bisect_left(self.levels, low) if include_low else bisect.bisect_right(self.levels, low)
+        hi = bisect.bisect_right(self.levels, high) if include_high else bisect.bisect_left(self.levels, high)
+        ids = self.ids[lo:hi]
+        del self.levels[lo:hi]
+        del self.ids[lo:hi]
+        live = [order_id for order_id in ids if order_id in self.live]
+        self.stale = max(0, self.stale - (len(ids) - len(live)))
+        return live
+
+
+class PaperTradingEngine:
+    """
+    模擬交易引擎：把交易信號轉為模擬訂單，以K線或逐筆成交撮合，並實時計算持倉和盈虧
+
+    帳戶和持倉以數組保存（帳戶 × 交易對），同一信號對數千個帳戶的開平倉一次向量化完成；
+    限價單和止損單按交易對放入排序的觸發水平索引，每根K線只取出被穿越的掛單。
+
+    K線按 開盤 → 最低 → 最高 → 收盤（陽線）或 開盤 → 最高 → 最低 → 收盤（陰線）的路徑撮合；
+    路徑上連續移動時掛單按觸發水平成交，跳空（上一價格到開盤價、逐筆成交之間）穿越的止損單
+    按跳空後的價格成交，限價單仍按限價成交。同一交易對請只用K線或只用逐筆成交驅動。
+
+    K線進度和信號去重按 (交易對, 時間週期) 分別記錄，時間一律為int毫秒：
+    不同週期或精簡模式（毫秒索引）的K線交替到達時互不跳過。
+    """
+
+    def __init__(self, fee_rate=0.001, log_size=1000):
+        """
+        Args:
+            fee_rate (float): 手續費率（按成交金額）
+            log_size (int): 保留的最近成交記錄數
+        """
+        self.fee_rate = fee_rate
+        self.symbols = {}
+        self.symbol_names = []
+        self.accounts = np.zeros(0, dtype=ACCOUNT_DTYPE)
+        self.qty = np.zeros((0, 0))
+        self.avg_price = np.zeros((0, 0))
+        self.last_prices = np.zeros(0)
+
+        self.orders = {}
+        # (交易對列, 'up'/'down') -> OrderIndex；up 在價格上漲穿越時觸發（賣出限價、買入止損）
+        self.indexes = {}
+        # (帳戶, 交易對列) -> 保護持倉的止損/止盈單ID，任一成交即撤銷其餘
+        self.brackets = {}
+        # (交易對列, 時間週期) -> [K線時間（毫秒）, 已見最高價, 已見最低價]
+        self.bars = {}
+        # (交易對列, 時間週期) -> 最近一次執行的 (K線時間, 意圖)；同一根K線上意圖不變時不重複執行（止損後不立即重新入場）
+        self.signal_times = {}
+        self.next_id = 1
+        self.fill_count = 0
+        self.fills = deque(maxlen=log_size)
+        self._lock = threading.RLock()
+
+    def _column(self, symbol):
+        col = self.symbols.get(symbol)
+        if col is None:
+            col = len(self.symbol_names)
+            self.symbols[symbol] = col
+            self.symbol_names.append(symbol)
+            rows = len(self.accounts)
+            self.qty = np.hstack([self.qty, np.zeros((rows, 1))])
+            self.avg_price = np.hstack([self.avg_price, np.zeros((rows, 1))])
+            self.last_prices = np.append(self.last_prices, np.nan)
+        return col
+
+    def _index(self, col, direction):
+        key = (col, direction)
+        if key not in self.indexes:
+            self.indexes[key] = OrderIndex(self.orders)
+        return self.indexes[key]
+
+    def add_accounts(self, count, cash=10000.0, strategies=ALL_STRATEGIES, fraction=0.1):
+        """
+        批量開設帳戶
+
+        Args:
+            count (int): 帳戶數
+            cash (float or ndarray): 初始資金
+            strategies (int or ndarray): 訂閱的策略位元（見STRATEGIES），0表示只接受手動下單
+            fraction (float or ndarray): 跟隨信號開倉時使用的權益比例
+
+        Returns:
+            numpy.ndarray: 新帳戶的ID
+        """
+        with self._lock:
+            start = len(self.accounts)
+            accounts = np.zeros(count, dtype=ACCOUNT_DTYPE)
+            accounts['cash'] = cash
+            accounts['initial'] = cash
+            accounts['fraction'] = fraction
+            accounts['strategies'] = strategies
+            self.accounts = np.concatenate([self.accounts, accounts])
+            self.qty = np.vstack([self.qty, np.zeros((count, len(self.symbol_names)))])
+            self.avg_price = np.vstack([self.avg_price, np.zeros((count, len(self.symbol_names)))])
+            return np.arange(start, start + count)
+
+    def _apply_fills(self, accounts, col, deltas, prices):
+        """向量化更新成交後的持倉、均價、已實現盈虧、手續費和現金（accounts不可重複）"""
+        position = self.qty[accounts, col]
+        avg = self.avg_price[accounts, col]
+        new = position + deltas
+        opposite = (position != 0) & (np.sign(position) != np.sign(deltas))
+        closed = np.where(opposite, np.minimum(np.abs(deltas), np.abs(position)), 0.0)
+        flipped = opposite & (np.abs(deltas) > np.abs(position))
+        # 加倉按成交量加權均價，減倉均價不變，反手以成交價為新均價，平倉後歸零
+        safe = np.where(new == 0, 1.0, new)
+        new_avg = np.where(opposite, avg, (position * avg + deltas * prices) / safe)
+        new_avg = np.where(flipped, prices, new_avg)
+        new_avg = np.where(new == 0, 0.0, new_avg)
+        fees = np.abs(deltas) * prices * self.fee_rate
+
+        self.accounts['realized'][accounts] += closed * (prices - avg) * np.sign(position)
+        self.accounts['fees'][accounts] += fees
+        self.accounts['cash'][accounts] -= deltas * prices + fees
+        self.qty[accounts, col] = new
+        self.avg_price[accounts, col] = new_avg
+        self.fill_count += len(accounts)
+
+    def _log(self, timestamp, account, col, delta, price, reason):
+        if self.fills.maxlen:
+            self.fills.append({
+                'time': timestamp,
+                'account': int(account),
+                'symbol': self.symbol_names[col],
+                'side': 'buy' if delta > 0 else 'sell',
+                'qty': float(abs(delta)),
+                'price': float(price),
+                'reason': reason
+            })
+
+    @staticmethod
+    def _direction(order):
+        return 'up' if (order['side'] == SELL) == (order['kind'] == LIMIT) else 'down'
+
+    @staticmethod
+    def _marketable(order, direction, price):
+        return price >= order['level'] if direction == 'up' else price <= order['level']
+
+    def place_order(self, account, symbol, side, qty, kind='market', price=None,
+                    stop_loss=None, take_profit=None, timestamp=None):
+        """
+        手動下單；可成交的訂單（市價單、已穿價的限價/止損單）立即按最新價成交
+
+        Args:
+            account (int): 帳戶ID
+            symbol (str): 交易對符號
+            side (str): 'buy' 或 'sell'
+            qty (float): 數量
+            kind (str): 'market'、'limit' 或 'stop'
+            price (float): 限價或止損觸發價（限價/止損單必填）
+            stop_loss (float): 成交後為持倉掛出的止損價，可選
+            take_profit (float): 成交後為持倉掛出的止盈價，可選
+            timestamp: 下單時間
+
+        Returns:
+            int: 訂單ID
+        """
+        if side not in SIDES:
+            raise ValueError(f"不支持的買賣方向: {side}")
+        if kind not in ORDER_KINDS:
+            raise ValueError(f"不支持的訂單類型: {kind}")
+        if qty <= 0:
+            raise ValueError("訂單數量必須大於0")
+        if kind != 'market' and price is None:
+            raise ValueError(f"{kind} 訂單需要提供價格")
+        if not 0 <= account < len(self.accounts):
+            raise ValueError(f"帳戶不存在: {account}")
+
+        with self._lock:
+            col = self._column(symbol)
+            if kind == 'market' and not np.isfinite(self.last_prices[col]):
+                raise ValueError(f"{symbol} 沒有最新價格，無法以市價成交")
+            order = self._new_order(account, col, SIDES[side], ORDER_KINDS[kind], qty,
+                                    np.nan if price is None else price, stop_loss, take_profit)
+            self._submit(order, timestamp, 'manual')
+            return order['id']
+
+    def _new_order(self, account, col, side, kind, qty, level, stop_loss=None, take_profit=None, reduce_only=False):
+        order = {
+            'id': self.next_id,
+            'account': int(account),
+            'symbol': col,
+            'side': side,
+            'kind': kind,
+            'reduce_only': reduce_only,
+            'qty': float(qty),
+            'level': float(level),
+            'stop_loss': np.nan if stop_loss is None else float(stop_loss),
+            'take_profit': np.nan if take_profit is None else float(take_profit)
+        }
+        self.next_id += 1
+        return order
+
+    def _submit(self, order, timestamp, reason):
+        """登記訂單；按最新價可成交則立即成交，否則放入觸發水平索引"""
+        self.orders[order['id']] = order
+        if order['reduce_only']:
+            self.brackets.setdefault((order['account'], order['symbol']), set()).add(order['id'])
+        price = self.last_prices[order['symbol']]
+        direction = self._direction(order)
+        if order['kind'] == MARKET or (np.isfinite(price) and self._marketable(order, direction, price)):
+            self._fill(order, price, timestamp, reason)
+        else:
+            self._index(order['symbol'], direction).add(order['level'], order['id'])
+
+    def _forget(self, order_id):
+        """從掛單表及保護單集合中移除訂單"""
+        order = self.orders.pop(order_id, None)
+        if order is not None and order['reduce_only']:
+            key = (order['account'], order['symbol'])
+            bracket = self.brackets.get(key)
+            if bracket is not None:
+                bracket.discard(order_id)
+                if not bracket:
+                    del self.brackets[key]
+        return order
+
+    def cancel_order(self, order_id):
+        """撤銷掛單"""
+        with self._lock:
+            order = self._forget(order_id)
+            if order is None:
+                return False
+            index = self.indexes.get((order['symbol'], self._direction(order)))
+            if index is not None:
+                index.discard()
+            return True
+
+    def _cancel_brackets(self, account, col):
+        for order_id in list(self.brackets.get((account, col), ())):
+            self.cancel_order(order_id)
+
+    def _protect(self, account, col, stop_loss, take_profit, timestamp):
+        """為帳戶在該交易對的全部持倉掛出止損/止盈單，替換原有的保護單"""
+        self._cancel_brackets(account, col)
+        for level, kind, reason in ((stop_loss, STOP, 'stop_loss'), (take_profit, LIMIT, 'take_profit')):
+            position = self.qty[account, col]
+            if position == 0 or level is None or not np.isfinite(level):
+                continue
+            order = self._new_order(account, col, -int(np.sign(position)), kind, abs(position), level,
+                                    reduce_only=True)
+            self._submit(order, timestamp, reason)
+
+    def _fill(self, order, price, timestamp, reason):
+        """成交一張已登記的訂單（已從觸發水平索引中取出）"""
+        self._forget(order['id'])
+        account, col = order['account'], order['symbol']
+        if order['reduce_only']:
+            position = self.qty[account, col]
+            if position == 0 or np.sign(position) == order['side']:
+                self._cancel_brackets(account, col)
+                return None
+            delta = -position
+        else:
+            delta = order['side'] * order['qty']
+
+        self._apply_fills(np.array([account]), col, np.array([delta]), np.array([price]))
+        self._log(timestamp, account, col, delta, price, reason)
+        if order['reduce_only']:
+            self._cancel_brackets(account, col)
+        elif np.isfinite(order['stop_loss']) or np.isfinite(order['take_profit']):
+            self._protect(account, col, order['stop_loss'], order['take_profit'], timestamp)
+        return delta
+
+    def _sweep(self, col, start, end, gap, timestamp):
+        """
+        價格從 start 移動到 end，成交沿途被穿越的掛單
+
+        成交掛出的止損/止盈單若仍位於剩餘路徑上，在同一次移動中繼續撮合。
+        """
+        fills = 0
+        if end > start:
+            index = self.indexes.get((col, 'up'))
+            low, include_low = start, False
+            while index is not None:
+                ids = index.pop_between(low, end, include_low, True)
+                if not ids:
+                    break
+                for order_id in ids:
+                    order = self.orders.get(order_id)
+                    if order is None:
+                        continue
+                    price = end if gap and order['kind'] == STOP else order['level']
+                    self.last_prices[col] = price
+                    fills += self._fill(order, price, timestamp, 'stop' if order['kind'] == STOP else 'limit') is not None
+                    low, include_low = order['level'], True
+        elif end < start:
+            index = self.indexes.get((col, 'down'))
+            high, include_high = start, False
+            while index is not None:
+                ids = index.pop_between(end, high, True, include_high)
+                if not ids:
+                    break
+                for order_id in reversed(ids):
+                    order = self.orders.get(order_id)
+                    if order is None:
+                        continue
+                    price = end if gap and order['kind'] == STOP else order['level']
+                    self.last_prices[col] = price
+                    fills += self._fill(order, price, timestamp, 'stop' if order['kind'] == STOP else 'limit') is not None
+                    high, include_high = order['level'], True
+        self.last_prices[col] = end
+        return fills
+
+    def on_bar(self, symbol, bar_time, open_, high, low, close, interval=None):
+        """
+        以一根K線撮合掛單；同一時間的K線再次到達（未收盤K線更新）時只撮合新增的價格範圍
+
+        Args:
+            symbol (str): 交易對符號
+            bar_time: K線開盤時間（Timestamp、datetime64或毫秒整數）
+            open_, high, low, close (float): K線價格
+            interval (str): 時間週期
+
+        Returns:
+            int: 成交的掛單數
+        """
+        bar_time = time_to_ms(bar_time)
+        with self._lock:
+            col = self._column(symbol)
+            key = (col, interval)
+            state = self.bars.get(key)
+            path = []
+            if state is None or bar_time > state[0]:
+                if np.isfinite(self.last_prices[col]):
+                    path.append((open_, True))
+                else:
+                    self.last_prices[col] = open_
+                extremes = [low, high] if close >= open_ else [high, low]
+                self.bars[key] = [bar_time, float(high), float(low)]
+            elif bar_time == state[0]:
+                extremes = []
+                if high > state[1]:
+                    extremes.append(high)
+                if low < state[2]:
+                    extremes.append(low)
+                if close < open_:
+                    extremes.reverse()
+                state[1], state[2] = max(float(high), state[1]), min(float(low), state[2])
+            else:
+                return 0
+            path.extend((price, False) for price in extremes)
+            path.append((close, False))
+
+            fills = 0
+            for price, gap in path:
+                fills += self._sweep(col, self.last_prices[col], float(price), gap, bar_time)
+            return fills
+
+    def on_trade(self, symbol, price, timestamp=None):
+        """
+        以一筆成交撮合掛單（兩筆成交之間視為跳空）
+
+        Args:
+            symbol (str): 交易對符號
+            price (float): 成交價
+            timestamp: 成交時間
+
+        Returns:
+            int: 成交的掛單數
+        """
+        with self._lock:
+            col = self._column(symbol)
+            last = self.last_prices[col]
+            if not np.isfinite(last):
+                self.last_prices[col] = price
+                return 0
+            return self._sweep(col, last, float(price), True, timestamp)
+
+    def on_signals(self, symbol, intents, timestamp=None):
+        """
+        讓訂閱了相應策略的帳戶按意圖以最新價開倉或反手，並為新持倉掛出止損/止盈單
+
+        已持有同方向倉位的帳戶不操作；每個帳戶取其訂閱策略中第一個給出方向的意圖。
+
+        Args:
+            symbol (str): 交易對符號
+            intents (list): signal_intents 的輸出
+            timestamp: 信號時間
+
+        Returns:
+            int: 開倉或反手的帳戶數
+        """
+        with self._lock:
+            col = self._column(symbol)
+            price = self.last_prices[col]
+            if not intents or not np.isfinite(price) or not len(self.accounts):
+                return 0
+
+            strategies = self.accounts['strategies']
+            target = np.zeros(len(self.accounts), dtype=np.int8)
+            chosen = np.full(len(self.accounts), -1)
+            for i, intent in enumerate(intents):
+                mask = ((strategies & STRATEGIES[intent['strategy']]) != 0) & (target == 0)
+                target[mask] = intent['side']
+                chosen[mask] = i
+            accounts = np.flatnonzero((target != 0) & (np.sign(self.qty[:, col]) != target))
+            if not len(accounts):
+                return 0
+
+            for account in accounts:
+                if (account, col) in self.brackets:
+                    self._cancel_brackets(int(account), col)
+            equity = self.equity()[accounts]
+            size = np.maximum(self.accounts['fraction'][accounts] * equity / price, 0.0)
+            deltas = target[accounts] * size - self.qty[accounts, col]
+            self._apply_fills(accounts, col, deltas, np.full(len(accounts), price))
+
+            tail = self.fills.maxlen or 0
+            if tail:
+                for account, delta, i in zip(accounts[-tail:], deltas[-tail:], chosen[accounts][-tail:]):
+                    self._log(timestamp, account, col, delta, price, intents[i]['reason'])
+            for i, intent in enumerate(intents):
+                if intent['stop_loss'] is None and intent['take_profit'] is None:
+                    continue
+                for account in accounts[chosen[accounts] == i]:
+                    self._protect(int(account), col, intent['stop_loss'], intent['take_profit'], timestamp)
+            return len(accounts)
+
+    def on_frame(self, symbol, df, trading_signals=None, interval=None):
+        """
+        以K線數據推進：撮合上次處理之後的K線，新K線或意圖改變時執行最新的交易信號
+
+        首次見到的 (交易對, 時間週期) 只從最後一根K線開始，不回補歷史。
+
+        Args:
+            symbol (str): 交易對符號
+            df (pandas.DataFrame): 含OHLC（及可選的rsi、macd、macd_signal列）的K線數據，
+                索引為DatetimeIndex或精簡模式的毫秒整數
+            trading_signals (dict): SMCAnalysis的交易信號，可選
+            interval (str): 時間週期
+
+        Returns:
+            int: 成交的掛單數加開倉或反手的帳戶數
+        """
+        if df is None or df.empty:
+            return 0
+        times = index_to_ms(df.index)
+        with self._lock:
+            key = (self._column(symbol), interval)
+            state = self.bars.get(key)
+            rows = [len(df) - 1] if state is None else np.flatnonzero(times >= state[0])
+            opens, highs, lows, closes = (df[name].to_numpy(dtype=float) for name in ('open', 'high', 'low', 'close'))
+            fills = 0
+            for i in rows:
+                fills += self.on_bar(symbol, times[i], opens[i], highs[i], lows[i], closes[i], interval)
+            bar_time = int(times[-1])
+            intents = signal_intents(df.iloc[-1], trading_signals)
+            signal_key = (bar_time, tuple((intent['strategy'], intent['side']) for intent in intents))
+            if self.signal_times.get(key) != signal_key:
+                self.signal_times[key] = signal_key
+                fills += self.on_signals(symbol, intents, bar_time)
+            return fills
+
+    def equity(self):
+        """各帳戶按最新價計算的權益"""
+        return self.accounts['cash'] + self.qty @ np.nan_to_num(self.last_prices)
+
+    def unrealized(self):
+        """各帳戶按最新價計算的未實現盈虧"""
+        marks = np.nan_to_num(self.last_prices)
+        return (self.qty * (marks - self.avg_price)).sum(axis=1)
+
+    def account_summary(self, account):
+        """
+        單個帳戶的實時狀態
+
+        Args:
+            account (int): 帳戶ID
+
+        Returns:
+            dict: 現金、權益、已實現/未實現盈虧、手續費、各交易對持倉和掛單
+        """
+        with self._lock:
+            marks = np.nan_to_num(self.last_prices)
+            positions = {
+                self.symbol_names[col]: {
+                    'qty': float(self.qty[account, col]),
+                    'avg_price': float(self.avg_price[account, col]),
+                    'unrealized': float(self.qty[account, col] * (marks[col] - self.avg_price[account, col]))
+                }
+                for col in np.flatnonzero(self.qty[account])
+            }
+            record = self.accounts[account]
+            return {
+                'cash': float(record['cash']),
+                'equity': float(record['cash'] + self.qty[account] @ marks),
+                'realized': float(record['realized']),
+                'unrealized': sum(position['unrealized'] for position in positions.values()),
+                'fees': float(record['fees']),
+                'positions': positions,
+                'orders': [dict(order, symbol=self.symbol_names[order['symbol']])
+                           for order in self.orders.values() if order['account'] == account]
+            }
+
+    def save(self, directory):
+        """
+        把引擎狀態保存到目錄下的 STATE_FILE：帳戶、持倉、均價、掛單四個數組加JSON元數據
+
+        先寫入臨時文件再以一次改名替換，讀取方只會看到完整的舊狀態或完整的新狀態。
+
+        Args:
+            directory (str): 目錄（不存在時創建）
+        """
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            orders = np.zeros(len(self.orders), dtype=ORDER_DTYPE)
+            for i, order in enumerate(self.orders.values()):
+                orders[i] = tuple(order[name] for name in ORDER_DTYPE.names)
+            meta = {
+                'fee_rate': self.fee_rate,
+                'symbols': self.symbol_names,
+                'last_prices': [None if not np.isfinite(price) else float(price) for price in self.last_prices],
+                'bars': [[col, interval, int(state[0]), state[1], state[2]]
+                         for (col, interval), state in self.bars.items()],
+                'signal_times': [[col, interval, int(bar_time), [list(item) for item in intents]]
+                                 for (col, interval), (bar_time, intents) in self.signal_times.items()],
+                'next_id': self.next_id,
+                'fill_count': self.fill_count
+            }
+            meta_bytes = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+            tmp_path = os.path.join(directory, f'{STATE_FILE}.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, accounts=self.accounts, qty=self.qty, avg_price=self.avg_price, orders=orders,
+                         meta=meta_bytes)
+            os.replace(tmp_path, os.path.join(directory, STATE_FILE))
+
+    @classmethod
+    def load(cls, directory, log_size=1000):
+        """
+        從 save 保存的目錄恢復引擎
+
+        Args:
+            directory (str): 目錄
+            log_size (int): 保留的最近成交記錄數（成交記錄不持久化）
+
+        Returns:
+            PaperTradingEngine: 恢復後的引擎
+        """
+        with np.load(os.path.join(directory, STATE_FILE)) as state:
+            arrays = {name: state[name] for name in ('accounts', 'qty', 'avg_price', 'orders', 'meta')}
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        engine = cls(fee_rate=meta['fee_rate'], log_size=log_size)
+        engine.symbol_names = list(meta['symbols'])
+        engine.symbols = {symbol: col for col, symbol in enumerate(engine.symbol_names)}
+        engine.last_prices = np.array([np.nan if price is None else price for price in meta['last_prices']],
+                                      dtype=float)
+        engine.bars = {(col, interval): [bar_time, high, low] for col, interval, bar_time, high, low in meta['bars']}
+        engine.signal_times = {(col, interval): (bar_time, tuple(tuple(item) for item in intents))
+                               for col, interval, bar_time, intents in meta['signal_times']}
+        engine.next_id = meta['next_id']
+        engine.fill_count = meta['fill_count']
+        engine.accounts = arrays['accounts']
+        engine.qty = arrays['qty']
+        engine.avg_price = arrays['avg_price']
+
+        # 按訂單ID順序恢復，相同觸發水平的掛單保持原來的成交先後
+        for record in np.sort(arrays['orders'], order='id'):
+            order = {name: record[name].item() for name in ORDER_DTYPE.names}
+            order['reduce_only'] = bool(order['reduce_only'])
+            engine.orders[order['id']] = order
+            if order['reduce_only']:
+                engine.brackets.setdefault((order['account'], order['symbol']), set()).add(order['id'])
+            engine._index(order['symbol'], engine._direction(order)).add(order['level'], order['id'])
+        return engine
+
+
+class PaperTradingFeed:
+    """
+    定期抓取一個 (交易對, 時間週期) 的K線驅動引擎的背景線程
+
+    引擎的推進與頁面渲染分離：頁面重跑或多個會話同時查看不會重複撮合；
+    只有出現新K線或有成交時才保存狀態。
+    """
+
+    # 跟隨信號計算時使用的指標配置，與頁面預設一致
+    INDICATORS = {'rsi': 14, 'macd': True}
+
+    def __init__(self, engine, data_fetcher, tech_indicators, smc_analyzer, symbol, interval,
+                 state_dir=None, interval_seconds=30, limit=500):
+        """
+        Args:
+            engine (PaperTradingEngine): 引擎（可由多個數據源共用）
+            data_fetcher (CryptoDataFetcher): 數據獲取器
+            tech_indicators (TechnicalIndicators): 技術指標計算器
+            smc_analyzer (SMCAnalysis): 提供時同時跟隨SMC交易信號，可選
+            symbol (str): 交易對符號
+            interval (str): 時間週期
+            state_dir (str): 保存狀態的目錄，None表示不保存
+            interval_seconds (float): 抓取間隔秒數
+            limit (int): 每次抓取的K線數
+        """
+        self.engine = engine
+        self.data_fetcher = data_fetcher
+        self.tech_indicators = tech_indicators
+        self.smc_analyzer = smc_analyzer
+        self.symbol = symbol
+        self.interval = interval
+        self.state_dir = state_dir
+        self.interval_seconds = interval_seconds
+        self.limit = limit
+        self._saved_bar = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """
+        抓取一次K線並推進引擎
+
+        Returns:
+            int: 成交的掛單數加開倉或反手的帳戶數
+        """
+        df = self.data_fetcher.get_kline_data(self.symbol, self.interval, limit=self.limit)
+        if df is None or df.empty:
+            return 0
+        df = self.tech_indicators.calculate_indicators(df, self.INDICATORS)
+        trading_signals = self.smc_analyzer.analyze_smc(df)['trading_signals'] if self.smc_analyzer else None
+        fills = self.engine.on_frame(self.symbol, df, trading_signals, self.interval)
+        bar_time = time_to_ms(df.index[-1])
+        if self.state_dir and (fills or bar_time != self._saved_bar):
+            self.engine.save(self.state_dir)
+            self._saved_bar = bar_time
+        return fills
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'paper-{self.symbol}-{self.interval}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                # 單次抓取失敗不中斷，下一輪重試
+                METRICS.inc('paper_feed_errors_total', help_text='模擬交易數據源推進失敗次數',
+                            symbol=self.symbol, interval=self.interval)
+                logger.warning("%s %s 模擬交易推進失敗: %r", self.symbol, self.interval, e)
+            self._stop.wait(self.interval_seconds)
+
+
+def replay(engine, symbol, df, smc_analyzer=None, smc_every=1, lookback=200, start=0, stop=None, interval=None):
+    """
+    以歷史K線回放驅動引擎：每根K線先撮合掛單，收盤時執行當根的交易信號
+
+    Args:
+        engine (PaperTradingEngine): 引擎
+        symbol (str): 交易對符號
+        df (pandas.DataFrame): 含OHLC及rsi/macd/macd_signal列的K線數據
+        smc_analyzer (SMCAnalysis): 提供時每 smc_every 根K線以最近 lookback 根K線計算SMC信號
+        smc_every (int): SMC信號的計算間隔
+        lookback (int): SMC分析的K線數
+        start (int): 起始K線位置
+        stop (int): 結束K線位置（不含）
+        interval (str): 時間週期
+
+    Returns:
+        int: 成交的掛單數加開倉或反手的帳戶數
+    """
+    stop = len(df) if stop is None else stop
+    opens, highs, lows, closes = (df[name].to_numpy(dtype=float) for name in ('open', 'high', 'low', 'close'))
+    columns = [name for name in ('rsi', 'macd', 'macd_signal') if name in df.columns]
+    values = {name: df[name].to_numpy(dtype=float) for name in columns}
+    times = index_to_ms(df.index)
+    fills = 0
+    for i in range(start, stop):
+        bar_time = int(times[i])
+        fills += engine.on_bar(symbol, bar_time, opens[i], highs[i], lows[i], closes[i], interval)
+        trading_signals = None
+        if smc_analyzer is not None and i + 1 >= lookback and i % smc_every == 0:
+            trading_signals = smc_analyzer.analyze_smc(df.iloc[i + 1 - lookback:i + 1])['trading_signals']
+        row = {name: values[name][i] for name in columns}
+        fills += engine.on_signals(symbol, signal_intents(row, trading_signals), bar_time)
+    return fills
+
+
+def _state_matches(a, b):
+    return (np.array_equal(a.accounts, b.accounts) and np.array_equal(a.qty, b.qty)
+            and np.array_equal(a.avg_price, b.avg_price) and a.orders.keys() == b.orders.keys()
+            and a.fill_count == b.fill_count and a.bars == b.bars and a.signal_times == b.signal_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以回放K線驅動模擬交易引擎，檢查持久化恢復與盈虧恆等式並測量吞吐量')
+    parser.add_argument('--accounts', type=int, default=5000)
+    parser.add_argument('--bars', type=int, default=2000)
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--market', choices=['random', 'live'], default='random',
+                        help='回放數據來源：random 為隨機生成，live 為連續推進的模擬交易所')
+    parser.add_argument('--smc-every', type=int, default=10, help='每隔多少根K線計算一次SMC信號，0為不使用')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from technical_indicators import TechnicalIndicators
+    from smc_analysis import SMCAnalysis
+    if args.market == 'live':
+        from market_simulator import MarketSimulator
+        generator = MarketSimulator(seed=args.seed)
+    else:
+        from mock_data_generator import MockDataGenerator
+        generator = MockDataGenerator()
+    df = generator.generate_kline_data(args.symbol, args.interval, args.bars)
+    df = TechnicalIndicators().calculate_indicators(df, {'rsi': 14, 'macd': True})
+    smc = SMCAnalysis() if args.smc_every else None
+
+    rng = np.random.default_rng(args.seed)
+    engine = PaperTradingEngine(log_size=0)
+    engine.add_accounts(args.accounts, cash=10000.0,
+                        strategies=rng.integers(1, ALL_STRATEGIES + 1, args.accounts),
+                        fraction=rng.uniform(0.05, 0.5, args.accounts))
+
+    # 回放前半段後保存並恢復，兩個引擎分別回放後半段，最終狀態必須完全相同
+    half = len(df) // 2
+    started = time.perf_counter()
+    replay(engine, args.symbol, df, smc, max(args.smc_every, 1), stop=half, interval=args.interval)
+    state_dir = tempfile.mkdtemp(prefix='paper_trading_')
+    try:
+        engine.save(state_dir)
+        state_bytes = sum(os.path.getsize(os.path.join(state_dir, name)) for name in os.listdir(state_dir))
+        restored = PaperTradingEngine.load(state_dir, log_size=0)
+    finally:
+        shutil.rmtree(state_dir)
+    replay(engine, args.symbol, df, smc, max(args.smc_every, 1), start=half, interval=args.interval)
+    elapsed = time.perf_counter() - started
+    replay(restored, args.symbol, df, smc, max(args.smc_every, 1), start=half, interval=args.interval)
+
+    failures = []
+    if not _state_matches(engine, restored):
+        failures.append("保存後恢復的引擎回放結果與未中斷的引擎不一致")
+    identity = engine.accounts['initial'] + engine.accounts['realized'] + engine.unrealized() - engine.accounts['fees']
+    if not np.allclose(engine.equity(), identity, rtol=1e-9, atol=1e-6):
+        failures.append("權益不等於 初始資金 + 已實現盈虧 + 未實現盈虧 - 手續費")
+
+    equity = engine.equity()
+    p5, p50, p95 = np.percentile(equity, [5, 50, 95])
+    print(f"{args.accounts} 個帳戶回放 {len(df)} 根K線：{elapsed:.2f} 秒（{len(df) / elapsed:.0f} 根/秒），"
+          f"成交 {engine.fill_count} 筆，掛單 {len(engine.orders)} 張")
+    print(f"權益 p5/p50/p95: {p5:.2f} / {p50:.2f} / {p95:.2f}，狀態文件 {state_bytes / 1024:.1f} KB")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis_cache import BarCloseCache, current_bar_open
+from metrics import timed
+
+# 歷史收盤價：開盤時間（毫秒）及收盤價
+HISTORY_DTYPE = np.dtype([('time', 'i8'), ('close', 'f8')])
+
+# 分塊卷積（overlap-save）的塊長度及索引支持的最大查詢長度
+BLOCK_SIZE = 1 << 15
+MAX_QUERY = 1024
+
+
+def _to_ms(index):
+    """把K線索引（DatetimeIndex或毫秒整數）轉為int64毫秒"""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit('ms').asi8
+    return np.asarray(index, dtype=np.int64)
+
+
+def _fft_size(n):
+    """不小於n的2的冪"""
+    return 1 << int(np.ceil(np.log2(max(n, 2))))
+
+
+def sliding_mean_std(series, m):
+    """
+    長度為m的所有滑動窗口的均值和標準差（以累積和計算，O(n)）
+
+    Args:
+        series (ndarray): 序列
+        m (int): 窗口長度
+
+    Returns:
+        tuple: (均值數組, 標準差數組)，長度均為 len(series) - m + 1
+    """
+    cumsum = np.concatenate(([0.0], np.cumsum(series)))
+    cumsum2 = np.concatenate(([0.0], np.cumsum(series * series)))
+    mean = (cumsum[m:] - cumsum[:-m]) / m
+    var = (cumsum2[m:] - cumsum2[:-m]) / m - mean * mean
+    return mean, np.sqrt(np.maximum(var, 0))
+
+
+def _distance(dot, m, query_mean, query_std, mean, std):
+    """由滑動點積計算z標準化歐氏距離；平坦窗口（標準差為0）的距離為inf"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (dot - m * query_mean * mean) / (m * query_std * std)
+    corr = np.where(std > 1e-12 * max(abs(query_mean), 1.0), corr, -np.inf)
+    return np.sqrt(np.maximum(2 * m * (1 - np.minimum(corr, 1.0)), 0))
+
+
+def mass(query, series):
+    """
+    MASS：查詢序列與長序列每個滑動窗口的z標準化歐氏距離
+
+    滑動點積以FFT卷積一次算出，總成本 O(n log n)，與查詢長度無關。
+
+    Args:
+        query (ndarray): 查詢序列，長度m
+        series (ndarray): 被搜索的序列，長度n（n >= m）
+
+    Returns:
+        ndarray: 長度 n - m + 1 的距離剖面
+    """
+    query = np.asarray(query, dtype=np.float64)
+    series = np.asarray(series, dtype=np.float64)
+    m, n = len(query), len(series)
+    n_fft = _fft_size(n + m)
+    dot = np.fft.irfft(np.fft.rfft(series, n_fft) * np.fft.rfft(query[::-1], n_fft), n_fft)[m - 1:n]
+    mean, std = sliding_mean_std(series, m)
+    return _distance(dot, m, query.mean(), query.std(), mean, std)
+
+
+class HistoryStore:
+    """
+    收盤價歷史庫
+
+    每個 (交易對, 時間週期) 一個.npy文件（HISTORY_DTYPE，按時間排序），
+    每次獲取K線後合併寫入，使歷史隨使用不斷加深；讀取時以內存映射打開。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.directory, f'{symbol}_{interval}.npy')
+
+    def load(self, symbol, interval):
+        """
+        讀取歷史
+
+        Returns:
+            ndarray: HISTORY_DTYPE 數組；沒有歷史時為空數組
+        """
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=HISTORY_DTYPE)
+        return np.load(path, mmap_mode='r')
+
+    def append(self, symbol, interval, df):
+        """
+        把K線數據合併進歷史：相同開盤時間以新數據為準（未收盤K線會更新）
+
+        Args:
+            symbol (str): 交易對
+            interval (str): 時間間隔
+            df (pandas.DataFrame): 含close列的K線數據
+
+        Returns:
+            int: 合併後的K線數
+        """
+        new = np.empty(len(df), dtype=HISTORY_DTYPE)
+        new['time'] = _to_ms(df.index)
+        new['close'] = df['close'].to_numpy(dtype=np.float64)
+
+        with self._lock:
+            old = np.asarray(self.load(symbol, interval))
+            if len(old) and len(new):
+                old = old[~np.isin(old['time'], new['time'])]
+            merged = np.concatenate([old, new])
+            merged = merged[np.argsort(merged['time'], kind='stable')]
+            # 先寫臨時文件再替換，避免讀取方看到寫了一半的文件
+            path = self._path(symbol, interval)
+            tmp_path = path + '.tmp.npy'
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, path)
+        return len(merged)
+
+    def symbols(self, interval):
+        """有歷史數據的交易對列表"""
+        suffix = f'_{interval}.npy'
+        return sorted(name[:-len(suffix)] for name in os.listdir(self.directory)
+                      if name.endswith(suffix) and not name.endswith('.tmp.npy'))
+
+
+class PatternIndex:
+    """
+    多交易對形態搜索索引
+
+    把所有交易對的收盤價首尾相接成一條序列，切成互相重疊的定長塊並預先計算每塊的頻譜
+    （overlap-save）。查詢時只需對查詢序列做一次短FFT，再對所有塊批量做逆FFT；
+    短FFT比整條序列的長FFT快數倍，且塊頻譜與查詢長度無關，可供所有查詢共用。
+    跨越兩個交易對邊界的窗口會被排除。
+    """
+
+    def __init__(self, histories):
+        """
+        Args:
+            histories (dict): 交易對 -> HISTORY_DTYPE 數組
+        """
+        histories = {s: h for s, h in histories.items() if len(h)}
+        self.symbols = list(histories)
+        lengths = np.array([len(h) for h in histories.values()], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.closes = np.concatenate([np.asarray(h['close'], dtype=np.float64) for h in histories.values()]) \
+            if histories else np.empty(0)
+        self.times = np.concatenate([np.asarray(h['time'], dtype=np.int64) for h in histories.values()]) \
+            if histories else np.empty(0, dtype=np.int64)
+        # 每個位置所屬的交易對編號
+        self.owner = np.repeat(np.arange(len(lengths)), lengths)
+        # 以對數價格搜索並減去各交易對的均值：z標準化距離不受影響，
+        # 但整條序列的數值範圍變小，FFT卷積的捨入誤差不會淹沒低價窗口
+        log_closes = np.log(np.maximum(self.closes, 1e-12))
+        self.values = log_closes - np.repeat(
+            np.add.reduceat(log_closes, self.offsets[:-1]) / np.maximum(lengths, 1), lengths) \
+            if histories else log_closes
+        self._blocks = None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.closes)
+
+    def _block_spectra(self):
+        """各塊的頻譜：塊起點間隔 BLOCK_SIZE - MAX_QUERY + 1，使任何不超過MAX_QUERY的窗口都完整落在某一塊內"""
+        with self._lock:
+            if self._blocks is None:
+                step = BLOCK_SIZE - MAX_QUERY + 1
+                n_blocks = max(int(np.ceil(len(self.values) / step)), 1)
+                padded = np.zeros((n_blocks - 1) * step + BLOCK_SIZE)
+                padded[:len(self.values)] = self.values
+                blocks = np.lib.stride_tricks.sliding_window_view(padded, BLOCK_SIZE)[::step][:n_blocks]
+                self._blocks = np.fft.rfft(blocks, axis=1)
+            return self._blocks
+
+    def _sliding_dot(self, query):
+        """查詢序列與每個滑動窗口的點積"""
+        m = len(query)
+        n = len(self.values)
+        if m > MAX_QUERY:
+            n_fft = _fft_size(n + m)
+            return np.fft.irfft(np.fft.rfft(self.values, n_fft) * np.fft.rfft(query[::-1], n_fft), n_fft)[m - 1:n]
+        step = BLOCK_SIZE - MAX_QUERY + 1
+        products = np.fft.irfft(self._block_spectra() * np.fft.rfft(query[::-1], BLOCK_SIZE), BLOCK_SIZE, axis=1)
+        # 每塊取起點落在本塊前step個位置的窗口，首尾相接即為全部窗口
+        return products[:, m - 1:m - 1 + step].ravel()[:n - m + 1]
+
+    def _window_scale(self, m, horizon):
+        """
+        與查詢無關、可按 (m, horizon) 快取的部分
+
+        Returns:
+            tuple: (各窗口標準差的倒數, 不可匹配窗口的掩碼)。不可匹配的窗口包括平坦窗口，
+                   以及窗口或其後horizon根K線跨越了交易對邊界的窗口
+        """
+        with self._lock:
+            key = (m, horizon)
+            if key not in self._stats:
+                _, std = sliding_mean_std(self.values, m)
+                starts = np.arange(len(std))
+                last = starts + m - 1 + horizon
+                invalid = (std <= 1e-12) | (last >= len(self.values))
+                invalid[~invalid] = self.owner[starts[~invalid]] != self.owner[last[~invalid]]
+                with np.errstate(divide='ignore'):
+                    inv_std = np.where(invalid, 0.0, 1.0 / std)
+                self._stats[key] = (inv_std, invalid)
+            return self._stats[key]
+
+    @timed('pattern_search')
+    def search(self, query, k=5, horizon=20, exclude=None):
+        """
+        查找與查詢序列最相似的k個歷史窗口
+
+        Args:
+            query (ndarray): 查詢收盤價序列，長度m（與歷史同樣取對數後比較）
+            k (int): 返回的匹配數
+            horizon (int): 匹配窗口之後需要存在的K線數（用於觀察「之後發生了甚麼」）
+            exclude (dict): 交易對 -> 毫秒時間，該交易對中結束時間不早於此時間的窗口不參與匹配（排除查詢自身）
+
+        Returns:
+            list: 按距離排序的 [{'symbol', 'start', 'end', 'distance', 'forward_return', 'closes'}, ...]，
+                  closes 為匹配窗口及其後horizon根K線的收盤價
+        """
+        query = np.log(np.maximum(np.asarray(query, dtype=np.float64), 1e-12))
+        m = len(query)
+        n = len(self.values)
+        if m < 3 or n < m + horizon or query.std() == 0:
+            return []
+        # 查詢已中心化，點積即 m × 協方差；乘以窗口標準差的倒數後與相關係數成正比
+        query = (query - query.mean()) / query.std()
+
+        inv_std, invalid = self._window_scale(m, horizon)
+        score = self._sliding_dot(query)
+        score *= inv_std
+        score[invalid] = -np.inf
+        for symbol, since_ms in (exclude or {}).items():
+            if symbol in self.symbols:
+                owner = self.symbols.index(symbol)
+                lo, hi = self.offsets[owner], self.offsets[owner + 1]
+                # 結束時間不早於since_ms的窗口是該交易對末尾的一段連續位置
+                first_end = lo + int(np.searchsorted(self.times[lo:hi], since_ms))
+                score[max(first_end - m + 1, lo):hi] = -np.inf
+
+        # 逐個取最大相關，並屏蔽其附近半個窗口，避免返回同一段行情的平移副本
+        zone = max(m // 2, 1)
+        matches = []
+        for _ in range(k):
+            i = int(np.argmax(score))
+            if not np.isfinite(score[i]):
+                break
+            corr = min(score[i] / m, 1.0)
+            end = i + m - 1
+            owner = int(self.owner[i])
+            matches.append({
+                'symbol': self.symbols[owner],
+                'start': pd.Timestamp(int(self.times[i]), unit='ms'),
+                'end': pd.Timestamp(int(self.times[end]), unit='ms'),
+                'distance': float(np.sqrt(2 * m * (1 - corr))),
+                'forward_return': float(self.closes[end + horizon] / self.closes[end] - 1),
+                'closes': self.closes[i:end + horizon + 1].copy()
+            })
+            score[max(i - zone, 0):i + zone + 1] = -np.inf
+        return matches
+
+
+class PatternSearch:
+    """歷史相似形態搜索服務：維護歷史庫，按時間週期建立索引，索引在每根K線收盤後重建"""
+
+    def __init__(self, data_fetcher, store, max_workers=16, backfill_limit=1000, cache=None, integrity=None):
+        """
+        Args:
+            data_fetcher: 提供get_kline_data的數據獲取器
+            store (HistoryStore): 歷史庫
+            max_workers (int): 並發獲取數據的線程數
+            backfill_limit (int): 建立索引前為每個交易對補充的K線數
+            integrity (KlineIntegrity): 提供時在建立索引前修復歷史庫中的缺口（如停機超過backfill_limit根K線）
+        """
+        self.data_fetcher = data_fetcher
+        self.store = store
+        self.max_workers = max_workers
+        self.backfill_limit = backfill_limit
+        self.integrity = integrity
+        self.cache = cache if cache is not None else BarCloseCache(max_entries=16, name='patterns')
+
+    def refresh(self, symbols, interval):
+        """並發獲取各交易對最近的K線並合併進歷史庫"""
+        def fetch(symbol):
+            try:
+                df = self.data_fetcher.get_kline_data(symbol, interval, limit=self.backfill_limit)
+            except Exception:
+                return
+            if df is not None and not df.empty:
+                self.store.append(symbol, interval, df)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(fetch, symbols))
+
+    def index(self, symbols, interval):
+        """
+        獲取時間週期的索引，每根K線收盤後重建一次
+
+        Args:
+            symbols (list): 需要補充歷史的交易對（歷史庫中已有的其他交易對同樣會被索引）
+            interval (str): 時間間隔
+
+        Returns:
+            PatternIndex: 索引
+        """
+        def build():
+            self.refresh(symbols, interval)
+            names = sorted(set(self.store.symbols(interval)) | set(symbols))
+            if self.integrity is not None:
+                self.integrity.repair_history(self.store, names, interval)
+            return PatternIndex({s: self.store.load(s, interval) for s in names})
+
+        return self.cache.get_or_compute(('patterns', interval), current_bar_open(interval), build)
+
+    def similar(self, symbol, interval, df, symbols, length=40, k=5, horizon=20):
+        """
+        以df最近length根K線為查詢，搜索全部交易對歷史中最相似的形態
+
+        Args:
+            symbol (str): 查詢的交易對
+            interval (str): 時間間隔
+            df (pandas.DataFrame): 當前K線數據
+            symbols (list): 參與搜索的交易對
+            length (int): 形態長度（K線數）
+            k (int): 返回的匹配數
+            horizon (int): 觀察匹配之後的K線數
+
+        Returns:
+            dict: {'length', 'horizon', 'matches', 'median_return', 'up_ratio'}；匹配不足時matches為空列表
+        """
+        query = df['close'].to_numpy(dtype=np.float64)[-length:]
+        query_start = int(_to_ms(df.index[-length:])[0])
+        matches = self.index(symbols, interval).search(query, k=k, horizon=horizon,
+                                                       exclude={symbol: query_start})
+        returns = np.array([match['forward_return'] for match in matches])
+        return {
+            'length': length,
+            'horizon': horizon,
+            'matches': matches,
+            'median_return': float(np.median(returns)) if len(returns) else None,
+            'up_ratio': float(np.mean(returns > 0)) if len(returns) else None
+        }
+
@@ -0,0 +1,184 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# 設置為 1 時全局開啟採樣，設置為文件路徑時同時指定輸出位置
+PROFILE_ENV = 'FANIC_PROFILE'
+DEFAULT_OUTPUT = 'fanic_profile.collapsed'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """
+    採樣式性能分析器
+
+    背景線程定期讀取已登記線程的調用棧（sys._current_frames），
+    把棧合併為 flamegraph.pl / speedscope 可讀取的 collapsed 格式：
+    每行 "根;...;葉 次數"。未開啟時登記只是一次布爾判斷。
+    """
+
+    def __init__(self, interval=0.005, output_path=None, enabled=None):
+        self.interval = interval
+        env_value = os.environ.get(PROFILE_ENV, '')
+        if enabled is None:
+            enabled = env_value not in ('', '0')
+        self.enabled = enabled
+        if output_path is None:
+            output_path = env_value if env_value not in ('', '0', '1') else DEFAULT_OUTPUT
+        self.output_path = output_path
+
+        self.stacks = Counter()
+        self.samples = 0
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def begin(self, name, force=False, frame=None):
+        """
+        開始採樣當前線程
+
+        Args:
+            name (str): 棧根部的標籤，如 'main' 或 'analyze_smc'
+            force (bool): 未全局開啟時也採樣（按請求開啟）
+            frame: 入口幀，預設為調用者；此幀以上的棧不計入
+
+        Returns:
+            bool: 是否由本次調用登記（需要傳給end）
+        """
+        if not (self.enabled or force):
+            return False
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id in self._targets:
+                # 已在外層採樣範圍內，嵌套調用不重複登記
+                return False
+            self._targets[thread_id] = (name, frame or sys._getframe(1))
+        self._ensure_thread()
+        self._wakeup.set()
+        return True
+
+    def end(self, registered):
+        """結束採樣當前線程，並把累計結果寫入輸出文件"""
+        if not registered:
+            return
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+        if self.output_path:
+            self.write_collapsed(self.output_path)
+
+    def profile(self, name, force=False):
+        """以區塊方式採樣當前線程"""
+        return _ProfileBlock(self, name, force)
+
+    def profiled(self, name):
+        """採樣裝飾器：外層未在採樣時，以函數名為棧根單獨採樣"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                registered = self.begin(name, frame=sys._getframe())
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.end(registered)
+            return wrapper
+        return decorator
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='fanic-profiler', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                targets = dict(self._targets)
+            if not targets:
+                # 沒有登記的線程時休眠，直到begin()喚醒
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            self._sample(targets)
+            time.sleep(self.interval)
+
+    def _sample(self, targets):
+        frames = sys._current_frames()
+        collected = []
+        for thread_id, (name, entry) in targets.items():
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None and frame is not entry:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(name)
+            collected.append(';'.join(reversed(stack)))
+        with self._lock:
+            self.stacks.update(collected)
+            self.samples += len(collected)
+
+    def collapsed_text(self):
+        """導出collapsed格式文本"""
+        with self._lock:
+            items = sorted(self.stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def write_collapsed(self, path):
+        """原子寫入collapsed格式文件（跨多次運行累計）"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed_text())
+        os.replace(tmp_path, path)
+
+    def top_functions(self, n=10):
+        """
+        按自身耗時（棧頂出現次數）排序的熱點函數
+
+        Returns:
+            list: [(函數, 採樣次數, 佔比), ...]
+        """
+        with self._lock:
+            stacks = dict(self.stacks)
+            total = self.samples
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [(func, count, count / total) for func, count in leaves.most_common(n)]
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+
+class _ProfileBlock:
+    def __init__(self, profiler, name, force):
+        self.profiler = profiler
+        self.name = name
+        self.force = force
+        self.registered = False
+
+    def __enter__(self):
+        # 入口幀取with語句所在的幀
+        self.registered = self.profiler.begin(self.name, self.force, frame=sys._getframe(1))
+        return self.profiler
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.end(self.registered)
+        return False
+
+
+# 全局採樣器
+PROFILER = SamplingProfiler()
+profiled = PROFILER.profiled
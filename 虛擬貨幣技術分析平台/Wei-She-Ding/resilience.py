@@ -0,0 +1,270 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from metrics import METRICS
+
+# 熔斷器狀態
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 視為暫時性故障、值得重試的HTTP狀態碼
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# 表示地區限制的HTTP狀態碼（Binance對受限地區返回451，部分CDN節點返回403）
+RESTRICTED_STATUS = {403, 451}
+
+
+class CircuitOpenError(Exception):
+    """熔斷器處於開啟狀態，請求未發出"""
+
+
+class UpstreamClientError(Exception):
+    """上游以不可重試的4xx拒絕了請求本身（如無效的交易對），上游服務正常"""
+
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class GeoRestrictedError(UpstreamClientError):
+    """上游因地區限制拒絕請求（HTTP 451/403）"""
+
+
+class CircuitBreaker:
+    """
+    熔斷器
+
+    連續失敗達到閾值後開啟；開啟reset_timeout秒後進入半開狀態，
+    只放行一個探測請求，成功則關閉，失敗則重新開啟。
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        self._state = state
+        METRICS.inc('circuit_transitions_total', help_text='熔斷器狀態切換次數', endpoint=self.name, state=state)
+
+    def allow(self):
+        """
+        判斷是否放行請求
+
+        Returns:
+            bool: 關閉狀態放行；半開狀態只放行一個探測請求
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self._state != OPEN:
+                    self._transition(OPEN)
+
+
+class SingleFlight:
+    """
+    合併並發的相同請求：同一鍵同時只執行一次，其餘調用者等待並共用其結果（或異常）
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        """
+        執行或加入同一鍵正在進行的計算
+
+        Args:
+            key: 請求鍵，如 ('klines', symbol, interval, limit)
+            compute (callable): 無參數的計算函數
+
+        Returns:
+            compute() 的結果
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            METRICS.inc('coalesced_requests_total', help_text='合併到進行中請求的次數', flight=self.name)
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class ResilientClient:
+    """帶重試、抖動退避、逐端點熔斷和延遲統計的HTTP JSON客戶端"""
+
+    def __init__(self, timeout=10, attempts=3, base_delay=0.2, max_delay=2.0,
+                 failure_threshold=5, reset_timeout=30.0, latency_samples=1000):
+        self.timeout = timeout
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_samples = latency_samples
+        self.breakers = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+                self.latencies[endpoint] = deque(maxlen=self.latency_samples)
+            return self.breakers[endpoint]
+
+    def backoff(self, attempt):
+        """第attempt次重試前的等待秒數（full jitter指數退避）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def get_json(self, endpoint, url, params=None):
+        """
+        發出GET請求並解析JSON
+
+        連線錯誤、逾時及429/5xx會以抖動退避重試，全部失敗才計為一次熔斷失敗；
+        其他4xx不重試也不計為熔斷失敗，以異常返回給調用方。
+
+        Args:
+            endpoint (str): 端點名，熔斷與延遲按端點分別統計
+            url (str): 請求地址
+            params (dict): 查詢參數
+
+        Returns:
+            解析後的JSON
+
+        Raises:
+            CircuitOpenError: 熔斷器開啟，請求未發出
+            GeoRestrictedError: 上游因地區限制拒絕請求
+            UpstreamClientError: 上游以其他4xx拒絕請求
+            requests.exceptions.RequestException: 重試後仍失敗
+        """
+        return self._request(endpoint, url, params, lambda response: response.json())
+
+    def get_bytes(self, endpoint, url, params=None):
+        """
+        與get_json相同，但返回原始響應內容，由調用方自行解碼
+
+        Returns:
+            bytes: 響應內容
+        """
+        return self._request(endpoint, url, params, lambda response: response.content)
+
+    def _request(self, endpoint, url, params, read):
+        import requests
+
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{endpoint} 熔斷中")
+
+        for attempt in range(self.attempts):
+            if attempt:
+                METRICS.inc('fetch_retries_total', help_text='API請求重試次數', endpoint=endpoint)
+                time.sleep(self.backoff(attempt - 1))
+            start = time.perf_counter()
+            try:
+                response = requests.get(url, params=params, timeout=self.timeout)
+                status = response.status_code
+                if status in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                if 400 <= status < 500:
+                    error = GeoRestrictedError if status in RESTRICTED_STATUS else UpstreamClientError
+                    raise error(status, response.text[:200])
+                data = read(response)
+            except (requests.exceptions.RequestException, ValueError):
+                if attempt == self.attempts - 1:
+                    breaker.record_failure()
+                    raise
+                continue
+            except UpstreamClientError:
+                # 上游正常響應了，只是拒絕這個請求
+                breaker.record_success()
+                raise
+            except BaseException:
+                # 其他意外異常同樣要結束半開狀態的探測，否則熔斷器會一直拒絕後續請求
+                breaker.record_failure()
+                raise
+            finally:
+                self.latencies[endpoint].append(time.perf_counter() - start)
+            breaker.record_success()
+            return data
+
+    def latency_stats(self, endpoint):
+        """
+        端點請求延遲統計
+
+        Returns:
+            dict: 樣本數及p50/p95/p99延遲（毫秒）
+        """
+        samples = np.array(self.latencies.get(endpoint, ()))
+        if len(samples) == 0:
+            return {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        return {'count': len(samples), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+    def status(self):
+        """
+        各端點的熔斷狀態和延遲
+
+        Returns:
+            dict: 端點 -> {'state', 'failures', 'count', 'p50_ms', 'p95_ms', 'p99_ms'}
+        """
+        with self._lock:
+            breakers = dict(self.breakers)
+        return {
+            endpoint: {'state': breaker.state, 'failures': breaker.failures, **self.latency_stats(endpoint)}
+            for endpoint, breaker in breakers.items()
+        }
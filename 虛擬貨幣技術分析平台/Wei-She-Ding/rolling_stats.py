@@ -0,0 +1,173 @@
+import bisect
+import math
+from collections import deque
+
+NAN = float('nan')
+
+
+class RollingSum:
+    """滾動和：每次更新O(1)"""
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0.0
+
+    def push(self, value):
+        if len(self.values) >= self.window:
+            self.total -= self.values.popleft()
+        self.values.append(value)
+        self.total += value
+
+    def replace_last(self, value):
+        self.total += value - self.values[-1]
+        self.values[-1] = value
+
+    @property
+    def full(self):
+        return len(self.values) >= self.window
+
+    def mean(self):
+        return self.total / self.window if self.full else NAN
+
+
+class Ema:
+    """指數移動平均（adjust=True，與pandas的ewm(span).mean()一致）"""
+
+    def __init__(self, span):
+        self.decay = 1 - 2 / (span + 1)
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self._previous = (0.0, 0.0)
+
+    def push(self, value):
+        self._previous = (self.numerator, self.denominator)
+        self.numerator = value + self.decay * self.numerator
+        self.denominator = 1 + self.decay * self.denominator
+
+    def replace_last(self, value):
+        self.numerator, self.denominator = self._previous
+        self.push(value)
+
+    def value(self):
+        return self.numerator / self.denominator if self.denominator else NAN
+
+
+class RecursiveMean:
+    """
+    遞歸平均 y = (1-alpha)·y + alpha·x（與pandas的ewm(alpha, adjust=False)一致）
+
+    開頭的NaN輸入會被跳過；未提供initial時以第一個有效值作為起點，
+    有效值個數未達min_periods時輸出NaN。
+    """
+
+    def __init__(self, alpha, initial=None, min_periods=1):
+        self.alpha = alpha
+        self.initial = initial
+        self.min_periods = min_periods
+        self.current = initial
+        self.count = 0
+        self._previous = (initial, 0)
+
+    def push(self, value):
+        self._previous = (self.current, self.count)
+        if math.isnan(value):
+            return
+        if self.current is None:
+            self.current = value
+        else:
+            self.current += self.alpha * (value - self.current)
+        self.count += 1
+
+    def replace_last(self, value):
+        self.current, self.count = self._previous
+        self.push(value)
+
+    def value(self):
+        return self.current if self.count >= self.min_periods and self.current is not None else NAN
+
+
+class SortedWindow:
+    """
+    滑動窗口順序統計
+
+    以到達順序的隊列和一個保持有序的列表維護最近window個值：
+    新值以二分查找插入、過期值以二分查找刪除，查詢中位數、分位數和百分位排名均為 O(log w)。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.sorted = []
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def full(self):
+        return len(self.values) >= self.window
+
+    def push(self, value):
+        """
+        加入新值，窗口已滿時移除最舊的值
+
+        Returns:
+            float: 被移除的值；窗口未滿時為None
+        """
+        removed = None
+        if len(self.values) >= self.window:
+            removed = self.values.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, removed)]
+        self.values.append(value)
+        bisect.insort(self.sorted, value)
+        return removed
+
+    def replace_last(self, value):
+        """以新值替換最近加入的值（未收盤K線價格更新）"""
+        old = self.values.pop()
+        del self.sorted[bisect.bisect_left(self.sorted, old)]
+        self.values.append(value)
+        bisect.insort(self.sorted, value)
+
+    def quantile(self, q):
+        """
+        分位數（線性插值，與pandas的rolling().quantile()口徑一致）
+
+        Args:
+            q (float): 0~1之間的分位
+
+        Returns:
+            float: 分位數；窗口為空時為NaN
+        """
+        n = len(self.sorted)
+        if n == 0:
+            return NAN
+        pos = q * (n - 1)
+        lo = int(pos)
+        hi = min(lo + 1, n - 1)
+        return self.sorted[lo] + (self.sorted[hi] - self.sorted[lo]) * (pos - lo)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def min(self):
+        return self.sorted[0] if self.sorted else NAN
+
+    def max(self):
+        return self.sorted[-1] if self.sorted else NAN
+
+    def percentile_rank(self, value):
+        """
+        值在窗口中的百分位排名（相同值取平均排名，與pandas的rank(pct=True)一致）
+
+        Returns:
+            float: (0, 1] 之間的排名
+        """
+        n = len(self.sorted)
+        if n == 0:
+            return NAN
+        less = bisect.bisect_left(self.sorted, value)
+        equal = bisect.bisect_right(self.sorted, value) - less
+        if equal == 0:
+            return less / n
+        return (less + (equal + 1) / 2) / n
@@ -39,6 +39,15 @@ class CryptoAnalysisPlatform {
         this.currentData = null;
         this.currentIndicators = {};
         this.refreshInterval = null;
+        // 本地分析服務的推送連接（Server-Sent Events），連接期間不再定時重新獲取
+        this.eventSource = null;
+        this.streamLimit = 500;
+        // 增量原位修改指標數組，以版本號通知Plotly.react重新讀取數據
+        this.dataRevision = 0;
+        
+        // 本地分析服務地址（由analysis_api.py提供頁面時使用同源地址）
+        this.apiBase = window.ANALYSIS_API_BASE ||
+            (window.location.protocol.startsWith('http') ? window.location.origin : null);
         
         this.init();
     }
@@ -54,9 +63,9 @@ class CryptoAnalysisPlatform {
         document.getElementById('symbolSelect').addEventListener('change', () => this.updateData());
         document.getElementById('timeframeSelect').addEventListener('change', () => this.updateData());
         
-        // 指標切換事件
+        // 指標切換事件：推送模式下指標由服務端計算，需以新的指標配置重新訂閱
         document.querySelectorAll('input[type="checkbox"]').forEach(checkbox => {
-            checkbox.addEventListener('change', () => this.updateChart());
+            checkbox.addEventListener('change', () => this.eventSource ? this.updateData() : this.updateChart());
         });
         
         // 滑桿變更事件
@@ -68,6 +77,9 @@ class CryptoAnalysisPlatform {
                 }
                 this.updateChart();
             });
+            slider.addEventListener('change', () => {
+                if (this.eventSource) this.updateData();
+            });
         });
     }
     
@@ -145,6 +157,170 @@ class CryptoAnalysisPlatform {
         }
     }
     
+    serverParams(symbol, timeframe, limit) {
+        const params = new URLSearchParams({ symbol, interval: timeframe, limit, format: 'bin' });
+        if (document.getElementById('smaCheck').checked) {
+            params.set('sma', document.getElementById('smaPeriod').value);
+        }
+        if (document.getElementById('emaCheck').checked) {
+            params.set('ema', document.getElementById('emaPeriod').value);
+        }
+        if (document.getElementById('rsiCheck').checked) {
+            params.set('rsi', document.getElementById('rsiPeriod').value);
+        }
+        if (document.getElementById('macdCheck').checked) {
+            params.set('macd', '1');
+        }
+        if (document.getElementById('bbCheck').checked) {
+            params.set('bb', document.getElementById('bbPeriod').value);
+        }
+        return params;
+    }
+    
+    async fetchServerAnalysis(symbol, timeframe, limit = 500) {
+        if (!this.apiBase) {
+            throw new Error('未配置本地分析服務');
+        }
+        
+        const params = this.serverParams(symbol, timeframe, limit);
+        const response = await fetch(`${this.apiBase}/api/indicators?${params}`);
+        if (!response.ok) {
+            throw new Error(`分析服務請求失敗: ${response.status}`);
+        }
+        
+        const { tables } = decodeColumnar(await response.arrayBuffer());
+        return this.columnsToAnalysis(tables.klines);
+    }
+    
+    // 把列式K線表轉為圖表使用的K線列表和指標序列
+    columnsToAnalysis(columns) {
+        const toList = (values) => values ? Array.from(values, v => Number.isNaN(v) ? null : v) : null;
+        
+        const data = Array.from(columns.time, (time, i) => ({
+            timestamp: new Date(Number(time)),
+            open: columns.open[i],
+            high: columns.high[i],
+            low: columns.low[i],
+            close: columns.close[i],
+            volume: columns.volume[i]
+        }));
+        
+        const indicators = {};
+        const smaColumn = Object.keys(columns).find(name => name.startsWith('sma_'));
+        const emaColumn = Object.keys(columns).find(name => name.startsWith('ema_'));
+        if (smaColumn) indicators.sma = toList(columns[smaColumn]);
+        if (emaColumn) indicators.ema = toList(columns[emaColumn]);
+        if (columns.rsi) indicators.rsi = toList(columns.rsi);
+        if (columns.macd) {
+            indicators.macd = {
+                line: toList(columns.macd),
+                signal: toList(columns.macd_signal),
+                histogram: toList(columns.macd_hist)
+            };
+        }
+        if (columns.bb_upper) {
+            indicators.bb = {
+                upper: toList(columns.bb_upper),
+                middle: toList(columns.bb_middle),
+                lower: toList(columns.bb_lower)
+            };
+        }
+        
+        return { data, indicators };
+    }
+    
+    // 訂閱本地分析服務的推送：第一個事件為完整快照，之後只有新增或改變的K線及其指標值。
+    // 收到快照後返回；在此之前連接失敗則拋出錯誤，由調用方改用其他數據來源
+    startStream(symbol, timeframe, limit = 500) {
+        this.stopStream();
+        if (!this.apiBase || !window.EventSource) {
+            return Promise.reject(new Error('未配置本地分析服務'));
+        }
+        
+        const params = this.serverParams(symbol, timeframe, limit);
+        params.delete('format');
+        const source = new EventSource(`${this.apiBase}/api/stream?${params}`);
+        this.eventSource = source;
+        this.streamLimit = limit;
+        
+        return new Promise((resolve, reject) => {
+            let ready = false;
+            // 斷線重連時服務端會重新發送快照，整體替換本地數據
+            source.addEventListener('snapshot', (event) => {
+                const analysis = this.columnsToAnalysis(decodeColumnar(base64ToBuffer(event.data)).tables.klines);
+                this.currentData = analysis.data;
+                this.currentIndicators = analysis.indicators;
+                if (ready) {
+                    this.refreshViews();
+                } else {
+                    ready = true;
+                    resolve();
+                }
+            });
+            source.addEventListener('delta', (event) => {
+                if (!ready) return;
+                this.applyStreamDelta(decodeColumnar(base64ToBuffer(event.data)).tables.klines);
+                this.refreshViews();
+            });
+            source.onerror = () => {
+                if (!ready) {
+                    this.stopStream();
+                    reject(new Error('無法連接本地分析服務的推送'));
+                }
+            };
+        });
+    }
+    
+    stopStream() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    // 按開盤時間合併增量：已有的K線原位替換，新的K線追加，並只保留最近streamLimit根
+    applyStreamDelta(columns) {
+        const delta = this.columnsToAnalysis(columns);
+        const data = this.currentData;
+        const seriesPairs = [];
+        const collect = (target, source) => {
+            if (!target || !source) return;
+            if (Array.isArray(target)) {
+                seriesPairs.push([target, source]);
+            } else {
+                Object.keys(target).forEach(key => collect(target[key], source[key]));
+            }
+        };
+        collect(this.currentIndicators, delta.indicators);
+        
+        delta.data.forEach((bar, j) => {
+            const time = bar.timestamp.getTime();
+            let i = data.length - 1;
+            while (i >= 0 && data[i].timestamp.getTime() > time) i--;
+            if (i >= 0 && data[i].timestamp.getTime() === time) {
+                data[i] = bar;
+                seriesPairs.forEach(([target, source]) => { target[i] = source[j]; });
+            } else {
+                data.splice(i + 1, 0, bar);
+                seriesPairs.forEach(([target, source]) => target.splice(i + 1, 0, source[j]));
+            }
+        });
+        
+        const excess = data.length - this.streamLimit;
+        if (excess > 0) {
+            data.splice(0, excess);
+            seriesPairs.forEach(([target]) => target.splice(0, excess));
+        }
+        this.dataRevision++;
+    }
+    
+    refreshViews() {
+        this.updateChart();
+        this.updateMarketInfo();
+        this.updateIndicatorValues();
+        this.updateTradingSignals();
+    }
+    
     calculateIndicators(data) {
         const indicators = {};
         
@@ -357,24 +533,41 @@ class CryptoAnalysisPlatform {
             `${this.cryptoNames[symbol]} - ${this.timeframes[timeframe]}`;
         
         try {
-            // 嘗試從幣安API獲取真實數據
-            this.currentData = await this.fetchBinanceData(symbol, timeframe);
-            document.querySelector('.data-source-info').textContent = 
-                '📊 數據來源：幣安官方API';
-        } catch (error) {
-            console.warn('幣安API獲取失敗，使用模擬數據:', error);
-            // 備用方案：使用模擬數據
-            this.currentData = this.generateMockData(symbol, timeframe);
+            // 優先訂閱本地分析服務的推送：K線與指標均由服務端計算，之後只接收增量
+            await this.startStream(symbol, timeframe);
             document.querySelector('.data-source-info').textContent = 
-                '💡 目前使用模擬數據進行展示，具有真實市場波動特性';
+                '📊 數據來源：本地分析服務（即時推送）';
+        } catch (streamError) {
+            await this.loadPolledData(symbol, timeframe);
         }
         
-        this.currentIndicators = this.calculateIndicators(this.currentData);
-        
-        this.updateChart();
-        this.updateMarketInfo();
-        this.updateIndicatorValues();
-        this.updateTradingSignals();
+        this.refreshViews();
+    }
+    
+    // 無法使用推送時一次性獲取全部K線（由定時刷新重複調用）
+    async loadPolledData(symbol, timeframe) {
+        try {
+            const analysis = await this.fetchServerAnalysis(symbol, timeframe);
+            this.currentData = analysis.data;
+            this.currentIndicators = analysis.indicators;
+            document.querySelector('.data-source-info').textContent = 
+                '📊 數據來源：本地分析服務';
+        } catch (serverError) {
+            try {
+                // 嘗試從幣安API獲取真實數據
+                this.currentData = await this.fetchBinanceData(symbol, timeframe);
+                document.querySelector('.data-source-info').textContent = 
+                    '📊 數據來源：幣安官方API';
+            } catch (error) {
+                console.warn('幣安API獲取失敗，使用模擬數據:', error);
+                // 備用方案：使用模擬數據
+                this.currentData = this.generateMockData(symbol, timeframe);
+                document.querySelector('.data-source-info').textContent = 
+                    '💡 目前使用模擬數據進行展示，具有真實市場波動特性';
+            }
+            
+            this.currentIndicators = this.calculateIndicators(this.currentData);
+        }
     }
     
     updateChart() {
@@ -473,6 +666,9 @@ class CryptoAnalysisPlatform {
                 x: 0
             },
             margin: { t: 80, b: 50, l: 60, r: 60 },
+            datarevision: this.dataRevision,
+            // 同一交易對和週期的增量更新保留使用者的縮放和平移
+            uirevision: document.getElementById('currentPair').textContent,
             annotations: [
                 {
                     x: 1,
@@ -494,8 +690,8 @@ class CryptoAnalysisPlatform {
             ]
         };
         
-        // 創建圖表
-        Plotly.newPlot('chartContainer', traces, layout, {
+        // 創建或更新圖表：推送增量到達時Plotly.react只更新變化的部分，不重建整個圖表
+        Plotly.react('chartContainer', traces, layout, {
             responsive: true,
             displayModeBar: false
         });
@@ -639,7 +835,10 @@ class CryptoAnalysisPlatform {
     startAutoRefresh() {
         // 每10分鐘自動刷新
         this.refreshInterval = setInterval(() => {
-            this.updateData();
+            // 推送連接期間數據由服務端增量更新
+            if (!this.eventSource) {
+                this.updateData();
+            }
         }, 600000); // 600秒 = 10分鐘
     }
     
@@ -650,6 +849,48 @@ class CryptoAnalysisPlatform {
     }
 }
 
+// 解碼分析服務的二進制列式格式（見columnar_codec.py）：
+// b'FCOL' | uint32頭部長度 | JSON頭部 | 8字節對齊的各列數組
+function decodeColumnar(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'FCOL') {
+        throw new Error('不是有效的列式數據');
+    }
+    
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const base = 8 + headerLength + ((8 - (8 + headerLength) % 8) % 8);
+    const arrayTypes = {
+        float64: Float64Array,
+        float32: Float32Array,
+        int64: BigInt64Array,
+        int32: Int32Array,
+        uint8: Uint8Array
+    };
+    
+    const tables = {};
+    for (const [name, spec] of Object.entries(header.tables)) {
+        tables[name] = {};
+        for (const column of spec.columns) {
+            const ArrayType = arrayTypes[column.dtype];
+            tables[name][column.name] = new ArrayType(buffer, base + column.offset, spec.rows);
+        }
+    }
+    
+    return { meta: header.meta, tables };
+}
+
+// SSE事件的data為base64文本，解碼為8字節對齊的新緩衝區供decodeColumnar建立類型化數組視圖
+function base64ToBuffer(text) {
+    const binary = atob(text);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes.buffer;
+}
+
 // 初始化應用程式
 document.addEventListener('DOMContentLoaded', () => {
     new CryptoAnalysisPlatform();
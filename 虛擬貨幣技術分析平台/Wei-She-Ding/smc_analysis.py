@@ -1,5 +1,10 @@
 import pandas as pd
 import numpy as np
+from smc_types import SMCResult
+from columnar_codec import time_to_ms
+from candle_patterns import detect_patterns, BULLISH_MASK, BEARISH_MASK
+from metrics import timed
+from profiling import profiled
 
 class SMCAnalysis:
     """Smart Money Concepts (SMC) 技術分析"""
@@ -158,7 +163,7 @@ class SMCAnalysis:
         
         return order_blocks
     
-    def identify_liquidity_zones(self, df, swing_highs, swing_lows):
+    def identify_liquidity_zones(self, df, swing_highs, swing_lows, depth_levels=None, equal_levels=None):
         """
         識別流動性區域
         
@@ -166,6 +171,8 @@ class SMCAnalysis:
             df: OHLCV數據
             swing_highs: 擺動高點列表
             swing_lows: 擺動低點列表
+            depth_levels (dict): 訂單簿中的掛單牆（DepthStore.resting_liquidity的輸出），可選
+            equal_levels (dict): 等高點/等低點流動性池（identify_equal_levels的輸出），可選
             
         Returns:
             dict: 流動性區域信息
@@ -193,9 +200,159 @@ class SMCAnalysis:
                 'description': '賣方流動性區域'
             })
         
+        # 訂單簿中實際存在的掛單牆：上方賣單牆、下方買單牆
+        if depth_levels:
+            for price, _ in depth_levels['asks']:
+                liquidity_zones['buy_side_liquidity'].append({
+                    'price': price,
+                    'time': depth_levels['time'],
+                    'type': 'ask_wall',
+                    'description': '賣單牆流動性區域'
+                })
+            for price, _ in depth_levels['bids']:
+                liquidity_zones['sell_side_liquidity'].append({
+                    'price': price,
+                    'time': depth_levels['time'],
+                    'type': 'bid_wall',
+                    'description': '買單牆流動性區域'
+                })
+        
+        # 等高點上方聚集買方流動性，等低點下方聚集賣方流動性
+        if equal_levels:
+            liquidity_zones['buy_side_liquidity'].extend(equal_levels['equal_highs'])
+            liquidity_zones['sell_side_liquidity'].extend(equal_levels['equal_lows'])
+        
         return liquidity_zones
     
-    def generate_trading_signals(self, df, bos_signals, order_blocks, liquidity_zones):
+    def identify_fair_value_gaps(self, df, min_gap_ratio=0.0):
+        """
+        識別公允價值缺口 (FVG - Fair Value Gap) 並追蹤其回補情況
+        
+        三根K線中，第三根的低點高於第一根的高點為看漲缺口，第三根的高點低於第一根的低點為看跌缺口。
+        回補以缺口形成後的前向極值判斷：看漲缺口在之後的最低價跌入缺口時視為已回補，看跌缺口反之。
+        缺口和回補深度以數組運算求出，首次觸及位置以單調棧一次掃描求出，整體為 O(n)。
+        
+        Args:
+            df: OHLCV數據
+            min_gap_ratio (float): 缺口高度相對價格的最小比例，用於過濾過小的缺口
+            
+        Returns:
+            list: 公允價值缺口列表，時間為中間K線的時間
+        """
+        high = df['high'].to_numpy(dtype=float)
+        low = df['low'].to_numpy(dtype=float)
+        n = len(high)
+        if n < 3:
+            return []
+        
+        # i 為第三根K線的位置
+        third = np.arange(2, n)
+        bullish = low[2:] > high[:-2] * (1 + min_gap_ratio)
+        bearish = high[2:] < low[:-2] * (1 - min_gap_ratio)
+        
+        # 之後（不含第三根）的最低價和最高價：反向累積極值
+        later_low = np.r_[np.minimum.accumulate(low[::-1])[::-1][1:], np.inf]
+        later_high = np.r_[np.maximum.accumulate(high[::-1])[::-1][1:], -np.inf]
+        
+        gaps = []
+        for code, mask in (('bullish_fvg', bullish), ('bearish_fvg', bearish)):
+            pos = third[mask]
+            if code == 'bullish_fvg':
+                top, bottom = low[pos], high[pos - 2]
+                # 從頂部往下被回補的深度
+                depth = top - later_low[pos]
+                touched = self._next_touch(low, below=True)[pos]
+            else:
+                top, bottom = low[pos - 2], high[pos]
+                depth = later_high[pos] - bottom
+                touched = self._next_touch(high, below=False)[pos]
+            fill = np.clip(depth / (top - bottom), 0, 1)
+            for p, t, b, f, j in zip(pos, top, bottom, fill, touched):
+                gaps.append({
+                    'type': code,
+                    'time': df.index[p - 1],
+                    'top': float(t),
+                    'bottom': float(b),
+                    'mitigated_time': df.index[j] if j < n else None,
+                    'fill': float(f),
+                    'description': '看漲公允價值缺口' if code == 'bullish_fvg' else '看跌公允價值缺口'
+                })
+        
+        gaps.sort(key=lambda gap: gap['time'])
+        return gaps
+    
+    @staticmethod
+    def _next_touch(values, below=True):
+        """
+        對每個位置 i，找出之後第一個不高於（below=True）或不低於 values[i] 的位置
+
+        看漲缺口的頂部即第三根K線的最低價，價格首次回到缺口內就是其後第一根最低價不高於它的K線；
+        看跌缺口對稱地使用最高價。以單調棧一次掃描求出全部位置，每個位置最多入棧出棧各一次，O(n)。
+
+        Returns:
+            ndarray: 位置數組；不存在時為len(values)
+        """
+        items = values.tolist()
+        n = len(items)
+        result = [n] * n
+        stack = []
+        for j, value in enumerate(items):
+            # 棧中為尚未找到觸及位置的下標；below時其值嚴格遞增，遇到不高於棧頂的值即逐個彈出
+            if below:
+                while stack and items[stack[-1]] >= value:
+                    result[stack.pop()] = j
+            else:
+                while stack and items[stack[-1]] <= value:
+                    result[stack.pop()] = j
+            stack.append(j)
+        return np.array(result, dtype=np.int64)
+    
+    def identify_equal_levels(self, swing_highs, swing_lows, tolerance=0.001, min_touches=2):
+        """
+        識別等高點和等低點流動性池
+        
+        把擺動點價格排序後一次掃描：相鄰價格相差不超過tolerance比例的歸為同一簇，
+        成本為排序的 O(n log n)，不需要兩兩比較。
+        
+        Args:
+            swing_highs: 擺動高點列表
+            swing_lows: 擺動低點列表
+            tolerance (float): 視為相等的最大價格差比例
+            min_touches (int): 成為流動性池所需的最少擺動點數
+            
+        Returns:
+            dict: {'equal_highs': [...], 'equal_lows': [...]}，每項為流動性區域，價格為簇內平均價、
+                  時間為最近一次觸及的擺動點時間（與擺動點相同的表示：Timestamp或精簡模式的毫秒整數）
+        """
+        def clusters(points, code, description):
+            if len(points) < min_touches:
+                return []
+            times = np.array([time_to_ms(p[0]) for p in points], dtype=np.int64)
+            prices = np.array([p[1] for p in points], dtype=float)
+            order = np.argsort(prices, kind='stable')
+            times, prices = times[order], prices[order]
+            # 與前一個價格的差距超過容差處即為新簇的開始
+            breaks = np.r_[True, np.diff(prices) > tolerance * prices[:-1]]
+            labels = np.cumsum(breaks) - 1
+            counts = np.bincount(labels)
+            means = np.bincount(labels, weights=prices) / counts
+            # 按 (簇, 時間) 排序後每簇最後一個即最近一次觸及，取回原擺動點的時間
+            by_time = np.lexsort((times, labels))
+            ends = np.r_[np.flatnonzero(np.diff(labels[by_time])), len(by_time) - 1]
+            latest = order[by_time[ends]]
+            return [{
+                'price': float(means[c]),
+                'time': points[latest[c]][0],
+                'type': code,
+                'description': description
+            } for c in np.flatnonzero(counts >= min_touches)]
+        
+        return {
+            'equal_highs': clusters(swing_highs, 'equal_highs', '等高點流動性池'),
+            'equal_lows': clusters(swing_lows, 'equal_lows', '等低點流動性池')
+        }
+    
+    def generate_trading_signals(self, df, bos_signals, order_blocks, liquidity_zones, candle_patterns=None):
         """
         基於SMC概念生成交易信號
         
@@ -204,6 +361,7 @@ class SMCAnalysis:
             bos_signals: 結構突破信號
             order_blocks: 訂單區塊
             liquidity_zones: 流動性區域
+            candle_patterns (ndarray): 每根K線的形態位元（candle_patterns.detect_patterns的輸出），可選
             
         Returns:
             dict: 交易信號和建議
@@ -251,6 +409,26 @@ class SMCAnalysis:
                         'stop_loss': ob['high'] * 1.01
                     })
         
+        # 最新K線的反轉/延續形態
+        if candle_patterns is not None and len(candle_patterns):
+            latest = int(candle_patterns[-1])
+            if latest & BULLISH_MASK:
+                signals['buy_signals'].append({
+                    'type': 'candle_pattern',
+                    'price': current_price,
+                    'reason': '最新K線出現看漲形態，尋找買入機會',
+                    'target': None,
+                    'stop_loss': df['low'].iloc[-1] * 0.99
+                })
+            if latest & BEARISH_MASK:
+                signals['sell_signals'].append({
+                    'type': 'candle_pattern',
+                    'price': current_price,
+                    'reason': '最新K線出現看跌形態，尋找賣出機會',
+                    'target': None,
+                    'stop_loss': df['high'].iloc[-1] * 1.01
+                })
+        
         # 關鍵價格水平
         for zone_type, zones in liquidity_zones.items():
             for zone in zones:
@@ -262,12 +440,15 @@ class SMCAnalysis:
         
         return signals
     
-    def analyze_smc(self, df):
+    @timed('analyze_smc')
+    @profiled('analyze_smc')
+    def analyze_smc(self, df, depth_levels=None):
         """
         完整的SMC分析
         
         Args:
             df: OHLCV數據
+            depth_levels (dict): 訂單簿掛單牆，提供時併入流動性區域
             
         Returns:
             dict: 完整的SMC分析結果
@@ -281,11 +462,23 @@ class SMCAnalysis:
         # 識別訂單區塊
         order_blocks = self.identify_order_blocks(df, swing_highs, swing_lows)
         
-        # 識別流動性區域
-        liquidity_zones = self.identify_liquidity_zones(df, swing_highs, swing_lows)
+        # 識別公允價值缺口
+        fair_value_gaps = self.identify_fair_value_gaps(df)
+        
+        # 識別流動性區域（含等高點/等低點流動性池）
+        equal_levels = self.identify_equal_levels(swing_highs, swing_lows)
+        liquidity_zones = self.identify_liquidity_zones(df, swing_highs, swing_lows, depth_levels, equal_levels)
+        
+        # K線形態：已由calculate_indicators計算時直接使用
+        if 'candle_patterns' in df.columns:
+            candle_patterns = df['candle_patterns'].to_numpy()
+        else:
+            candle_patterns = detect_patterns(df['open'].to_numpy(), df['high'].to_numpy(),
+                                              df['low'].to_numpy(), df['close'].to_numpy())
         
         # 生成交易信號
-        trading_signals = self.generate_trading_signals(df, bos_signals, order_blocks, liquidity_zones)
+        trading_signals = self.generate_trading_signals(df, bos_signals, order_blocks, liquidity_zones,
+                                                        candle_patterns)
         
         return {
             'swing_highs': swing_highs,
@@ -293,5 +486,19 @@ class SMCAnalysis:
             'bos_signals': bos_signals,
             'order_blocks': order_blocks,
             'liquidity_zones': liquidity_zones,
+            'fair_value_gaps': fair_value_gaps,
             'trading_signals': trading_signals
-        }
\ No newline at end of file
+        }
+    
+    def analyze_smc_compact(self, df, depth_levels=None):
+        """
+        完整的SMC分析（緊湊格式）
+        
+        Args:
+            df: OHLCV數據
+            depth_levels (dict): 訂單簿掛單牆
+            
+        Returns:
+            SMCResult: 以結構化數組和類型代碼保存的結果，to_dict()可還原為analyze_smc的輸出
+        """
+        return SMCResult.from_dict(self.analyze_smc(df, depth_levels))
\ No newline at end of file
@@ -0,0 +1,295 @@
+from enum import IntEnum
+import pandas as pd
+import numpy as np
+from columnar_codec import time_to_ms
+
+
+class SMCCode(IntEnum):
+    """SMC結果的類型代碼，描述文字只在顯示時查表"""
+    BULLISH_BOS = 1
+    BEARISH_BOS = 2
+    BULLISH_OB = 3
+    BEARISH_OB = 4
+    BUY_SIDE_LIQUIDITY = 5
+    SELL_SIDE_LIQUIDITY = 6
+    OB_BUY_ENTRY = 7
+    OB_SELL_ENTRY = 8
+    ASK_WALL = 9
+    BID_WALL = 10
+    BULLISH_FVG = 11
+    BEARISH_FVG = 12
+    EQUAL_HIGHS = 13
+    EQUAL_LOWS = 14
+    CANDLE_BUY = 15
+    CANDLE_SELL = 16
+
+
+# 代碼 -> 原始dict輸出中的 'type' 字段
+TYPE_NAMES = {
+    SMCCode.BULLISH_BOS: 'bullish_bos',
+    SMCCode.BEARISH_BOS: 'bearish_bos',
+    SMCCode.BULLISH_OB: 'bullish_ob',
+    SMCCode.BEARISH_OB: 'bearish_ob',
+    SMCCode.BUY_SIDE_LIQUIDITY: 'resistance',
+    SMCCode.SELL_SIDE_LIQUIDITY: 'support',
+    SMCCode.OB_BUY_ENTRY: 'order_block_entry',
+    SMCCode.OB_SELL_ENTRY: 'order_block_entry',
+    SMCCode.ASK_WALL: 'ask_wall',
+    SMCCode.BID_WALL: 'bid_wall',
+    SMCCode.BULLISH_FVG: 'bullish_fvg',
+    SMCCode.BEARISH_FVG: 'bearish_fvg',
+    SMCCode.EQUAL_HIGHS: 'equal_highs',
+    SMCCode.EQUAL_LOWS: 'equal_lows',
+    SMCCode.CANDLE_BUY: 'candle_pattern',
+    SMCCode.CANDLE_SELL: 'candle_pattern'
+}
+
+# 代碼 -> 顯示用描述
+DESCRIPTIONS = {
+    SMCCode.BULLISH_BOS: '看漲結構突破',
+    SMCCode.BEARISH_BOS: '看跌結構突破',
+    SMCCode.BULLISH_OB: '看漲訂單區塊',
+    SMCCode.BEARISH_OB: '看跌訂單區塊',
+    SMCCode.BUY_SIDE_LIQUIDITY: '買方流動性區域',
+    SMCCode.SELL_SIDE_LIQUIDITY: '賣方流動性區域',
+    SMCCode.OB_BUY_ENTRY: '價格在看漲訂單區塊內，尋找買入機會',
+    SMCCode.OB_SELL_ENTRY: '價格在看跌訂單區塊內，尋找賣出機會',
+    SMCCode.ASK_WALL: '賣單牆流動性區域',
+    SMCCode.BID_WALL: '買單牆流動性區域',
+    SMCCode.BULLISH_FVG: '看漲公允價值缺口',
+    SMCCode.BEARISH_FVG: '看跌公允價值缺口',
+    SMCCode.EQUAL_HIGHS: '等高點流動性池',
+    SMCCode.EQUAL_LOWS: '等低點流動性池',
+    SMCCode.CANDLE_BUY: '最新K線出現看漲形態，尋找買入機會',
+    SMCCode.CANDLE_SELL: '最新K線出現看跌形態，尋找賣出機會'
+}
+
+CODES_BY_NAME = {
+    'bullish_bos': SMCCode.BULLISH_BOS,
+    'bearish_bos': SMCCode.BEARISH_BOS,
+    'bullish_ob': SMCCode.BULLISH_OB,
+    'bearish_ob': SMCCode.BEARISH_OB,
+    'resistance': SMCCode.BUY_SIDE_LIQUIDITY,
+    'support': SMCCode.SELL_SIDE_LIQUIDITY,
+    'ask_wall': SMCCode.ASK_WALL,
+    'bid_wall': SMCCode.BID_WALL,
+    'bullish_fvg': SMCCode.BULLISH_FVG,
+    'bearish_fvg': SMCCode.BEARISH_FVG,
+    'equal_highs': SMCCode.EQUAL_HIGHS,
+    'equal_lows': SMCCode.EQUAL_LOWS
+}
+
+# 屬於買方流動性（價格上方）的代碼
+BUY_SIDE_CODES = (SMCCode.BUY_SIDE_LIQUIDITY, SMCCode.ASK_WALL, SMCCode.EQUAL_HIGHS)
+
+MARKET_BIAS = ['neutral', 'bullish', 'bearish']
+
+# 結構化數組的欄位定義
+SWING_DTYPE = np.dtype([('time', 'M8[ns]'), ('price', 'f8')])
+BOS_DTYPE = np.dtype([('code', 'u1'), ('time', 'M8[ns]'), ('price', 'f8')])
+ORDER_BLOCK_DTYPE = np.dtype([('code', 'u1'), ('time', 'M8[ns]'), ('high', 'f8'), ('low', 'f8')])
+LEVEL_DTYPE = np.dtype([('code', 'u1'), ('time', 'M8[ns]'), ('price', 'f8')])
+SIGNAL_DTYPE = np.dtype([('code', 'u1'), ('price', 'f8'), ('stop_loss', 'f8')])
+# 公允價值缺口：mitigated_time 為價格首次回到缺口內的時間（未回補為NaT），fill 為已回補比例
+FVG_DTYPE = np.dtype([('code', 'u1'), ('time', 'M8[ns]'), ('top', 'f8'), ('bottom', 'f8'),
+                      ('mitigated_time', 'M8[ns]'), ('fill', 'f8')])
+
+
+def _to_datetime64(values):
+    """把時間（Timestamp或精簡模式的毫秒整數）統一經 time_to_ms 轉為datetime64"""
+    return np.array([time_to_ms(v) for v in values], dtype=np.int64).astype('M8[ms]').astype('M8[ns]')
+
+
+def _to_timestamp(value):
+    return pd.Timestamp(time_to_ms(value), unit='ms')
+
+
+class SMCResult:
+    """緊湊的SMC分析結果：各項結果以結構化數組保存，便於快取、序列化和跨進程傳遞"""
+
+    __slots__ = ('swing_highs', 'swing_lows', 'bos', 'order_blocks', 'liquidity',
+                 'buy_signals', 'sell_signals', 'key_levels', 'market_bias', 'fair_value_gaps')
+
+    def __init__(self, swing_highs, swing_lows, bos, order_blocks, liquidity,
+                 buy_signals, sell_signals, key_levels, market_bias=0, fair_value_gaps=None):
+        self.swing_highs = swing_highs
+        self.swing_lows = swing_lows
+        self.bos = bos
+        self.order_blocks = order_blocks
+        self.liquidity = liquidity
+        self.buy_signals = buy_signals
+        self.sell_signals = sell_signals
+        self.key_levels = key_levels
+        self.market_bias = market_bias
+        self.fair_value_gaps = fair_value_gaps if fair_value_gaps is not None else np.empty(0, dtype=FVG_DTYPE)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # 舊版本序列化的結果沒有公允價值缺口
+        self.fair_value_gaps = np.empty(0, dtype=FVG_DTYPE)
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def nbytes(self):
+        """所有數組佔用的字節數"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__ if name != 'market_bias')
+
+    @classmethod
+    def from_dict(cls, results):
+        """
+        由SMCAnalysis.analyze_smc的dict輸出轉換為緊湊格式
+
+        Args:
+            results (dict): analyze_smc的輸出
+
+        Returns:
+            SMCResult: 緊湊格式結果
+        """
+        def swings(points):
+            arr = np.empty(len(points), dtype=SWING_DTYPE)
+            if points:
+                arr['time'] = _to_datetime64([p[0] for p in points])
+                arr['price'] = [p[1] for p in points]
+            return arr
+
+        bos_signals = results['bos_signals']
+        bos = np.empty(len(bos_signals), dtype=BOS_DTYPE)
+        if bos_signals:
+            bos['code'] = [CODES_BY_NAME[s['type']] for s in bos_signals]
+            bos['time'] = _to_datetime64([s['time'] for s in bos_signals])
+            bos['price'] = [s['price'] for s in bos_signals]
+
+        obs = results['order_blocks']
+        order_blocks = np.empty(len(obs), dtype=ORDER_BLOCK_DTYPE)
+        if obs:
+            order_blocks['code'] = [CODES_BY_NAME[ob['type']] for ob in obs]
+            order_blocks['time'] = _to_datetime64([ob['time'] for ob in obs])
+            order_blocks['high'] = [ob['high'] for ob in obs]
+            order_blocks['low'] = [ob['low'] for ob in obs]
+
+        zones = (results['liquidity_zones']['buy_side_liquidity']
+                 + results['liquidity_zones']['sell_side_liquidity'])
+        liquidity = np.empty(len(zones), dtype=LEVEL_DTYPE)
+        if zones:
+            liquidity['code'] = [CODES_BY_NAME[z['type']] for z in zones]
+            liquidity['time'] = _to_datetime64([z['time'] for z in zones])
+            liquidity['price'] = [z['price'] for z in zones]
+
+        trading_signals = results['trading_signals']
+
+        def signals(items, codes):
+            arr = np.empty(len(items), dtype=SIGNAL_DTYPE)
+            if items:
+                arr['code'] = [codes[s['type']] for s in items]
+                arr['price'] = [s['price'] for s in items]
+                arr['stop_loss'] = [s['stop_loss'] for s in items]
+            return arr
+
+        gaps = results.get('fair_value_gaps', [])
+        fair_value_gaps = np.empty(len(gaps), dtype=FVG_DTYPE)
+        if gaps:
+            fair_value_gaps['code'] = [CODES_BY_NAME[gap['type']] for gap in gaps]
+            fair_value_gaps['time'] = _to_datetime64([gap['time'] for gap in gaps])
+            fair_value_gaps['top'] = [gap['top'] for gap in gaps]
+            fair_value_gaps['bottom'] = [gap['bottom'] for gap in gaps]
+            fair_value_gaps['mitigated_time'] = np.datetime64('NaT')
+            mitigated = [i for i, gap in enumerate(gaps) if gap['mitigated_time'] is not None]
+            if mitigated:
+                fair_value_gaps['mitigated_time'][mitigated] = _to_datetime64([gaps[i]['mitigated_time'] for i in mitigated])
+            fair_value_gaps['fill'] = [gap['fill'] for gap in gaps]
+
+        levels = trading_signals['key_levels']
+        key_levels = np.empty(len(levels), dtype=LEVEL_DTYPE)
+        if levels:
+            key_levels['code'] = [CODES_BY_NAME[level['type']] for level in levels]
+            key_levels['time'] = np.datetime64('NaT')
+            key_levels['price'] = [level['price'] for level in levels]
+
+        return cls(
+            swing_highs=swings(results['swing_highs']),
+            swing_lows=swings(results['swing_lows']),
+            bos=bos,
+            order_blocks=order_blocks,
+            liquidity=liquidity,
+            buy_signals=signals(trading_signals['buy_signals'],
+                                {'order_block_entry': SMCCode.OB_BUY_ENTRY, 'candle_pattern': SMCCode.CANDLE_BUY}),
+            sell_signals=signals(trading_signals['sell_signals'],
+                                 {'order_block_entry': SMCCode.OB_SELL_ENTRY, 'candle_pattern': SMCCode.CANDLE_SELL}),
+            key_levels=key_levels,
+            market_bias=MARKET_BIAS.index(trading_signals['market_bias']),
+            fair_value_gaps=fair_value_gaps
+        )
+
+    def to_dict(self):
+        """
+        轉換回analyze_smc的dict輸出，供ChartRenderer和app.py使用
+
+        Returns:
+            dict: 與SMCAnalysis.analyze_smc相同結構的結果
+        """
+        def swings(arr):
+            return [(_to_timestamp(t), p) for t, p in zip(arr['time'], arr['price'])]
+
+        def signals(arr):
+            return [{
+                'type': TYPE_NAMES[SMCCode(code)],
+                'price': price,
+                'reason': DESCRIPTIONS[SMCCode(code)],
+                'target': None,
+                'stop_loss': stop_loss
+            } for code, price, stop_loss in zip(arr['code'], arr['price'], arr['stop_loss'])]
+
+        liquidity_zones = {'buy_side_liquidity': [], 'sell_side_liquidity': []}
+        for code, t, price in zip(self.liquidity['code'], self.liquidity['time'], self.liquidity['price']):
+            code = SMCCode(code)
+            side = 'buy_side_liquidity' if code in BUY_SIDE_CODES else 'sell_side_liquidity'
+            liquidity_zones[side].append({
+                'price': price,
+                'time': _to_timestamp(t),
+                'type': TYPE_NAMES[code],
+                'description': DESCRIPTIONS[code]
+            })
+
+        return {
+            'swing_highs': swings(self.swing_highs),
+            'swing_lows': swings(self.swing_lows),
+            'bos_signals': [{
+                'type': TYPE_NAMES[SMCCode(code)],
+                'time': _to_timestamp(t),
+                'price': price,
+                'description': DESCRIPTIONS[SMCCode(code)]
+            } for code, t, price in zip(self.bos['code'], self.bos['time'], self.bos['price'])],
+            'order_blocks': [{
+                'type': TYPE_NAMES[SMCCode(code)],
+                'time': _to_timestamp(t),
+                'high': high,
+                'low': low,
+                'description': DESCRIPTIONS[SMCCode(code)]
+            } for code, t, high, low in zip(self.order_blocks['code'], self.order_blocks['time'],
+                                            self.order_blocks['high'], self.order_blocks['low'])],
+            'liquidity_zones': liquidity_zones,
+            'fair_value_gaps': [{
+                'type': TYPE_NAMES[SMCCode(code)],
+                'time': _to_timestamp(t),
+                'top': top,
+                'bottom': bottom,
+                'mitigated_time': None if np.isnat(mitigated) else _to_timestamp(mitigated),
+                'fill': fill,
+                'description': DESCRIPTIONS[SMCCode(code)]
+            } for code, t, top, bottom, mitigated, fill in zip(
+                self.fair_value_gaps['code'], self.fair_value_gaps['time'], self.fair_value_gaps['top'],
+                self.fair_value_gaps['bottom'], self.fair_value_gaps['mitigated_time'], self.fair_value_gaps['fill'])],
+            'trading_signals': {
+                'buy_signals': signals(self.buy_signals),
+                'sell_signals': signals(self.sell_signals),
+                'market_bias': MARKET_BIAS[self.market_bias],
+                'key_levels': [{
+                    'price': price,
+                    'type': TYPE_NAMES[SMCCode(code)],
+                    'description': DESCRIPTIONS[SMCCode(code)]
+                } for code, price in zip(self.key_levels['code'], self.key_levels['price'])]
+            }
+        }
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 各模塊在全新解釋器中的導入耗時上限（毫秒），以pandas本身約300毫秒為基準
+BUDGETS_MS = {
+    'technical_indicators': 450,
+    'smc_analysis': 450,
+    'market_screener': 450,
+    'data_fetcher': 500,
+    'chart_renderer': 500,
+    'analysis_api': 600,
+}
+
+# 核心分析模塊不應在導入時帶入的重量級依賴
+HEADLESS_FORBIDDEN = ('streamlit', 'plotly', 'requests')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=3):
+    """
+    在全新的解釋器中測量模塊的冷啟動導入耗時
+
+    Args:
+        module (str): 模塊名
+        repeat (int): 重複次數，取最小值以排除干擾
+
+    Returns:
+        tuple: (最小耗時毫秒, 導入後已載入的重量級依賴列表)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, loaded = None, []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, forbidden=HEADLESS_FORBIDDEN)],
+            cwd=here, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['ms'] < best:
+            best = result['ms']
+        loaded = result['loaded']
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='檢查各模塊的冷啟動導入耗時是否在預算內')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = 0
+    for module, budget in BUDGETS_MS.items():
+        elapsed, loaded = measure(module, args.repeat)
+        ok = elapsed <= budget and not loaded
+        failures += not ok
+        extra = f"  已載入: {', '.join(loaded)}" if loaded else ''
+        print(f"{'OK  ' if ok else 'FAIL'} {module:<22} {elapsed:7.1f} ms / {budget} ms{extra}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import math
+from collections import deque
+from rolling_stats import SortedWindow, RollingSum, Ema, NAN
+from indicator_planner import QUANTILE_BANDS
+from indicator_registry import REGISTRY
+
+
+class StreamingIndicators:
+    """
+    逐根K線增量更新的指標（串流模式）
+
+    與TechnicalIndicators.calculate_indicators使用相同的配置鍵和輸出列名，
+    每根K線的更新成本與歷史長度無關：均值類O(1)，順序統計類O(log w)。
+    同一時間的K線再次到達（未收盤K線價格變動）時替換最後一個值而非追加。
+
+    支持的配置鍵：sma、ema、rsi、median、pct_rank、qbands，以及indicator_registry中帶有串流實現的指標。
+    """
+
+    def __init__(self, indicators_config):
+        self.config = indicators_config
+        self.last_time = None
+        self.closes = deque(maxlen=2)
+        self.sums = {}
+        self.emas = {}
+        self.windows = {}
+
+        if "sma" in indicators_config:
+            self.sums['sma'] = RollingSum(indicators_config["sma"])
+        if "ema" in indicators_config:
+            self.emas['ema'] = Ema(indicators_config["ema"])
+        if "rsi" in indicators_config:
+            self.sums['gain'] = RollingSum(indicators_config["rsi"])
+            self.sums['loss'] = RollingSum(indicators_config["rsi"])
+        # median 和 qbands 週期相同時共用同一個順序統計窗口
+        for key in ("median", "pct_rank", "qbands"):
+            if key in indicators_config:
+                period = indicators_config[key]
+                self.windows.setdefault(period, SortedWindow(period))
+        # 已登記指標的串流對象：配置鍵 -> (指標描述, 配置值, 串流對象)
+        self.streams = {}
+        for key, value in indicators_config.items():
+            spec = REGISTRY.get(key)
+            if spec is not None and spec.stream is not None:
+                self.streams[key] = (spec, value, spec.stream(**spec.params(value)))
+
+    def seed(self, df):
+        """
+        以歷史K線初始化
+
+        Args:
+            df (pandas.DataFrame): 含close列的K線數據
+
+        Returns:
+            dict: 最後一根K線的指標值
+        """
+        names = sorted({name for spec, _, _ in self.streams.values() for name in spec.inputs} - {'close'})
+        fields = [df[name].to_numpy(dtype=float) for name in names]
+        latest = {}
+        for i, (bar_time, close) in enumerate(zip(df.index, df['close'].to_numpy(dtype=float))):
+            latest = self.update(bar_time, close, **{name: values[i] for name, values in zip(names, fields)})
+        return latest
+
+    def update(self, bar_time, close, **fields):
+        """
+        加入或更新一根K線
+
+        Args:
+            bar_time: K線開盤時間
+            close (float): 收盤價（未收盤K線為最新價）
+            **fields: 已登記指標需要的其他列（如high、low、volume）
+
+        Returns:
+            dict: 輸出列名 -> 最新值
+        """
+        close = float(close)
+        replace = bar_time == self.last_time and len(self.closes) > 0
+        if replace:
+            self.closes[-1] = close
+        else:
+            self.closes.append(close)
+        self.last_time = bar_time
+
+        updates = []
+        if 'sma' in self.sums:
+            updates.append((self.sums['sma'], close))
+        if 'gain' in self.sums:
+            # 第一根K線的漲跌記為0（與批量計算中diff的NaN被視為0一致）
+            delta = self.closes[-1] - self.closes[-2] if len(self.closes) == 2 else 0.0
+            updates.append((self.sums['gain'], max(delta, 0.0)))
+            updates.append((self.sums['loss'], max(-delta, 0.0)))
+        updates.extend((ema, close) for ema in self.emas.values())
+        updates.extend((window, close) for window in self.windows.values())
+
+        for state, value in updates:
+            if replace:
+                state.replace_last(value)
+            else:
+                state.push(value)
+
+        for spec, _, stream in self.streams.values():
+            args = [close if name == 'close' else float(fields[name]) for name in spec.inputs]
+            if replace:
+                stream.replace_last(*args)
+            else:
+                stream.push(*args)
+
+        return self.values()
+
+    def values(self):
+        """當前各輸出列的值（窗口未滿時為NaN，與批量計算的開頭一致）"""
+        config = self.config
+        result = {}
+        if "sma" in config:
+            result[f'sma_{config["sma"]}'] = self.sums['sma'].mean()
+        if "ema" in config:
+            result[f'ema_{config["ema"]}'] = self.emas['ema'].value()
+        if "rsi" in config:
+            gain = self.sums['gain'].mean()
+            loss = self.sums['loss'].mean()
+            if math.isnan(gain) or math.isnan(loss) or gain == loss == 0:
+                result['rsi'] = NAN
+            else:
+                result['rsi'] = 100 - 100 / (1 + gain / loss) if loss else 100.0
+        if "median" in config:
+            window = self.windows[config["median"]]
+            result[f'median_{config["median"]}'] = window.median() if window.full else NAN
+        if "pct_rank" in config:
+            window = self.windows[config["pct_rank"]]
+            result[f'pct_rank_{config["pct_rank"]}'] = \
+                window.percentile_rank(self.closes[-1]) if window.full else NAN
+        if "qbands" in config:
+            window = self.windows[config["qbands"]]
+            for band, q in QUANTILE_BANDS.items():
+                result[f'qband_{band}'] = window.quantile(q) if window.full else NAN
+        for spec, value, stream in self.streams.values():
+            result.update(zip(spec.columns(value), stream.values()))
+        return result
@@ -1,12 +1,19 @@
 import pandas as pd
 import numpy as np
+from indicator_planner import IndicatorPlanner, QUANTILE_BANDS
+from streaming_indicators import StreamingIndicators
+from compact_frames import is_compact, COMPACT_DTYPE
+from metrics import timed
+from profiling import profiled
 
 class TechnicalIndicators:
     """技術指標計算類"""
     
     def __init__(self):
-        pass
+        self.planner = IndicatorPlanner()
     
+    @timed('calculate_indicators')
+    @profiled('calculate_indicators')
     def calculate_indicators(self, df, indicators_config):
         """
         計算技術指標
@@ -16,42 +23,40 @@ class TechnicalIndicators:
             indicators_config (dict): 指標配置
             
         Returns:
-            pandas.DataFrame: 包含技術指標的數據框
+            pandas.DataFrame: 包含技術指標的數據框；輸入為精簡格式時，
+                指標列為float32，且不複製原有的OHLCV數據
         """
-        df_result = df.copy()
-        
-        # 簡單移動平均線 (SMA)
-        if "sma" in indicators_config:
-            period = indicators_config["sma"]
-            df_result[f'sma_{period}'] = self.sma(df['close'], period)
-        
-        # 指數移動平均線 (EMA)
-        if "ema" in indicators_config:
-            period = indicators_config["ema"]
-            df_result[f'ema_{period}'] = self.ema(df['close'], period)
-        
-        # 相對強弱指標 (RSI)
-        if "rsi" in indicators_config:
-            period = indicators_config["rsi"]
-            df_result['rsi'] = self.rsi(df['close'], period)
-        
-        # MACD
-        if "macd" in indicators_config:
-            macd_line, macd_signal, macd_hist = self.macd(df['close'])
-            df_result['macd'] = macd_line
-            df_result['macd_signal'] = macd_signal
-            df_result['macd_hist'] = macd_hist
-        
-        # 布林通道 (Bollinger Bands)
-        if "bb" in indicators_config:
-            period = indicators_config["bb"]
-            bb_upper, bb_middle, bb_lower = self.bollinger_bands(df['close'], period)
-            df_result['bb_upper'] = bb_upper
-            df_result['bb_middle'] = bb_middle
-            df_result['bb_lower'] = bb_lower
+        compact = is_compact(df)
+        # 精簡模式只做淺複製：新增指標列不會複製或修改原有的OHLCV數據塊
+        df_result = df.copy(deep=not compact)
+        
+        # 由規劃器把配置轉為原始運算的有向無環圖：
+        # SMA與布林中軌共享滾動和，MACD與EMA共享相同週期的EMA，
+        # 隨機指標、威廉指標共享滾動最高/最低價，每個中間結果只計算一次
+        plan = self.planner.plan(indicators_config)
+        for column, values in plan.execute(df).items():
+            # 整數列（如K線形態位元）保持原類型
+            df_result[column] = values.to_numpy(dtype=COMPACT_DTYPE) if compact and values.dtype.kind == 'f' else values
         
         return df_result
     
+    def streaming(self, indicators_config, df=None):
+        """
+        建立串流模式的指標計算器，逐根K線增量更新
+        
+        Args:
+            indicators_config (dict): 指標配置（支持 sma、ema、rsi、median、pct_rank、qbands，
+                以及indicator_registry中帶有串流實現的指標）
+            df (pandas.DataFrame): 用於初始化的歷史K線，可選
+            
+        Returns:
+            StreamingIndicators: 串流計算器
+        """
+        stream = StreamingIndicators(indicators_config)
+        if df is not None:
+            stream.seed(df)
+        return stream
+    
     def sma(self, data, period):
         """簡單移動平均線"""
         return data.rolling(window=period).mean()
@@ -121,6 +126,19 @@ class TechnicalIndicators:
         
         return cci
     
+    def rolling_median(self, data, period=20):
+        """滾動中位數"""
+        return data.rolling(window=period).median()
+    
+    def percentile_rank(self, data, period=100):
+        """滾動百分位排名：最新值在窗口中的排名比例 (0, 1]"""
+        return data.rolling(window=period).rank(pct=True)
+    
+    def quantile_bands(self, data, period=20):
+        """分位數通道：以滾動分位數代替標準差，不受極端K線影響"""
+        rolling = data.rolling(window=period)
+        return tuple(rolling.quantile(QUANTILE_BANDS[band]) for band in ('upper', 'middle', 'lower'))
+    
     def atr(self, high, low, close, period=14):
         """平均真實範圍"""
         high_low = high - low
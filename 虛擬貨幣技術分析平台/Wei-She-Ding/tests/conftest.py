@@ -0,0 +1,81 @@
+import os
+import sys
+import pytest
+
+# 各模塊以扁平方式放在上一級目錄，與 streamlit run app.py 時的導入方式一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def api():
+    """以隨機模擬數據運行的分析服務"""
+    from analysis_api import AnalysisAPI
+    from data_fetcher import CryptoDataFetcher
+    from smc_analysis import SMCAnalysis
+    from technical_indicators import TechnicalIndicators
+
+    fetcher = CryptoDataFetcher()
+    fetcher.use_mock_data = True
+    return AnalysisAPI(fetcher, TechnicalIndicators(), SMCAnalysis(), max_workers=2)
+
+
+class StubUpstream:
+    """
+    本地HTTP替身：以handler(path, query)返回 (狀態碼, JSON對象)，並統計每個路徑的請求次數
+
+    Args:
+        handler (callable): 請求處理函數，在服務線程中執行
+    """
+
+    def __init__(self, handler):
+        import json
+        import threading
+        from collections import Counter
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlsplit, parse_qs
+
+        self.hits = Counter()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with lock:
+                    stub.hits[parts.path] += 1
+                status, payload = handler(parts.path, {k: v[-1] for k, v in parse_qs(parts.query).items()})
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v3"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_upstream():
+    """建立本地HTTP替身的工廠，測試結束時全部關閉"""
+    stubs = []
+
+    def start(handler):
+        stub = StubUpstream(handler)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.close()
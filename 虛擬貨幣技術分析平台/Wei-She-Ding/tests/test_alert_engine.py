@@ -0,0 +1,55 @@
+import pandas as pd
+from alert_engine import AlertEngine, QueueSink
+from compact_frames import to_compact
+from mock_data_generator import MockDataGenerator
+from smc_analysis import SMCAnalysis
+from technical_indicators import TechnicalIndicators
+
+
+def make_engine():
+    sink = QueueSink()
+    return AlertEngine([sink], TechnicalIndicators(), SMCAnalysis()), sink
+
+
+def bar(close, time='2026-01-01'):
+    return pd.DataFrame({'open': [close], 'high': [close], 'low': [close], 'close': [close], 'volume': [1.0]},
+                        index=pd.DatetimeIndex([pd.Timestamp(time)], name='timestamp'))
+
+
+def test_crossings_are_tracked_per_interval():
+    engine, sink = make_engine()
+    engine.add_alert('BTCUSDT', 'price_above', value=100)
+    engine.on_bar('BTCUSDT', bar(90), '1m')
+    engine.on_bar('BTCUSDT', bar(110), '1d')
+    engine.on_bar('BTCUSDT', bar(95), '1m')
+    assert sink.drain() == []
+
+    engine.on_bar('BTCUSDT', bar(105), '1m')
+    assert [event['condition'] for event in sink.drain()] == ['price_above']
+
+
+def test_compact_mode_toggle_keeps_shared_state_comparable():
+    engine, sink = make_engine()
+    engine.add_alert('BTCUSDT', 'new_bos', once=False)
+    engine.add_alert('BTCUSDT', 'enter_order_block', once=False)
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 300)
+
+    # 同一序列在 DatetimeIndex 和精簡模式的毫秒索引之間來回切換
+    for frame in (df, to_compact(df), df, to_compact(df)):
+        engine.on_bar('BTCUSDT', frame, '1h')
+        latest = engine.last_bos_time[('BTCUSDT', '1h')]
+        assert latest is None or isinstance(latest, int)
+
+    # 數據相同時切換模式不會被誤認為新的結構突破
+    assert [event for event in sink.drain() if event['condition'] == 'new_bos'] == []
+
+
+def test_event_time_is_epoch_ms_in_both_modes():
+    engine, sink = make_engine()
+    engine.add_alert('BTCUSDT', 'price_below', value=100, once=False)
+    engine.on_bar('BTCUSDT', bar(110), '1h')
+    engine.on_bar('BTCUSDT', to_compact(bar(90)), '1h')
+    engine.on_bar('BTCUSDT', bar(110), '1h')
+    engine.on_bar('BTCUSDT', bar(90), '1h')
+    times = [event['time'] for event in sink.drain()]
+    assert times == [1767225600000, 1767225600000]
@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+from analysis_api import APIError
+
+
+def get(api, target, headers=None):
+    return asyncio.run(api.route('GET', target, headers or {}))
+
+
+def test_etag_differs_per_format(api):
+    status, json_headers, _ = get(api, '/api/indicators?symbol=BTCUSDT&interval=1h&format=json')
+    assert status == 200
+
+    # 快取了JSON的客戶端請求二進制格式時必須得到完整響應
+    status, bin_headers, body = get(api, '/api/indicators?symbol=BTCUSDT&interval=1h&format=bin',
+                                    {'if-none-match': json_headers['ETag']})
+    assert status == 200 and body[:4] == b'FCOL'
+    assert bin_headers['ETag'] != json_headers['ETag']
+
+    status, _, body = get(api, '/api/indicators?symbol=BTCUSDT&interval=1h&format=bin',
+                          {'if-none-match': bin_headers['ETag']})
+    assert status == 304 and body == b''
+
+
+@pytest.mark.parametrize('query', ['interval=7x', 'symbol=BTC/USDT', 'symbol=' + 'A' * 40, 'limit=abc',
+                                   'limit=0', 'limit=-5', 'rsi=-3', 'rsi=51', 'sma=0', 'bb=1', 'rsi=abc'])
+def test_invalid_parameters_are_rejected(api, query):
+    with pytest.raises(APIError) as error:
+        get(api, f'/api/indicators?{query}')
+    assert error.value.status == 400
+
+
+def test_parameters_at_range_bounds_are_accepted(api):
+    status, _, _ = get(api, '/api/indicators?limit=1&sma=5&bb=50&format=json')
+    assert status == 200
+    status, _, _ = get(api, '/api/smc?limit=5000&format=json')
+    assert status == 200
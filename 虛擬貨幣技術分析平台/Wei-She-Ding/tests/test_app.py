@@ -0,0 +1,18 @@
+import os
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def test_compact_mode_toggle_renders_without_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ('FANIC_PAPER_DIR', 'FANIC_HISTORY_DIR', 'FANIC_DEPTH_DIR'):
+        monkeypatch.setenv(name, str(tmp_path / name.lower()))
+    monkeypatch.setenv('FANIC_REFRESH_SECONDS', '0')
+
+    app = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    compact = next(checkbox for checkbox in app.checkbox if '精簡' in checkbox.label)
+    for value in (True, False, True):
+        compact.set_value(value)
+        app.run()
+        assert not app.exception and not app.error
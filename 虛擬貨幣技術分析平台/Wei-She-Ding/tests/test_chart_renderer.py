@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+from chart_renderer import ChartRenderer
+from compact_frames import to_compact
+from mock_data_generator import MockDataGenerator
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_pattern_projection_extends_the_bar_time_axis(compact):
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 100)
+    length, horizon = 20, 5
+    rng = np.random.default_rng(0)
+    pattern_matches = {
+        'length': length,
+        'horizon': horizon,
+        'matches': [{
+            'symbol': 'ETHUSDT',
+            'start': pd.Timestamp('2026-01-01'),
+            'closes': 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length + horizon))),
+            'distance': 1.0,
+            'forward_return': 0.01
+        }]
+    }
+    frame = to_compact(df) if compact else df
+    fig = ChartRenderer().create_candlestick_chart(frame, 'BTCUSDT', {}, pattern_matches=pattern_matches)
+
+    expected = df.index[-length:].append(pd.date_range(df.index[-1] + pd.Timedelta('1h'), periods=horizon, freq='1h'))
+    trace = next(trace for trace in fig.data if trace.name.startswith('相似形態 ETHUSDT'))
+    assert pd.DatetimeIndex(trace.x).equals(expected)
+    median = next(trace for trace in fig.data if trace.name == '相似形態後續中位數')
+    assert pd.DatetimeIndex(median.x).equals(expected[length - 1:])
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from correlation_service import CorrelationService
+from mock_data_generator import MockDataGenerator
+
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT']
+
+
+class ReplayFetcher:
+    """只返回到 position 為止的K線，模擬隨時間推進的交易所"""
+
+    def __init__(self, bars=400):
+        generator = MockDataGenerator()
+        self.frames = {symbol: generator.generate_kline_data(symbol, '1h', bars) for symbol in SYMBOLS}
+        self.position = 200
+
+    def get_kline_data(self, symbol, interval, limit=500):
+        return self.frames[symbol].iloc[:self.position].iloc[-limit:]
+
+
+def expected_corr(fetcher, window):
+    closes = pd.DataFrame({symbol: df['close'].iloc[:fetcher.position] for symbol, df in fetcher.frames.items()})
+    return np.log(closes).diff().iloc[-window:].corr().to_numpy()
+
+
+def test_refresh_fetches_missed_bars_before_applying():
+    fetcher = ReplayFetcher()
+    service = CorrelationService(fetcher, interval='1h', windows=(30, 100), history=200)
+    service.load(SYMBOLS)
+
+    for step in (1, 10, 1, 150, 2):
+        fetcher.position += step
+        service.refresh()
+        for window in service.windows:
+            assert np.allclose(service.correlation_matrix(window).to_numpy(), expected_corr(fetcher, window),
+                               atol=1e-9)
+        assert service.last_time == fetcher.frames['BTCUSDT'].index[fetcher.position - 1]
@@ -0,0 +1,70 @@
+import json
+import time
+import numpy as np
+from depth_store import DepthStore, DepthRecorder, DepthReplayer
+from metrics import METRICS
+
+
+class BookFetcher:
+    """依次返回預設的訂單簿；列表用完後拋出異常"""
+
+    def __init__(self, books):
+        self.books = list(books)
+
+    def get_order_book(self, symbol, limit=1000):
+        if not self.books:
+            raise ConnectionError("upstream down")
+        return self.books.pop(0)
+
+
+def book(bid_wall, ask_wall):
+    bids = [[f'{price:.2f}', '1.0'] for price in np.arange(90.0, 100.0, 0.5)]
+    asks = [[f'{price:.2f}', '1.0'] for price in np.arange(100.5, 110.0, 0.5)]
+    bids.append([f'{bid_wall:.2f}', '50.0'])
+    asks.append([f'{ask_wall:.2f}', '80.0'])
+    return {'bids': bids, 'asks': asks}
+
+
+def make_store(path):
+    return DepthStore(str(path), price_min=80.0, price_max=120.0, bin_size=0.5, capacity=16)
+
+
+def test_replayed_recording_rebuilds_the_same_store(tmp_path):
+    recording = tmp_path / 'depth.jsonl'
+    store = make_store(tmp_path / 'live')
+    recorder = DepthRecorder(BookFetcher([book(95.0, 105.0)] * 5), store, 'BTCUSDT', recording_path=str(recording))
+    for _ in range(5):
+        assert recorder.capture()
+        time.sleep(0.002)
+
+    replayed = make_store(tmp_path / 'replayed')
+    assert DepthReplayer(str(recording)).replay(replayed) == 5
+
+    times, grid = replayed.snapshots()
+    assert np.array_equal(times, store.snapshots()[0])
+    assert np.array_equal(grid, store.snapshots()[1])
+
+    walls = replayed.resting_liquidity(100.0)
+    assert walls == store.resting_liquidity(100.0)
+    # 價位為價格箱中心
+    assert walls['bids'][0] == (95.25, 51.0)
+    assert walls['asks'][0] == (105.25, 81.0)
+
+    # 全部快照落在最後一根K線內：熱力圖該列為快照平均，之前的K線為NaN
+    bar_index = np.array([times[0] - 60_000, times[0]], dtype=np.int64)
+    bar_times, prices, z = replayed.heatmap(bar_index, price_low=90.0, price_high=110.0)
+    expected = store.heatmap(bar_index, price_low=90.0, price_high=110.0)
+    assert np.array_equal(prices, expected[1]) and np.array_equal(z, expected[2], equal_nan=True)
+    assert np.isnan(z[:, 0]).all()
+    assert prices[np.argmax(z[:, 1])] == 105.25 and z[:, 1].max() == 81.0
+
+    assert [json.loads(line)['time'] for line in recording.read_text().splitlines()] == list(times)
+
+
+def test_recorder_counts_failures(tmp_path):
+    before = METRICS.counter_value('depth_capture_errors_total', symbol='ETHUSDT', reason='error')
+    recorder = DepthRecorder(BookFetcher([]), make_store(tmp_path), 'ETHUSDT', interval_seconds=0.01)
+    recorder.start()
+    time.sleep(0.1)
+    recorder.stop()
+    assert METRICS.counter_value('depth_capture_errors_total', symbol='ETHUSDT', reason='error') > before
@@ -0,0 +1,16 @@
+import pytest
+from indicator_checks import check_parity
+from indicator_registry import REGISTRY
+from mock_data_generator import MockDataGenerator
+from technical_indicators import TechnicalIndicators
+
+
+@pytest.fixture(scope='module')
+def small_frame():
+    return MockDataGenerator().generate_kline_data('BTCUSDT', '1m', 300)
+
+
+# 沒有輸出列的登記項（如成交量）只影響圖表佈局，無需比較
+@pytest.mark.parametrize('key', [key for key, spec in REGISTRY.items() if spec.outputs])
+def test_registered_indicator_parity(key, small_frame):
+    assert check_parity(REGISTRY[key], small_frame, TechnicalIndicators()) == []
@@ -0,0 +1,34 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from kline_decoder import _decode_text, _sample_payload, decode_klines, klines_to_frame, _decode_rows
+
+
+def test_fast_path_matches_generic_path():
+    content = _sample_payload(50)
+    pd.testing.assert_frame_equal(decode_klines(content), klines_to_frame(*_decode_rows(json.loads(content))))
+
+
+def test_rows_with_wrong_field_count_fall_back_to_generic_path():
+    rows = json.loads(_sample_payload(6))
+    # 一行少一個統計字段、另一行多一個：總字段數仍是12的倍數，但快速路徑會使後面的行錯位
+    rows[1] = rows[1][:-1]
+    rows[4] = rows[4] + ["0"]
+    content = json.dumps(rows).encode('utf-8')
+    with pytest.raises(ValueError):
+        _decode_text(content)
+
+    df = decode_klines(content)
+    assert len(df) == 6
+    assert np.array_equal(df['close'].to_numpy(), [float(row[4]) for row in rows])
+
+
+def test_malformed_row_is_not_silently_dropped():
+    rows = json.loads(_sample_payload(4))
+    rows[3][0] = "broken"
+    content = json.dumps(rows).encode('utf-8')
+    with pytest.raises(ValueError):
+        _decode_text(content)
+    with pytest.raises(ValueError):
+        decode_klines(content)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from compact_frames import to_compact
+from market_screener import MarketScreener
+from mock_data_generator import MockDataGenerator
+from technical_indicators import TechnicalIndicators
+
+
+class FrameFetcher:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def get_kline_data(self, symbol, interval, limit=500):
+        return self.frames[symbol]
+
+
+def test_panel_aligns_on_open_time_with_nan_padding():
+    generator = MockDataGenerator()
+    full = generator.generate_kline_data('BTCUSDT', '1h', 200)
+    listed = generator.generate_kline_data('ETHUSDT', '1h', 200).iloc[-60:]
+    gapped = generator.generate_kline_data('BNBUSDT', '1h', 200).drop(full.index[150:160])
+    frames = {'BTCUSDT': full, 'ETHUSDT': to_compact(listed), 'BNBUSDT': gapped}
+
+    screener = MarketScreener(FrameFetcher(frames))
+    symbols, panel = screener.build_panel(list(frames), '1h')
+    assert symbols == list(frames)
+    assert np.array_equal(panel['time'], full.index.as_unit('ms').asi8)
+    assert np.array_equal(panel['close'][0], full['close'].to_numpy())
+
+    # 新上市的交易對前面補NaN，有缺口的交易對在缺口處為NaN，其餘K線仍對準各自的開盤時間
+    assert np.isnan(panel['close'][1, :140]).all()
+    assert np.allclose(panel['close'][1, 140:], listed['close'].to_numpy(), rtol=1e-6)
+    assert np.isnan(panel['close'][2, 150:160]).all()
+    assert np.array_equal(panel['close'][2, 160:], gapped['close'].to_numpy()[150:])
+
+
+def test_scan_is_unaffected_by_other_symbols_history():
+    generator = MockDataGenerator()
+    full = generator.generate_kline_data('BTCUSDT', '1h', 200)
+    listed = generator.generate_kline_data('ETHUSDT', '1h', 200).iloc[-60:]
+    frames = {'BTCUSDT': full, 'ETHUSDT': listed}
+
+    alone = MarketScreener(FrameFetcher(frames))._scan(['BTCUSDT'], '1h', 14, 20, 120)
+    together = MarketScreener(FrameFetcher(frames))._scan(['BTCUSDT', 'ETHUSDT'], '1h', 14, 20, 120)
+    pd.testing.assert_frame_equal(alone, together.iloc[:1])
+
+    # 新上市交易對的指標只按其自身存在的K線計算
+    expected = TechnicalIndicators().calculate_indicators(listed, {'rsi': 14})['rsi'].iloc[-1]
+    assert np.isclose(together['rsi'].iloc[1], expected)
+    assert together['price'].iloc[1] == listed['close'].iloc[-1]
@@ -0,0 +1,29 @@
+import asyncio
+from metrics import MetricsRegistry, METRICS
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.inc('requests_total', path='a"b\\c\nd')
+    assert 'fanic_requests_total{path="a\\"b\\\\c\\nd"} 1' in registry.prometheus_text()
+
+
+def test_unknown_paths_share_one_endpoint_label(api):
+    async def request_paths(paths):
+        server = await asyncio.start_server(api.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        for path in paths:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+            await writer.drain()
+            await reader.read()
+            writer.close()
+        server.close()
+        await server.wait_closed()
+
+    before = METRICS.counter_value('http_requests_total', endpoint='other', status=404)
+    asyncio.run(request_paths([f'/missing-{i}' for i in range(20)] + ['/x"y\\z', '/api/health']))
+    assert METRICS.counter_value('http_requests_total', endpoint='other', status=404) == before + 21
+    text = METRICS.prometheus_text()
+    assert 'missing-' not in text and 'x"y' not in text
+    assert 'endpoint="/api/health"' in text
@@ -0,0 +1,215 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from compact_frames import to_compact
+from metrics import METRICS
+from mock_data_generator import MockDataGenerator
+from paper_trading import PaperTradingEngine, PaperTradingFeed, STATE_FILE, replay
+from technical_indicators import TechnicalIndicators
+
+
+def frame(closes, start='2026-01-01', freq='1min'):
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({'open': closes, 'high': closes + 1, 'low': closes - 1, 'close': closes,
+                         'volume': np.ones(len(closes))},
+                        index=pd.date_range(start, periods=len(closes), freq=freq, name='timestamp'))
+
+
+def engine_with_stop(level):
+    engine = PaperTradingEngine()
+    engine.add_accounts(1, strategies=0)
+    engine.on_trade('BTCUSDT', 100.0)
+    engine.place_order(0, 'BTCUSDT', 'buy', 1.0, kind='stop', price=level)
+    return engine
+
+
+def test_compact_toggle_and_save_use_epoch_ms(tmp_path):
+    engine = PaperTradingEngine()
+    engine.add_accounts(2)
+    df = TechnicalIndicators().calculate_indicators(
+        MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 100), {'rsi': 14, 'macd': True})
+
+    # 同一序列在 DatetimeIndex 和精簡模式的毫秒索引之間來回切換，每次都保存
+    for view in (df.iloc[:60], to_compact(df.iloc[:80]), df.iloc[:90], to_compact(df)):
+        engine.on_frame('BTCUSDT', view, interval='1h')
+        engine.save(tmp_path)
+
+    bar_time, high, low = engine.bars[(0, '1h')]
+    assert isinstance(bar_time, int) and bar_time == df.index[-1].value // 10**6
+    assert os.listdir(tmp_path) == [STATE_FILE]
+    restored = PaperTradingEngine.load(tmp_path)
+    assert restored.bars == engine.bars and restored.signal_times == engine.signal_times
+    assert np.array_equal(restored.qty, engine.qty)
+
+
+def test_interleaved_intervals_do_not_skip_bars():
+    engine = engine_with_stop(105.0)
+    engine.on_frame('BTCUSDT', frame([100, 100, 100, 100]), interval='1m')
+
+    # 小時線的最後一根開盤早於已處理的分鐘線，仍須撮合其穿越止損的價格
+    hours = frame([100, 110], start='2025-12-31 23:00', freq='1h')
+    assert engine.on_frame('BTCUSDT', hours, interval='1h') == 1
+    assert engine.qty[0, 0] == 1.0
+
+    # 回到分鐘線時從分鐘線自己的進度繼續
+    minutes = frame([100, 100, 100, 100, 112])
+    engine.on_frame('BTCUSDT', minutes, interval='1m')
+    assert engine.bars[(0, '1m')][0] == minutes.index[-1].value // 10**6
+    assert engine.bars[(0, '1h')][0] == hours.index[-1].value // 10**6
+
+
+def test_save_replaces_state_atomically(tmp_path):
+    engine = engine_with_stop(120.0)
+    engine.save(tmp_path)
+    # 中斷的保存只會留下臨時文件，已保存的狀態保持完整
+    with open(os.path.join(tmp_path, f'{STATE_FILE}.tmp'), 'wb') as f:
+        f.write(b'partial')
+    restored = PaperTradingEngine.load(tmp_path)
+    assert list(restored.orders) == list(engine.orders)
+
+
+class FrameFetcher:
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def get_kline_data(self, symbol, interval, limit=500):
+        self.calls += 1
+        return self.df
+
+
+def test_feed_saves_only_on_new_bar_or_fill(tmp_path):
+    engine = PaperTradingEngine()
+    engine.add_accounts(1, strategies=0)
+    fetcher = FrameFetcher(frame(np.full(60, 100.0)))
+    feed = PaperTradingFeed(engine, fetcher, TechnicalIndicators(), None, 'BTCUSDT', '1m', state_dir=str(tmp_path))
+
+    feed.poll()
+    path = os.path.join(tmp_path, STATE_FILE)
+    saved_at = os.stat(path).st_mtime_ns
+    os.utime(path, ns=(0, 0))
+    feed.poll()
+    assert os.stat(path).st_mtime_ns == 0
+
+    fetcher.df = frame(np.full(61, 100.0))
+    feed.poll()
+    assert os.stat(path).st_mtime_ns >= saved_at
+    assert engine.bars[(0, '1m')][0] == fetcher.df.index[-1].value // 10**6
+
+
+class FailingFetcher:
+    def get_kline_data(self, symbol, interval, limit=500):
+        raise ConnectionError("upstream down")
+
+
+def test_feed_counts_failures():
+    before = METRICS.counter_value('paper_feed_errors_total', symbol='ETHUSDT', interval='1m')
+    feed = PaperTradingFeed(PaperTradingEngine(), FailingFetcher(), TechnicalIndicators(), None,
+                            'ETHUSDT', '1m', interval_seconds=0.01)
+    feed.start()
+    time.sleep(0.1)
+    feed.stop()
+    assert METRICS.counter_value('paper_feed_errors_total', symbol='ETHUSDT', interval='1m') > before
+
+
+def ohlc(*bars):
+    """以 (開, 高, 低, 收) 元組組成的分鐘K線"""
+    opens, highs, lows, closes = (np.array(column, dtype=float) for column in zip(*bars))
+    return pd.DataFrame({'open': opens, 'high': highs, 'low': lows, 'close': closes,
+                         'volume': np.ones(len(bars))},
+                        index=pd.date_range('2026-01-01', periods=len(bars), freq='1min', name='timestamp'))
+
+
+def manual_engine(accounts=1, price=100.0, fee_rate=0.0):
+    engine = PaperTradingEngine(fee_rate=fee_rate)
+    engine.add_accounts(accounts, strategies=0)
+    engine.on_trade('BTCUSDT', price)
+    return engine
+
+
+def fills(engine):
+    return [(fill['account'], fill['side'], fill['price'], fill['reason']) for fill in engine.fills]
+
+
+@pytest.mark.parametrize('bar, expected', [
+    # 陽線按 開 → 低 → 高 → 收 撮合：先買入限價，後賣出限價
+    ((100, 106, 94, 105), [(0, 'buy', 95.0, 'limit'), (0, 'sell', 105.0, 'limit')]),
+    # 陰線按 開 → 高 → 低 → 收 撮合：先賣出限價，後買入限價
+    ((100, 106, 94, 95), [(0, 'sell', 105.0, 'limit'), (0, 'buy', 95.0, 'limit')]),
+])
+def test_replay_follows_bar_path(bar, expected):
+    engine = manual_engine(fee_rate=0.001)
+    engine.place_order(0, 'BTCUSDT', 'buy', 1.0, kind='limit', price=95.0)
+    engine.place_order(0, 'BTCUSDT', 'sell', 1.0, kind='limit', price=105.0)
+
+    assert replay(engine, 'BTCUSDT', ohlc(bar)) == 2
+    assert fills(engine) == expected
+    account = engine.accounts[0]
+    assert engine.qty[0, 0] == 0
+    assert account['realized'] == pytest.approx(10.0)
+    assert account['fees'] == pytest.approx(0.2)
+    assert account['cash'] == pytest.approx(10000 + 10.0 - 0.2)
+
+
+def test_replay_gap_fills_stops_at_open_and_limits_at_limit():
+    engine = manual_engine(accounts=2)
+    engine.place_order(0, 'BTCUSDT', 'buy', 1.0)
+    engine.place_order(0, 'BTCUSDT', 'sell', 1.0, kind='stop', price=95.0)
+    engine.place_order(1, 'BTCUSDT', 'buy', 1.0, kind='limit', price=97.0)
+
+    # 第二根K線跳空低開於90：止損按開盤價成交，限價單仍按限價成交
+    replay(engine, 'BTCUSDT', ohlc((100, 100, 100, 100), (90, 92, 88, 91)))
+    assert fills(engine)[1:] == [(1, 'buy', 97.0, 'limit'), (0, 'sell', 90.0, 'stop')]
+    assert engine.accounts['realized'][0] == pytest.approx(-10.0)
+    assert engine.qty[:, 0].tolist() == [0.0, 1.0]
+    assert engine.avg_price[1, 0] == 97.0
+
+
+def test_replay_sweeps_stacked_orders_in_path_order():
+    engine = manual_engine(accounts=2)
+    for level in (97.0, 99.0, 98.0):
+        engine.place_order(0, 'BTCUSDT', 'buy', 1.0, kind='limit', price=level)
+    for level in (103.0, 101.0, 102.0):
+        engine.place_order(1, 'BTCUSDT', 'buy', 1.0, kind='stop', price=level)
+
+    # 下跌時由高到低成交限價單，隨後上漲時由低到高成交止損單，路徑連續時都按觸發價成交
+    assert replay(engine, 'BTCUSDT', ohlc((100, 104, 96, 103))) == 6
+    assert [fill[2] for fill in fills(engine)] == [99.0, 98.0, 97.0, 101.0, 102.0, 103.0]
+    assert not engine.orders
+    assert engine.qty[:, 0].tolist() == [3.0, 3.0]
+    assert engine.avg_price[:, 0] == pytest.approx([98.0, 102.0])
+    assert engine.unrealized() == pytest.approx([15.0, 3.0])
+
+
+@pytest.mark.parametrize('bars, exit_fill, realized', [
+    # 先觸及止盈：止損單隨之撤銷，之後跌穿止損不再成交
+    ([(100, 111, 99, 108), (108, 108, 90, 91)], (0, 'sell', 110.0, 'limit'), 10.0),
+    # 先觸及止損：止盈單隨之撤銷，之後漲穿止盈不再成交
+    ([(100, 104, 94, 96), (96, 120, 96, 119)], (0, 'sell', 95.0, 'stop'), -5.0),
+])
+def test_replay_bracket_exit_cancels_other_leg(bars, exit_fill, realized):
+    engine = manual_engine(fee_rate=0.001)
+    engine.place_order(0, 'BTCUSDT', 'buy', 1.0, stop_loss=95.0, take_profit=110.0)
+    assert len(engine.orders) == 2
+
+    replay(engine, 'BTCUSDT', ohlc(*bars))
+    assert fills(engine) == [(0, 'buy', 100.0, 'manual'), exit_fill]
+    assert not engine.orders and not engine.brackets
+    account = engine.accounts[0]
+    assert engine.qty[0, 0] == 0
+    assert account['realized'] == pytest.approx(realized)
+    assert account['fees'] == pytest.approx((100.0 + exit_fill[2]) * 0.001)
+    # 平倉後權益 = 初始資金 + 已實現盈虧 - 手續費
+    assert engine.equity()[0] == pytest.approx(account['initial'] + account['realized'] - account['fees'])
+
+
+def test_replay_gap_through_stop_loss_fills_at_open():
+    engine = manual_engine()
+    engine.place_order(0, 'BTCUSDT', 'buy', 1.0, stop_loss=95.0, take_profit=110.0)
+
+    replay(engine, 'BTCUSDT', ohlc((100, 101, 99, 100), (92, 93, 91, 92)))
+    assert fills(engine)[-1] == (0, 'sell', 92.0, 'stop')
+    assert engine.accounts['realized'][0] == pytest.approx(-8.0)
+    assert not engine.orders
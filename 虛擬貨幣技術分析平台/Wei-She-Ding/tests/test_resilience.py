@@ -0,0 +1,103 @@
+import pytest
+from data_fetcher import CryptoDataFetcher
+from mock_data_generator import MockDataGenerator
+from resilience import ResilientClient, HALF_OPEN, CLOSED
+
+ROW = [1767225600000, "100.0", "101.0", "99.0", "100.5", "12.0", 1767229199999, "0", 1, "0", "0", "0"]
+
+
+def make_fetcher(stub):
+    client = ResilientClient(timeout=2, attempts=1)
+    return CryptoDataFetcher(client=client, mock_generator=MockDataGenerator(), base_url=stub.base_url)
+
+
+def test_invalid_symbol_does_not_switch_to_mock_data(stub_upstream):
+    def handler(path, query):
+        if query.get('symbol') == 'NOPE':
+            return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+        return 200, [ROW]
+
+    fetcher = make_fetcher(stub_upstream(handler))
+    assert fetcher.get_kline_data('NOPE', '1h', limit=1) is None
+    assert fetcher.get_current_price('NOPE') is None
+    assert not fetcher.use_mock_data
+    assert fetcher.client.breaker('klines').state == CLOSED
+
+    df = fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert float(df['close'].iloc[-1]) == 100.5
+
+
+@pytest.mark.parametrize('status', [451, 403])
+def test_geo_restriction_switches_to_mock_data(stub_upstream, status):
+    fetcher = make_fetcher(stub_upstream(lambda path, query: (status, {'code': 0, 'msg': 'restricted'})))
+    df = fetcher.get_kline_data('BTCUSDT', '1h', limit=50)
+    assert fetcher.use_mock_data
+    assert len(df) == 50
+
+
+def test_half_open_probe_is_released_after_unexpected_error(monkeypatch):
+    import requests
+
+    client = ResilientClient(attempts=1, failure_threshold=1, reset_timeout=0.0)
+    breaker = client.breaker('klines')
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+
+    def explode(*args, **kwargs):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(requests, 'get', explode)
+    with pytest.raises(RuntimeError):
+        client.get_bytes('klines', 'http://127.0.0.1:9/klines')
+
+    # 探測失敗後重新開啟，reset_timeout過後應再放行一個探測請求，而不是永久拒絕
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+
+def test_open_breaker_serves_stale_frame_then_recovers_through_half_open(stub_upstream):
+    import time
+    from resilience import OPEN
+
+    upstream = {'status': 200, 'close': '100.5'}
+
+    def handler(path, query):
+        if upstream['status'] != 200:
+            return upstream['status'], {'msg': 'unavailable'}
+        return 200, [ROW[:4] + [upstream['close']] + ROW[5:]]
+
+    stub = stub_upstream(handler)
+    client = ResilientClient(timeout=2, attempts=1, failure_threshold=1, reset_timeout=0.3)
+    fetcher = CryptoDataFetcher(client=client, mock_generator=MockDataGenerator(), base_url=stub.base_url)
+    breaker = client.breaker('klines')
+
+    fresh = fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert not fresh.attrs.get('stale')
+    # 調用方原地修改返回的數據框不影響之後返回的過期數據
+    fresh['close'] = 0.0
+
+    upstream['status'] = 503
+    stale = fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert stale.attrs['stale'] and stale.attrs['fetched_at'] <= time.time()
+    assert float(stale['close'].iloc[-1]) == 100.5
+    assert breaker.state == OPEN
+    stale['close'] = 0.0
+
+    # 熔斷開啟期間不請求上游，繼續返回過期數據
+    hits = stub.hits['/api/v3/klines']
+    stale = fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert stub.hits['/api/v3/klines'] == hits
+    assert stale.attrs['stale'] and float(stale['close'].iloc[-1]) == 100.5
+    assert not fetcher.use_mock_data
+
+    # reset_timeout 過後半開放行一個探測請求，成功後關閉並返回新數據
+    upstream.update(status=200, close='101.5')
+    time.sleep(0.35)
+    assert breaker.state == HALF_OPEN
+    recovered = fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert stub.hits['/api/v3/klines'] == hits + 1
+    assert not recovered.attrs.get('stale')
+    assert float(recovered['close'].iloc[-1]) == 101.5
+    assert breaker.state == CLOSED
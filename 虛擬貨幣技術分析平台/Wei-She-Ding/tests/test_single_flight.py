@@ -0,0 +1,89 @@
+import threading
+import time
+import requests
+from data_fetcher import CryptoDataFetcher
+from mock_data_generator import MockDataGenerator
+from resilience import ResilientClient, SingleFlight
+
+CALLERS = 300
+ROW = [1767225600000, "100.0", "101.0", "99.0", "100.5", "12.0", 1767229199999, "0", 1, "0", "0", "0"]
+
+
+def slow(status, payload, delay=0.5):
+    """上游替身：延遲響應，讓所有調用者在第一個請求完成前到達"""
+    def handler(path, query):
+        time.sleep(delay)
+        return status, payload
+    return handler
+
+
+def run_concurrently(func, callers=CALLERS):
+    """所有線程在同一屏障後同時調用func，返回每個線程的 ('ok', 結果) 或 ('error', 異常)"""
+    barrier = threading.Barrier(callers)
+    outcomes = [None] * callers
+
+    def worker(i):
+        barrier.wait()
+        try:
+            outcomes[i] = ('ok', func())
+        except Exception as e:
+            outcomes[i] = ('error', e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def make_fetcher(stub):
+    return CryptoDataFetcher(client=ResilientClient(timeout=10, attempts=1), mock_generator=MockDataGenerator(),
+                             base_url=stub.base_url)
+
+
+def test_concurrent_kline_requests_share_one_upstream_call(stub_upstream):
+    stub = stub_upstream(slow(200, [ROW]))
+    fetcher = make_fetcher(stub)
+
+    outcomes = run_concurrently(lambda: fetcher.get_kline_data('BTCUSDT', '1h', limit=1))
+
+    assert stub.hits['/api/v3/klines'] == 1
+    assert all(kind == 'ok' for kind, _ in outcomes)
+    first = outcomes[0][1]
+    assert all(result is first for _, result in outcomes)
+    assert float(first['close'].iloc[-1]) == 100.5
+
+
+def test_concurrent_failure_is_shared_by_every_caller(stub_upstream):
+    stub = stub_upstream(slow(500, {'code': -1000, 'msg': 'boom'}))
+    client = ResilientClient(timeout=10, attempts=1)
+    flight = SingleFlight('test')
+
+    outcomes = run_concurrently(
+        lambda: flight.do(('klines', 'BTCUSDT'), lambda: client.get_bytes('klines', f"{stub.base_url}/klines")))
+
+    assert stub.hits['/api/v3/klines'] == 1
+    errors = [value for kind, value in outcomes if kind == 'error']
+    assert len(errors) == CALLERS
+    assert all(error is errors[0] for error in errors)
+    assert isinstance(errors[0], requests.exceptions.HTTPError)
+
+
+def test_failed_kline_fetch_falls_back_once_for_all_callers(stub_upstream):
+    stub = stub_upstream(slow(500, {'code': -1000, 'msg': 'boom'}))
+    fetcher = make_fetcher(stub)
+
+    outcomes = run_concurrently(lambda: fetcher.get_kline_data('BTCUSDT', '1h', limit=20))
+
+    assert stub.hits['/api/v3/klines'] == 1
+    first = outcomes[0][1]
+    assert all(kind == 'ok' and result is first for kind, result in outcomes)
+
+
+def test_next_call_after_completion_goes_upstream_again(stub_upstream):
+    stub = stub_upstream(slow(200, [ROW], delay=0))
+    fetcher = make_fetcher(stub)
+    fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    fetcher.get_kline_data('BTCUSDT', '1h', limit=1)
+    assert stub.hits['/api/v3/klines'] == 2
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from columnar_codec import index_to_ms
+from compact_frames import to_compact
+from mock_data_generator import MockDataGenerator
+from smc_analysis import SMCAnalysis
+
+
+def test_equal_levels_keep_swing_time_representation():
+    smc = SMCAnalysis()
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 300)
+    for frame in (df, to_compact(df)):
+        swing_highs, swing_lows = smc.identify_swing_points(frame)
+        # 每個擺動點重複一次，保證形成等高/等低點簇
+        levels = smc.identify_equal_levels(swing_highs + swing_highs, swing_lows + swing_lows)
+        assert levels['equal_highs'] and levels['equal_lows']
+        times = index_to_ms(frame.index)
+        for zone in levels['equal_highs'] + levels['equal_lows']:
+            assert type(zone['time']) is type(frame.index[0])
+            assert index_to_ms(pd.Index([zone['time']]))[0] in times
+
+
+def test_equal_levels_time_is_latest_touch():
+    t = pd.date_range('2026-01-01', periods=4, freq='1h')
+    levels = SMCAnalysis().identify_equal_levels(
+        [(t[2], 100.0), (t[0], 100.05), (t[1], 120.0), (t[3], 100.02)], [])
+    assert levels['equal_highs'] == [{'price': levels['equal_highs'][0]['price'], 'time': t[3],
+                                      'type': 'equal_highs', 'description': '等高點流動性池'}]
+    assert np.isclose(levels['equal_highs'][0]['price'], (100.0 + 100.05 + 100.02) / 3)
+
+
+def brute_force_touch(values, below):
+    n = len(values)
+    result = np.full(n, n)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if (values[j] <= values[i]) if below else (values[j] >= values[i]):
+                result[i] = j
+                break
+    return result
+
+
+def test_next_touch_matches_brute_force():
+    rng = np.random.default_rng(1)
+    # 含大量相等值，檢查「不高於/不低於」的邊界
+    for values in (rng.normal(size=300).cumsum(), rng.integers(0, 5, 300).astype(float), np.ones(10), np.empty(0)):
+        for below in (True, False):
+            assert np.array_equal(SMCAnalysis._next_touch(values, below), brute_force_touch(values, below))
+
+
+def test_fair_value_gap_mitigation_matches_brute_force():
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 500)
+    high, low = df['high'].to_numpy(), df['low'].to_numpy()
+    gaps = SMCAnalysis().identify_fair_value_gaps(df)
+    assert gaps and any(gap['mitigated_time'] is not None for gap in gaps)
+    for gap in gaps:
+        third = df.index.get_loc(gap['time']) + 1
+        later = range(third + 1, len(df))
+        if gap['type'] == 'bullish_fvg':
+            touch = next((j for j in later if low[j] <= gap['top']), None)
+        else:
+            touch = next((j for j in later if high[j] >= gap['bottom']), None)
+        assert gap['mitigated_time'] == (None if touch is None else df.index[touch])
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from columnar_codec import time_to_ms
+from compact_frames import to_compact
+from mock_data_generator import MockDataGenerator
+from smc_analysis import SMCAnalysis
+from smc_types import SMCResult
+
+
+def times(results):
+    """analyze_smc 輸出中各類結果的時間（毫秒）"""
+    return {
+        'swing_highs': [time_to_ms(t) for t, _ in results['swing_highs']],
+        'bos_signals': [time_to_ms(s['time']) for s in results['bos_signals']],
+        'order_blocks': [time_to_ms(ob['time']) for ob in results['order_blocks']],
+        'liquidity': sorted(time_to_ms(z['time']) for side in results['liquidity_zones'].values() for z in side),
+        'fair_value_gaps': [time_to_ms(gap['time']) for gap in results['fair_value_gaps']],
+        'mitigated': [None if gap['mitigated_time'] is None else time_to_ms(gap['mitigated_time'])
+                      for gap in results['fair_value_gaps']]
+    }
+
+
+def test_compact_frame_round_trip_keeps_epoch_times():
+    df = MockDataGenerator().generate_kline_data('BTCUSDT', '1h', 300)
+    compact = to_compact(df)
+    results = SMCAnalysis().analyze_smc(compact)
+    result = SMCResult.from_dict(results)
+
+    assert len(result.bos) and len(result.fair_value_gaps)
+    first, last = df.index[0].to_datetime64(), df.index[-1].to_datetime64()
+    for name in ('swing_highs', 'bos', 'order_blocks', 'liquidity', 'fair_value_gaps'):
+        values = getattr(result, name)['time']
+        assert ((values >= first) & (values <= last)).all(), name
+    assert times(result.to_dict()) == times(results)
+    assert all(isinstance(s['time'], pd.Timestamp) for s in result.to_dict()['bos_signals'])
@@ -0,0 +1,232 @@
+import json
+import numpy as np
+import pandas as pd
+from analysis_cache import BarCloseCache, current_bar_open, INTERVAL_MS
+from metrics import timed
+
+# 逐筆成交：成交時間（毫秒）、價格、數量、買方是否為掛單方（True表示主動賣出）
+TRADE_DTYPE = np.dtype([('time', 'i8'), ('price', 'f8'), ('qty', 'f8'), ('buyer_maker', '?')])
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def trades_from_agg(rows):
+    """
+    把Binance /api/v3/aggTrades 的響應轉為結構化數組
+
+    Args:
+        rows (list): [{'T': 時間, 'p': 價格, 'q': 數量, 'm': 買方是否為掛單方, ...}, ...]
+
+    Returns:
+        ndarray: TRADE_DTYPE 數組
+    """
+    trades = np.empty(len(rows), dtype=TRADE_DTYPE)
+    if rows:
+        trades['time'] = np.fromiter((row['T'] for row in rows), dtype=np.int64, count=len(rows))
+        trades['price'] = np.fromiter((float(row['p']) for row in rows), dtype=np.float64, count=len(rows))
+        trades['qty'] = np.fromiter((float(row['q']) for row in rows), dtype=np.float64, count=len(rows))
+        trades['buyer_maker'] = np.fromiter((row['m'] for row in rows), dtype=bool, count=len(rows))
+    return trades
+
+
+def save_trades(path, trades):
+    """把成交數組保存為.npy文件"""
+    np.save(path, np.asarray(trades, dtype=TRADE_DTYPE))
+
+
+def load_trades(path):
+    """
+    讀取錄製的成交數據
+
+    支持 .npy（save_trades的輸出，以內存映射方式打開）以及
+    Binance aggTrades 格式的 .json（列表）或 .jsonl（每行一筆）。
+
+    Returns:
+        ndarray: 按時間排序的 TRADE_DTYPE 數組
+    """
+    if path.endswith('.npy'):
+        trades = np.load(path, mmap_mode='r')
+    else:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = json.load(f)
+        trades = trades_from_agg(rows)
+    if len(trades) > 1 and np.any(np.diff(trades['time']) < 0):
+        trades = np.sort(trades, order='time', kind='stable')
+    return trades
+
+
+def _price_bins(prices, price_low, price_high, n_bins):
+    """等寬價格分箱：返回 (各成交所在箱號, 箱邊界)，價格等於上限的成交歸入末箱"""
+    price_high = max(price_high, price_low + 1e-12)
+    edges = np.linspace(price_low, price_high, n_bins + 1)
+    scale = n_bins / (price_high - price_low)
+    idx = np.clip(((prices - price_low) * scale).astype(np.int64), 0, n_bins - 1)
+    return idx, edges
+
+
+def _bar_ms(bar_index):
+    if isinstance(bar_index, pd.DatetimeIndex):
+        return bar_index.as_unit('ms').asi8
+    return np.asarray(bar_index, dtype=np.int64)
+
+
+class TradeAggregator:
+    """把逐筆成交聚合為每根K線的買賣量差、VWAP以及成交量分佈（全部以bincount分箱計算）"""
+
+    def __init__(self, data_fetcher=None, cache=None, max_trades=200000):
+        self.data_fetcher = data_fetcher
+        self.max_trades = max_trades
+        self.cache = cache if cache is not None else BarCloseCache(max_entries=64, name='trades')
+
+    @timed('aggregate_trades')
+    def bar_stats(self, trades, bar_index, interval_ms=None):
+        """
+        每根K線的成交統計
+
+        Args:
+            trades (ndarray): TRADE_DTYPE 數組
+            bar_index: K線索引（DatetimeIndex或毫秒整數）
+            interval_ms (int): K線週期毫秒數，預設取相鄰K線的間隔
+
+        Returns:
+            pandas.DataFrame: 與K線同索引，列為 buy_volume、sell_volume、delta、trades、vwap、session_vwap
+        """
+        bar_ms = _bar_ms(bar_index)
+        n_bars = len(bar_ms)
+        if interval_ms is None:
+            interval_ms = int(bar_ms[1] - bar_ms[0]) if n_bars > 1 else DAY_MS
+
+        pos = np.searchsorted(bar_ms, trades['time'], side='right') - 1
+        valid = (pos >= 0) & (trades['time'] < bar_ms[-1] + interval_ms)
+        pos = pos[valid]
+        price = trades['price'][valid]
+        qty = trades['qty'][valid]
+        sell = trades['buyer_maker'][valid]
+
+        volume = np.bincount(pos, weights=qty, minlength=n_bars)
+        sell_volume = np.bincount(pos, weights=qty * sell, minlength=n_bars)
+        buy_volume = volume - sell_volume
+        notional = np.bincount(pos, weights=price * qty, minlength=n_bars)
+        counts = np.bincount(pos, minlength=n_bars)
+
+        # 以UTC日為交易時段，時段內累計成交額/成交量即為時段VWAP
+        session = bar_ms // DAY_MS
+        cum_notional = np.cumsum(notional)
+        cum_volume = np.cumsum(volume)
+        starts = np.flatnonzero(np.r_[True, session[1:] != session[:-1]])
+        offset = np.repeat(starts, np.diff(np.r_[starts, n_bars]))
+        base_notional = np.where(offset > 0, cum_notional[offset - 1], 0.0)
+        base_volume = np.where(offset > 0, cum_volume[offset - 1], 0.0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap = notional / volume
+            session_vwap = (cum_notional - base_notional) / (cum_volume - base_volume)
+
+        return pd.DataFrame({
+            'buy_volume': buy_volume,
+            'sell_volume': sell_volume,
+            'delta': buy_volume - sell_volume,
+            'trades': counts,
+            'vwap': vwap,
+            'session_vwap': session_vwap
+        }, index=bar_index)
+
+    @timed('volume_profile')
+    def volume_profile(self, trades, price_low, price_high, n_bins=60, value_area=0.7):
+        """
+        成交量分佈（volume at price）
+
+        Args:
+            trades (ndarray): TRADE_DTYPE 數組
+            price_low (float): 價格下限
+            price_high (float): 價格上限
+            n_bins (int): 價格箱數
+            value_area (float): 價值區域涵蓋的成交量比例
+
+        Returns:
+            dict: prices（各箱中心價）、buy、sell、total、poc（最大成交量價位）、
+                  value_area_low、value_area_high
+        """
+        # 只統計價格範圍內的成交
+        in_range = (trades['price'] >= price_low) & (trades['price'] <= price_high)
+        trades = trades[in_range]
+        idx, edges = _price_bins(trades['price'], price_low, price_high, n_bins)
+        qty = trades['qty']
+        total = np.bincount(idx, weights=qty, minlength=n_bins)
+        sell = np.bincount(idx, weights=qty * trades['buyer_maker'], minlength=n_bins)
+        prices = (edges[:-1] + edges[1:]) / 2
+
+        poc = int(np.argmax(total))
+        # 從POC向兩側擴展，每次加入成交量較大的一側，直到涵蓋value_area比例的成交量
+        lo = hi = poc
+        covered = total[poc]
+        target = total.sum() * value_area
+        while covered < target and (lo > 0 or hi < n_bins - 1):
+            below = total[lo - 1] if lo > 0 else -1
+            above = total[hi + 1] if hi < n_bins - 1 else -1
+            if above >= below:
+                hi += 1
+                covered += total[hi]
+            else:
+                lo -= 1
+                covered += total[lo]
+
+        return {
+            'prices': prices,
+            'buy': total - sell,
+            'sell': sell,
+            'total': total,
+            'poc': float(prices[poc]),
+            'value_area_low': float(edges[lo]),
+            'value_area_high': float(edges[hi + 1])
+        }
+
+    def footprint(self, trades, bar_index, price_low, price_high, n_bins=40):
+        """
+        足跡圖：每根K線內各價格箱的主動買入量和主動賣出量
+
+        Returns:
+            tuple: (價格箱中心價, 買入量矩陣, 賣出量矩陣)，矩陣形狀為 (K線 × 價格箱)
+        """
+        bar_ms = _bar_ms(bar_index)
+        n_bars = len(bar_ms)
+        pos = np.searchsorted(bar_ms, trades['time'], side='right') - 1
+        valid = (pos >= 0) & (trades['price'] >= price_low) & (trades['price'] <= price_high)
+        price_idx, edges = _price_bins(trades['price'][valid], price_low, price_high, n_bins)
+        cell = pos[valid] * n_bins + price_idx
+        qty = trades['qty'][valid]
+        sell = trades['buyer_maker'][valid]
+        sell_volume = np.bincount(cell, weights=qty * sell, minlength=n_bars * n_bins).reshape(n_bars, n_bins)
+        total = np.bincount(cell, weights=qty, minlength=n_bars * n_bins).reshape(n_bars, n_bins)
+        return (edges[:-1] + edges[1:]) / 2, total - sell_volume, sell_volume
+
+    def summary(self, symbol, interval, df, n_bins=60):
+        """
+        獲取K線範圍內的成交並計算每根K線統計與成交量分佈，結果按K線收盤快取
+
+        Args:
+            symbol (str): 交易對
+            interval (str): 時間間隔
+            df (pandas.DataFrame): K線數據
+
+        Returns:
+            dict: {'bars': bar_stats結果, 'profile': volume_profile結果}；沒有成交數據時返回None
+        """
+        bar_ms = _bar_ms(df.index)
+        key = ('trades', symbol, interval, len(df), n_bins)
+
+        def compute():
+            start_ms = int(bar_ms[0])
+            end_ms = int(bar_ms[-1]) + INTERVAL_MS.get(interval, INTERVAL_MS['1h'])
+            trades = self.data_fetcher.get_agg_trades(symbol, start_ms, end_ms, max_trades=self.max_trades, klines=df)
+            if trades is None or len(trades) == 0:
+                return None
+            return {
+                'bars': self.bar_stats(trades, df.index, INTERVAL_MS.get(interval)),
+                'profile': self.volume_profile(trades, float(df['low'].min()), float(df['high'].max()), n_bins)
+            }
+
+        return self.cache.get_or_compute(key, current_bar_open(interval), compute)